@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the AWQ/GPTQ CPU fallbacks in custom_ops_fallback
+
+Compares, per batch size, a plain bf16 matmul against awq_gemm / gptq_gemm
+in "cache" mode (dequantized weight kept per layer) and "blocked" mode
+(dequantized on the fly in column blocks).
+
+Usage:
+    python benchmark_quant_fallback.py --in-features 4096 --out-features 11008 --batch 1 8 32
+"""
+
+import argparse
+import statistics
+import time
+
+import torch
+
+import custom_ops_fallback as fallback
+
+
+def time_op(fn, warmup: int, iters: int) -> float:
+    """Median latency of fn() in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def random_packed(rows: int, cols: int) -> torch.Tensor:
+    """Random int32 words (every nibble value is a valid 4-bit weight)"""
+    return torch.randint(-2**31, 2**31 - 1, (rows, cols), dtype=torch.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AWQ/GPTQ CPU fallback micro-benchmark")
+    parser.add_argument("--in-features", type=int, default=4096)
+    parser.add_argument("--out-features", type=int, default=11008)
+    parser.add_argument("--group-size", type=int, default=128)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--block-n", type=int, default=fallback.QUANT_FALLBACK_BLOCK_N)
+    parser.add_argument("--dtype", choices=["bfloat16", "float16", "float32"], default="bfloat16")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    dtype = getattr(torch, args.dtype)
+    k, n, group = args.in_features, args.out_features, args.group_size
+    groups = k // group
+
+    # AWQ: qweight [in, out/8], qzeros [groups, out/8], scales [groups, out]
+    awq_qweight = random_packed(k, n // 8)
+    awq_qzeros = random_packed(groups, n // 8)
+    awq_scales = (torch.rand(groups, n) * 0.01).to(torch.float16)
+
+    # GPTQ: qweight [in/8, out], qzeros [groups, out/8], scales [groups, out]
+    gptq_qweight = random_packed(k // 8, n)
+    gptq_qzeros = random_packed(groups, n // 8)
+    gptq_scales = (torch.rand(groups, n) * 0.01).to(torch.float16)
+    gptq_g_idx = torch.empty(0, dtype=torch.int32)
+
+    baseline_weight = fallback.awq_dequantize_fallback(awq_qweight, awq_scales, awq_qzeros, 0, 0, 0).to(dtype)
+
+    print("=" * 78)
+    print(f"  Quantized GEMM fallback: [M, {k}] x [{k}, {n}], group {group}, {args.dtype}, "
+          f"{torch.get_num_threads()} threads")
+    print("=" * 78)
+    packed_mb = (awq_qweight.numel() * 4 + awq_scales.numel() * 2) / 1024**2
+    dense_mb = baseline_weight.numel() * baseline_weight.element_size() / 1024**2
+    print(f"  Packed weight: {packed_mb:.1f} MB | dequantized weight (cache mode): {dense_mb:.1f} MB | "
+          f"blocked working set: {k * args.block_n * baseline_weight.element_size() / 1024**2:.1f} MB")
+    print("")
+    print(f"  {'M':>4} | {'bf16 base':>10} | {'AWQ cache':>10} | {'AWQ block':>10} | "
+          f"{'GPTQ cache':>10} | {'GPTQ block':>10}   (ms)")
+    print("  " + "-" * 74)
+
+    for m in args.batch:
+        x = torch.randn(m, k).to(dtype)
+        row = [time_op(lambda: torch.matmul(x, baseline_weight), args.warmup, args.iters)]
+
+        for mode in ("cache", "blocked"):
+            fallback.set_quant_fallback_mode(mode, block_n=args.block_n)
+            row.append(time_op(
+                lambda: fallback.awq_gemm_fallback(x, awq_qweight, awq_qzeros, awq_scales, 8),
+                args.warmup, args.iters
+            ))
+        for mode in ("cache", "blocked"):
+            fallback.set_quant_fallback_mode(mode, block_n=args.block_n)
+            row.append(time_op(
+                lambda: fallback.gptq_gemm_fallback(
+                    x, gptq_qweight, gptq_qzeros, gptq_scales, gptq_g_idx, False, False, 4
+                ),
+                args.warmup, args.iters
+            ))
+
+        print(f"  {m:>4} | " + " | ".join(f"{t:>10.3f}" for t in row))
+
+    print("")
+    print(f"  Cache stats: {fallback.get_quant_fallback_stats()['cache']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,14 @@ personalizadas que no están disponibles en ARM-Axion.
 import torch
 import torch.nn.functional as F
 import math
+import os
+import threading
+import weakref
+from collections import OrderedDict
 from typing import Optional
 
+from quant_packing import AWQ_REVERSE_ORDER, unpack_shifts, unpack_with_shifts
+
 # Mover la importación al nivel superior del módulo
 try:
     from vllm._custom_ops import *
@@ -108,6 +114,107 @@ def apply_repetition_penalties_fallback(
     return logits * scaling
 
 
+# Tokens por partición en paged_attention_v2 (igual que _PARTITION_SIZE de vLLM)
+PAGED_ATTENTION_PARTITION_SIZE = 512
+
+# Formatos fp8 de la KV cache (la cache se guarda como uint8)
+_FP8_KV_DTYPES = {
+    'fp8': getattr(torch, 'float8_e4m3fn', None),
+    'fp8_e4m3': getattr(torch, 'float8_e4m3fn', None),
+    'fp8_e5m2': getattr(torch, 'float8_e5m2', None),
+}
+
+
+def _load_kv_blocks(cache: torch.Tensor, block_ids: torch.Tensor,
+                    kv_cache_dtype: str, kv_scale) -> torch.Tensor:
+    """
+    Reúne los bloques físicos `block_ids` ([num_seqs, num_blocks]) de la
+    cache con una sola indexación y los pasa a float32 (des-escalando fp8)
+    """
+    blocks = cache[block_ids]
+    fp8_dtype = _FP8_KV_DTYPES.get(kv_cache_dtype)
+    if fp8_dtype is not None and blocks.dtype == torch.uint8:
+        return blocks.view(fp8_dtype).to(torch.float32) * kv_scale
+    return blocks.to(torch.float32)
+
+
+def _paged_attention_partition(
+    query: torch.Tensor,
+    key_cache: torch.Tensor,
+    value_cache: torch.Tensor,
+    num_kv_heads: int,
+    block_tables: torch.Tensor,
+    seq_lens: torch.Tensor,
+    block_size: int,
+    first_block: int,
+    num_blocks: int,
+    alibi_slopes: Optional[torch.Tensor],
+    kv_cache_dtype: str,
+    k_scale,
+    v_scale,
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Atención de un query por secuencia sobre los bloques
+    [first_block, first_block + num_blocks) de todo el batch a la vez
+
+    Args:
+        query: [num_seqs, num_heads, head_size], ya multiplicado por scale
+        key_cache: [num_blocks, num_kv_heads, head_size/x, block_size, x]
+        value_cache: [num_blocks, num_kv_heads, head_size, block_size]
+
+    Returns:
+        (salida normalizada [num_seqs, num_heads, head_size],
+         max logit [num_seqs, num_heads], suma de exponenciales [num_seqs, num_heads]),
+        en float32. Las secuencias sin tokens en el rango dan salida 0,
+        max -inf y suma 0.
+    """
+    num_seqs, num_heads, head_size = query.shape
+    group_size = num_heads // num_kv_heads
+    num_tokens = num_blocks * block_size
+
+    block_ids = block_tables[:, first_block:first_block + num_blocks].long()
+
+    # K: [B, nb, kvh, hs/x, bs, x] -> [B, kvh, hs, T] (listo para q @ k)
+    k = _load_kv_blocks(key_cache, block_ids, kv_cache_dtype, k_scale)
+    k = k.permute(0, 2, 1, 4, 3, 5).reshape(num_seqs, num_kv_heads, num_tokens, head_size)
+    # V: [B, nb, kvh, hs, bs] -> [B, kvh, T, hs]
+    v = _load_kv_blocks(value_cache, block_ids, kv_cache_dtype, v_scale)
+    v = v.permute(0, 2, 1, 4, 3).reshape(num_seqs, num_kv_heads, num_tokens, head_size)
+
+    # GQA: las cabezas de query de un mismo grupo comparten la cabeza KV
+    q = query.to(torch.float32).reshape(num_seqs, num_kv_heads, group_size, head_size)
+    scores = torch.matmul(q, k.transpose(-1, -2))  # [B, kvh, G, T]
+
+    positions = torch.arange(
+        first_block * block_size, first_block * block_size + num_tokens, device=query.device
+    )
+    lens = seq_lens.to(device=query.device, dtype=torch.long).view(num_seqs, 1)
+
+    if alibi_slopes is not None:
+        # Sesgo relativo a la última posición de cada secuencia (como el kernel)
+        relative = (positions.view(1, -1) - lens + 1).to(torch.float32)
+        slopes = alibi_slopes.to(torch.float32).view(1, num_kv_heads, group_size, 1)
+        scores = scores + slopes * relative.view(num_seqs, 1, 1, num_tokens)
+
+    # Longitudes irregulares: se enmascaran los tokens más allá de seq_len
+    # (un único query de decode no necesita máscara causal)
+    valid = (positions.view(1, -1) < lens).view(num_seqs, 1, 1, num_tokens)
+    scores = scores.masked_fill(~valid, float('-inf'))
+
+    max_logits = scores.amax(dim=-1, keepdim=True)
+    safe_max = torch.where(torch.isfinite(max_logits), max_logits, torch.zeros_like(max_logits))
+    exp_scores = torch.exp(scores - safe_max)
+    exp_sums = exp_scores.sum(dim=-1, keepdim=True)
+
+    out = torch.matmul(exp_scores, v) / exp_sums.clamp_min(torch.finfo(torch.float32).tiny)
+
+    return (
+        out.view(num_seqs, num_heads, head_size),
+        max_logits.view(num_seqs, num_heads),
+        exp_sums.view(num_seqs, num_heads),
+    )
+
+
 def paged_attention_v1_fallback(
     out: torch.Tensor,
     query: torch.Tensor,
@@ -131,71 +238,22 @@ def paged_attention_v1_fallback(
 ) -> None:
     """
     Implementación de fallback para la operación paged_attention_v1
+
+    Todo el batch se procesa de una vez: los bloques KV de todas las
+    secuencias se reúnen con una indexación, las longitudes irregulares se
+    enmascaran y GQA se resuelve agrupando cabezas (sin bucles Python por
+    secuencia ni por bloque). Los parámetros blocksparse no se soportan.
     """
-    # Esta es una implementación simplificada de atención paginada
-    # En la implementación real, esto se hace con kernels optimizados
-    batch_size = query.shape[0]
-    
-    # Para cada secuencia en el batch
-    for i in range(batch_size):
-        seq_len = int(seq_lens[i].item())
-        if seq_len == 0:
-            continue
-            
-        # Calcular cuántos bloques de atención se necesitan
-        num_blocks = (seq_len + block_size - 1) // block_size
-        
-        # Obtener la posición de bloque para esta secuencia
-        block_table = block_tables[i]
-        
-        # Extraer query para esta posición
-        q = query[i:i+1, :]  # Shape: [1, head_size]
-        
-        # Concatenar keys y values de los bloques relevantes
-        all_k = []
-        all_v = []
-        
-        for block_idx in range(num_blocks):
-            if block_idx >= len(block_table):
-                continue
-            physical_block_number = int(block_table[block_idx].item())
-            
-            # Obtener las posiciones de clave y valor del bloque
-            block_start = block_idx * block_size
-            block_end = min(block_start + block_size, seq_len)
-            
-            # Extraer k y v para este bloque (esto es simplificado)
-            k_block = key_cache[physical_block_number]
-            v_block = value_cache[physical_block_number]
-            
-            all_k.append(k_block)
-            all_v.append(v_block)
-        
-        if all_k:
-            k = torch.cat(all_k, dim=0)
-            v = torch.cat(all_v, dim=0)
-            
-            # Calcular atención
-            scores = torch.matmul(q, k.transpose(-1, -2)) * scale
-            
-            if alibi_slopes is not None:
-                # Aplicar penalización ALiBi
-                seq_len_k = k.size(-2)
-                alibi_bias = torch.arange(seq_len_k, device=scores.device).view(1, -1) * -abs(alibi_slopes[i])
-                scores = scores + alibi_bias.unsqueeze(0)
-            
-            # Aplicar máscara triangular para atención causal
-            causal_mask = torch.triu(
-                torch.ones(seq_len, seq_len, dtype=torch.bool, device=scores.device),
-                diagonal=1
-            )
-            scores.masked_fill_(causal_mask, float("-inf"))
-            
-            # Calcular probabilidades de atención
-            attn_weights = torch.softmax(scores, dim=-1)
-            
-            # Aplicar atención a los valores
-            out[i:i+1, :] = torch.matmul(attn_weights, v)
+    num_blocks = min(-(-max_seq_len // block_size), block_tables.shape[1])
+    if query.shape[0] == 0 or num_blocks == 0:
+        out.zero_()
+        return
+
+    attn_out, _, _ = _paged_attention_partition(
+        query * scale, key_cache, value_cache, num_kv_heads, block_tables, seq_lens,
+        block_size, 0, num_blocks, alibi_slopes, kv_cache_dtype, k_scale, v_scale
+    )
+    out.copy_(attn_out.to(out.dtype))
 
 
 def paged_attention_v2_fallback(
@@ -224,14 +282,243 @@ def paged_attention_v2_fallback(
 ) -> None:
     """
     Implementación de fallback para la operación paged_attention_v2
+
+    Split-K: el contexto se parte en particiones de
+    PAGED_ATTENTION_PARTITION_SIZE tokens. Cada partición calcula, para todo
+    el batch, su salida parcial, su max logit y su suma de exponenciales
+    (en tmp_out, max_logits y exp_sum) y al final se combinan reescalando
+    con el max global. La memoria de trabajo queda acotada por partición en
+    lugar de crecer con el contexto, y en cada partición solo entran las
+    secuencias que llegan a ella.
     """
-    # Similar a v1 pero incluye componentes adicionales para la implementación incremental
-    paged_attention_v1_fallback(
-        out, query, key_cache, value_cache, num_kv_heads, scale, block_tables,
-        seq_lens, block_size, max_seq_len, alibi_slopes, kv_cache_dtype,
-        k_scale, v_scale, tp_rank, blocksparse_local_blocks,
-        blocksparse_vert_stride, blocksparse_block_size, blocksparse_head_sliding_step
+    num_seqs = query.shape[0]
+    max_blocks = min(-(-max_seq_len // block_size), block_tables.shape[1])
+    if num_seqs == 0 or max_blocks == 0:
+        out.zero_()
+        return
+
+    max_partitions = tmp_out.shape[2]
+    partition_size = max(PAGED_ATTENTION_PARTITION_SIZE, -(-max_seq_len // max_partitions))
+    blocks_per_partition = max(1, -(-partition_size // block_size))
+    num_partitions = -(-max_blocks // blocks_per_partition)
+
+    query = query * scale
+    exp_sum.zero_()
+    max_logits.fill_(float('-inf'))
+    tmp_out.zero_()
+
+    all_seqs = torch.arange(num_seqs, device=query.device)
+    lens = seq_lens.to(query.device)
+    for partition in range(num_partitions):
+        first_block = partition * blocks_per_partition
+        num_blocks = min(blocks_per_partition, max_blocks - first_block)
+
+        # Solo las secuencias que tienen tokens en esta partición
+        if partition == 0:
+            seqs = all_seqs
+        else:
+            seqs = all_seqs[lens > first_block * block_size]
+            if seqs.numel() == 0:
+                break
+        full_batch = seqs.numel() == num_seqs
+
+        part_out, part_max, part_sum = _paged_attention_partition(
+            query if full_batch else query[seqs],
+            key_cache, value_cache, num_kv_heads,
+            block_tables if full_batch else block_tables[seqs],
+            seq_lens if full_batch else lens[seqs],
+            block_size, first_block, num_blocks,
+            alibi_slopes, kv_cache_dtype, k_scale, v_scale
+        )
+        tmp_out[seqs, :, partition] = part_out.to(tmp_out.dtype)
+        max_logits[seqs, :, partition] = part_max.to(max_logits.dtype)
+        exp_sum[seqs, :, partition] = part_sum.to(exp_sum.dtype)
+
+    # Reducción: cada partición pesa exp_sum * exp(max_parcial - max_global)
+    part_max = max_logits[:, :, :num_partitions].to(torch.float32)
+    global_max = part_max.amax(dim=-1, keepdim=True)
+    global_max = torch.where(torch.isfinite(global_max), global_max, torch.zeros_like(global_max))
+    weights = exp_sum[:, :, :num_partitions].to(torch.float32) * torch.exp(part_max - global_max)
+    total = weights.sum(dim=-1, keepdim=True).clamp_min(torch.finfo(torch.float32).tiny)
+
+    partials = tmp_out[:, :, :num_partitions].to(torch.float32)
+    combined = (partials * (weights / total).unsqueeze(-1)).sum(dim=2)
+    out.copy_(combined.to(out.dtype))
+
+
+# Fallbacks AWQ/GPTQ: en modo "cache" el peso descuantizado de cada capa se
+# guarda (más memoria, GEMM a velocidad del dtype de activación); en modo
+# "blocked" se descuantiza por bloques de columnas en cada llamada sin
+# materializar nunca la matriz completa
+QUANT_FALLBACK_MODE = os.environ.get('VLLM_ARM_QUANT_FALLBACK_MODE', 'cache')
+QUANT_FALLBACK_CACHE_GB = float(os.environ.get('VLLM_ARM_QUANT_CACHE_GB', '16'))
+QUANT_FALLBACK_BLOCK_N = int(os.environ.get('VLLM_ARM_QUANT_BLOCK_N', '512'))
+
+def _unpack_int32(packed: torch.Tensor, bits: int, dim: int,
+                  order: Optional[list] = None) -> torch.Tensor:
+    """
+    Desempaqueta enteros de `bits` bits guardados en int32
+
+    Args:
+        packed: Tensor int32 2D
+        bits: 2, 4 u 8
+        dim: 1 si los valores van empaquetados por columnas, 0 si por filas
+        order: Nibble de cada valor dentro del int32 (None = secuencial)
+
+    Returns:
+        Tensor int32 con la dimensión `dim` multiplicada por 32 // bits
+    """
+    shifts = torch.tensor(unpack_shifts(bits, order), dtype=torch.int32, device=packed.device)
+    return unpack_with_shifts(packed, shifts, bits, dim)
+
+
+def _awq_dequantize_columns(qweight: torch.Tensor, scales: torch.Tensor, qzeros: torch.Tensor,
+                            col_start: int, col_end: int, dtype: torch.dtype) -> torch.Tensor:
+    """Columnas [col_start, col_end) del peso AWQ descuantizado ([in_features, n])"""
+    pack_factor = 8
+    packed_cols = slice(col_start // pack_factor, col_end // pack_factor)
+    weight = _unpack_int32(qweight[:, packed_cols], 4, 1, AWQ_REVERSE_ORDER)
+    zeros = _unpack_int32(qzeros[:, packed_cols], 4, 1, AWQ_REVERSE_ORDER)
+
+    group_size = qweight.shape[0] // scales.shape[0]
+    group_scales = scales[:, col_start:col_end]
+    zeros = zeros.repeat_interleave(group_size, dim=0)
+    group_scales = group_scales.repeat_interleave(group_size, dim=0)
+    return ((weight - zeros).to(group_scales.dtype) * group_scales).to(dtype)
+
+
+def _gptq_dequantize_columns(b_q_weight: torch.Tensor, b_gptq_qzeros: torch.Tensor,
+                             b_gptq_scales: torch.Tensor, b_g_idx: torch.Tensor,
+                             use_v2_format: bool, bit: int,
+                             col_start: int, col_end: int, dtype: torch.dtype) -> torch.Tensor:
+    """Columnas [col_start, col_end) del peso GPTQ descuantizado ([in_features, n])"""
+    pack_factor = 32 // bit
+    weight = _unpack_int32(b_q_weight[:, col_start:col_end], bit, 0)
+    zeros = _unpack_int32(
+        b_gptq_qzeros[:, col_start // pack_factor:-(-col_end // pack_factor)], bit, 1
     )
+    zeros = zeros[:, col_start % pack_factor:col_start % pack_factor + (col_end - col_start)]
+    if not use_v2_format:
+        # Formato GPTQ v1: los zeros se guardan restando 1
+        zeros = zeros + 1
+
+    in_features = weight.shape[0]
+    if b_g_idx is not None and b_g_idx.numel() == in_features:
+        # act-order: cada fila de entrada tiene su grupo
+        groups = b_g_idx.long()
+    else:
+        group_size = in_features // b_gptq_scales.shape[0]
+        groups = torch.arange(in_features, device=weight.device) // group_size
+    group_scales = b_gptq_scales[groups, col_start:col_end]
+    return ((weight - zeros[groups]).to(group_scales.dtype) * group_scales).to(dtype)
+
+
+class _DequantizedWeightCache:
+    """
+    Pesos descuantizados por capa (LRU acotado en bytes)
+
+    La clave es el tensor empaquetado (data_ptr + forma); se guarda una
+    referencia débil para no servir un peso de un tensor ya liberado cuya
+    memoria se haya reutilizado.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, packed: torch.Tensor, dtype: torch.dtype, create):
+        key = (packed.data_ptr(), tuple(packed.shape), dtype)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0]() is packed:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        weight = create()
+        size = weight.numel() * weight.element_size()
+        with self._lock:
+            self.misses += 1
+            if size > self.max_bytes:
+                return weight
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            while self._entries and self.bytes + size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+            self._entries[key] = (weakref.ref(packed), weight, size)
+            self.bytes += size
+        return weight
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def get_stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'gb': round(self.bytes / 1024**3, 3),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_dequant_cache = _DequantizedWeightCache(int(QUANT_FALLBACK_CACHE_GB * 1024**3))
+
+
+def set_quant_fallback_mode(mode: str, cache_gb: Optional[float] = None,
+                            block_n: Optional[int] = None) -> None:
+    """
+    Cambia el modo de los fallbacks AWQ/GPTQ ("cache" o "blocked")
+    """
+    global QUANT_FALLBACK_MODE, QUANT_FALLBACK_BLOCK_N
+    if mode not in ('cache', 'blocked'):
+        raise ValueError(f"Modo de fallback cuantizado desconocido: {mode}")
+    QUANT_FALLBACK_MODE = mode
+    if cache_gb is not None:
+        _dequant_cache.max_bytes = int(cache_gb * 1024**3)
+        _dequant_cache.clear()
+    if block_n is not None:
+        QUANT_FALLBACK_BLOCK_N = block_n
+
+
+def get_quant_fallback_stats() -> dict:
+    """Modo actual y estado de la cache de pesos descuantizados"""
+    return {
+        'mode': QUANT_FALLBACK_MODE,
+        'block_n': QUANT_FALLBACK_BLOCK_N,
+        'cache': _dequant_cache.get_stats(),
+    }
+
+
+def _quantized_matmul(input: torch.Tensor, packed: torch.Tensor, out_features: int,
+                      dequantize_columns) -> torch.Tensor:
+    """
+    input @ W con W descuantizado según QUANT_FALLBACK_MODE
+
+    dequantize_columns(col_start, col_end, dtype) devuelve las columnas
+    [col_start, col_end) de W.
+    """
+    dtype = input.dtype
+    if QUANT_FALLBACK_MODE == 'cache':
+        weight = _dequant_cache.get_or_create(
+            packed, dtype, lambda: dequantize_columns(0, out_features, dtype)
+        )
+        return torch.matmul(input, weight)
+
+    # Bloques de columnas (múltiplo de 8 para no partir un int32 empaquetado)
+    block_n = max(8, QUANT_FALLBACK_BLOCK_N // 8 * 8)
+    out = torch.empty(*input.shape[:-1], out_features, dtype=dtype, device=input.device)
+    for col_start in range(0, out_features, block_n):
+        col_end = min(col_start + block_n, out_features)
+        out[..., col_start:col_end] = torch.matmul(input, dequantize_columns(col_start, col_end, dtype))
+    return out
 
 
 def awq_dequantize_fallback(
@@ -244,17 +531,13 @@ def awq_dequantize_fallback(
 ) -> torch.Tensor:
     """
     Implementación de fallback para la operación awq_dequantize
+
+    qweight [in, out/8] y zeros [in/group, out/8] llevan 8 nibbles por int32
+    en el orden intercalado de AWQ; scales es [in/group, out]. Devuelve el
+    peso [in, out] en el dtype de scales.
     """
-    # Simplified AWQ dequantization (this is a very simplified version)
-    # In real AWQ, there would be more sophisticated bit manipulation
-    # This is essentially: (qweight - zeros) * scales
-    qweight_f = qweight.to(torch.float32)
-    zeros_f = zeros.to(torch.float32)
-    scales_f = scales.to(torch.float32)
-    
-    # Apply dequantization formula
-    dequantized = (qweight_f - zeros_f) * scales_f
-    return dequantized.to(qweight.dtype)
+    out_features = scales.shape[1]
+    return _awq_dequantize_columns(qweight, scales, zeros, 0, out_features, scales.dtype)
 
 
 def awq_gemm_fallback(
@@ -267,11 +550,19 @@ def awq_gemm_fallback(
     """
     Implementación de fallback para la operación awq_gemm
     """
-    # Dequantize the weight first
-    dequantized_weight = awq_dequantize_fallback(qweight, scales, qzeros, split_k_iters, 1, 1)
-    
-    # Perform the GEMM operation (matrix multiplication)
-    return torch.matmul(input, dequantized_weight)
+    # La capa AWQ de vLLM pasa (input, qweight, scales, qzeros, ...): se
+    # distinguen por dtype (los zeros van empaquetados en int32)
+    if qzeros.is_floating_point():
+        qzeros, scales = scales, qzeros
+
+    out_features = scales.shape[1]
+    scales = scales.to(input.dtype)
+    return _quantized_matmul(
+        input, qweight, out_features,
+        lambda col_start, col_end, dtype: _awq_dequantize_columns(
+            qweight, scales, qzeros, col_start, col_end, dtype
+        )
+    )
 
 
 def gptq_gemm_fallback(
@@ -286,32 +577,29 @@ def gptq_gemm_fallback(
 ) -> torch.Tensor:
     """
     Implementación de fallback para la operación gptq_gemm
+
+    b_q_weight [in/pack, out] va empaquetado por filas; b_gptq_qzeros
+    [grupos, out/pack] por columnas; b_g_idx da el grupo de cada fila (o
+    está vacío sin act-order). Los pesos se leen en el formato del
+    checkpoint porque gptq_shuffle_fallback no los reordena.
     """
-    # Simplified GPTQ dequantization and GEMM
-    # In reality, GPTQ has complex bit-packing and dequantization algorithms
-    
-    # For the fallback, we'll use a simple approach
-    # This won't be as efficient as the optimized CUDA kernels but will work
-    
-    # Note: A full GPTQ implementation would be quite complex
-    # This is a basic approximation
+    out_features = b_q_weight.shape[1]
     scales = b_gptq_scales.to(a.dtype)
-    zeros = b_gptq_qzeros.to(a.dtype)
-    
-    # Simple dequantization (this is not the exact GPTQ algorithm but serves as fallback)
-    # In GPTQ, the weight is packed differently, but for fallback we approximate
-    quantized_float = b_q_weight.to(torch.float32)
-    dequantized_weight = (quantized_float - zeros) * scales
-    
-    return torch.matmul(a.to(dequantized_weight.dtype), dequantized_weight.to(a.dtype))
+    return _quantized_matmul(
+        a, b_q_weight, out_features,
+        lambda col_start, col_end, dtype: _gptq_dequantize_columns(
+            b_q_weight, b_gptq_qzeros, scales, b_g_idx,
+            use_v2_format, bit, col_start, col_end, dtype
+        )
+    )
 
 
 def gptq_shuffle_fallback(q_weight: torch.Tensor, q_perm: torch.Tensor, bit: int) -> None:
     """
     Implementación de fallback para la operación gptq_shuffle
     """
-    # This is a no-op for CPU since we don't need the same optimizations as for CUDA
-    # The permutation was already applied during model loading
+    # No-op: gptq_gemm_fallback lee el formato original del checkpoint y
+    # aplica g_idx directamente, sin el reordenado de exllama
     pass
 
 
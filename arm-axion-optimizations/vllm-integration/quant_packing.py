@@ -0,0 +1,60 @@
+"""
+Desempaquetado de pesos int2/int4/int8 guardados en int32 (AWQ/GPTQ)
+Este módulo no depende de torch: custom_ops_fallback lo usa con tensores y
+los tests con arrays de numpy, así el orden de los nibbles se comprueba
+aunque torch no esté instalado.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+# AWQ empaqueta 8 columnas por int32 en orden [0, 2, 4, 6, 1, 3, 5, 7]:
+# la columna c está en el nibble AWQ_REVERSE_ORDER[c]
+AWQ_REVERSE_ORDER = [0, 4, 1, 5, 2, 6, 3, 7]
+
+
+def unpack_shifts(bits: int, order: Optional[list] = None) -> List[int]:
+    """
+    Desplazamiento en bits de cada valor dentro del int32
+
+    Args:
+        bits: 2, 4 u 8
+        order: Nibble de cada valor dentro del int32 (None = secuencial)
+    """
+    if 32 % bits != 0:
+        raise NotImplementedError(f"Empaquetado de {bits} bits no soportado en el fallback")
+    shifts = list(range(0, 32, bits))
+    if order is not None:
+        shifts = [shifts[position] for position in order]
+    return shifts
+
+
+def unpack_with_shifts(packed, shifts, bits: int, dim: int):
+    """
+    Desempaqueta `packed` (int32 2D) con `shifts` del mismo tipo de array
+
+    Sirve tanto para torch.Tensor como para np.ndarray: sólo usa indexado,
+    desplazamiento aritmético, máscara y reshape. El desplazamiento propaga
+    el bit de signo, pero la máscara lo descarta.
+
+    Returns:
+        Array con la dimensión `dim` multiplicada por 32 // bits
+    """
+    pack_factor = 32 // bits
+    mask = (1 << bits) - 1
+
+    rows, cols = packed.shape
+    if dim == 1:
+        values = (packed[:, :, None] >> shifts[None, None, :]) & mask
+        return values.reshape(rows, cols * pack_factor)
+    values = (packed[:, None, :] >> shifts[None, :, None]) & mask
+    return values.reshape(rows * pack_factor, cols)
+
+
+def unpack_int32(packed: np.ndarray, bits: int, dim: int,
+                 order: Optional[list] = None) -> np.ndarray:
+    """Referencia en numpy de custom_ops_fallback._unpack_int32"""
+    packed = np.asarray(packed, dtype=np.int32)
+    shifts = np.asarray(unpack_shifts(bits, order), dtype=np.int32)
+    return unpack_with_shifts(packed, shifts, bits, dim)
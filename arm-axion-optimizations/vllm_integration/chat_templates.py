@@ -0,0 +1,320 @@
+"""
+Model-native chat templating with cached prefix renders
+
+- Each expert's own tokenizer chat template (apply_chat_template) is used
+  instead of generic <|system|>/<|user|> tags, so prompts look like what the
+  model was trained on and the same conversation always renders the same way
+- Conversations are tokenized incrementally: the rendered system + history
+  prefix is cached as token ids (LRU), and each turn only tokenizes the text
+  past the longest cached prefix
+- Prompts are handed to vLLM as token ids, so identical prefixes map to
+  identical KV blocks and automatic prefix caching can reuse them
+- Models without a chat template (or templates that reject a conversation)
+  fall back to the generic tag format
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    from transformers import AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+
+Message = Dict[str, str]
+
+
+def normalize_messages(messages: Sequence[Any]) -> List[Message]:
+    """Chat messages (pydantic models or dicts) as role/content dicts"""
+    normalized = []
+    for msg in messages:
+        if isinstance(msg, dict):
+            normalized.append({'role': msg['role'], 'content': msg.get('content') or ''})
+        else:
+            normalized.append({'role': msg.role, 'content': msg.content or ''})
+    return normalized
+
+
+def format_generic_prompt(messages: Sequence[Any]) -> str:
+    """Generic tag format, for models without a chat template"""
+    prompt = ""
+    for msg in normalize_messages(messages):
+        if msg['role'] == "system":
+            prompt += f"<|system|>\n{msg['content']}\n"
+        elif msg['role'] == "user":
+            prompt += f"<|user|>\n{msg['content']}\n"
+        elif msg['role'] == "assistant":
+            prompt += f"<|assistant|>\n{msg['content']}\n"
+
+    prompt += "<|assistant|>\n"
+    return prompt
+
+
+def _merge_system_messages(messages: List[Message]) -> List[Message]:
+    """Fold system messages into the first user turn (templates without a system role)"""
+    system = "\n\n".join(m['content'] for m in messages if m['role'] == 'system')
+    rest = [dict(m) for m in messages if m['role'] != 'system']
+    if system:
+        if rest and rest[0]['role'] == 'user':
+            rest[0]['content'] = f"{system}\n\n{rest[0]['content']}"
+        else:
+            rest.insert(0, {'role': 'user', 'content': system})
+    return rest
+
+
+class ChatTemplateRenderer:
+    """
+    Renders and tokenizes conversations for one model (thread-safe)
+
+    The prefix cache is keyed by a running hash of the conversation's
+    messages. A cached prefix is only reused when the new render starts
+    with exactly the cached text and the split falls on a special-token
+    boundary, so the ids are always the same as tokenizing the whole prompt.
+    """
+
+    def __init__(self, tokenizer: Any = None, model_id: str = '', prefix_cache_size: int = 256):
+        """
+        Args:
+            tokenizer: HF tokenizer of the model (None = generic format only)
+            model_id: Expert id, for logs and stats
+            prefix_cache_size: Max cached conversation prefixes
+        """
+        self.tokenizer = tokenizer
+        self.model_id = model_id
+        self.prefix_cache_size = prefix_cache_size
+        self.has_template = bool(tokenizer is not None and getattr(tokenizer, 'chat_template', None))
+
+        self._merge_system = False
+        self._special_tokens: Tuple[str, ...] = ()
+        self._strip_bos: Optional[str] = None
+        if self.has_template:
+            self._special_tokens = self._collect_special_tokens(tokenizer)
+            self._strip_bos = self._bos_added_by_encode(tokenizer)
+
+        self._prefixes: "OrderedDict[int, Tuple[str, List[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Stats
+        self.renders = 0
+        self.prefix_hits = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def _collect_special_tokens(tokenizer) -> Tuple[str, ...]:
+        tokens = set(getattr(tokenizer, 'all_special_tokens', None) or [])
+        added = getattr(tokenizer, 'added_tokens_decoder', None) or {}
+        for token in added.values():
+            if getattr(token, 'special', False):
+                tokens.add(str(token))
+        return tuple(t for t in tokens if t)
+
+    @staticmethod
+    def _bos_added_by_encode(tokenizer) -> Optional[str]:
+        """BOS text if encode() adds it (vLLM's text path would double it)"""
+        bos_token = getattr(tokenizer, 'bos_token', None)
+        bos_token_id = getattr(tokenizer, 'bos_token_id', None)
+        if not bos_token or bos_token_id is None:
+            return None
+        try:
+            ids = tokenizer.encode("", add_special_tokens=True)
+        except Exception:
+            return None
+        return bos_token if bos_token_id in ids else None
+
+    def _apply(self, messages: List[Message], add_generation_prompt: bool) -> str:
+        if self._merge_system:
+            messages = _merge_system_messages(messages)
+        return self.tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=add_generation_prompt
+        )
+
+    def _render_native(self, messages: List[Message]) -> Optional[str]:
+        """Full prompt from the model's template, or None if it rejects the conversation"""
+        try:
+            return self._apply(messages, add_generation_prompt=True)
+        except Exception as e:
+            if not self._merge_system and any(m['role'] == 'system' for m in messages):
+                # e.g. Gemma / Mistral: "System role not supported"
+                self._merge_system = True
+                print(f"⚠️  {self.model_id}: chat template has no system role, merging into first user turn")
+                return self._render_native(messages)
+            print(f"⚠️  {self.model_id}: chat template failed ({e}), using generic format")
+            return None
+
+    def render(self, messages: Sequence[Any]) -> str:
+        """
+        Prompt text for engines that tokenize it themselves
+
+        A leading BOS is dropped when encode() would add it again.
+        """
+        msgs = normalize_messages(messages)
+        self.renders += 1
+        text = self._render_native(msgs) if self.has_template else None
+        if text is None:
+            self.fallbacks += 1
+            return format_generic_prompt(msgs)
+        if self._strip_bos and text.startswith(self._strip_bos):
+            text = text[len(self._strip_bos):]
+        return text
+
+    def _is_token_boundary(self, text: str, pos: int) -> bool:
+        """True if tokenizing text[:pos] and text[pos:] separately is exact"""
+        if pos == 0 or pos == len(text):
+            return True
+        for token in self._special_tokens:
+            if text.startswith(token, pos) or text.endswith(token, 0, pos):
+                return True
+        return False
+
+    def _encode(self, text: str) -> List[int]:
+        # Chat templates already contain the model's special tokens
+        return self.tokenizer.encode(text, add_special_tokens=False) if text else []
+
+    def _extend(self, text: str, base: Optional[Tuple[str, List[int]]]) -> Optional[List[int]]:
+        """Ids of `text` reusing `base` (a cached prefix), or None if the split is unsafe"""
+        if base is None:
+            return None
+        base_text, base_ids = base
+        if not text.startswith(base_text) or not self._is_token_boundary(text, len(base_text)):
+            return None
+        return base_ids + self._encode(text[len(base_text):])
+
+    def encode(self, messages: Sequence[Any]) -> Optional[List[int]]:
+        """
+        Prompt token ids (None when the model has no usable chat template)
+
+        Tokenizes only what is not covered by the longest cached prefix of
+        the conversation, then caches the conversation minus its last
+        message for the next turn.
+        """
+        if not self.has_template:
+            return None
+
+        msgs = normalize_messages(messages)
+        full_text = self._render_native(msgs)
+        self.renders += 1
+        if full_text is None:
+            self.fallbacks += 1
+            return None
+
+        # Running hash per prefix length: keys[i] covers msgs[:i + 1]
+        keys = []
+        key = hash(self._merge_system)
+        for msg in msgs:
+            key = hash((key, msg['role'], msg['content']))
+            keys.append(key)
+
+        history_len = len(msgs) - 1
+        base = None
+        base_len = 0
+        with self._lock:
+            for length in range(history_len, 0, -1):
+                entry = self._prefixes.get(keys[length - 1])
+                if entry is not None and full_text.startswith(entry[0]):
+                    self._prefixes.move_to_end(keys[length - 1])
+                    base, base_len = entry, length
+                    break
+
+        history = base if base_len == history_len else None
+        reused = len(base[1]) if history is not None else 0
+        if history is None and history_len > 0:
+            # Cache the history (system + earlier turns) for the next turn
+            try:
+                history_text = self._apply(msgs[:history_len], add_generation_prompt=False)
+            except Exception:
+                history_text = None
+            if history_text is not None and full_text.startswith(history_text) \
+                    and self._is_token_boundary(full_text, len(history_text)):
+                history_ids = self._extend(history_text, base)
+                if history_ids is None:
+                    history_ids = self._encode(history_text)
+                else:
+                    reused = len(base[1])
+                history = (history_text, history_ids)
+                with self._lock:
+                    self._prefixes[keys[history_len - 1]] = history
+                    while len(self._prefixes) > self.prefix_cache_size:
+                        self._prefixes.popitem(last=False)
+
+        token_ids = self._extend(full_text, history)
+        if token_ids is None:
+            token_ids = self._encode(full_text)
+        elif reused:
+            self.prefix_hits += 1
+            self.cached_prompt_tokens += reused
+
+        self.prompt_tokens += len(token_ids)
+        return token_ids
+
+    def prompt(self, messages: Sequence[Any]) -> Union[str, Dict[str, List[int]]]:
+        """vLLM prompt: {"prompt_token_ids": [...]} with a template, else generic text"""
+        token_ids = self.encode(messages)
+        if token_ids is None:
+            return format_generic_prompt(messages)
+        return {"prompt_token_ids": token_ids}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Renderer statistics"""
+        return {
+            'model_id': self.model_id,
+            'native_template': self.has_template,
+            'system_merged': self._merge_system,
+            'renders': self.renders,
+            'prefix_hits': self.prefix_hits,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_prompt_tokens': self.cached_prompt_tokens,
+            'fallbacks': self.fallbacks,
+            'cached_prefixes': len(self._prefixes)
+        }
+
+
+_renderers: Dict[str, ChatTemplateRenderer] = {}
+_renderers_lock = threading.Lock()
+
+
+def get_chat_renderer(
+    model_id: str,
+    tokenizer: Any = None,
+    model_path: Optional[str] = None,
+    trust_remote_code: bool = False
+) -> ChatTemplateRenderer:
+    """
+    Shared renderer per model
+
+    The template is loaded once: from `tokenizer` (e.g. the vLLM engine's)
+    or, failing that, from the tokenizer files at `model_path`. Passing a
+    tokenizer later replaces a renderer that had none.
+    """
+    with _renderers_lock:
+        renderer = _renderers.get(model_id)
+        if renderer is not None and (tokenizer is None or renderer.tokenizer is not None):
+            return renderer
+
+    if tokenizer is None and model_path and TRANSFORMERS_AVAILABLE:
+        try:
+            tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=trust_remote_code)
+        except Exception as e:
+            print(f"⚠️  Tokenizer for {model_id} unavailable ({e}), using generic chat format")
+
+    renderer = ChatTemplateRenderer(tokenizer, model_id)
+    if renderer.has_template:
+        print(f"✅ Chat template loaded for {model_id}")
+
+    with _renderers_lock:
+        existing = _renderers.get(model_id)
+        if existing is not None and (existing.tokenizer is not None or tokenizer is None):
+            return existing
+        _renderers[model_id] = renderer
+        return renderer
+
+
+def get_renderer_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats of every shared renderer, by model id"""
+    with _renderers_lock:
+        renderers = list(_renderers.values())
+    return {renderer.model_id: renderer.get_stats() for renderer in renderers}
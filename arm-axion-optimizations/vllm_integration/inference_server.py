@@ -31,8 +31,10 @@ from vllm_integration.vllm_axion_backend import (
 )
 from vllm_integration.livemind_orchestrator import (
     LiveMindOrchestrator,
-    GenerationRequest
+    GenerationRequest,
+    ClientDisconnected
 )
+from vllm_integration.stream_emitter import SSEChunkTemplate, StreamEmitter, text_deltas
 
 # FastAPI app
 app = FastAPI(
@@ -230,7 +232,7 @@ async def list_experts():
 
 # OpenAI-compatible completions endpoint
 @app.post("/v1/completions")
-async def completions(request: CompletionRequest):
+async def completions(request: CompletionRequest, http_request: Request):
     """
     OpenAI-compatible completions endpoint
 
@@ -246,44 +248,17 @@ async def completions(request: CompletionRequest):
         max_tokens=request.max_tokens,
         temperature=request.temperature,
         top_p=request.top_p,
-        stream=request.stream
+        stream=request.stream,
+        is_disconnected=http_request.is_disconnected
     )
 
     if request.stream:
         # Streaming response
         async def generate_stream():
-            async for token in orchestrator.generate_streaming(gen_request):
-                chunk = {
-                    "id": gen_request.request_id,
-                    "object": "text_completion.chunk",
-                    "created": int(time.time()),
-                    "model": request.model,
-                    "choices": [
-                        {
-                            "text": token,
-                            "index": 0,
-                            "finish_reason": None
-                        }
-                    ]
-                }
-                yield f"data: {json.dumps(chunk)}\n\n"
-
-            # Final chunk
-            final_chunk = {
-                "id": gen_request.request_id,
-                "object": "text_completion.chunk",
-                "created": int(time.time()),
-                "model": request.model,
-                "choices": [
-                    {
-                        "text": "",
-                        "index": 0,
-                        "finish_reason": "stop"
-                    }
-                ]
-            }
-            yield f"data: {json.dumps(final_chunk)}\n\n"
-            yield "data: [DONE]\n\n"
+            # Preformatted, coalesced chunks (see stream_emitter)
+            emitter = StreamEmitter(SSEChunkTemplate.completion(gen_request.request_id, request.model))
+            async for frame in emitter.frames(text_deltas(orchestrator.generate_streaming(gen_request))):
+                yield frame
 
         return StreamingResponse(
             generate_stream(),
@@ -291,8 +266,11 @@ async def completions(request: CompletionRequest):
         )
 
     else:
-        # Non-streaming response
-        result = await orchestrator.generate(gen_request)
+        # Non-streaming response (generation is aborted if the client leaves)
+        try:
+            result = await orchestrator.generate(gen_request)
+        except ClientDisconnected:
+            raise HTTPException(status_code=499, detail="Client disconnected")
 
         response = CompletionResponse(
             id=gen_request.request_id,
@@ -317,7 +295,7 @@ async def completions(request: CompletionRequest):
 
 # OpenAI-compatible chat completions endpoint
 @app.post("/v1/chat/completions")
-async def chat_completions(request: ChatCompletionRequest):
+async def chat_completions(request: ChatCompletionRequest, http_request: Request):
     """
     OpenAI-compatible chat completions endpoint
 
@@ -354,44 +332,17 @@ async def chat_completions(request: ChatCompletionRequest):
         temperature=request.temperature,
         top_p=request.top_p,
         stream=request.stream,
-        expert_id=expert_id
+        expert_id=expert_id,
+        is_disconnected=http_request.is_disconnected
     )
 
     if request.stream:
         # Streaming response
         async def generate_stream():
-            async for token in orchestrator.generate_streaming(gen_request):
-                chunk = {
-                    "id": gen_request.request_id,
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": request.model,
-                    "choices": [
-                        {
-                            "delta": {"content": token},
-                            "index": 0,
-                            "finish_reason": None
-                        }
-                    ]
-                }
-                yield f"data: {json.dumps(chunk)}\n\n"
-
-            # Final chunk
-            final_chunk = {
-                "id": gen_request.request_id,
-                "object": "chat.completion.chunk",
-                "created": int(time.time()),
-                "model": request.model,
-                "choices": [
-                    {
-                        "delta": {},
-                        "index": 0,
-                        "finish_reason": "stop"
-                    }
-                ]
-            }
-            yield f"data: {json.dumps(final_chunk)}\n\n"
-            yield "data: [DONE]\n\n"
+            # Preformatted, coalesced chunks (see stream_emitter)
+            emitter = StreamEmitter(SSEChunkTemplate.chat(gen_request.request_id, request.model))
+            async for frame in emitter.frames(text_deltas(orchestrator.generate_streaming(gen_request))):
+                yield frame
 
         return StreamingResponse(
             generate_stream(),
@@ -399,8 +350,11 @@ async def chat_completions(request: ChatCompletionRequest):
         )
 
     else:
-        # Non-streaming response
-        result = await orchestrator.generate(gen_request)
+        # Non-streaming response (generation is aborted if the client leaves)
+        try:
+            result = await orchestrator.generate(gen_request)
+        except ClientDisconnected:
+            raise HTTPException(status_code=499, detail="Client disconnected")
 
         response = ChatCompletionResponse(
             id=gen_request.request_id,
@@ -0,0 +1,110 @@
+"""
+Fixed-memory streaming latency histogram
+
+HDR-style log-spaced buckets: every recorded value is counted in the bucket
+covering it, so memory is constant no matter how many requests are served
+and percentiles carry a bounded relative error (~1% by default).
+"""
+
+import math
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """
+    Streaming histogram for latencies in seconds
+
+    Values below `min_value` land in the first bucket and values above
+    `max_value` in the last one; exact min/max/mean are tracked separately.
+    """
+
+    def __init__(
+        self,
+        min_value: float = 1e-4,
+        max_value: float = 3600.0,
+        relative_error: float = 0.01
+    ):
+        """
+        Args:
+            min_value: Smallest value resolved (seconds)
+            max_value: Largest value resolved (seconds)
+            relative_error: Max relative error of reported percentiles
+        """
+        self.min_value = min_value
+        self.max_value = max_value
+        self._growth = 1.0 + 2.0 * relative_error
+        self._log_growth = math.log(self._growth)
+        self._log_min = math.log(min_value)
+
+        num_buckets = int(math.ceil((math.log(max_value) - self._log_min) / self._log_growth)) + 1
+        self._counts = np.zeros(num_buckets, dtype=np.int64)
+
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        index = int((math.log(value) - self._log_min) / self._log_growth)
+        return min(index, len(self._counts) - 1)
+
+    def _bucket_value(self, index: int) -> float:
+        """Representative value of a bucket (geometric midpoint)"""
+        lower = math.exp(self._log_min + index * self._log_growth)
+        return lower * math.sqrt(self._growth)
+
+    def record(self, value: float):
+        """Record one observation"""
+        if value is None or value < 0:
+            return
+        value = float(value)
+
+        with self._lock:
+            self._counts[self._bucket(value)] += 1
+            self.count += 1
+            self.total += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Approximate p-th percentile (0-100), None if empty"""
+        with self._lock:
+            if self.count == 0:
+                return None
+
+            rank = max(1, int(math.ceil(p / 100.0 * self.count)))
+            index = int(np.searchsorted(np.cumsum(self._counts), rank))
+            value = self._bucket_value(index)
+            return min(max(value, self.min), self.max)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Summary stats (count, mean, min, max, p50, p95, p99)"""
+        if self.count == 0:
+            return {'count': 0}
+
+        p50 = self.percentile(50)
+        return {
+            'count': self.count,
+            'mean': self.total / self.count,
+            'median': p50,
+            'p50': p50,
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'min': self.min,
+            'max': self.max
+        }
+
+    def reset(self):
+        """Drop all observations"""
+        with self._lock:
+            self._counts[:] = 0
+            self.count = 0
+            self.total = 0.0
+            self.min = math.inf
+            self.max = 0.0
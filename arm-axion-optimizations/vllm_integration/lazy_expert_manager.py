@@ -4,8 +4,12 @@ Gestiona carga/descarga dinámica de expertos vLLM para optimizar memoria
 
 Features:
 - Lazy loading: Solo carga expertos cuando se necesitan
-- LRU eviction: Descarga expertos menos usados cuando memoria es alta
-- Priority-based loading: Expertos más probables se cargan primero
+- Single-flight: Peticiones concurrentes al mismo experto esperan una única carga
+- Carga en worker: El event loop nunca se bloquea construyendo un engine
+- Prefetch predictivo: El top-k del router precarga expertos probables, en
+  su propio hilo para no retrasar cargas bajo demanda
+- Eviction por coste: Pondera probabilidad predicha, recencia y coste de recarga
+- Nunca se descarga un experto con peticiones en curso
 - Memory monitoring: Track de uso de memoria en tiempo real
 - Warmup pool: Mantiene N expertos más comunes siempre cargados
 """
@@ -15,6 +19,8 @@ from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, field
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import math
 import time
 import threading
 import psutil
@@ -46,6 +52,7 @@ class ExpertState:
     total_requests: int = 0
     total_load_time_s: float = 0.0
     load_count: int = 0
+    predicted_probability: float = 0.0  # EWMA of router probability
 
     # Memory estimation
     estimated_memory_gb: float = 0.0
@@ -67,11 +74,20 @@ class LazyExpertManager:
 
     Strategy:
     1. Start with warmup_pool_size experts loaded (highest priority)
-    2. Load other experts on-demand when requested
-    3. Unload LRU experts when memory usage > memory_threshold
+    2. Load other experts on-demand (or prefetch them from router hints)
+       in a worker thread, one in-flight load per expert
+    3. When memory usage > memory_threshold or the pool is full, evict the
+       expert that is cheapest to lose: low predicted probability, idle,
+       fast to reload and large in memory
     4. Track usage stats to optimize future loading decisions
     """
 
+    PROBABILITY_EWMA_ALPHA = 0.3
+    DEFAULT_LOAD_TIME_S = 30.0  # Assumed reload cost before the first measurement
+    # An engine handed out by get_expert this recently counts as busy even
+    # before its caller submits a request
+    BUSY_GRACE_S = 5.0
+
     def __init__(
         self,
         expert_configs: List[Dict[str, Any]],
@@ -79,7 +95,9 @@ class LazyExpertManager:
         max_loaded_experts: int = 4,
         memory_threshold: float = 0.80,  # Unload when >80% memory used
         auto_unload_after_s: float = 300.0,  # Auto-unload after 5min idle
-        enable_auto_unload: bool = True
+        enable_auto_unload: bool = True,
+        prefetch_threshold: float = 0.3,
+        max_concurrent_loads: int = 1
     ):
         """
         Args:
@@ -89,6 +107,9 @@ class LazyExpertManager:
             memory_threshold: Unload LRU when memory > this (0-1)
             auto_unload_after_s: Auto-unload after this many seconds idle
             enable_auto_unload: Enable automatic unloading of idle experts
+            prefetch_threshold: Min router probability to prefetch an expert
+            max_concurrent_loads: Worker threads for on-demand loads
+                (prefetches run on one separate thread)
         """
         if not VLLM_AVAILABLE:
             raise ImportError("vLLM not installed. Install: pip install vllm")
@@ -98,6 +119,7 @@ class LazyExpertManager:
         self.memory_threshold = memory_threshold
         self.auto_unload_after_s = auto_unload_after_s
         self.enable_auto_unload = enable_auto_unload
+        self.prefetch_threshold = prefetch_threshold
 
         # Initialize expert states
         self.experts: Dict[str, ExpertState] = {}
@@ -109,15 +131,34 @@ class LazyExpertManager:
         # Memory tracking
         self.system_memory_gb = psutil.virtual_memory().total / (1024**3)
 
-        # Lock for thread safety
+        # Lock for thread safety (bookkeeping only, never held while loading)
         self.lock = threading.Lock()
 
+        # Single-flight loads: expert_id -> Future[bool] of the in-flight load
+        self._loading: Dict[str, Future] = {}
+        self._prefetch_loads = set()  # Expert IDs whose in-flight load is a prefetch
+        # Loads that made room and are building their engine: expert_id -> GB.
+        # They count against the pool and memory limits until they finish
+        self._reserved: Dict[str, float] = {}
+        self._load_executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_loads,
+            thread_name_prefix="expert-loader"
+        )
+        # Separate slot: on-demand loads never queue behind speculative ones
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="expert-prefetch"
+        )
+
         # Stats
         self.total_loads = 0
         self.total_unloads = 0
         self.total_evictions = 0
         self.cache_hits = 0  # Expert already loaded
         self.cache_misses = 0  # Had to load expert
+        self.total_prefetches = 0
+        self.promoted_prefetches = 0  # Queued prefetches taken over by a request
+        self.single_flight_waits = 0  # Requests that joined an in-flight load
 
         print(f"✅ LazyExpertManager initialized")
         print(f"   Total experts: {len(self.experts)}")
@@ -149,6 +190,7 @@ class LazyExpertManager:
                 max_num_seqs=config_dict.get('max_num_seqs', 128),
                 enable_neon=config_dict.get('enable_neon', True),
                 enable_chunked_prefill=config_dict.get('enable_chunked_prefill', True),
+                max_concurrent_generations=config_dict.get('max_concurrent_generations', 4),
             )
 
             # Estimate memory based on quantization
@@ -245,6 +287,9 @@ class LazyExpertManager:
         """
         Get expert engine, loading if necessary
 
+        Cold loads run in a worker thread; concurrent requests for the same
+        expert wait on the same load.
+
         Args:
             expert_id: Expert identifier
             predicted_probability: Routing probability (for eviction decisions)
@@ -262,6 +307,7 @@ class LazyExpertManager:
             # Update last used time
             expert_state.last_used = time.time()
             expert_state.total_requests += 1
+            self._observe_probability(expert_state, predicted_probability)
 
             # Update LRU order
             if expert_id in self.lru_order:
@@ -274,31 +320,159 @@ class LazyExpertManager:
             if expert_state.is_loaded and expert_state.engine:
                 return expert_state.engine
 
-            # Need to load - check memory first
-            mem_stats = self._get_memory_stats()
+            if expert_id in self._loading:
+                self.single_flight_waits += 1
+            else:
+                print(f"📥 Loading expert {expert_id} (prob: {predicted_probability:.2f})...")
+            future = self._start_load(expert_id)
+            joined_prefetch = expert_id in self._prefetch_loads
+
+        # shield: a cancelled waiter must not cancel the shared load
+        success = await asyncio.shield(asyncio.wrap_future(future))
+
+        if not success and joined_prefetch:
+            # The prefetch we joined gave up (it may not evict likelier
+            # experts); a request needs the expert, so load it on demand
+            with self.lock:
+                if expert_state.is_loaded and expert_state.engine:
+                    return expert_state.engine
+                print(f"📥 Loading expert {expert_id} on demand (prefetch skipped)...")
+                future = self._start_load(expert_id)
+            success = await asyncio.shield(asyncio.wrap_future(future))
+
+        if success:
+            return expert_state.engine
+        else:
+            return None
 
-            # If memory is tight and we're at max loaded, evict LRU
-            if (mem_stats.percent_used / 100 > self.memory_threshold or
-                self._get_loaded_count() >= self.max_loaded_experts):
+    def prefetch(self, expert_ids: List[str], probabilities: List[float]) -> List[str]:
+        """
+        Predictive prefetch from the router's top-k (non-blocking)
 
-                # Evict LRU expert (but not from warmup pool)
-                evicted = self._evict_lru_expert()
-                if evicted:
-                    print(f"♻️  Evicted {evicted} to make room for {expert_id}")
+        Updates each expert's predicted probability and starts background
+        loads for likely experts that are not loaded yet. A prefetch never
+        evicts an expert that is at least as likely as the one it loads.
 
-            # Load expert
-            print(f"📥 Loading expert {expert_id} (prob: {predicted_probability:.2f})...")
-            success = self._load_expert(expert_id)
+        Args:
+            expert_ids: Top-k expert IDs from the router
+            probabilities: Their routing probabilities
 
-            if success:
-                return expert_state.engine
+        Returns:
+            Expert IDs whose load was started
+        """
+        started = []
+        hinted = dict(zip(expert_ids, probabilities))
+
+        with self.lock:
+            for expert_id, expert_state in self.experts.items():
+                self._observe_probability(expert_state, hinted.get(expert_id, 0.0))
+
+            for expert_id, probability in hinted.items():
+                expert_state = self.experts.get(expert_id)
+                if (expert_state is None or probability < self.prefetch_threshold or
+                        expert_state.is_loaded or expert_id in self._loading):
+                    continue
+
+                self._start_load(expert_id, prefetch=True)
+                self.total_prefetches += 1
+                started.append(expert_id)
+
+        for expert_id in started:
+            print(f"🔮 Prefetching expert {expert_id} (prob: {hinted[expert_id]:.2f})")
+
+        return started
+
+    def _observe_probability(self, expert_state: ExpertState, probability: float):
+        """Fold a routing probability into the expert's EWMA (lock held)"""
+        alpha = self.PROBABILITY_EWMA_ALPHA
+        expert_state.predicted_probability = (
+            (1 - alpha) * expert_state.predicted_probability + alpha * probability
+        )
+
+    def _start_load(self, expert_id: str, prefetch: bool = False) -> Future:
+        """Return the in-flight load for an expert, submitting one if needed (lock held)"""
+        future = self._loading.get(expert_id)
+        if (future is not None and not prefetch and expert_id in self._prefetch_loads
+                and future.cancel()):
+            # Prefetch still queued behind other prefetches: load it on demand
+            self.promoted_prefetches += 1
+            future = None
+
+        if future is None:
+            executor = self._prefetch_executor if prefetch else self._load_executor
+            future = executor.submit(self._load_worker, expert_id, prefetch)
+            self._loading[expert_id] = future
+            if prefetch:
+                self._prefetch_loads.add(expert_id)
             else:
-                return None
+                self._prefetch_loads.discard(expert_id)
+        return future
+
+    def _load_worker(self, expert_id: str, prefetch: bool) -> bool:
+        """Make room and load an expert (runs in the loader thread)"""
+        try:
+            with self.lock:
+                if self.experts[expert_id].is_loaded:
+                    return True
+                if not self._make_room(expert_id, prefetch=prefetch):
+                    print(f"⏭️  Prefetch of {expert_id} skipped (no expert cheap enough to evict)")
+                    return False
+                # Hold the slot and memory while the engine is built unlocked
+                self._reserved[expert_id] = self.experts[expert_id].estimated_memory_gb
+
+            return self._load_expert(expert_id)
+        finally:
+            with self.lock:
+                self._loading.pop(expert_id, None)
+                self._prefetch_loads.discard(expert_id)
+                self._reserved.pop(expert_id, None)
+
+    def _make_room(self, expert_id: str, prefetch: bool = False) -> bool:
+        """
+        Evict experts until `expert_id` fits (lock held)
+
+        Loads still building their engine count as loaded. Memory is polled
+        once: each eviction is credited with the victim's accounted memory,
+        since RSS does not drop the moment an engine is released.
+
+        Returns:
+            False if room is needed but a prefetch may not evict anyone
+        """
+        max_probability = self.experts[expert_id].predicted_probability if prefetch else None
+
+        # One slot for this expert
+        while self._get_loaded_count() + len(self._reserved) >= self.max_loaded_experts:
+            evicted = self._evict_expert(exclude=expert_id, max_probability=max_probability)
+            if not evicted:
+                # Nothing evictable: on-demand loads proceed anyway (as before)
+                return not prefetch
+            print(f"♻️  Evicted {evicted} to make room for {expert_id}")
+
+        # Memory for this expert
+        excess_gb = self._memory_excess_gb(expert_id)
+        while excess_gb > 0:
+            evicted = self._evict_expert(exclude=expert_id, max_probability=max_probability)
+            if not evicted:
+                return not prefetch
+            excess_gb -= self.experts[evicted].estimated_memory_gb
+            print(f"♻️  Evicted {evicted} to free memory for {expert_id}")
+
+        return True
+
+    def _memory_excess_gb(self, expert_id: str) -> float:
+        """GB over memory_threshold once `expert_id` and in-flight loads are in (lock held)"""
+        mem_stats = self._get_memory_stats()
+        incoming_gb = sum(self._reserved.values()) + self.experts[expert_id].estimated_memory_gb
+        limit_gb = self.memory_threshold * mem_stats.total_gb
+        return mem_stats.total_gb * mem_stats.percent_used / 100 + incoming_gb - limit_gb
 
     def _load_expert(self, expert_id: str) -> bool:
         """
         Load expert engine
 
+        Must be called without holding self.lock: building the engine can
+        take tens of seconds and only the bookkeeping is locked.
+
         Returns:
             True if loaded successfully
         """
@@ -318,19 +492,25 @@ class LazyExpertManager:
 
             load_time = time.time() - start_time
 
-            # Update state
-            expert_state.engine = engine
-            expert_state.is_loaded = True
-            expert_state.last_used = time.time()
-            expert_state.total_load_time_s += load_time
-            expert_state.load_count += 1
-
-            # Add to LRU
-            self.lru_order[expert_id] = True
-            self.lru_order.move_to_end(expert_id)
+            with self.lock:
+                # Update state
+                expert_state.engine = engine
+                expert_state.is_loaded = True
+                self._reserved.pop(expert_id, None)
+                # One engine per model now serves batch and streaming, so its
+                # own weights + KV cache accounting replaces the heuristic
+                if engine.memory_gb is not None:
+                    expert_state.estimated_memory_gb = engine.memory_gb
+                expert_state.last_used = time.time()
+                expert_state.total_load_time_s += load_time
+                expert_state.load_count += 1
+
+                # Add to LRU
+                self.lru_order[expert_id] = True
+                self.lru_order.move_to_end(expert_id)
 
-            # Stats
-            self.total_loads += 1
+                # Stats
+                self.total_loads += 1
 
             print(f"✅ Expert {expert_id} loaded in {load_time:.1f}s")
             return True
@@ -358,8 +538,14 @@ class LazyExpertManager:
         if not expert_state.is_loaded:
             return False
 
+        if self._is_busy(expert_state):
+            # shutdown() would fail its in-flight requests
+            return False
+
         try:
-            # Delete engine (vLLM will cleanup)
+            # Stop the engine thread, then drop the engine (vLLM will cleanup)
+            if expert_state.engine is not None:
+                expert_state.engine.shutdown()
             expert_state.engine = None
             expert_state.is_loaded = False
 
@@ -379,11 +565,45 @@ class LazyExpertManager:
             print(f"⚠️  Error unloading {expert_id}: {e}")
             return False
 
-    def _evict_lru_expert(self) -> Optional[str]:
+    def _is_busy(self, expert_state: ExpertState, now: Optional[float] = None) -> bool:
+        """True if the expert has requests in flight or was just handed out (lock held)"""
+        now = time.time() if now is None else now
+        if now - expert_state.last_used < self.BUSY_GRACE_S:
+            return True
+        engine = expert_state.engine
+        return engine is not None and engine.in_flight_requests > 0
+
+    def _retention_score(self, expert_state: ExpertState, now: float) -> float:
         """
-        Evict least recently used expert
+        Expected cost of evicting an expert (lower = better victim)
 
-        Will not evict from warmup pool
+        Likelihood of being needed soon (predicted probability and recency)
+        times the seconds it takes to reload, per GB it occupies.
+        """
+        idle_s = max(now - expert_state.last_used, 0.0)
+        recency = math.exp(-idle_s / max(self.auto_unload_after_s, 1.0))
+        likelihood = 0.5 * expert_state.predicted_probability + 0.5 * recency
+
+        load_cost_s = (
+            expert_state.total_load_time_s / expert_state.load_count
+            if expert_state.load_count > 0 else self.DEFAULT_LOAD_TIME_S
+        )
+
+        return likelihood * load_cost_s / max(expert_state.estimated_memory_gb, 0.1)
+
+    def _evict_expert(
+        self,
+        exclude: Optional[str] = None,
+        max_probability: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        Evict the loaded expert with the lowest retention score
+
+        Will not evict from warmup pool, nor experts with requests in flight
+
+        Args:
+            exclude: Expert that must not be evicted (the one being loaded)
+            max_probability: Only evict experts less likely than this (prefetch)
 
         Returns:
             Expert ID that was evicted, or None
@@ -393,16 +613,24 @@ class LazyExpertManager:
 
         # Get warmup expert IDs (protected from eviction)
         warmup_ids = set(list(self.experts.keys())[:self.warmup_pool_size])
+        now = time.time()
+
+        # LRU order breaks ties between equal scores
+        candidates = [
+            expert_id for expert_id in self.lru_order
+            if expert_id not in warmup_ids and expert_id != exclude and (
+                max_probability is None or
+                self.experts[expert_id].predicted_probability < max_probability
+            ) and not self._is_busy(self.experts[expert_id], now)
+        ]
+        if not candidates:
+            # All loaded experts are protected or busy - can't evict
+            return None
 
-        # Find LRU expert not in warmup pool
-        for expert_id in self.lru_order:
-            if expert_id not in warmup_ids:
-                # Evict this one
-                success = self._unload_expert(expert_id, is_eviction=True)
-                if success:
-                    return expert_id
+        victim = min(candidates, key=lambda e: self._retention_score(self.experts[e], now))
+        if self._unload_expert(victim, is_eviction=True):
+            return victim
 
-        # All loaded experts are in warmup pool - can't evict
         return None
 
     def _get_loaded_count(self) -> int:
@@ -447,9 +675,9 @@ class LazyExpertManager:
                         if not expert_state.is_loaded:
                             continue
 
-                        # Check if idle for too long
+                        # Check if idle for too long (long streams keep it busy)
                         idle_time = current_time - expert_state.last_used
-                        if idle_time > self.auto_unload_after_s:
+                        if idle_time > self.auto_unload_after_s and not self._is_busy(expert_state):
                             print(f"⏰ Auto-unloading idle expert {expert_id} (idle {idle_time:.0f}s)")
                             self._unload_expert(expert_id, is_eviction=False)
 
@@ -477,6 +705,8 @@ class LazyExpertManager:
                     if expert_state.load_count > 0 else 0
                 ),
                 'estimated_memory_gb': expert_state.estimated_memory_gb,
+                'predicted_probability': expert_state.predicted_probability,
+                'is_loading': expert_id in self._loading,
                 'idle_time_s': time.time() - expert_state.last_used if expert_state.last_used > 0 else 0
             })
 
@@ -493,6 +723,10 @@ class LazyExpertManager:
             'cache_hits': self.cache_hits,
             'cache_misses': self.cache_misses,
             'cache_hit_rate': cache_hit_rate,
+            'total_prefetches': self.total_prefetches,
+            'promoted_prefetches': self.promoted_prefetches,
+            'single_flight_waits': self.single_flight_waits,
+            'loading_experts': list(self._loading.keys()),
             'memory': {
                 'total_gb': mem_stats.total_gb,
                 'used_gb': mem_stats.used_gb,
@@ -12,10 +12,11 @@ Combines:
 
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Any, AsyncIterator
+from typing import Dict, List, Optional, Any, AsyncIterator, Awaitable, Callable
 from dataclasses import dataclass
 import asyncio
 import time
+from collections import Counter
 import numpy as np
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -38,6 +39,7 @@ from vllm_integration.speculative_router import (
     SpeculativeRouter,
     SpeculativeDecision
 )
+from vllm_integration.latency_histogram import LatencyHistogram
 
 try:
     from vllm import SamplingParams
@@ -68,6 +70,8 @@ class GenerationRequest:
     stream: bool = True
     created_at: float = 0.0
     expert_id: Optional[str] = None  # Specific expert to use (bypasses routing)
+    # Async check for a gone client (e.g. Starlette's Request.is_disconnected)
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
 
 
 @dataclass
@@ -80,6 +84,49 @@ class GenerationResult:
     time_to_first_token: float
     total_time: float
     chunks_processed: int
+    consensus_strategy: Optional[str] = None  # early_exit, agreement, synthesis, top_expert
+
+
+class ClientDisconnected(Exception):
+    """The client went away before generation finished"""
+
+
+DISCONNECT_POLL_INTERVAL_S = 0.5
+
+
+async def run_until_disconnected(
+    awaitable: Awaitable,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]],
+    poll_interval_s: float = DISCONNECT_POLL_INTERVAL_S
+):
+    """
+    Await `awaitable` as a task, cancelling it if the client disconnects
+
+    Cancelling the task reaches generate_async(), which aborts the vLLM
+    requests so their KV blocks are freed instead of finishing for nobody.
+
+    Raises:
+        ClientDisconnected: If `is_disconnected()` turned true first
+    """
+    if is_disconnected is None:
+        return await awaitable
+
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval_s)
+            if done:
+                return task.result()
+            if await is_disconnected():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
 
 
 class ChunkedTokenizer:
@@ -193,7 +240,11 @@ class LiveMindOrchestrator:
         use_fast_classifier: bool = True,
         enable_rag: bool = True,
         rag_bridge_url: str = "http://localhost:8001",
-        rag_collection: str = "capibara_docs"
+        rag_collection: str = "capibara_docs",
+        consensus_quorum: int = 2,
+        consensus_agreement_threshold: float = 0.85,
+        consensus_similarity: str = "embedding",
+        consensus_prefix_tokens: int = 32
     ):
         """
         Args:
@@ -206,10 +257,19 @@ class LiveMindOrchestrator:
             enable_rag: Enable RAG parallel fetching
             rag_bridge_url: URL for RAG bridge API
             rag_collection: Milvus collection name
+            consensus_quorum: Agreeing experts needed to stop early
+            consensus_agreement_threshold: Similarity at which two answers agree
+            consensus_similarity: "embedding" (cosine) or "token" (word overlap)
+            consensus_prefix_tokens: Streamed tokens between agreement checks
+                (and minimum prefix an expert needs before it is compared)
         """
         self.expert_system = expert_system
         self.enable_consensus = enable_consensus
         self.chunk_size = chunk_size
+        self.consensus_quorum = max(1, consensus_quorum)
+        self.consensus_agreement_threshold = consensus_agreement_threshold
+        self.consensus_similarity = consensus_similarity
+        self.consensus_prefix_tokens = max(1, consensus_prefix_tokens)
 
         # Chunking
         self.chunker = ChunkedTokenizer(chunk_size=chunk_size)
@@ -264,10 +324,11 @@ class LiveMindOrchestrator:
         else:
             self.consensus_engine = None
 
-        # Metrics
+        # Metrics (fixed-memory histograms, no raw samples kept)
         self.total_requests = 0
-        self.total_ttft = []
-        self.total_latency = []
+        self.ttft_histogram = LatencyHistogram()
+        self.latency_histogram = LatencyHistogram()
+        self.consensus_strategies = Counter()
 
         print(f"✅ LiveMind Orchestrator initialized")
         print(f"   Experts: {len(expert_system.experts)}")
@@ -331,6 +392,12 @@ class LiveMindOrchestrator:
                 chunk.text
             )
 
+            # Start loading likely experts while routing continues
+            self.expert_system.prefetch_experts(
+                routing_prediction.expert_ids,
+                routing_prediction.probabilities
+            )
+
             # Can we route?
             if routing_prediction.can_route:
                 ttft = time.time() - start_time
@@ -342,6 +409,9 @@ class LiveMindOrchestrator:
             routing_prediction = self.router.finalize_routing(request.request_id)
             ttft = time.time() - start_time
 
+        # Routing decided: the per-request router state is no longer needed
+        self.router.release_request(request.request_id)
+
         # Wait for RAG fetch to complete (if started)
         is_rag_query = False
         rag_context = None
@@ -357,11 +427,10 @@ class LiveMindOrchestrator:
         expert_probs = routing_prediction.probabilities
 
         if self.enable_consensus and len(expert_ids) > 1:
-            # Multi-expert consensus
-            result = await self._generate_consensus(
-                request,
-                expert_ids,
-                routing_prediction
+            # Multi-expert consensus (cancelling it cancels every expert)
+            result = await run_until_disconnected(
+                self._generate_consensus(request, expert_ids, routing_prediction),
+                request.is_disconnected
             )
         else:
             # Single expert (pass probability for lazy loading priority)
@@ -378,8 +447,8 @@ class LiveMindOrchestrator:
         result.chunks_processed = routing_prediction.chunks_processed
 
         self.total_requests += 1
-        self.total_ttft.append(ttft)
-        self.total_latency.append(total_time)
+        self.ttft_histogram.record(ttft)
+        self.latency_histogram.record(total_time)
 
         return result
 
@@ -411,8 +480,12 @@ class LiveMindOrchestrator:
             max_tokens=request.max_tokens
         )
 
-        # Generate
-        results = expert.generate([full_prompt], sampling_params)
+        # Generate off the event loop; cancelled (and aborted in vLLM) if the
+        # caller is cancelled or the client disconnects
+        results = await run_until_disconnected(
+            expert.generate_async([full_prompt], sampling_params),
+            request.is_disconnected
+        )
 
         return GenerationResult(
             request_id=request.request_id,
@@ -431,7 +504,15 @@ class LiveMindOrchestrator:
         routing_prediction: RoutingPrediction
     ) -> GenerationResult:
         """
-        Generate from multiple experts and create consensus
+        Generate from multiple experts with speculative early exit
+
+        Experts stream concurrently on their engines and their partial
+        answers are compared every `consensus_prefix_tokens` tokens. As soon
+        as `consensus_quorum` prefixes agree, the disagreeing experts are
+        aborted and the most probable agreeing expert runs to completion,
+        with no synthesis pass; the other agreeing experts keep running as
+        fallbacks until it finishes. Only divergent answers go to the
+        consensus engine.
 
         Args:
             request: Generation request
@@ -439,30 +520,140 @@ class LiveMindOrchestrator:
             routing_prediction: Routing prediction
 
         Returns:
-            Consensus result
+            Consensus result (consensus_strategy says which path was taken)
         """
-        # Generate from all experts in parallel
-        expert_results = await self.expert_system.generate_parallel(
-            request.prompt,
-            expert_ids,
-            SamplingParams(
-                temperature=request.temperature,
-                top_p=request.top_p,
-                max_tokens=request.max_tokens
-            )
+        sampling_params = SamplingParams(
+            temperature=request.temperature,
+            top_p=request.top_p,
+            max_tokens=request.max_tokens
         )
+        probabilities = dict(zip(routing_prediction.expert_ids, routing_prediction.probabilities))
+
+        # Load all experts concurrently (lazy loads overlap)
+        experts = await asyncio.gather(*(
+            self.expert_system.get_expert(
+                expert_id,
+                predicted_probability=probabilities.get(expert_id, 1.0)
+            )
+            for expert_id in expert_ids
+        ), return_exceptions=True)
+
+        # Stream from every expert; progress events go through one queue
+        progress: asyncio.Queue = asyncio.Queue()
+        streams: Dict[str, Dict[str, Any]] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        for expert_id, expert in zip(expert_ids, experts):
+            if isinstance(expert, BaseException):
+                print(f"⚠️  [{request.request_id}] Expert {expert_id} failed to load: {expert}")
+                continue
+            if expert:
+                streams[expert_id] = {'text': '', 'tokens': 0, 'finished': False}
+                tasks[expert_id] = asyncio.create_task(self._stream_expert(
+                    expert, request.prompt, sampling_params, streams[expert_id], expert_id, progress
+                ))
+
+        if not tasks:
+            raise ValueError(f"No experts available: {expert_ids}")
+
+        quorum = min(self.consensus_quorum, len(tasks))
+        agreeing = None
+        running = set(tasks)
+        failed = set()
+        unchecked_tokens = 0
+
+        try:
+            while running and agreeing is None:
+                expert_id, error = await progress.get()
+                if error is not None:
+                    print(f"⚠️  [{request.request_id}] Expert {expert_id} failed: {error}")
+                    failed.add(expert_id)
+                if streams[expert_id]['finished'] or error is not None:
+                    running.discard(expert_id)
+                else:
+                    # Compare prefixes every consensus_prefix_tokens tokens,
+                    # and whenever an expert finishes or fails
+                    unchecked_tokens += 1
+                    if unchecked_tokens < self.consensus_prefix_tokens:
+                        continue
+                unchecked_tokens = 0
+
+                candidates = [
+                    {'expert_id': eid, 'result': state}
+                    for eid, state in streams.items()
+                    if eid not in failed and (
+                        state['finished'] or state['tokens'] >= self.consensus_prefix_tokens
+                    )
+                ]
+                agreeing = await self._find_agreement(candidates, quorum, partial=bool(running))
+
+            stopped = []
+            if agreeing is not None:
+                # Abort the experts that disagree; agreeing ones keep running
+                # as fallbacks until the most probable of them finishes
+                agreeing_ids = {r['expert_id'] for r in agreeing}
+                stopped = [eid for eid in running if eid not in agreeing_ids]
+                for eid in stopped:
+                    tasks[eid].cancel()
+                    running.discard(eid)
+
+                best = None
+                for r in sorted(agreeing, key=lambda a: probabilities.get(a['expert_id'], 0.0),
+                                reverse=True):
+                    eid = r['expert_id']
+                    if eid in running:
+                        await tasks[eid]
+                        running.discard(eid)
+                    if streams[eid]['finished']:
+                        best = r
+                        break
+                    print(f"⚠️  [{request.request_id}] Agreeing expert {eid} failed, trying the next one")
+
+                # The remaining agreeing experts are no longer needed. If all
+                # of them failed, fall through to the experts that finished
+                stopped += list(running)
+                agreeing = [best] if best is not None else None
+        finally:
+            # Stop stragglers (closing their streams aborts the vLLM requests)
+            for eid in running:
+                tasks[eid].cancel()
+
+        expert_results = [
+            {'expert_id': eid, 'result': state}
+            for eid, state in streams.items()
+            if state['finished'] and eid not in failed
+        ]
+        pending = stopped if agreeing is not None else []
+
+        if not expert_results:
+            raise RuntimeError(f"All experts failed for request {request.request_id}")
+
+        # Keep routing order (the consensus prompt pairs results with probabilities)
+        expert_results.sort(key=lambda r: expert_ids.index(r['expert_id']))
+
+        if agreeing is not None:
+            strategy = 'early_exit' if pending else 'agreement'
+            best = agreeing[0]
+        elif not self.consensus_engine:
+            strategy = 'top_expert'
+            best = expert_results[0]
+        else:
+            strategy = 'synthesis'
+            best = None
 
-        if not self.consensus_engine:
-            # No consensus engine, return first expert
-            best_result = expert_results[0]['result']
+        self.consensus_strategies[strategy] += 1
+        print(f"🤝 [{request.request_id}] Consensus strategy: {strategy} "
+              f"({len(expert_results)}/{len(tasks)} experts finished)")
+
+        if best is not None:
             return GenerationResult(
                 request_id=request.request_id,
-                text=best_result['text'],
-                expert_id=expert_results[0]['expert_id'],
-                tokens_generated=len(best_result['tokens']),
+                text=best['result']['text'],
+                expert_id=best['expert_id'],
+                tokens_generated=best['result']['tokens'],
                 time_to_first_token=0.0,
                 total_time=0.0,
-                chunks_processed=0
+                chunks_processed=0,
+                consensus_strategy=strategy
             )
 
         # Create consensus prompt
@@ -478,10 +669,10 @@ class LiveMindOrchestrator:
             max_tokens=request.max_tokens
         )
 
-        consensus_result = self.consensus_engine.generate(
+        consensus_result = (await self.consensus_engine.generate_async(
             [consensus_prompt],
             consensus_sampling
-        )[0]
+        ))[0]
 
         return GenerationResult(
             request_id=request.request_id,
@@ -490,9 +681,102 @@ class LiveMindOrchestrator:
             tokens_generated=len(consensus_result['tokens']),
             time_to_first_token=0.0,
             total_time=0.0,
-            chunks_processed=0
+            chunks_processed=0,
+            consensus_strategy=strategy
         )
 
+    async def _stream_expert(
+        self,
+        expert: AxionVLLMEngine,
+        prompt: str,
+        sampling_params: SamplingParams,
+        state: Dict[str, Any],
+        expert_id: str,
+        progress: asyncio.Queue
+    ):
+        """
+        Stream one expert's answer into `state`, reporting each token
+
+        Puts (expert_id, None) on `progress` per token and when finished,
+        or (expert_id, error) if generation fails. Cancelling the task
+        closes the stream, which aborts the vLLM request.
+        """
+        try:
+            async for token in expert.generate_streaming(prompt, sampling_params):
+                state['text'] += token
+                state['tokens'] += 1
+                progress.put_nowait((expert_id, None))
+            state['finished'] = True
+            progress.put_nowait((expert_id, None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            progress.put_nowait((expert_id, e))
+
+    async def _find_agreement(
+        self,
+        expert_results: List[Dict[str, Any]],
+        quorum: int,
+        partial: bool = False
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Find a group of at least `quorum` mutually similar answers
+
+        Args:
+            expert_results: Answers so far ({'expert_id', 'result': {'text', ...}})
+            quorum: Agreeing answers needed
+            partial: Answers are streamed prefixes; they are cut to the same
+                number of words before comparing
+
+        Returns:
+            The agreeing results, or None if there is no quorum yet
+        """
+        if len(expert_results) < quorum:
+            return None
+        if quorum == 1:
+            return expert_results[:1]
+
+        texts = [r['result']['text'] for r in expert_results]
+        if partial:
+            words = [text.split() for text in texts]
+            length = min(len(w) for w in words)
+            texts = [' '.join(w[:length]) for w in words]
+
+        similarity = await self._answer_similarity(texts)
+        agrees = similarity >= self.consensus_agreement_threshold
+
+        # Largest group around a single answer
+        best = int(np.argmax(agrees.sum(axis=1)))
+        if agrees[best].sum() < quorum:
+            return None
+
+        return [r for r, ok in zip(expert_results, agrees[best]) if ok]
+
+    async def _answer_similarity(self, texts: List[str]) -> np.ndarray:
+        """Pairwise similarity matrix between expert answers"""
+        if self.consensus_similarity == "embedding":
+            try:
+                # Embedding runs a model: keep it off the event loop
+                embeddings = await asyncio.to_thread(self.router.embedding_model.embed_batch, texts)
+                embeddings = np.stack(embeddings).astype(np.float32)
+                norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                embeddings = embeddings / norms
+                return embeddings @ embeddings.T
+            except Exception as e:
+                print(f"⚠️  Embedding similarity failed, using token overlap: {e}")
+
+        # Token overlap (Jaccard over lowercase words)
+        token_sets = [set(text.lower().split()) for text in texts]
+        n = len(token_sets)
+        similarity = np.eye(n, dtype=np.float32)
+        for i in range(n):
+            for j in range(i + 1, n):
+                union = token_sets[i] | token_sets[j]
+                overlap = len(token_sets[i] & token_sets[j]) / len(union) if union else 1.0
+                similarity[i, j] = similarity[j, i] = overlap
+        return similarity
+
     def _create_consensus_prompt(
         self,
         original_prompt: str,
@@ -587,6 +871,12 @@ Synthesized response:"""
                 chunk.text
             )
 
+            # Start loading likely experts while routing continues
+            self.expert_system.prefetch_experts(
+                routing_prediction.expert_ids,
+                routing_prediction.probabilities
+            )
+
             # Route as soon as we're confident
             if routing_prediction.can_route:
                 print(f"✅ [{request.request_id}] Fast routing after {i+1} chunks")
@@ -596,6 +886,9 @@ Synthesized response:"""
         if not routing_prediction or not routing_prediction.can_route:
             routing_prediction = self.router.finalize_routing(request.request_id)
 
+        # Routing decided: the per-request router state is no longer needed
+        self.router.release_request(request.request_id)
+
         # Wait for RAG fetch to complete (if started)
         is_rag_query = False
         rag_context = None
@@ -653,8 +946,8 @@ Synthesized response:"""
         # Update metrics
         total_time = time.time() - start_time
         if first_token_time:
-            self.total_ttft.append(first_token_time - start_time)
-        self.total_latency.append(total_time)
+            self.ttft_histogram.record(first_token_time - start_time)
+        self.latency_histogram.record(total_time)
         self.total_requests += 1
 
     def get_stats(self) -> Dict[str, Any]:
@@ -665,21 +958,14 @@ Synthesized response:"""
             'experts': self.expert_system.list_experts()
         }
 
-        if self.total_ttft:
-            stats['ttft'] = {
-                'mean': np.mean(self.total_ttft),
-                'median': np.median(self.total_ttft),
-                'p95': np.percentile(self.total_ttft, 95),
-                'p99': np.percentile(self.total_ttft, 99)
-            }
-
-        if self.total_latency:
-            stats['latency'] = {
-                'mean': np.mean(self.total_latency),
-                'median': np.median(self.total_latency),
-                'p95': np.percentile(self.total_latency, 95),
-                'p99': np.percentile(self.total_latency, 99)
-            }
+        if self.ttft_histogram.count:
+            stats['ttft'] = self.ttft_histogram.snapshot()
+
+        if self.latency_histogram.count:
+            stats['latency'] = self.latency_histogram.snapshot()
+
+        if self.consensus_strategies:
+            stats['consensus_strategies'] = dict(self.consensus_strategies)
 
         # Add RAG stats if enabled
         if self.rag_fetcher:
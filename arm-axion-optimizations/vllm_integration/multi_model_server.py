@@ -70,6 +70,9 @@ from vllm import LLM, SamplingParams
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_llm_engine import AsyncLLMEngine
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from vllm_integration.chat_templates import get_chat_renderer, get_renderer_stats
+
 app = FastAPI(title="vLLM Multi-Model Server", version="1.0.0")
 
 # Global state
@@ -121,21 +124,6 @@ def load_config() -> Dict:
         return json.load(f)
 
 
-def format_messages_to_prompt(messages: List[ChatMessage]) -> str:
-    """Convert chat messages to prompt format"""
-    prompt = ""
-    for msg in messages:
-        if msg.role == "system":
-            prompt += f"<|system|>\n{msg.content}\n"
-        elif msg.role == "user":
-            prompt += f"<|user|>\n{msg.content}\n"
-        elif msg.role == "assistant":
-            prompt += f"<|assistant|>\n{msg.content}\n"
-
-    prompt += "<|assistant|>\n"
-    return prompt
-
-
 def load_model(model_id: str) -> LLM:
     """Load a model into memory"""
     global config, models, loaded_models
@@ -173,6 +161,11 @@ def get_model(model_id: str) -> LLM:
     return models[model_id]
 
 
+def chat_prompt(model_id: str, model: LLM, messages: List[ChatMessage]):
+    """Chat prompt in the model's own template (token ids), generic format if it has none"""
+    return get_chat_renderer(model_id, tokenizer=model.get_tokenizer()).prompt(messages)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize server"""
@@ -245,8 +238,8 @@ async def chat_completions(request: ChatRequest):
     try:
         model = get_model(request.model)
 
-        # Convert messages to prompt
-        prompt = format_messages_to_prompt(request.messages)
+        # Convert messages to prompt (model's chat template, cached prefix)
+        prompt = chat_prompt(request.model, model, request.messages)
 
         # Sampling parameters
         sampling_params = SamplingParams(
@@ -407,6 +400,7 @@ async def stats():
     """Statistics endpoint"""
     return {
         "models_loaded": list(loaded_models),
+        "chat_templates": get_renderer_stats(),
         "models_available": [e["expert_id"] for e in config.get("experts", [])],
         "config": {
             "lazy_loading": config.get("lazy_loading", {}),
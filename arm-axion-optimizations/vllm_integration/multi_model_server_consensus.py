@@ -78,6 +78,9 @@ except ImportError as e:
     LIVE_MIND_AVAILABLE = False
     from vllm import LLM, SamplingParams  # Fallback clásico
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from vllm_integration.chat_templates import format_generic_prompt, get_chat_renderer, get_renderer_stats
+
 app = FastAPI(title="vLLM Multi-Model Server - ARM Axion Optimized with Consensus", version="3.0.0")
 
 # Global state
@@ -209,19 +212,17 @@ async def startup_event():
         print(f"❌ Error durante inicio: {e}")
 
 
-def format_messages_to_prompt(messages: List[ChatMessage]) -> str:
-    """Convert chat messages to prompt format"""
-    prompt = ""
-    for msg in messages:
-        if msg.role == "system":
-            prompt += f"<|system|>\n{msg.content}\n"
-        elif msg.role == "user":
-            prompt += f"<|user|>\n{msg.content}\n"
-        elif msg.role == "assistant":
-            prompt += f"<|assistant|>\n{msg.content}\n"
-
-    prompt += "<|assistant|>\n"
-    return prompt
+def chat_prompt_for(model_id: Optional[str], messages: List[ChatMessage]) -> str:
+    """Prompt text in the requested expert's chat template (generic format when routed)"""
+    expert = next((e for e in config.get("experts", []) if e["expert_id"] == model_id), None) if model_id else None
+    if expert is None:
+        return format_generic_prompt(messages)
+    renderer = get_chat_renderer(
+        model_id,
+        model_path=expert["model_path"],
+        trust_remote_code=expert.get("trust_remote_code", False)
+    )
+    return renderer.render(messages)
 
 
 @app.post("/v1/chat/completions")
@@ -231,8 +232,8 @@ async def chat_completions(request: ChatRequest):
         if livemind_orchestrator is None:
             raise HTTPException(status_code=500, detail="LiveMind Orchestrator no inicializado")
         
-        # Convert messages to single prompt string
-        prompt = format_messages_to_prompt(request.messages)
+        # Convert messages to single prompt string (expert's chat template)
+        prompt = chat_prompt_for(request.model, request.messages)
         
         from livemind_orchestrator import GenerationRequest
         
@@ -240,7 +241,7 @@ async def chat_completions(request: ChatRequest):
         gen_request = GenerationRequest(
             request_id=f"chat-{int(time.time())}-{id(request)}",
             prompt=prompt,
-            system_prompt=None,  # Already included in format_messages_to_prompt
+            system_prompt=None,  # Already included by the chat template
             max_tokens=request.max_tokens,
             temperature=request.temperature,
             top_p=request.top_p,
@@ -474,6 +475,7 @@ async def stats():
     """Statistics endpoint with consensus information"""
     stats_data = {
         "models_loaded": list(loaded_models),
+        "chat_templates": get_renderer_stats(),
         "models_available": [e["expert_id"] for e in config.get("experts", [])] if config else [],
         "config": {
             "lazy_loading": config.get("lazy_loading", {}) if config else {},
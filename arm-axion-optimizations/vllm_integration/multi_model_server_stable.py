@@ -71,6 +71,9 @@ from vllm import LLM, SamplingParams
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_llm_engine import AsyncLLMEngine
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from vllm_integration.chat_templates import format_generic_prompt, get_chat_renderer, get_renderer_stats
+
 app = FastAPI(title="vLLM Multi-Model Server with Intelligent Routing", version="2.0.0")
 
 # Global state
@@ -123,21 +126,6 @@ def load_config() -> Dict:
         return json.load(f)
 
 
-def format_messages_to_prompt(messages: List[ChatMessage]) -> str:
-    """Convert chat messages to prompt format"""
-    prompt = ""
-    for msg in messages:
-        if msg.role == "system":
-            prompt += f"<|system|>\n{msg.content}\n"
-        elif msg.role == "user":
-            prompt += f"<|user|>\n{msg.content}\n"
-        elif msg.role == "assistant":
-            prompt += f"<|assistant|>\n{msg.content}\n"
-
-    prompt += "<|assistant|>\n"
-    return prompt
-
-
 def load_model(model_id: str) -> LLM:
     """Load a model into memory"""
     global config, models, loaded_models
@@ -181,6 +169,11 @@ def get_model(model_id: str) -> LLM:
     return models[model_id]
 
 
+def chat_prompt(model_id: str, model: LLM, messages: List[ChatMessage]):
+    """Chat prompt in the model's own template (token ids), generic format if it has none"""
+    return get_chat_renderer(model_id, tokenizer=model.get_tokenizer()).prompt(messages)
+
+
 def get_fastest_model() -> str:
     """Return the ID of the fastest model based on priority settings"""
     # Get models sorted by priority (lower number = higher priority/speed)
@@ -345,8 +338,8 @@ async def list_models():
 async def chat_completions(request: ChatRequest):
     """Chat completions endpoint (OpenAI compatible) with intelligent routing"""
     try:
-        # Convert messages to prompt for routing analysis
-        prompt = format_messages_to_prompt(request.messages)
+        # Plain conversation text for routing analysis
+        routing_text = format_generic_prompt(request.messages)
         
         # Determine which model to use
         if request.model:
@@ -354,13 +347,16 @@ async def chat_completions(request: ChatRequest):
             model_id = request.model
         else:
             # Use intelligent routing to select best model
-            model_id = simple_route_request_to_model(prompt)
+            model_id = simple_route_request_to_model(routing_text)
         
         print(f"Routing request to model: {model_id}")
         
         # Get the model
         model = get_model(model_id)
 
+        # Prompt in the selected model's chat template (cached prefix)
+        prompt = chat_prompt(model_id, model, request.messages)
+
         # Sampling parameters
         sampling_params = SamplingParams(
             temperature=request.temperature,
@@ -551,6 +547,7 @@ async def stats():
     """Statistics endpoint"""
     return {
         "models_loaded": list(loaded_models),
+        "chat_templates": get_renderer_stats(),
         "models_available": [e["expert_id"] for e in config.get("experts", [])],
         "config": {
             "lazy_loading": config.get("lazy_loading", {}),
@@ -9,7 +9,7 @@ import json
 import time
 import asyncio
 import os
-from typing import Dict, List, Optional, Any, AsyncIterator
+from typing import Dict, List, Optional, Any, AsyncIterator, Union
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -34,6 +34,7 @@ import sys
 
 # Asegurar el path
 sys.path.insert(0, "/home/elect/capibara6/vllm-source-modified")
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
 # Aplicar patches de fallback antes de importar vLLM
 def apply_fallback_patches():
@@ -67,18 +68,24 @@ def apply_fallback_patches():
 apply_fallback_patches()
 
 # vLLM imports
-from vllm import LLM, SamplingParams
+from vllm import SamplingParams
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_llm_engine import AsyncLLMEngine
 from vllm.utils import random_uuid
 
+from vllm_integration.chat_templates import get_chat_renderer, get_renderer_stats
+from vllm_integration.stream_emitter import (
+    SSEChunkTemplate, StreamEmitter, prepare_streaming_params, request_output_deltas
+)
+
 app = FastAPI(title="vLLM Multi-Model Server - ARM Axion Optimized", version="2.0.0")
 
-# Global state
-models: Dict[str, LLM] = {}
+# Global state: one engine per model serves streaming and non-streaming
+# requests (weights and KV cache are loaded once)
+engines: Dict[str, AsyncLLMEngine] = {}
+engine_locks: Dict[str, asyncio.Lock] = {}
 config: Dict = {}
 loaded_models: set = set()
-async_engines: Dict[str, AsyncLLMEngine] = {}  # Engines for streaming
 
 # Data Models
 class ChatMessage(BaseModel):
@@ -112,137 +119,22 @@ def load_config() -> Dict:
         return json.load(f)
 
 
-async def get_async_engine(model_id: str) -> AsyncLLMEngine:
-    """Get or create async engine for streaming purposes"""
-    if model_id not in async_engines:
-        expert = next((e for e in config["experts"] if e["expert_id"] == model_id), None)
-        if not expert:
-            raise ValueError(f"Model {model_id} not found in config")
-
-        print(f"Creating async engine for streaming: {model_id}")
-        
-        engine_args = AsyncEngineArgs(
-            model=expert["model_path"],
-            tensor_parallel_size=expert.get("tensor_parallel_size", 1),
-            gpu_memory_utilization=expert.get("gpu_memory_utilization", 0.9),
-            max_num_seqs=expert.get("max_num_seqs", 64),  # Reduced for lower latency
-            max_model_len=expert.get("max_model_len", 4096),
-            quantization=expert.get("quantization") if expert.get("quantization") != "q4_0" else None,
-            dtype=expert.get("dtype", "float16"),
-            trust_remote_code=expert.get("trust_remote_code", False),
-            enforce_eager=expert.get("enforce_eager", False),
-            device="cpu",  # For ARM Axion
-            kv_cache_dtype=expert.get("kv_cache_dtype", "auto"),
-            enable_prefix_caching=expert.get("enable_prefix_caching", True),
-            use_v2_block_manager=expert.get("use_v2_block_manager", True),
-            swap_space=expert.get("swap_space", 4),
-            cpu_offload_gb=expert.get("cpu_offload_gb", 0),
-            max_num_batched_tokens=expert.get("max_num_batched_tokens", 4096)
-        )
-
-        # Create async engine with optimized settings for streaming
-        engine = AsyncLLMEngine.from_engine_args(engine_args)
-        async_engines[model_id] = engine
-        print(f"Async engine created for {model_id}")
-
-    return async_engines[model_id]
-
-
-def format_messages_to_prompt(messages: List[ChatMessage]) -> str:
-    """Convert chat messages to prompt format"""
-    prompt = ""
-    for msg in messages:
-        if msg.role == "system":
-            prompt += f"<|system|>\n{msg.content}\n"
-        elif msg.role == "user":
-            prompt += f"<|user|>\n{msg.content}\n"
-        elif msg.role == "assistant":
-            prompt += f"<|assistant|>\n{msg.content}\n"
-
-    prompt += "<|assistant|>\n"
-    return prompt
-
-
-async def generate_chat_streaming(
-    model_id: str,
-    messages: List[ChatMessage],
-    sampling_params: SamplingParams,
-    request_id: str
-) -> AsyncIterator[str]:
-    """Generate tokens streamingly from async engine with chat format"""
-    # Convert messages to prompt
-    prompt = format_messages_to_prompt(messages)
-    
-    # Get async engine
-    async_engine = await get_async_engine(model_id)
-    
-    # Create results generator
-    results_generator = async_engine.generate(
-        prompt,
-        sampling_params,
-        request_id
-    )
-    
-    # Track previous tokens to send only deltas
-    previous_texts = {0: ""}
-    
-    async for request_output in results_generator:
-        for output in request_output.outputs:
-            delta_text = output.text[len(previous_texts[output.index]):]
-            previous_texts[output.index] = output.text
-            
-            # Create OpenAI-compatible streaming chunk
-            chunk = {
-                "id": f"chatcmpl-{request_id}",
-                "object": "chat.completion.chunk",
-                "created": int(time.time()),
-                "model": model_id,
-                "choices": [{
-                    "index": output.index,
-                    "delta": {"role": "assistant", "content": delta_text},
-                    "logprobs": None,
-                    "finish_reason": output.finish_reason
-                }]
-            }
-            
-            yield f"data: {json.dumps(chunk)}\n\n"
-    
-    yield "data: [DONE]\n\n"
-
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize server"""
-    global config
-
-    print("="*70)
-    print("  vLLM Multi-Model Inference Server - ARM Axion Optimized")
-    print("  WITH TRUE STREAMING SUPPORT")
-    print("="*70)
-    print("")
-
-    config_file = os.environ.get('VLLM_CONFIG_PATH', 'config.json')
-    config = load_config()
-    print(f"Loaded configuration from {config_file} with {len(config['experts'])} experts")
-    print("")
-
-    print("")
-    print("🚀 Server ready with TRUE streaming support")
-    print("   Streaming enabled by default for all endpoints")
-    print("   First token latency optimized with speculative decoding")
-    print("")
-
+async def get_engine(model_id: str) -> AsyncLLMEngine:
+    """Get the model's engine, loading it on first use"""
+    if model_id in engines:
+        return engines[model_id]
 
-def get_model(model_id: str) -> LLM:
-    """Get model, loading if necessary"""
-    if model_id not in models:
-        load_model(model_id)
-    return models[model_id]
+    # One load per model even if several requests arrive at once
+    lock = engine_locks.setdefault(model_id, asyncio.Lock())
+    async with lock:
+        if model_id not in engines:
+            load_model(model_id)
+    return engines[model_id]
 
 
-def load_model(model_id: str) -> LLM:
+def load_model(model_id: str) -> AsyncLLMEngine:
     """Load a model into memory"""
-    global config, models, loaded_models
+    global config, engines, loaded_models
 
     expert = next((e for e in config["experts"] if e["expert_id"] == model_id), None)
     if not expert:
@@ -250,8 +142,7 @@ def load_model(model_id: str) -> LLM:
 
     print(f"Loading model: {model_id} from {expert['model_path']}")
 
-    # vLLM initialization params
-    model = LLM(
+    engine_args = AsyncEngineArgs(
         model=expert["model_path"],
         tensor_parallel_size=expert.get("tensor_parallel_size", 1),
         gpu_memory_utilization=expert.get("gpu_memory_utilization", 0.9),
@@ -271,11 +162,93 @@ def load_model(model_id: str) -> LLM:
         max_num_batched_tokens=expert.get("max_num_batched_tokens", 8192)
     )
 
-    models[model_id] = model
+    engine = AsyncLLMEngine.from_engine_args(engine_args)
+
+    engines[model_id] = engine
     loaded_models.add(model_id)
     print(f"✓ Model {model_id} loaded successfully")
 
-    return model
+    return engine
+
+
+async def generate_full(
+    model_id: str,
+    prompt: Union[str, Dict[str, Any]],
+    sampling_params: SamplingParams,
+    request_id: str
+):
+    """Non-streaming generation on the shared engine (returns the final RequestOutput)"""
+    engine = await get_engine(model_id)
+
+    final_output = None
+    async for request_output in engine.generate(prompt, sampling_params, request_id):
+        final_output = request_output
+    return final_output
+
+
+async def chat_prompt(model_id: str, messages: List[ChatMessage]) -> Union[str, Dict[str, Any]]:
+    """Chat prompt in the model's own template (token ids), generic format if it has none"""
+    engine = await get_engine(model_id)
+    tokenizer = await engine.get_tokenizer()
+    return get_chat_renderer(model_id, tokenizer=tokenizer).prompt(messages)
+
+
+async def stream_deltas(
+    model_id: str,
+    prompt: Union[str, Dict[str, Any]],
+    sampling_params: SamplingParams,
+    request_id: str
+) -> AsyncIterator:
+    """(text, finish_reason) deltas from the model's engine"""
+    engine = await get_engine(model_id)
+    tokenizer = await engine.get_tokenizer()
+
+    # Delta outputs; detokenized in the stream rather than in the engine loop
+    sampling_params, detokenize_in_stream = prepare_streaming_params(sampling_params, tokenizer)
+    results_generator = engine.generate(prompt, sampling_params, request_id)
+
+    return request_output_deltas(results_generator, tokenizer, detokenize_in_stream)
+
+
+async def generate_chat_streaming(
+    model_id: str,
+    messages: List[ChatMessage],
+    sampling_params: SamplingParams,
+    request_id: str
+) -> AsyncIterator[str]:
+    """Generate tokens streamingly from async engine with chat format"""
+    # Convert messages to prompt (model's chat template, cached prefix)
+    prompt = await chat_prompt(model_id, messages)
+
+    deltas = await stream_deltas(model_id, prompt, sampling_params, request_id)
+
+    # OpenAI-compatible chunks from a preformatted template, coalesced
+    emitter = StreamEmitter(SSEChunkTemplate.chat(f"chatcmpl-{request_id}", model_id))
+    async for frame in emitter.frames(deltas):
+        yield frame
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize server"""
+    global config
+
+    print("="*70)
+    print("  vLLM Multi-Model Inference Server - ARM Axion Optimized")
+    print("  WITH TRUE STREAMING SUPPORT")
+    print("="*70)
+    print("")
+
+    config_file = os.environ.get('VLLM_CONFIG_PATH', 'config.json')
+    config = load_config()
+    print(f"Loaded configuration from {config_file} with {len(config['experts'])} experts")
+    print("")
+
+    print("")
+    print("🚀 Server ready with TRUE streaming support")
+    print("   Streaming enabled by default for all endpoints")
+    print("   First token latency optimized with speculative decoding")
+    print("")
 
 
 # Enhanced chat completions with true streaming
@@ -303,11 +276,9 @@ async def chat_completions(request: ChatRequest):
 
             return StreamingResponse(streaming_response(), media_type="text/event-stream")
         else:
-            # Non-streaming response (the original behavior)
-            model = get_model(request.model)
-            
-            # Convert messages to prompt
-            prompt = format_messages_to_prompt(request.messages)
+            # Non-streaming response from the same engine
+            # Convert messages to prompt (model's chat template, cached prefix)
+            prompt = await chat_prompt(request.model, request.messages)
 
             # Sampling parameters
             sampling_params = SamplingParams(
@@ -317,10 +288,9 @@ async def chat_completions(request: ChatRequest):
             )
 
             start_time = time.time()
-            outputs = model.generate([prompt], sampling_params)
+            output = await generate_full(request.model, prompt, sampling_params, f"chat-{random_uuid()}")
             generation_time = time.time() - start_time
 
-            output = outputs[0]
             generated_text = output.outputs[0].text
 
             # Format response
@@ -356,37 +326,16 @@ async def generate_completion_streaming(
     model_id: str,
     prompt: str,
     sampling_params: SamplingParams,
-    request_id: str
+    request_id: str,
+    template: Optional[SSEChunkTemplate] = None
 ) -> AsyncIterator[str]:
     """Generate completion tokens streamingly from async engine"""
-    # Get async engine
-    async_engine = await get_async_engine(model_id)
-    
-    # Create results generator
-    results_generator = async_engine.generate(
-        prompt,
-        sampling_params,
-        request_id
-    )
-    
-    async for request_output in results_generator:
-        # Format as OpenAI completion chunk
-        chunk = {
-            "id": f"cmpl-{request_id}",
-            "object": "text_completion.chunk",
-            "created": int(time.time()),
-            "model": model_id,
-            "choices": [{
-                "text": request_output.outputs[0].text,  # Full text accumulated so far
-                "index": 0,
-                "logprobs": None,
-                "finish_reason": request_output.outputs[0].finish_reason
-            }]
-        }
-        
-        yield f"data: {json.dumps(chunk)}\n\n"
-    
-    yield "data: [DONE]\n\n"
+    deltas = await stream_deltas(model_id, prompt, sampling_params, request_id)
+
+    # Format as OpenAI completion chunks (text deltas), coalesced
+    emitter = StreamEmitter(template or SSEChunkTemplate.completion(f"cmpl-{request_id}", model_id))
+    async for frame in emitter.frames(deltas):
+        yield frame
 
 
 @app.post("/v1/completions")
@@ -412,9 +361,7 @@ async def completions(request: CompletionRequest):
 
             return StreamingResponse(streaming_response(), media_type="text/event-stream")
         else:
-            # Non-streaming response (the original behavior)
-            model = get_model(request.model)
-
+            # Non-streaming response from the same engine
             # Sampling parameters
             sampling_params = SamplingParams(
                 temperature=request.temperature,
@@ -424,10 +371,9 @@ async def completions(request: CompletionRequest):
 
             # Generate
             start_time = time.time()
-            outputs = model.generate([request.prompt], sampling_params)
+            output = await generate_full(request.model, request.prompt, sampling_params, f"cmpl-{random_uuid()}")
             generation_time = time.time() - start_time
 
-            output = outputs[0]
             generated_text = output.outputs[0].text
 
             # Format response
@@ -522,31 +468,19 @@ async def ollama_generate(request: dict):
                     max_tokens=request.get("max_tokens", 2048),
                 )
                 
+                # Ollama-format frames straight from the template
                 async for chunk in generate_completion_streaming(
                     model_id,
                     prompt,
                     sampling_params,
-                    f"ollama-{random_uuid()}"
+                    f"ollama-{random_uuid()}",
+                    template=SSEChunkTemplate.ollama(model_name)
                 ):
-                    # Convert to Ollama format
-                    parsed_chunk = json.loads(chunk[6:])  # Remove "data: " prefix
-                    if not parsed_chunk.get("choices"):
-                        continue
-                        
-                    ollama_format = {
-                        "model": model_name,
-                        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-                        "response": parsed_chunk["choices"][0]["text"],
-                        "done": parsed_chunk["choices"][0]["finish_reason"] is not None
-                    }
-                    
-                    yield f"data: {json.dumps(ollama_format)}\n\n"
+                    yield chunk
             
             return StreamingResponse(ollama_streaming_response(), media_type="text/event-stream")
         else:
-            # Non-streaming response (original behavior)
-            model = get_model(model_id)
-
+            # Non-streaming response from the same engine
             # Sampling parameters
             sampling_params = SamplingParams(
                 temperature=request.get("temperature", 0.7),
@@ -556,10 +490,9 @@ async def ollama_generate(request: dict):
 
             # Generate
             start_time = time.time()
-            outputs = model.generate([prompt], sampling_params)
+            output = await generate_full(model_id, prompt, sampling_params, f"ollama-{random_uuid()}")
             total_duration = time.time() - start_time
 
-            output = outputs[0]
             generated_text = output.outputs[0].text
 
             # Format Ollama-compatible response
@@ -596,6 +529,7 @@ async def stats():
     """Statistics endpoint"""
     return {
         "models_loaded": list(loaded_models),
+        "chat_templates": get_renderer_stats(),
         "models_available": [e["expert_id"] for e in config.get("experts", [])],
         "config": {
             "lazy_loading": config.get("lazy_loading", {}),
@@ -20,6 +20,8 @@ from dataclasses import dataclass
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from vllm_integration.token_counter import get_token_counter
+
 
 @dataclass
 class RAGQuery:
@@ -263,7 +265,9 @@ class RAGParallelFetcher:
         collection_name: str = "capibara_docs",
         enable_rag: bool = True,
         detection_threshold: float = 0.5,
-        max_context_tokens: int = 1000
+        max_context_tokens: int = 1000,
+        model_family: str = 'default',
+        tokenizer: Optional[Any] = None
     ):
         """
         Initialize RAG parallel fetcher
@@ -273,11 +277,14 @@ class RAGParallelFetcher:
             collection_name: Milvus collection name
             enable_rag: Enable RAG integration
             detection_threshold: Confidence threshold for RAG detection
-            max_context_tokens: Max tokens for context (approx)
+            max_context_tokens: Max tokens for context
+            model_family: Tokenizer family of the target model
+            tokenizer: Target model tokenizer for exact counts (optional)
         """
         self.enable_rag = enable_rag
         self.detection_threshold = detection_threshold
         self.max_context_tokens = max_context_tokens
+        self.token_counter = get_token_counter(model_family, tokenizer=tokenizer)
 
         # Initialize components
         if enable_rag:
@@ -391,16 +398,19 @@ class RAGParallelFetcher:
         Returns:
             Formatted RAGContext
         """
-        # Build context text
+        counter = self.token_counter
+
+        # Build context text; each part is counted once and the counts summed
         context_parts = [
             f"[RETRIEVED CONTEXT for: \"{query}\"]",
             f"[Intent: {intent}]",
             ""
         ]
+        footer = "\n[END CONTEXT]\n"
+        # One extra token per part for the joining newline
+        total_tokens = sum(counter.count(part) + 1 for part in context_parts) + counter.count(footer)
 
         sources = []
-        total_chars = 0
-        max_chars = self.max_context_tokens * 4  # Rough estimate: 1 token ≈ 4 chars
 
         for i, result in enumerate(results):
             # Extract fields
@@ -411,11 +421,12 @@ class RAGParallelFetcher:
             # Format source
             source_text = f"{i+1}. {text}\n   (Score: {score:.3f})"
 
-            if total_chars + len(source_text) > max_chars:
+            source_tokens = counter.count(source_text) + 1
+            if total_tokens + source_tokens > self.max_context_tokens:
                 break  # Reached max tokens
 
             context_parts.append(source_text)
-            total_chars += len(source_text)
+            total_tokens += source_tokens
 
             sources.append({
                 'id': result.get('id'),
@@ -424,7 +435,7 @@ class RAGParallelFetcher:
                 'metadata': metadata
             })
 
-        context_parts.append("\n[END CONTEXT]\n")
+        context_parts.append(footer)
 
         context_text = "\n".join(context_parts)
 
@@ -433,7 +444,7 @@ class RAGParallelFetcher:
             sources=sources,
             fetch_time=0.0,  # Set by caller
             source_type='milvus',
-            tokens_count=len(context_text) // 4  # Rough estimate
+            tokens_count=total_tokens
         )
 
     def inject_context(
@@ -475,7 +486,8 @@ Instructions: Use the retrieved context above to answer the user's query. If the
             'rag_queries': self.rag_queries,
             'non_rag_queries': self.non_rag_queries,
             'rag_rate': f"{(self.rag_queries / self.total_queries * 100):.1f}%" if self.total_queries > 0 else "0%",
-            'cache_size': len(self.context_cache)
+            'cache_size': len(self.context_cache),
+            'token_counter': self.token_counter.get_stats()
         }
 
         if self.total_fetch_time:
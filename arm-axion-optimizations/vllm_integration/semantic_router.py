@@ -12,6 +12,7 @@ import sys
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass
+from collections import OrderedDict
 import numpy as np
 import time
 import asyncio
@@ -51,7 +52,9 @@ class IncrementalSemanticRouter:
         routing_threshold: float = 0.7,
         top_k_experts: int = 2,
         embedding_model_name: str = "all-MiniLM-L6-v2",
-        embedding_cache_size: int = 10000
+        embedding_cache_size: int = 10000,
+        max_active_requests: int = 10000,
+        request_ttl_seconds: float = 300.0
     ):
         """
         Args:
@@ -63,12 +66,16 @@ class IncrementalSemanticRouter:
             top_k_experts: Number of experts to activate
             embedding_model_name: SentenceTransformer model name
             embedding_cache_size: Max embeddings to cache
+            max_active_requests: Max request states kept (LRU beyond that)
+            request_ttl_seconds: Idle time after which a request state expires
         """
         self.expert_domains = expert_domains
         self.num_experts = len(expert_domains)
         self.chunk_size = chunk_size
         self.routing_threshold = routing_threshold
         self.top_k_experts = top_k_experts
+        self.max_active_requests = max_active_requests
+        self.request_ttl_seconds = request_ttl_seconds
 
         # Real embedding model with cache
         if embedding_model is None:
@@ -95,8 +102,9 @@ class IncrementalSemanticRouter:
         # Expert embeddings (use real embeddings for domains)
         self._initialize_expert_embeddings()
 
-        # Request state tracking
-        self.request_states = {}
+        # Request state tracking (ordered by last access, oldest first)
+        self.request_states: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.expired_requests = 0
 
     def _initialize_expert_embeddings(self):
         """Initialize expert domain embeddings using real embeddings"""
@@ -111,12 +119,11 @@ class IncrementalSemanticRouter:
             'medical': 'medical health diagnosis treatment patient symptoms'
         }
 
-        self.expert_embeddings = {}
-        expert_ids = list(self.expert_domains.keys())
+        self.expert_ids = list(self.expert_domains.keys())
 
         # Collect texts to embed in batch
         texts_to_embed = []
-        for expert_id in expert_ids:
+        for expert_id in self.expert_ids:
             domain = self.expert_domains[expert_id]
             description = domain_descriptions.get(domain, domain)
             texts_to_embed.append(description)
@@ -125,21 +132,65 @@ class IncrementalSemanticRouter:
         print(f"🔄 Computing expert domain embeddings...")
         embeddings = self.embedding_model.embed_batch(texts_to_embed)
 
-        # Store embeddings
-        for expert_id, embedding in zip(expert_ids, embeddings):
-            self.expert_embeddings[expert_id] = embedding
+        # Stacked, L2-normalized expert matrix [num_experts x embed_dim]:
+        # evidence for a chunk is one GEMV, for many chunks one GEMM
+        matrix = np.asarray(np.stack(embeddings), dtype=np.float32)
+        self.expert_matrix = self._normalize_rows(matrix)
+        # Transposed copy [embed_dim x num_experts] for the NEON matmul (A @ B)
+        self._expert_matrix_t = np.ascontiguousarray(self.expert_matrix.T)
+
+        # Per-expert views (kept for callers that look up single experts)
+        self.expert_embeddings = {
+            expert_id: self.expert_matrix[i]
+            for i, expert_id in enumerate(self.expert_ids)
+        }
 
         print(f"✅ Expert embeddings initialized ({self.embedding_model.embed_dim}d, real embeddings)")
 
     def start_request(self, request_id: str):
         """Initialize tracking for a new request"""
+        self._evict_stale_requests()
+
         self.request_states[request_id] = {
             'expert_probs': np.ones(self.num_experts, dtype=np.float32) / self.num_experts,
             'confidence': 0.0,
             'chunks_processed': 0,
             'embeddings': [],
-            'routed': False
+            'routed': False,
+            'last_access': time.monotonic()
         }
+        self.request_states.move_to_end(request_id)
+
+    def release_request(self, request_id: str):
+        """Drop the state of a finished request (safe to call twice)"""
+        self.request_states.pop(request_id, None)
+
+    def _get_state(self, request_id: str) -> Dict[str, Any]:
+        """Get (or create) a request state and mark it as recently used"""
+        state = self.request_states.get(request_id)
+        if state is None:
+            self.start_request(request_id)
+            return self.request_states[request_id]
+
+        state['last_access'] = time.monotonic()
+        self.request_states.move_to_end(request_id)
+        return state
+
+    def _evict_stale_requests(self):
+        """
+        Expire idle request states (TTL) and cap their number (LRU)
+
+        States are kept in access order, so only the front is inspected.
+        """
+        deadline = time.monotonic() - self.request_ttl_seconds
+
+        while self.request_states:
+            oldest = next(iter(self.request_states.values()))
+            if (len(self.request_states) < self.max_active_requests
+                    and oldest['last_access'] >= deadline):
+                break
+            self.request_states.popitem(last=False)
+            self.expired_requests += 1
 
     def process_chunk(
         self,
@@ -158,10 +209,7 @@ class IncrementalSemanticRouter:
         Returns:
             Current routing prediction
         """
-        if request_id not in self.request_states:
-            self.start_request(request_id)
-
-        state = self.request_states[request_id]
+        state = self._get_state(request_id)
 
         # Get chunk embedding
         if chunk_embedding is None:
@@ -173,7 +221,54 @@ class IncrementalSemanticRouter:
         # Compute evidence from this chunk
         chunk_evidence = self._compute_chunk_evidence(chunk_embedding)
 
-        # Bayesian update
+        return self._update_state(state, chunk_evidence)
+
+    def process_chunks_batch(
+        self,
+        request_ids: List[str],
+        chunk_texts: List[str],
+        chunk_embeddings: Optional[np.ndarray] = None
+    ) -> List[RoutingPrediction]:
+        """
+        Process chunks from many concurrent requests in one pass
+
+        Embeds all uncached chunks in a single batch and computes the
+        evidence for every (chunk, expert) pair with one GEMM. Chunks are
+        applied in order, so a request may appear more than once.
+
+        Args:
+            request_ids: Request identifier for each chunk
+            chunk_texts: Text of each chunk
+            chunk_embeddings: Pre-computed embeddings [num_chunks x dim] (optional)
+
+        Returns:
+            Routing prediction for each chunk, aligned with the inputs
+        """
+        if len(request_ids) != len(chunk_texts):
+            raise ValueError("request_ids and chunk_texts must have the same length")
+        if not request_ids:
+            return []
+
+        if chunk_embeddings is None:
+            chunk_embeddings = self.embedding_model.embed_batch(chunk_texts)
+        chunk_embeddings = np.asarray(np.stack(chunk_embeddings), dtype=np.float32)
+
+        evidence = self._compute_batch_evidence(chunk_embeddings)
+
+        predictions = []
+        for i, request_id in enumerate(request_ids):
+            state = self._get_state(request_id)
+            state['embeddings'].append(chunk_embeddings[i])
+            predictions.append(self._update_state(state, evidence[i]))
+
+        return predictions
+
+    def _update_state(
+        self,
+        state: Dict[str, Any],
+        chunk_evidence: np.ndarray
+    ) -> RoutingPrediction:
+        """Bayesian update of a request state with the evidence of one chunk"""
         prior = state['expert_probs']
         posterior = prior * chunk_evidence
         posterior = posterior / posterior.sum()  # Normalize
@@ -187,15 +282,16 @@ class IncrementalSemanticRouter:
         # Can we route?
         can_route = self._can_route(state)
 
-        # Get top experts
-        expert_ids = list(self.expert_domains.keys())
-        top_indices = np.argsort(posterior)[-self.top_k_experts:][::-1]
-        top_expert_ids = [expert_ids[i] for i in top_indices]
-        top_probs = [float(posterior[i]) for i in top_indices]
+        return self._make_prediction(state, can_route)
+
+    def _make_prediction(self, state: Dict[str, Any], can_route: bool) -> RoutingPrediction:
+        """Build the top-k prediction for a request state"""
+        probs = state['expert_probs']
+        top_indices = np.argsort(probs)[-self.top_k_experts:][::-1]
 
         return RoutingPrediction(
-            expert_ids=top_expert_ids,
-            probabilities=top_probs,
+            expert_ids=[self.expert_ids[i] for i in top_indices],
+            probabilities=[float(probs[i]) for i in top_indices],
             confidence=float(state['confidence']),
             chunks_processed=state['chunks_processed'],
             can_route=can_route
@@ -211,36 +307,42 @@ class IncrementalSemanticRouter:
         embedding = self.embedding_model.embed(chunk_text)
         return embedding
 
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        """L2-normalize each row (zero rows are left as-is)"""
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
     def _compute_chunk_evidence(self, chunk_embedding: np.ndarray) -> np.ndarray:
         """
         Compute evidence for each expert from chunk embedding
 
-        Uses NEON-optimized dot product if available
+        Single GEMV against the stacked expert matrix
         """
-        evidence = np.ones(self.num_experts, dtype=np.float32) * 0.1
+        return self._compute_batch_evidence(chunk_embedding.reshape(1, -1))[0]
 
-        expert_ids = list(self.expert_domains.keys())
+    def _compute_batch_evidence(self, chunk_embeddings: np.ndarray) -> np.ndarray:
+        """
+        Compute evidence for a batch of chunk embeddings
 
-        for i, expert_id in enumerate(expert_ids):
-            expert_emb = self.expert_embeddings[expert_id]
+        Args:
+            chunk_embeddings: [num_chunks x embed_dim]
 
-            # Compute cosine similarity
-            if self.use_neon and self.kernels:
-                # NEON-optimized dot product (5x faster)
-                dot = self.kernels.dot_product(
-                    chunk_embedding.astype(np.float32),
-                    expert_emb.astype(np.float32)
-                )
-                # Embeddings are already normalized
-                similarity = dot
-            else:
-                # NumPy fallback
-                similarity = np.dot(chunk_embedding, expert_emb)
+        Returns:
+            Evidence matrix [num_chunks x num_experts]
 
-            # Convert similarity [-1, 1] to evidence [0, 2]
-            evidence[i] *= (1.0 + similarity)
+        Uses the NEON matmul if available (one call for the whole batch)
+        """
+        queries = self._normalize_rows(np.asarray(chunk_embeddings, dtype=np.float32))
+
+        if self.use_neon and self.kernels:
+            similarity = self.kernels.matmul_fp32(queries, self._expert_matrix_t)
+        else:
+            similarity = queries @ self.expert_matrix.T
 
-        return evidence
+        # Convert cosine similarity [-1, 1] to evidence [0, 0.2]
+        return 0.1 * (1.0 + similarity)
 
     def _compute_confidence(
         self,
@@ -297,11 +399,15 @@ class IncrementalSemanticRouter:
 
         return False
 
-    def finalize_routing(self, request_id: str) -> RoutingPrediction:
+    def finalize_routing(self, request_id: str, release: bool = False) -> RoutingPrediction:
         """
         Finalize routing decision for a request
 
         Call this when done processing chunks or when ready to route
+
+        Args:
+            request_id: Request identifier
+            release: Drop the request state after computing the prediction
         """
         if request_id not in self.request_states:
             raise ValueError(f"Unknown request: {request_id}")
@@ -310,20 +416,12 @@ class IncrementalSemanticRouter:
         state['routed'] = True
 
         # Get final prediction
-        probs = state['expert_probs']
-        expert_ids = list(self.expert_domains.keys())
+        prediction = self._make_prediction(state, can_route=True)
 
-        top_indices = np.argsort(probs)[-self.top_k_experts:][::-1]
-        top_expert_ids = [expert_ids[i] for i in top_indices]
-        top_probs = [float(probs[i]) for i in top_indices]
+        if release:
+            self.release_request(request_id)
 
-        return RoutingPrediction(
-            expert_ids=top_expert_ids,
-            probabilities=top_probs,
-            confidence=float(state['confidence']),
-            chunks_processed=state['chunks_processed'],
-            can_route=True
-        )
+        return prediction
 
     def get_routing_stats(self) -> Dict[str, Any]:
         """Get router statistics including embedding cache performance"""
@@ -332,6 +430,7 @@ class IncrementalSemanticRouter:
         return {
             'num_experts': self.num_experts,
             'active_requests': len(self.request_states),
+            'expired_requests': self.expired_requests,
             'use_neon': self.use_neon,
             'routing_threshold': self.routing_threshold,
             'top_k_experts': self.top_k_experts,
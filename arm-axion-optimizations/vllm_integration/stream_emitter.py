@@ -0,0 +1,365 @@
+"""
+Streaming delta emission for OpenAI-compatible SSE
+
+- Delta outputs: vLLM is asked for RequestOutputKind.DELTA where supported,
+  and otherwise deltas are cut from token/text offsets, so no step copies
+  or rescans the whole completion
+- Incremental detokenizer: optional, decodes only a small window of new
+  token ids (used when vLLM's own detokenization is turned off)
+- Preformatted SSE templates: each frame is prefix + json string + suffix
+  instead of building and serializing a chunk dict per token
+- Coalescing: bursts of tokens are merged into one frame per
+  max_delay_ms / max_chars; slow token streams are never delayed
+- Backpressure: engine output is drained into a bounded text buffer while
+  the client is slow, and the request is aborted if it overflows
+"""
+
+import asyncio
+import copy
+import json
+import time
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+try:
+    from vllm.sampling_params import RequestOutputKind
+except ImportError:
+    RequestOutputKind = None
+
+
+def prepare_streaming_params(sampling_params, tokenizer: Any = None) -> Tuple[Any, bool]:
+    """
+    Copy of `sampling_params` set up for delta streaming
+
+    Args:
+        sampling_params: vLLM SamplingParams (not modified)
+        tokenizer: If given (and no stop strings need matching), vLLM
+            detokenization is turned off and the stream decodes token ids
+
+    Returns:
+        (params, detokenize_in_stream)
+    """
+    if hasattr(sampling_params, 'clone'):
+        params = sampling_params.clone()
+    else:
+        params = copy.copy(sampling_params)
+
+    if RequestOutputKind is not None:
+        params.output_kind = RequestOutputKind.DELTA
+
+    detokenize_in_stream = (
+        tokenizer is not None
+        and hasattr(params, 'detokenize')
+        and not getattr(params, 'stop', None)
+    )
+    if detokenize_in_stream:
+        params.detokenize = False
+
+    return params, detokenize_in_stream
+
+
+class IncrementalDetokenizer:
+    """
+    Decodes token ids as they arrive
+
+    Each step decodes only the ids since the last emitted boundary (plus a
+    few ids of context for tokenizers that merge leading spaces), and holds
+    back text ending in an incomplete UTF-8 sequence.
+    """
+
+    CONTEXT_TOKENS = 5
+
+    def __init__(self, tokenizer: Any, prompt_token_ids: Optional[List[int]] = None,
+                 skip_special_tokens: bool = True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        context = list(prompt_token_ids or [])[-self.CONTEXT_TOKENS:]
+        self.token_ids: List[int] = context
+        self.prefix_offset = 0
+        self.read_offset = len(context)
+
+    def _decode(self, token_ids: List[int]) -> str:
+        return self.tokenizer.decode(token_ids, skip_special_tokens=self.skip_special_tokens)
+
+    def add(self, new_token_ids: List[int]) -> str:
+        """Append token ids and return the newly decodable text"""
+        if not new_token_ids:
+            return ""
+        self.token_ids.extend(new_token_ids)
+
+        prefix_text = self._decode(self.token_ids[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.token_ids[self.prefix_offset:])
+        if len(new_text) <= len(prefix_text) or new_text.endswith('\ufffd'):
+            return ""
+
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.token_ids)
+        return new_text[len(prefix_text):]
+
+    def flush(self) -> str:
+        """Whatever is still held back at the end of the stream"""
+        prefix_text = self._decode(self.token_ids[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.token_ids[self.prefix_offset:])
+        self.prefix_offset = self.read_offset = len(self.token_ids)
+        return new_text[len(prefix_text):]
+
+
+class DeltaTracker:
+    """
+    Per-request text delta from successive vLLM CompletionOutputs
+
+    Handles both delta outputs (RequestOutputKind.DELTA) and cumulative
+    ones (offset slicing), and counts generated tokens.
+    """
+
+    def __init__(self, detokenizer: Optional[IncrementalDetokenizer] = None):
+        self.detokenizer = detokenizer
+        self.delta_mode = RequestOutputKind is not None
+        self.text_offset = 0
+        self.num_tokens = 0
+
+    def update(self, completion_output) -> str:
+        """New text in `completion_output`"""
+        token_ids = completion_output.token_ids
+        if self.delta_mode:
+            new_token_ids = token_ids
+        else:
+            new_token_ids = token_ids[self.num_tokens:]
+        self.num_tokens += len(new_token_ids)
+
+        if self.detokenizer is not None:
+            text = self.detokenizer.add(list(new_token_ids))
+            if completion_output.finish_reason is not None:
+                text += self.detokenizer.flush()
+            return text
+
+        if self.delta_mode:
+            return completion_output.text
+        text = completion_output.text[self.text_offset:]
+        self.text_offset = len(completion_output.text)
+        return text
+
+
+async def request_output_deltas(
+    results_generator: AsyncIterator[Any],
+    tokenizer: Any = None,
+    detokenize_in_stream: bool = False,
+    tracker_out: Optional[List[DeltaTracker]] = None
+) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """
+    (text, finish_reason) deltas of the first completion of a vLLM stream
+
+    Args:
+        results_generator: vLLM RequestOutput stream
+        tokenizer: Tokenizer for in-stream detokenization
+        detokenize_in_stream: As returned by prepare_streaming_params()
+        tracker_out: If given, receives the DeltaTracker (token counts)
+    """
+    tracker = None
+    try:
+        async for request_output in results_generator:
+            if tracker is None:
+                detokenizer = None
+                if detokenize_in_stream:
+                    detokenizer = IncrementalDetokenizer(
+                        tokenizer, getattr(request_output, 'prompt_token_ids', None)
+                    )
+                tracker = DeltaTracker(detokenizer)
+                if tracker_out is not None:
+                    tracker_out.append(tracker)
+
+            output = request_output.outputs[0]
+            text = tracker.update(output)
+            if text or output.finish_reason is not None:
+                yield text, output.finish_reason
+    finally:
+        # Closing the engine stream right away aborts the vLLM request
+        aclose = getattr(results_generator, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+
+async def text_deltas(tokens: AsyncIterator[str]) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """Adapt a plain token-string stream to (text, finish_reason) deltas"""
+    try:
+        async for token in tokens:
+            yield token, None
+    finally:
+        aclose = getattr(tokens, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+
+class SSEChunkTemplate:
+    """
+    Preformatted OpenAI SSE chunk: only the text is serialized per frame
+    """
+
+    def __init__(self, head: str, tail: str, final_head: str, final_tail: str,
+                 first_frame: Optional[str] = None, done_frame: str = "data: [DONE]\n\n"):
+        self.head = head
+        self.tail = tail
+        self.final_head = final_head
+        self.final_tail = final_tail
+        self.first_frame = first_frame
+        self.done_frame = done_frame
+
+    def frame(self, text: str) -> str:
+        """Content frame"""
+        return f"{self.head}{json.dumps(text, ensure_ascii=False)}{self.tail}"
+
+    def final(self, finish_reason: Optional[str]) -> str:
+        """Last frame (finish_reason) plus the end-of-stream sentinel"""
+        return f"{self.final_head}{json.dumps(finish_reason or 'stop')}{self.final_tail}{self.done_frame}"
+
+    @classmethod
+    def chat(cls, request_id: str, model: str, created: Optional[int] = None) -> "SSEChunkTemplate":
+        """chat.completion.chunk frames (role sent once, in the first frame)"""
+        envelope = (
+            f'data: {{"id":{json.dumps(request_id)},"object":"chat.completion.chunk",'
+            f'"created":{int(created or time.time())},"model":{json.dumps(model)},"choices":[{{"index":0,'
+        )
+        return cls(
+            head=envelope + '"delta":{"content":',
+            tail='},"logprobs":null,"finish_reason":null}]}\n\n',
+            final_head=envelope + '"delta":{},"logprobs":null,"finish_reason":',
+            final_tail='}]}\n\n',
+            first_frame=envelope + '"delta":{"role":"assistant","content":""},"logprobs":null,"finish_reason":null}]}\n\n'
+        )
+
+    @classmethod
+    def completion(cls, request_id: str, model: str, created: Optional[int] = None) -> "SSEChunkTemplate":
+        """text_completion.chunk frames"""
+        envelope = (
+            f'data: {{"id":{json.dumps(request_id)},"object":"text_completion.chunk",'
+            f'"created":{int(created or time.time())},"model":{json.dumps(model)},"choices":[{{"index":0,'
+        )
+        return cls(
+            head=envelope + '"text":',
+            tail=',"logprobs":null,"finish_reason":null}]}\n\n',
+            final_head=envelope + '"text":"","logprobs":null,"finish_reason":',
+            final_tail='}]}\n\n'
+        )
+
+    @classmethod
+    def ollama(cls, model: str) -> "SSEChunkTemplate":
+        """Ollama /api/generate stream frames (no [DONE] sentinel)"""
+        envelope = (
+            f'data: {{"model":{json.dumps(model)},'
+            f'"created_at":"{time.strftime("%Y-%m-%dT%H:%M:%S.000Z")}","response":'
+        )
+        return cls(
+            head=envelope,
+            tail=',"done":false}\n\n',
+            final_head=envelope + '"","done":true,"done_reason":',
+            final_tail='}\n\n',
+            done_frame=''
+        )
+
+
+class StreamEmitter:
+    """
+    Turns (text, finish_reason) deltas into coalesced SSE frames
+
+    A producer task drains the source into a text buffer; frames are cut
+    from it as the client consumes them. A delta that arrives at least
+    max_delay_ms after the previous frame is sent right away; faster bursts
+    are merged into one frame per max_delay_ms (or max_chars). If the
+    client falls more than max_pending_chars behind, the source is closed
+    (aborting the vLLM request) and the stream ends with finish_reason
+    "abort".
+    """
+
+    def __init__(
+        self,
+        template: SSEChunkTemplate,
+        max_delay_ms: float = 15.0,
+        max_chars: int = 256,
+        max_pending_chars: int = 1 << 20
+    ):
+        self.template = template
+        self.max_delay = max_delay_ms / 1000
+        self.max_chars = max_chars
+        self.max_pending_chars = max_pending_chars
+
+        # Stats
+        self.frames_sent = 0
+        self.deltas_received = 0
+        self.overflowed = False
+
+    async def frames(self, deltas: AsyncIterator[Tuple[str, Optional[str]]]) -> AsyncIterator[str]:
+        """SSE frames (ending with the final chunk and [DONE])"""
+        loop = asyncio.get_running_loop()
+        pending: List[str] = []
+        state = {'chars': 0, 'finish_reason': None, 'done': False, 'error': None}
+        wakeup = asyncio.Event()
+
+        async def produce():
+            try:
+                async for text, finish_reason in deltas:
+                    self.deltas_received += 1
+                    if text:
+                        pending.append(text)
+                        state['chars'] += len(text)
+                    if finish_reason is not None:
+                        state['finish_reason'] = finish_reason
+                    if state['chars'] > self.max_pending_chars:
+                        # Client too slow: stop pulling from the engine
+                        self.overflowed = True
+                        state['finish_reason'] = 'abort'
+                        break
+                    wakeup.set()
+            except Exception as e:
+                state['error'] = e
+            finally:
+                aclose = getattr(deltas, 'aclose', None)
+                if aclose is not None:
+                    await aclose()
+                state['done'] = True
+                wakeup.set()
+
+        producer = asyncio.create_task(produce())
+        last_frame = 0.0
+        try:
+            if self.template.first_frame:
+                yield self.template.first_frame
+
+            while True:
+                await wakeup.wait()
+                wakeup.clear()
+
+                if not state['done'] and state['chars'] < self.max_chars:
+                    # Coalesce bursts: wait out the rest of the frame interval
+                    remaining = last_frame + self.max_delay - loop.time()
+                    if remaining > 0:
+                        await asyncio.sleep(remaining)
+
+                if pending:
+                    text = ''.join(pending)
+                    pending.clear()
+                    state['chars'] = 0
+                    last_frame = loop.time()
+                    self.frames_sent += 1
+                    yield self.template.frame(text)
+
+                if state['done'] and not pending:
+                    break
+
+            if state['error'] is not None:
+                raise state['error']
+
+            yield self.template.final(state['finish_reason'])
+        finally:
+            if not producer.done():
+                producer.cancel()
+                try:
+                    await producer
+                except asyncio.CancelledError:
+                    pass
+
+    def get_stats(self) -> dict:
+        """Emitter statistics"""
+        return {
+            'frames_sent': self.frames_sent,
+            'deltas_received': self.deltas_received,
+            'overflowed': self.overflowed
+        }
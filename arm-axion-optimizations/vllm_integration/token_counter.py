@@ -0,0 +1,156 @@
+"""
+Shared token counting for context assembly
+
+Counts are cached per text and keyed by model family. Exact mode uses the
+family's real tokenizer (the engine's own tokenizer when registered);
+approximate mode uses a per-family chars-per-token ratio.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from transformers import AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+
+# Average chars per token on mixed Spanish/English text
+CHARS_PER_TOKEN = {
+    'default': 4.0,
+    'gpt-oss': 4.0,
+    'llama': 3.8,
+    'mistral': 3.5,
+    'gemma': 3.8,
+    'qwen': 3.7,
+    'aya': 3.6
+}
+
+FAMILY_TOKENIZERS = {
+    'gpt-oss': 'openai/gpt-oss-20b',
+    'llama': 'meta-llama/Llama-3.1-8B-Instruct',
+    'mistral': 'mistralai/Mistral-7B-Instruct-v0.3',
+    'gemma': 'google/gemma-3-12b-it',
+    'qwen': 'Qwen/Qwen2.5-7B-Instruct',
+    'aya': 'CohereForAI/aya-expanse-8b'
+}
+
+
+def model_family_for(model_name: str) -> str:
+    """Tokenizer family for a model name or path"""
+    name = (model_name or '').lower()
+    for family in FAMILY_TOKENIZERS:
+        if family in name:
+            return family
+    if 'phi' in name:
+        return 'llama'
+    return 'default'
+
+
+class TokenCounter:
+    """Cached token counter for one model family (thread-safe)"""
+
+    def __init__(
+        self,
+        model_family: str = 'default',
+        exact: bool = False,
+        tokenizer: Any = None,
+        cache_size: int = 50000
+    ):
+        """
+        Args:
+            model_family: Tokenizer family (see CHARS_PER_TOKEN)
+            exact: Count with the real tokenizer (falls back to approximate)
+            tokenizer: Already-loaded tokenizer for exact mode
+            cache_size: Max cached counts
+        """
+        self.model_family = model_family
+        self.exact = exact or tokenizer is not None
+        self.chars_per_token = CHARS_PER_TOKEN.get(model_family, CHARS_PER_TOKEN['default'])
+        self.cache_size = cache_size
+
+        self._tokenizer = tokenizer
+        self._tokenizer_failed = False
+        self._cache: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.counts = 0
+        self.cache_hits = 0
+
+    def _get_tokenizer(self):
+        if self._tokenizer is not None or self._tokenizer_failed:
+            return self._tokenizer
+
+        name = FAMILY_TOKENIZERS.get(self.model_family)
+        if TRANSFORMERS_AVAILABLE and name is not None:
+            try:
+                self._tokenizer = AutoTokenizer.from_pretrained(name)
+                return self._tokenizer
+            except Exception as e:
+                print(f"⚠️  Tokenizer {name} unavailable ({e}), using approximate counts")
+
+        self._tokenizer_failed = True
+        return None
+
+    def _count_uncached(self, text: str) -> int:
+        if self.exact:
+            tokenizer = self._get_tokenizer()
+            if tokenizer is not None:
+                return len(tokenizer.encode(text, add_special_tokens=False))
+        # Every word is at least one token; the family ratio covers the rest
+        return max(len(text.split()), math.ceil(len(text) / self.chars_per_token))
+
+    def count(self, text: str) -> int:
+        """Token count of `text` (cached)"""
+        if not text:
+            return 0
+
+        key = (len(text), hash(text))
+        with self._lock:
+            self.counts += 1
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return tokens
+
+        tokens = self._count_uncached(text)
+
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counter statistics"""
+        return {
+            'model_family': self.model_family,
+            'exact': self.exact and self._tokenizer is not None,
+            'counts': self.counts,
+            'cache_hits': self.cache_hits,
+            'cached_entries': len(self._cache)
+        }
+
+
+_counters: Dict[Tuple[str, bool], TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model_family: str = 'default', exact: bool = False,
+                      tokenizer: Optional[Any] = None) -> TokenCounter:
+    """
+    Shared counter per (family, mode)
+
+    Passing a tokenizer (e.g. the vLLM engine's) registers it as the exact
+    counter for that family.
+    """
+    key = (model_family, exact or tokenizer is not None)
+    with _counters_lock:
+        counter = _counters.get(key)
+        if counter is None or (tokenizer is not None and counter._tokenizer is None):
+            counter = _counters[key] = TokenCounter(model_family, key[1], tokenizer)
+        return counter
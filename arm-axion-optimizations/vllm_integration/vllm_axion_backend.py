@@ -10,8 +10,11 @@ Integración con vLLM existente, agregando:
 
 import os
 import sys
+import asyncio
+import itertools
+import threading
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 import numpy as np
 
 # Add parent directory to path for our kernels
@@ -25,19 +28,79 @@ except ImportError:
     NEON_AVAILABLE = False
     print("⚠️  NEON kernels not available, using vLLM defaults")
 
+from vllm_integration.stream_emitter import (
+    DeltaTracker, IncrementalDetokenizer, prepare_streaming_params
+)
+
 # vLLM imports
 try:
-    from vllm import LLM, SamplingParams
+    from vllm import SamplingParams
     from vllm.config import ModelConfig, ParallelConfig, SchedulerConfig
-    from vllm.engine.arg_utils import EngineArgs, AsyncEngineArgs
+    from vllm.engine.arg_utils import EngineArgs
     from vllm.engine.llm_engine import LLMEngine
-    from vllm.engine.async_llm_engine import AsyncLLMEngine
     VLLM_AVAILABLE = True
 except ImportError:
     VLLM_AVAILABLE = False
     print("⚠️  vLLM not installed. Install: pip install vllm")
 
 
+def _model_weight_bytes(engine) -> Optional[int]:
+    """Bytes of the loaded weights, as accounted by the engine's model runner"""
+    try:
+        runner = engine.model_executor.driver_worker.model_runner
+    except AttributeError:
+        return None
+
+    usage = getattr(runner, 'model_memory_usage', None)
+    if usage:
+        return int(usage)
+
+    model = getattr(runner, 'model', None)
+    if model is None:
+        return None
+    tensors = itertools.chain(model.parameters(), model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def _kv_cache_bytes(engine) -> Optional[int]:
+    """Bytes of the KV cache: allocated blocks x bytes per block"""
+    try:
+        cache_config = engine.cache_config
+        model_config = engine.model_config
+        parallel_config = engine.parallel_config
+        num_blocks = cache_config.num_gpu_blocks
+        if not num_blocks:
+            return None
+
+        if cache_config.cache_dtype in (None, 'auto'):
+            dtype_bytes = model_config.dtype.itemsize
+        else:
+            dtype_bytes = 1  # fp8 variants
+        # Keys and values for every layer of one block
+        block_bytes = (2 * cache_config.block_size *
+                       model_config.get_num_kv_heads(parallel_config) *
+                       model_config.get_head_size() *
+                       model_config.get_num_layers(parallel_config) * dtype_bytes)
+    except (AttributeError, TypeError):
+        return None
+    return int(num_blocks) * block_bytes
+
+
+def _engine_memory_gb(engine) -> Optional[float]:
+    """
+    Memory an engine holds (weights + KV cache) in GB, from its own
+    accounting; None if this vLLM version does not expose it
+
+    Unlike a process RSS delta it is not skewed by other experts loading
+    at the same time.
+    """
+    weights = _model_weight_bytes(engine)
+    kv_cache = _kv_cache_bytes(engine)
+    if weights is None and kv_cache is None:
+        return None
+    return ((weights or 0) + (kv_cache or 0)) / (1024**3)
+
+
 class AxionVLLMConfig:
     """
     Configuración optimizada para vLLM en ARM Axion
@@ -54,6 +117,7 @@ class AxionVLLMConfig:
         enable_neon: bool = True,
         enable_chunked_prefill: bool = True,
         max_num_batched_tokens: Optional[int] = None,
+        max_concurrent_generations: int = 4,
     ):
         """
         Args:
@@ -66,6 +130,8 @@ class AxionVLLMConfig:
             enable_neon: Enable NEON optimizations
             enable_chunked_prefill: Enable chunked prefill for lower TTFT
             max_num_batched_tokens: Max tokens in batch (for prefill)
+            max_concurrent_generations: Max in-flight generate_async() calls
+                for this expert (extra callers wait without holding a thread)
         """
         self.model_path = model_path
         self.quantization = quantization
@@ -78,6 +144,7 @@ class AxionVLLMConfig:
         self.max_num_batched_tokens = max_num_batched_tokens or (
             8192 if enable_chunked_prefill else None
         )
+        self.max_concurrent_generations = max(1, max_concurrent_generations)
 
     def to_engine_args(self) -> Dict[str, Any]:
         """Convert to vLLM EngineArgs format"""
@@ -117,6 +184,12 @@ class AxionVLLMEngine:
     - Custom Q4/Q8 quantization
     - ARM-optimized memory management
     - Integration with semantic routing
+
+    One LLMEngine per model serves blocking generate(), generate_async()
+    and generate_streaming(): a single engine thread owns the engine,
+    steps it while any request is in flight and hands each RequestOutput
+    to the caller that submitted it. All callers share the same weights,
+    KV cache and scheduler (so their requests are batched together).
     """
 
     def __init__(
@@ -153,24 +226,153 @@ class AxionVLLMEngine:
         else:
             self.quantizer = None
 
-        # Create vLLM engine (sync for batch operations)
+        # Create the model's only vLLM engine (weights + KV cache loaded once)
         print(f"🚀 [{self.engine_id}] Initializing vLLM engine...")
         engine_args = config.to_engine_args()
 
         try:
-            self.llm = LLM(**engine_args)
+            self.engine = LLMEngine.from_engine_args(EngineArgs(**engine_args))
             print(f"✅ [{self.engine_id}] vLLM engine ready")
         except Exception as e:
             print(f"❌ [{self.engine_id}] Failed to initialize vLLM: {e}")
             raise
 
-        # Create async engine for streaming (lazy initialization)
-        self.async_engine = None
-        self.async_engine_args = engine_args
+        # Weights + KV cache held by this engine, or None when this vLLM
+        # version does not expose its accounting
+        self.memory_gb = _engine_memory_gb(self.engine)
+
+        # Engine thread state: submissions/aborts are queued under
+        # _work_available and applied by the engine thread between steps
+        self._work_available = threading.Condition()
+        self._pending_adds: List[tuple] = []
+        self._pending_aborts: List[str] = []
+        self._sinks: Dict[str, Callable] = {}
+        self._closed = False
+        self._generation_slots: Optional[asyncio.Semaphore] = None
+        self._request_counter = itertools.count()
+        self._tokenizer = None
+
+        self._engine_thread = threading.Thread(
+            target=self._engine_loop,
+            name=f"vllm-{self.engine_id}",
+            daemon=True
+        )
+        self._engine_thread.start()
 
         # Stats
         self.total_requests = 0
         self.total_tokens_generated = 0
+        self.cancelled_requests = 0
+
+    def _engine_loop(self):
+        """Engine thread: apply queued adds/aborts, step, dispatch outputs"""
+        engine = self.engine
+        while True:
+            with self._work_available:
+                while (not self._closed and not self._pending_adds and
+                       not self._pending_aborts and not engine.has_unfinished_requests()):
+                    self._work_available.wait()
+                if self._closed:
+                    break
+                adds, self._pending_adds = self._pending_adds, []
+                aborts, self._pending_aborts = self._pending_aborts, []
+
+            for request_id, prompt, sampling_params in adds:
+                try:
+                    engine.add_request(request_id, prompt, sampling_params)
+                except Exception as e:
+                    self._dispatch(request_id, None, e)
+
+            if aborts:
+                engine.abort_request(aborts)
+
+            if not engine.has_unfinished_requests():
+                continue
+
+            try:
+                outputs = engine.step()
+            except Exception as e:
+                # Fail every in-flight request instead of killing the thread
+                print(f"❌ [{self.engine_id}] Engine step failed: {e}")
+                request_ids = list(self._sinks)
+                engine.abort_request(request_ids)
+                for request_id in request_ids:
+                    self._dispatch(request_id, None, e)
+                continue
+
+            for output in outputs:
+                self._dispatch(output.request_id, output, None)
+
+        # Closed: fail whoever is still waiting
+        for request_id in list(self._sinks):
+            self._dispatch(request_id, None, RuntimeError(f"Engine {self.engine_id} shut down"))
+
+    def _dispatch(self, request_id: str, output, error: Optional[BaseException]):
+        """Hand an output (or error) to the request's sink"""
+        if error is not None or output.finished:
+            sink = self._sinks.pop(request_id, None)
+        else:
+            sink = self._sinks.get(request_id)
+        if sink is not None:
+            sink(output, error)
+
+    def _submit(
+        self,
+        prompt: str,
+        sampling_params: SamplingParams,
+        sink: Callable,
+        request_id: Optional[str] = None
+    ) -> str:
+        """
+        Queue a request for the engine thread
+
+        `sink(output, error)` is called from the engine thread for every
+        RequestOutput of the request, or once with an error.
+
+        Raises:
+            ValueError: If `request_id` is already in flight
+        """
+        if request_id is None:
+            request_id = f"{self.engine_id}-{next(self._request_counter)}"
+
+        with self._work_available:
+            if self._closed:
+                raise RuntimeError(f"Engine {self.engine_id} is shut down")
+            if request_id in self._sinks or request_id in self._pending_aborts:
+                raise ValueError(f"Request {request_id} is already in flight on {self.engine_id}")
+            self._sinks[request_id] = sink
+            self._pending_adds.append((request_id, prompt, sampling_params))
+            self._work_available.notify()
+
+        return request_id
+
+    def _abort(self, request_ids: List[str]):
+        """Drop the sinks and abort the requests at the next engine step"""
+        with self._work_available:
+            for request_id in request_ids:
+                self._sinks.pop(request_id, None)
+            self._pending_aborts.extend(request_ids)
+            self._work_available.notify()
+
+    @staticmethod
+    def _future_sink(loop: asyncio.AbstractEventLoop, future: asyncio.Future) -> Callable:
+        """Sink resolving `future` with the final output (thread-safe)"""
+        def resolve(output, error):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(output)
+
+        def sink(output, error):
+            if error is not None or output.finished:
+                try:
+                    loop.call_soon_threadsafe(resolve, output, error)
+                except RuntimeError:
+                    pass  # Event loop already closed
+
+        return sink
 
     def generate(
         self,
@@ -179,12 +381,15 @@ class AxionVLLMEngine:
         use_tqdm: bool = False
     ) -> List[Dict[str, Any]]:
         """
-        Generate completions for prompts
+        Generate completions for prompts (blocking)
+
+        Must not be called from the event loop thread; use generate_async()
+        there.
 
         Args:
             prompts: List of prompt strings
             sampling_params: vLLM sampling parameters
-            use_tqdm: Show progress bar
+            use_tqdm: Unused, kept for API compatibility
 
         Returns:
             List of generation results
@@ -196,14 +401,33 @@ class AxionVLLMEngine:
                 max_tokens=512,
             )
 
-        # Generate with vLLM
-        outputs = self.llm.generate(
-            prompts,
-            sampling_params,
-            use_tqdm=use_tqdm
-        )
+        if not prompts:
+            return []
+
+        done = threading.Event()
+        finished: Dict[str, Any] = {}
+        errors: List[BaseException] = []
+
+        def sink(output, error):
+            if error is not None:
+                errors.append(error)
+                done.set()
+            elif output.finished:
+                finished[output.request_id] = output
+                if len(finished) == len(prompts):
+                    done.set()
+
+        request_ids = [self._submit(prompt, sampling_params, sink) for prompt in prompts]
+        done.wait()
+
+        if errors:
+            self._abort(request_ids)
+            raise errors[0]
 
-        # Process outputs
+        return self._process_outputs([finished[rid] for rid in request_ids])
+
+    def _process_outputs(self, outputs) -> List[Dict[str, Any]]:
+        """Convert vLLM RequestOutputs to result dicts and update stats"""
         results = []
         for output in outputs:
             result = {
@@ -217,31 +441,60 @@ class AxionVLLMEngine:
 
             self.total_tokens_generated += len(output.outputs[0].token_ids)
 
-        self.total_requests += len(prompts)
+        self.total_requests += len(outputs)
 
         return results
 
-    async def _get_async_engine(self):
+    async def generate_async(
+        self,
+        prompts: List[str],
+        sampling_params: Optional[SamplingParams] = None
+    ) -> List[Dict[str, Any]]:
         """
-        Get or create async engine for streaming (lazy initialization)
+        Generate completions without blocking the event loop
+
+        Limited to max_concurrent_generations in-flight calls. If the
+        awaiting task is cancelled (e.g. the client disconnected), the vLLM
+        requests are aborted at the next engine step.
+
+        Args:
+            prompts: List of prompt strings
+            sampling_params: vLLM sampling parameters
 
         Returns:
-            AsyncLLMEngine instance
+            List of generation results
         """
-        if self.async_engine is None:
-            import asyncio
+        if sampling_params is None:
+            sampling_params = SamplingParams(
+                temperature=0.7,
+                top_p=0.9,
+                max_tokens=512,
+            )
 
-            print(f"🚀 [{self.engine_id}] Initializing async engine for streaming...")
+        if self._generation_slots is None:
+            self._generation_slots = asyncio.Semaphore(self.config.max_concurrent_generations)
 
-            # Create AsyncEngineArgs from engine_args
-            async_args = AsyncEngineArgs(**self.async_engine_args)
+        loop = asyncio.get_running_loop()
 
-            # Create async engine
-            self.async_engine = AsyncLLMEngine.from_engine_args(async_args)
+        async with self._generation_slots:
+            request_ids = []
+            futures = []
+            for prompt in prompts:
+                future = loop.create_future()
+                request_ids.append(self._submit(prompt, sampling_params, self._future_sink(loop, future)))
+                futures.append(future)
 
-            print(f"✅ [{self.engine_id}] Async engine ready")
+            try:
+                outputs = await asyncio.gather(*futures)
+            except asyncio.CancelledError:
+                self._abort(request_ids)
+                self.cancelled_requests += 1
+                raise
+            except Exception:
+                self._abort(request_ids)
+                raise
 
-        return self.async_engine
+        return self._process_outputs(outputs)
 
     async def generate_streaming(
         self,
@@ -252,8 +505,11 @@ class AxionVLLMEngine:
         """
         Generate completion with TRUE streaming (async generator)
 
-        Uses vLLM's AsyncLLMEngine for real token-by-token streaming
-        with minimal latency (TTFT ~0.05-0.1s vs simulated ~0.2s+)
+        Token-by-token output from the same engine that serves generate(),
+        so streaming does not load a second copy of the model. Holds one of
+        the max_concurrent_generations slots (shared with generate_async)
+        until the stream ends. Closing the generator early aborts the
+        request.
 
         Args:
             prompt: Single prompt string
@@ -263,8 +519,6 @@ class AxionVLLMEngine:
         Yields:
             Token strings as they're generated in real-time
         """
-        import uuid
-
         if sampling_params is None:
             sampling_params = SamplingParams(
                 temperature=0.7,
@@ -272,34 +526,80 @@ class AxionVLLMEngine:
                 max_tokens=512,
             )
 
-        if request_id is None:
-            request_id = str(uuid.uuid4())
+        # Delta outputs, detokenized here instead of on the engine thread
+        tokenizer = self.get_tokenizer()
+        sampling_params, detokenize_in_stream = prepare_streaming_params(sampling_params, tokenizer)
+        detokenizer = None
+        tracker = None
 
-        # Get async engine (lazy init)
-        engine = await self._get_async_engine()
+        if self._generation_slots is None:
+            self._generation_slots = asyncio.Semaphore(self.config.max_concurrent_generations)
 
-        # Add request to async engine
-        results_generator = engine.generate(
-            prompt=prompt,
-            sampling_params=sampling_params,
-            request_id=request_id
-        )
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
 
-        # Stream tokens as they're generated
-        previous_text = ""
-        async for request_output in results_generator:
-            # Get the new text (delta from previous)
-            current_text = request_output.outputs[0].text
-            new_text = current_text[len(previous_text):]
-            previous_text = current_text
+        def sink(output, error):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (output, error))
+            except RuntimeError:
+                pass  # Event loop already closed
 
-            if new_text:
-                yield new_text
+        await self._generation_slots.acquire()
+        try:
+            request_id = self._submit(prompt, sampling_params, sink, request_id)
+        except BaseException:
+            self._generation_slots.release()
+            raise
 
-            # Track tokens generated
-            if request_output.finished:
-                self.total_tokens_generated += len(request_output.outputs[0].token_ids)
-                self.total_requests += 1
+        # Stream tokens as they're generated
+        finished = False
+        try:
+            while not finished:
+                request_output, error = await queue.get()
+                if error is not None:
+                    finished = True
+                    raise error
+
+                if tracker is None:
+                    if detokenize_in_stream:
+                        detokenizer = IncrementalDetokenizer(tokenizer, request_output.prompt_token_ids)
+                    tracker = DeltaTracker(detokenizer)
+
+                # New text from token/text offsets (no rescans of the completion)
+                new_text = tracker.update(request_output.outputs[0])
+
+                # Track tokens generated
+                if request_output.finished:
+                    finished = True
+                    self.total_tokens_generated += tracker.num_tokens
+                    self.total_requests += 1
+
+                if new_text:
+                    yield new_text
+        finally:
+            if not finished:
+                self._abort([request_id])
+                self.cancelled_requests += 1
+            self._generation_slots.release()
+
+    def get_tokenizer(self):
+        """Tokenizer of the loaded model (e.g. for exact token counting)"""
+        if self._tokenizer is None:
+            self._tokenizer = self.engine.get_tokenizer()
+        return self._tokenizer
+
+    @property
+    def in_flight_requests(self) -> int:
+        """Requests submitted and not finished (or aborted) yet"""
+        with self._work_available:
+            return len(self._sinks)
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop the engine thread; pending requests fail with RuntimeError"""
+        with self._work_available:
+            self._closed = True
+            self._work_available.notify()
+        self._engine_thread.join(timeout=timeout)
 
     def get_stats(self) -> Dict[str, Any]:
         """Get engine statistics"""
@@ -307,6 +607,9 @@ class AxionVLLMEngine:
             'engine_id': self.engine_id,
             'total_requests': self.total_requests,
             'total_tokens_generated': self.total_tokens_generated,
+            'cancelled_requests': self.cancelled_requests,
+            'in_flight_requests': len(self._sinks),
+            'memory_gb': round(self.memory_gb, 2) if self.memory_gb is not None else None,
             'neon_enabled': self.use_neon,
             'quantization': self.config.quantization,
             'model': self.config.model_path
@@ -398,6 +701,7 @@ class AxionMultiExpertVLLM:
                     max_num_seqs=expert_config.get('max_num_seqs', 128),
                     enable_neon=expert_config.get('enable_neon', True),
                     enable_chunked_prefill=expert_config.get('enable_chunked_prefill', True),
+                    max_concurrent_generations=expert_config.get('max_concurrent_generations', 4),
                 )
 
                 # Create engine
@@ -436,6 +740,20 @@ class AxionMultiExpertVLLM:
             expert_info = self.experts.get(expert_id)
             return expert_info.get('engine') if expert_info else None
 
+    def prefetch_experts(self, expert_ids: List[str], probabilities: List[float]) -> List[str]:
+        """
+        Hint likely experts from the router's top-k (non-blocking)
+
+        With lazy loading, starts background loads for probable experts
+        that are not loaded yet. No-op when all experts are preloaded.
+
+        Returns:
+            Expert IDs whose load was started
+        """
+        if not self.use_lazy_loading:
+            return []
+        return self.lazy_manager.prefetch(expert_ids, probabilities)
+
     def get_expert_sync(self, expert_id: str) -> Optional[AxionVLLMEngine]:
         """
         Get expert by ID (synchronous version for non-lazy mode)
@@ -494,8 +812,6 @@ class AxionMultiExpertVLLM:
         Returns:
             List of results from each expert
         """
-        import asyncio
-
         if expert_probabilities is None:
             expert_probabilities = [1.0] * len(expert_ids)
 
@@ -505,26 +821,27 @@ class AxionMultiExpertVLLM:
             expert = await self.get_expert(expert_id, predicted_probability=prob)
 
             if expert:
-                # Note: In real implementation, use vLLM's async API
+                # Each expert generates on its own engine thread (off the event loop)
                 task = asyncio.create_task(
-                    asyncio.to_thread(
-                        expert.generate,
-                        [prompt],
-                        sampling_params
-                    )
+                    expert.generate_async([prompt], sampling_params)
                 )
                 tasks.append((expert_id, task))
 
-        # Wait for all experts
-        results = []
-        for expert_id, task in tasks:
-            expert_result = await task
-            results.append({
+        # Wait for all experts (cancelling the rest if one fails or we are cancelled)
+        try:
+            expert_results = await asyncio.gather(*(task for _, task in tasks))
+        except BaseException:
+            for _, task in tasks:
+                task.cancel()
+            raise
+
+        return [
+            {
                 'expert_id': expert_id,
                 'result': expert_result[0]
-            })
-
-        return results
+            }
+            for (expert_id, _), expert_result in zip(tasks, expert_results)
+        ]
 
     async def generate_streaming_from_expert(
         self,
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ContextFanout - Consulta concurrente de fuentes de contexto con presupuesto de tiempo.
+
+Cada fuente (StaticCache, DynamicContext, RAG, proveedores) se ejecuta en un
+pool compartido con su propio timeout; el llamador recibe lo que haya
+llegado antes del límite y la latencia de cada fuente, de modo que la más
+lenta ya no fija el suelo de cada petición. La espera en cola del pool se
+informa aparte (queue_ms) y no se suma a latency_ms.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from ..deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SourceResult:
+    """Resultado de una fuente dentro de un fan-out."""
+    name: str
+    content: Any = None
+    latency_ms: float = 0.0  # Ejecución de la fuente
+    queue_ms: float = 0.0    # Espera hasta obtener un hilo del pool
+    status: str = "pending"  # ok, empty, timeout, error
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+class ContextFanout:
+    """
+    Ejecuta fuentes de contexto en paralelo, cada una con su timeout.
+
+    Las fuentes que no responden a tiempo se marcan como 'timeout' y su
+    resultado se descarta; el hilo sigue hasta terminar (no se puede
+    interrumpir), por eso el pool se comparte y tiene tamaño acotado.
+    """
+
+    def __init__(self, max_workers: int = 16, default_timeout_ms: float = 500.0):
+        """
+        Args:
+            max_workers: Hilos del pool compartido
+            default_timeout_ms: Timeout de las fuentes sin uno propio
+        """
+        self.default_timeout_ms = default_timeout_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="context-fanout")
+
+        self.stats = {
+            'fanouts': 0,
+            'source_calls': 0,
+            'timeouts': 0,
+            'errors': 0
+        }
+
+    @staticmethod
+    def _timed(func: Callable[[], Any], started: Dict[str, float], name: str):
+        start = started[name] = time.monotonic()
+        value = func()
+        return value, (time.monotonic() - start) * 1000
+
+    def run(self, sources: Dict[str, Callable[[], Any]],
+            timeouts_ms: Dict[str, float] = None,
+            deadline: Optional[Deadline] = None) -> Dict[str, SourceResult]:
+        """
+        Consulta todas las fuentes concurrentemente.
+
+        Args:
+            sources: Nombre -> función sin argumentos que devuelve el contexto
+            timeouts_ms: Timeout por fuente (opcional)
+            deadline: Presupuesto global; ninguna fuente espera más allá
+
+        Returns:
+            Nombre -> SourceResult, en el orden de `sources`
+        """
+        timeouts_ms = timeouts_ms or {}
+        results = {name: SourceResult(name) for name in sources}
+        if not sources:
+            return results
+
+        start = time.monotonic()
+        global_limit = start + deadline.remaining_s() if deadline is not None else None
+
+        futures = {}
+        limits = {}
+        started: Dict[str, float] = {}
+        for name, func in sources.items():
+            future = self._executor.submit(self._timed, func, started, name)
+            futures[future] = name
+            limit = start + timeouts_ms.get(name, self.default_timeout_ms) / 1000
+            limits[future] = min(limit, global_limit) if global_limit is not None else limit
+
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            expired = {future for future in pending if limits[future] <= now}
+            for future in expired:
+                future.cancel()
+                result = results[futures[future]]
+                result.status = "timeout"
+                self._split_latency(result, start, started.get(result.name), now)
+            pending -= expired
+            if not pending:
+                break
+
+            next_limit = min(limits[future] for future in pending)
+            done, pending = wait(pending, timeout=max(0.0, next_limit - now),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                result = results[futures[future]]
+                try:
+                    result.content, result.latency_ms = future.result()
+                    result.queue_ms = (started[result.name] - start) * 1000
+                    result.status = "ok" if result.content else "empty"
+                except Exception as e:
+                    result.status = "error"
+                    result.error = str(e)
+                    self._split_latency(result, start, started.get(result.name), time.monotonic())
+                    logger.error(f"Error en fuente de contexto '{result.name}': {e}")
+
+        self._update_stats(results)
+        return results
+
+    @staticmethod
+    def _split_latency(result: SourceResult, submitted: float,
+                       started: Optional[float], now: float):
+        """Reparte el tiempo transcurrido entre cola y ejecución."""
+        if started is None:
+            # Ni siquiera obtuvo un hilo
+            result.queue_ms = (now - submitted) * 1000
+            result.latency_ms = 0.0
+        else:
+            result.queue_ms = (started - submitted) * 1000
+            result.latency_ms = (now - started) * 1000
+
+    def _update_stats(self, results: Dict[str, SourceResult]):
+        self.stats['fanouts'] += 1
+        self.stats['source_calls'] += len(results)
+        for result in results.values():
+            if result.status == "timeout":
+                self.stats['timeouts'] += 1
+                logger.warning(f"Fuente de contexto '{result.name}' excedió su presupuesto "
+                               f"({result.latency_ms:.1f}ms + {result.queue_ms:.1f}ms en cola)")
+            elif result.status == "error":
+                self.stats['errors'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estadísticas del fan-out."""
+        return dict(self.stats)
+
+
+_default_fanout: Optional[ContextFanout] = None
+_default_fanout_lock = threading.Lock()
+
+
+def get_context_fanout() -> ContextFanout:
+    """Fan-out compartido por los componentes CAG del proceso."""
+    global _default_fanout
+    if _default_fanout is None:
+        with _default_fanout_lock:
+            if _default_fanout is None:
+                _default_fanout = ContextFanout()
+    return _default_fanout
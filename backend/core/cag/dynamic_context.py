@@ -5,53 +5,182 @@ DynamicContext - Contexto dinámico que se llenará con ACE.
 """
 
 import logging
-from typing import Dict, List, Any, Optional, Callable
+from typing import Dict, List, Any, Iterator, Optional, Callable, Set, Tuple
 from datetime import datetime, timedelta
+import heapq
+import itertools
 import json
+import re
 import threading
 from collections import deque
 
+from ..token_counter import CountedText, TokenCounter, get_token_counter
+from .context_fanout import ContextFanout
+
 logger = logging.getLogger(__name__)
 
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Partición de las entradas sin sesión (compartidas por todas las sesiones)
+GLOBAL_PARTITION = "__global__"
+
+
+def _entry_terms(entry: Dict[str, Any]) -> Set[str]:
+    """Términos indexables de una entrada (contenido y metadata de texto)."""
+    terms = set(TOKEN_PATTERN.findall(entry['content'].lower()))
+    for value in entry.get('metadata', {}).values():
+        if isinstance(value, str):
+            terms.update(TOKEN_PATTERN.findall(value.lower()))
+    return terms
+
+
+class _ContextPartition:
+    """
+    Entradas de una sesión con su propio lock.
+    
+    Mantiene un min-heap por expiración (las entradas vencidas se retiran
+    de forma perezosa, sin recorrer el resto), conjuntos por fuente y un
+    índice invertido término -> ids para seleccionar candidatos relevantes.
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries: Dict[str, Dict[str, Any]] = {}  # Orden de inserción
+        self.expiry_heap: List[Tuple[datetime, int, str]] = []
+        self.by_source: Dict[str, Set[str]] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        self.terms: Dict[str, Set[str]] = {}
+        self._seq = itertools.count()
+    
+    def add(self, entry: Dict[str, Any]):
+        entry_id = entry['id']
+        self.entries[entry_id] = entry
+        heapq.heappush(self.expiry_heap, (entry['expires_at'], next(self._seq), entry_id))
+        self.by_source.setdefault(entry['source'], set()).add(entry_id)
+        
+        terms = _entry_terms(entry)
+        self.terms[entry_id] = terms
+        for term in terms:
+            self.postings.setdefault(term, set()).add(entry_id)
+    
+    def remove(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return None
+        
+        source_ids = self.by_source.get(entry['source'])
+        if source_ids is not None:
+            source_ids.discard(entry_id)
+            if not source_ids:
+                del self.by_source[entry['source']]
+        
+        for term in self.terms.pop(entry_id, ()):
+            term_ids = self.postings.get(term)
+            if term_ids is not None:
+                term_ids.discard(entry_id)
+                if not term_ids:
+                    del self.postings[term]
+        # El heap conserva la referencia; se descarta al salir por arriba
+        return entry
+    
+    def expire(self, now: datetime) -> int:
+        """Retira las entradas vencidas: O(k log n) para k expiradas."""
+        expired = 0
+        heap = self.expiry_heap
+        while heap and heap[0][0] <= now:
+            _, _, entry_id = heapq.heappop(heap)
+            entry = self.entries.get(entry_id)
+            if entry is not None and entry['expires_at'] <= now:
+                self.remove(entry_id)
+                expired += 1
+        
+        # Compactar si el heap acumula demasiadas referencias huérfanas
+        if len(heap) > 2 * len(self.entries) + 64:
+            self.expiry_heap = [(entry['expires_at'], next(self._seq), entry_id)
+                                for entry_id, entry in self.entries.items()]
+            heapq.heapify(self.expiry_heap)
+        return expired
+    
+    def relevant(self, query_terms: Set[str], sources: Optional[Set[str]],
+                 now: datetime) -> List[Tuple[float, Dict[str, Any]]]:
+        """Entradas vivas que comparten términos con la query, con su relevancia."""
+        matches: Dict[str, int] = {}
+        for term in query_terms:
+            for entry_id in self.postings.get(term, ()):
+                matches[entry_id] = matches.get(entry_id, 0) + 1
+        
+        relevant = []
+        for entry_id, count in matches.items():
+            entry = self.entries[entry_id]
+            if entry['expires_at'] <= now:
+                continue
+            if sources is not None and entry['source'] not in sources:
+                continue
+            relevant.append((count / len(query_terms), entry))
+        return relevant
+    
+    def recent(self, sources: Optional[Set[str]], now: datetime) -> Iterator[Dict[str, Any]]:
+        """Entradas vivas de la más reciente a la más antigua."""
+        for entry in reversed(list(self.entries.values())):
+            if entry['expires_at'] > now and (sources is None or entry['source'] in sources):
+                yield entry
+
 
 class DynamicContext:
     """
     Contexto dinámico que se llenará con ACE.
     Gestiona contexto evolutivo basado en conversaciones y patrones.
+    
+    Las entradas se guardan en particiones por sesión (más una global),
+    cada una con su lock, heap de expiración e índice de relevancia, así que
+    peticiones de sesiones distintas no se serializan entre sí.
     """
     
     def __init__(self, max_context_size: int = 1000, 
-                 context_ttl_hours: int = 24):
+                 context_ttl_hours: int = 24,
+                 provider_timeout_ms: float = 200.0):
         """
         Inicializa el DynamicContext.
         
         Args:
             max_context_size: Tamaño máximo del contexto
             context_ttl_hours: TTL del contexto en horas
+            provider_timeout_ms: Timeout por defecto de cada proveedor
         """
         self.max_context_size = max_context_size
         self.context_ttl = timedelta(hours=context_ttl_hours)
+        self.provider_timeout_ms = provider_timeout_ms
         
-        # Almacenamiento de contexto
-        self.context_entries = deque(maxlen=max_context_size)
+        # Almacenamiento de contexto: particiones por sesión y orden global
+        # de inserción (para respetar max_context_size expulsando la más antigua)
+        self._partitions: Dict[str, _ContextPartition] = {}
+        self._partitions_lock = threading.Lock()
+        self._insertion_order = deque()  # (partición, id)
+        self._order_lock = threading.Lock()
+        self._entry_count = 0
         self.context_providers = {}
         self.context_filters = {}
         
-        # Thread safety
+        # Thread safety (proveedores, filtros y métricas)
         self._lock = threading.RLock()
         
+        # Los proveedores se consultan en paralelo, fuera del lock.
+        # Pool propio: get_context puede ejecutarse dentro del fan-out de CAG
+        self._fanout = ContextFanout(max_workers=8, default_timeout_ms=provider_timeout_ms)
+        
         # Métricas
         self.stats = {
             'total_entries': 0,
-            'active_entries': 0,
             'expired_entries': 0,
-            'provider_calls': 0
+            'provider_calls': 0,
+            'provider_timeouts': 0
         }
         
         logger.info("DynamicContext inicializado")
     
     def register_provider(self, name: str, provider_func: Callable, 
-                         priority: int = 0, enabled: bool = True):
+                         priority: int = 0, enabled: bool = True,
+                         timeout_ms: float = None):
         """
         Registra un proveedor de contexto.
         
@@ -60,6 +189,8 @@ class DynamicContext:
             provider_func: Función que genera contexto
             priority: Prioridad (mayor = más importante)
             enabled: Si está habilitado
+            timeout_ms: Presupuesto de tiempo del proveedor (por defecto
+                        provider_timeout_ms)
         """
         try:
             with self._lock:
@@ -67,8 +198,11 @@ class DynamicContext:
                     'function': provider_func,
                     'priority': priority,
                     'enabled': enabled,
+                    'timeout_ms': timeout_ms or self.provider_timeout_ms,
                     'last_called': None,
-                    'call_count': 0
+                    'call_count': 0,
+                    'timeout_count': 0,
+                    'last_latency_ms': None
                 }
                 
                 logger.info(f"Proveedor de contexto '{name}' registrado con prioridad {priority}")
@@ -105,8 +239,32 @@ class DynamicContext:
         except Exception as e:
             logger.error(f"Error registrando filtro '{name}': {e}")
     
+    @property
+    def context_entries(self) -> List[Dict[str, Any]]:
+        """Snapshot de las entradas vivas, en orden de inserción."""
+        with self._order_lock:
+            order = list(self._insertion_order)
+        
+        now = datetime.now()
+        entries = []
+        for partition_key, entry_id in order:
+            partition = self._partitions.get(partition_key)
+            entry = partition.entries.get(entry_id) if partition is not None else None
+            if entry is not None and entry['expires_at'] > now:
+                entries.append(entry)
+        return entries
+    
+    def _get_partition(self, session_id: Optional[str], create: bool = False) -> Optional[_ContextPartition]:
+        key = session_id or GLOBAL_PARTITION
+        partition = self._partitions.get(key)
+        if partition is None and create:
+            with self._partitions_lock:
+                partition = self._partitions.setdefault(key, _ContextPartition())
+        return partition
+    
     def add_context(self, content: str, source: str = "manual", 
-                   metadata: Dict[str, Any] = None, ttl_hours: int = None):
+                   metadata: Dict[str, Any] = None, ttl_hours: int = None,
+                   session_id: str = None):
         """
         Agrega contexto manual.
         
@@ -115,37 +273,82 @@ class DynamicContext:
             source: Fuente del contexto
             metadata: Metadata adicional
             ttl_hours: TTL personalizado en horas
+            session_id: Sesión a la que pertenece (None = compartido)
         """
         try:
+            if metadata is None:
+                metadata = {}
+            
+            ttl = timedelta(hours=ttl_hours) if ttl_hours else self.context_ttl
+            expires_at = datetime.now() + ttl
+            
+            entry = {
+                'id': self._generate_entry_id(),
+                'content': content,
+                'source': source,
+                'metadata': metadata,
+                'created_at': datetime.now(),
+                'expires_at': expires_at,
+                'access_count': 0,
+                'last_accessed': None,
+                'session_id': session_id
+            }
+            
+            self._insert_entry(entry, session_id)
+            
             with self._lock:
-                if metadata is None:
-                    metadata = {}
-                
-                ttl = timedelta(hours=ttl_hours) if ttl_hours else self.context_ttl
-                expires_at = datetime.now() + ttl
-                
-                entry = {
-                    'id': self._generate_entry_id(),
-                    'content': content,
-                    'source': source,
-                    'metadata': metadata,
-                    'created_at': datetime.now(),
-                    'expires_at': expires_at,
-                    'access_count': 0,
-                    'last_accessed': None
-                }
-                
-                self.context_entries.append(entry)
                 self.stats['total_entries'] += 1
-                self.stats['active_entries'] += 1
-                
-                logger.debug(f"Contexto agregado: {source} - {len(content)} chars")
+            
+            logger.debug(f"Contexto agregado: {source} - {len(content)} chars")
                 
         except Exception as e:
             logger.error(f"Error agregando contexto: {e}")
     
+    def _insert_entry(self, entry: Dict[str, Any], session_id: Optional[str] = None):
+        """Inserta una entrada en su partición y expulsa las más antiguas si sobran."""
+        partition_key = session_id or GLOBAL_PARTITION
+        partition = self._get_partition(partition_key, create=True)
+        with partition.lock:
+            partition.add(entry)
+        
+        evicted = []
+        with self._order_lock:
+            self._insertion_order.append((partition_key, entry['id']))
+            self._entry_count += 1
+            
+            # Las entradas ya retiradas quedan como huecos en el orden; se
+            # saltan al expulsar y se compactan cuando se acumulan
+            overflow = self._entry_count - self.max_context_size
+            while overflow > 0 and self._insertion_order:
+                evicted_key, evicted_id = self._insertion_order.popleft()
+                evicted_partition = self._partitions.get(evicted_key)
+                if evicted_partition is not None and evicted_id in evicted_partition.entries:
+                    evicted.append((evicted_partition, evicted_id))
+                    overflow -= 1
+            
+            if len(self._insertion_order) > 2 * self._entry_count + 64:
+                self._insertion_order = deque(
+                    (key, entry_id) for key, entry_id in self._insertion_order
+                    if key in self._partitions and entry_id in self._partitions[key].entries
+                )
+        
+        removed = 0
+        for evicted_partition, evicted_id in evicted:
+            with evicted_partition.lock:
+                if evicted_partition.remove(evicted_id) is not None:
+                    removed += 1
+        self._forget_entries(removed)
+    
+    def _forget_entries(self, count: int):
+        """Descuenta entradas retiradas (expiradas, expulsadas o limpiadas)."""
+        if count:
+            with self._order_lock:
+                self._entry_count -= count
+    
     def get_context(self, query: str, max_tokens: int = 2000, 
-                   include_providers: bool = True) -> str:
+                   include_providers: bool = True, deadline=None,
+                   token_counter: TokenCounter = None, session_id: str = None,
+                   sources: List[str] = None) -> str:
         """
         Obtiene contexto relevante para una query.
         
@@ -153,98 +356,169 @@ class DynamicContext:
             query: Query del usuario
             max_tokens: Máximo número de tokens
             include_providers: Si incluir proveedores dinámicos
+            deadline: Deadline opcional que acota la espera por proveedores
+            token_counter: Contador del modelo destino (por defecto el compartido)
+            session_id: Sesión cuyo contexto se incluye además del compartido
+            sources: Limitar el contexto almacenado a estas fuentes
             
         Returns:
             Contexto relevante
         """
+        return self.get_context_counted(query, max_tokens, include_providers,
+                                        deadline, token_counter, session_id, sources).text
+    
+    def get_context_counted(self, query: str, max_tokens: int = 2000,
+                            include_providers: bool = True, deadline=None,
+                            token_counter: TokenCounter = None, session_id: str = None,
+                            sources: List[str] = None) -> CountedText:
+        """Igual que get_context(), pero devuelve también el conteo de tokens."""
         try:
-            with self._lock:
-                # Limpiar entradas expiradas
-                self._cleanup_expired()
-                
-                # Obtener contexto de proveedores
-                provider_context = ""
-                if include_providers:
-                    provider_context = self._get_provider_context(query, max_tokens // 2)
-                
-                # Obtener contexto almacenado
-                stored_context = self._get_stored_context(query, max_tokens - len(provider_context.split()))
-                
-                # Combinar contextos
-                context_parts = []
-                if provider_context:
-                    context_parts.append(f"**Contexto Dinámico:**\n{provider_context}")
-                if stored_context:
-                    context_parts.append(f"**Contexto Histórico:**\n{stored_context}")
-                
-                final_context = "\n\n".join(context_parts)
-                
-                logger.debug(f"Contexto generado: {len(final_context.split())} tokens")
-                return final_context
+            counter = token_counter or get_token_counter()
+            
+            # Obtener contexto de proveedores (en paralelo, sin el lock)
+            provider_context = CountedText("", 0)
+            if include_providers:
+                provider_context = self._get_provider_context(query, max_tokens // 2,
+                                                              deadline, counter)
+            
+            # Obtener contexto almacenado (solo las particiones implicadas)
+            stored_context = self._get_stored_context(query, max_tokens - provider_context.tokens,
+                                                      counter, session_id, sources)
+            
+            # Combinar contextos
+            context_parts = []
+            if provider_context:
+                context_parts.append(counter.join([counter.counted("**Contexto Dinámico:**"),
+                                                   provider_context], "\n"))
+            if stored_context:
+                context_parts.append(counter.join([counter.counted("**Contexto Histórico:**"),
+                                                   stored_context], "\n"))
+            
+            final_context = counter.join(context_parts)
+            
+            logger.debug(f"Contexto generado: {final_context.tokens} tokens")
+            return final_context
                 
         except Exception as e:
             logger.error(f"Error obteniendo contexto: {e}")
-            return ""
+            return CountedText("", 0)
     
-    def _get_provider_context(self, query: str, max_tokens: int) -> str:
-        """Obtiene contexto de proveedores registrados."""
+    def _get_provider_context(self, query: str, max_tokens: int, deadline=None,
+                              counter: TokenCounter = None) -> CountedText:
+        """
+        Obtiene contexto de proveedores registrados.
+        
+        Todos los proveedores habilitados se llaman a la vez, cada uno con su
+        timeout; las respuestas se ensamblan por prioridad dentro del
+        presupuesto de tokens y los que no llegan a tiempo se omiten.
+        """
         try:
-            # Ordenar proveedores por prioridad
-            sorted_providers = sorted(
-                self.context_providers.items(),
-                key=lambda x: x[1]['priority'],
-                reverse=True
+            counter = counter or get_token_counter()
+            
+            # Ordenar proveedores por prioridad (snapshot bajo el lock)
+            with self._lock:
+                sorted_providers = [
+                    (name, provider_info) for name, provider_info in sorted(
+                        self.context_providers.items(),
+                        key=lambda x: x[1]['priority'],
+                        reverse=True
+                    )
+                    if provider_info['enabled']
+                ]
+            
+            if not sorted_providers:
+                return CountedText("", 0)
+            
+            results = self._fanout.run(
+                {name: (lambda func=provider_info['function']: func(query))
+                 for name, provider_info in sorted_providers},
+                timeouts_ms={name: provider_info['timeout_ms']
+                             for name, provider_info in sorted_providers},
+                deadline=deadline
             )
             
             context_parts = []
             current_tokens = 0
             
-            for name, provider_info in sorted_providers:
-                if not provider_info['enabled']:
-                    continue
-                
-                if current_tokens >= max_tokens:
-                    break
-                
-                try:
-                    # Llamar proveedor
-                    provider_context = provider_info['function'](query)
+            with self._lock:
+                for name, provider_info in sorted_providers:
+                    result = results[name]
+                    provider_info['last_latency_ms'] = result.latency_ms
+                    if result.status == "timeout":
+                        provider_info['timeout_count'] += 1
+                        self.stats['provider_timeouts'] += 1
+                        continue
+                    if not result.ok or current_tokens >= max_tokens:
+                        continue
                     
-                    if provider_context:
-                        provider_tokens = len(provider_context.split())
+                    provider_context = counter.counted(f"[{name}] {result.content}")
+                    provider_tokens = provider_context.tokens
+                    
+                    if current_tokens + provider_tokens <= max_tokens:
+                        context_parts.append(provider_context)
+                        current_tokens += provider_tokens
                         
-                        if current_tokens + provider_tokens <= max_tokens:
-                            context_parts.append(f"[{name}] {provider_context}")
-                            current_tokens += provider_tokens
-                            
-                            # Actualizar estadísticas
-                            provider_info['last_called'] = datetime.now()
-                            provider_info['call_count'] += 1
-                            self.stats['provider_calls'] += 1
-                
-                except Exception as e:
-                    logger.error(f"Error en proveedor '{name}': {e}")
+                        # Actualizar estadísticas
+                        provider_info['last_called'] = datetime.now()
+                        provider_info['call_count'] += 1
+                        self.stats['provider_calls'] += 1
             
-            return "\n\n".join(context_parts)
+            return counter.join(context_parts)
             
         except Exception as e:
             logger.error(f"Error obteniendo contexto de proveedores: {e}")
-            return ""
+            return CountedText("", 0)
     
-    def _get_stored_context(self, query: str, max_tokens: int) -> str:
-        """Obtiene contexto relevante del almacenamiento."""
+    # Entradas recientes consideradas cuando ninguna comparte términos con la query
+    RECENT_FALLBACK_LIMIT = 50
+    
+    def _get_stored_context(self, query: str, max_tokens: int,
+                            counter: TokenCounter = None, session_id: str = None,
+                            sources: List[str] = None) -> CountedText:
+        """
+        Obtiene contexto relevante del almacenamiento.
+        
+        Los candidatos salen del índice de relevancia de la partición de la
+        sesión y de la compartida (o de las entradas más recientes si ninguna
+        comparte términos con la query); las vencidas se retiran por el heap.
+        """
         try:
-            # Filtrar entradas activas
-            active_entries = [
-                entry for entry in self.context_entries
-                if entry['expires_at'] > datetime.now()
-            ]
+            counter = counter or get_token_counter()
+            now = datetime.now()
+            query_terms = set(TOKEN_PATTERN.findall(query.lower()))
+            source_set = set(sources) if sources else None
+            
+            partitions = []
+            for key in {session_id or GLOBAL_PARTITION, GLOBAL_PARTITION}:
+                partition = self._get_partition(key)
+                if partition is not None:
+                    partitions.append(partition)
+            
+            # Candidatos (relevancia, entrada, partición)
+            candidates = []
+            expired = 0
+            for partition in partitions:
+                with partition.lock:
+                    expired += partition.expire(now)
+                    if query_terms:
+                        candidates.extend((score, entry, partition) for score, entry
+                                          in partition.relevant(query_terms, source_set, now))
+            
+            if not candidates:
+                for partition in partitions:
+                    with partition.lock:
+                        recent = itertools.islice(partition.recent(source_set, now),
+                                                  self.RECENT_FALLBACK_LIMIT)
+                        candidates.extend((0.0, entry, partition) for entry in recent)
+            self._record_expired(expired)
             
             # Aplicar filtros
-            filtered_entries = self._apply_filters(active_entries, query)
+            owners = {entry['id']: (score, partition) for score, entry, partition in candidates}
+            filtered_entries = self._apply_filters([entry for _, entry, _ in candidates], query)
             
-            # Ordenar por relevancia (acceso reciente, frecuencia)
+            # Ordenar por relevancia y luego por acceso reciente y frecuencia
             filtered_entries.sort(key=lambda x: (
+                owners[x['id']][0] if x['id'] in owners else 0.0,
                 x['last_accessed'] or datetime.min,
                 x['access_count']
             ), reverse=True)
@@ -252,26 +526,34 @@ class DynamicContext:
             # Construir contexto
             context_parts = []
             current_tokens = 0
+            selected = []
             
             for entry in filtered_entries:
                 if current_tokens >= max_tokens:
                     break
                 
-                entry_tokens = len(entry['content'].split())
+                entry_tokens = counter.count(entry['content'])
                 
                 if current_tokens + entry_tokens <= max_tokens:
-                    context_parts.append(entry['content'])
+                    context_parts.append(CountedText(entry['content'], entry_tokens))
                     current_tokens += entry_tokens
-                    
-                    # Actualizar estadísticas de acceso
+                    selected.append(entry)
+            
+            # Actualizar estadísticas de acceso
+            accessed_at = datetime.now()
+            for entry in selected:
+                owner = owners.get(entry['id'])
+                if owner is None:
+                    continue
+                with owner[1].lock:
                     entry['access_count'] += 1
-                    entry['last_accessed'] = datetime.now()
+                    entry['last_accessed'] = accessed_at
             
-            return "\n\n".join(context_parts)
+            return counter.join(context_parts)
             
         except Exception as e:
             logger.error(f"Error obteniendo contexto almacenado: {e}")
-            return ""
+            return CountedText("", 0)
     
     def _apply_filters(self, entries: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
         """Aplica filtros registrados a las entradas."""
@@ -291,52 +573,60 @@ class DynamicContext:
             return entries
     
     def _cleanup_expired(self):
-        """Limpia entradas expiradas."""
+        """Limpia entradas expiradas de todas las particiones (vía heap)."""
         try:
             now = datetime.now()
-            initial_count = len(self.context_entries)
-            
-            # Filtrar entradas no expiradas
-            self.context_entries = deque([
-                entry for entry in self.context_entries
-                if entry['expires_at'] > now
-            ], maxlen=self.max_context_size)
-            
-            expired_count = initial_count - len(self.context_entries)
-            if expired_count > 0:
-                self.stats['expired_entries'] += expired_count
-                self.stats['active_entries'] = len(self.context_entries)
-                logger.debug(f"Limpiadas {expired_count} entradas expiradas")
+            expired_count = 0
+            for partition in list(self._partitions.values()):
+                with partition.lock:
+                    expired_count += partition.expire(now)
+            self._record_expired(expired_count)
                 
         except Exception as e:
             logger.error(f"Error limpiando entradas expiradas: {e}")
     
+    def _record_expired(self, expired_count: int):
+        if expired_count > 0:
+            self._forget_entries(expired_count)
+            with self._lock:
+                self.stats['expired_entries'] += expired_count
+            logger.debug(f"Limpiadas {expired_count} entradas expiradas")
+    
     def _generate_entry_id(self) -> str:
         """Genera ID único para entrada."""
         import uuid
         return str(uuid.uuid4())[:8]
     
-    def clear_context(self, source: str = None):
+    def clear_context(self, source: str = None, session_id: str = None):
         """
         Limpia contexto.
         
         Args:
             source: Fuente específica a limpiar (opcional)
+            session_id: Limpiar solo esta sesión (opcional)
         """
         try:
-            with self._lock:
-                if source:
-                    # Limpiar solo de una fuente específica
-                    self.context_entries = deque([
-                        entry for entry in self.context_entries
-                        if entry['source'] != source
-                    ], maxlen=self.max_context_size)
-                else:
-                    # Limpiar todo
-                    self.context_entries.clear()
-                
-                self.stats['active_entries'] = len(self.context_entries)
-                logger.info(f"Contexto limpiado (fuente: {source or 'todas'})")
+            if session_id is not None:
+                partition = self._get_partition(session_id)
+                partitions = [partition] if partition is not None else []
+            else:
+                partitions = list(self._partitions.values())
+            
+            removed = 0
+            for partition in partitions:
+                with partition.lock:
+                    if source:
+                        # Limpiar solo de una fuente específica
+                        entry_ids = list(partition.by_source.get(source, ()))
+                    else:
+                        entry_ids = list(partition.entries)
+                    for entry_id in entry_ids:
+                        if partition.remove(entry_id) is not None:
+                            removed += 1
+            self._forget_entries(removed)
+            
+            logger.info(f"Contexto limpiado (fuente: {source or 'todas'}, "
+                        f"sesión: {session_id or 'todas'})")
                 
         except Exception as e:
             logger.error(f"Error limpiando contexto: {e}")
@@ -344,8 +634,7 @@ class DynamicContext:
     def get_context_history(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Retorna historial de contexto."""
         try:
-            with self._lock:
-                return list(self.context_entries)[-limit:]
+            return self.context_entries[-limit:]
         except Exception as e:
             logger.error(f"Error obteniendo historial: {e}")
             return []
@@ -360,6 +649,8 @@ class DynamicContext:
                         'enabled': info['enabled'],
                         'priority': info['priority'],
                         'call_count': info['call_count'],
+                        'timeout_count': info['timeout_count'],
+                        'last_latency_ms': info['last_latency_ms'],
                         'last_called': info['last_called'].isoformat() if info['last_called'] else None
                     }
                 return stats
@@ -370,12 +661,15 @@ class DynamicContext:
     def get_stats(self) -> Dict[str, Any]:
         """Retorna estadísticas generales."""
         try:
+            self._cleanup_expired()
             with self._lock:
                 return {
                     'total_entries': self.stats['total_entries'],
-                    'active_entries': len(self.context_entries),
+                    'active_entries': self._entry_count,
+                    'sessions': len(self._partitions) - (GLOBAL_PARTITION in self._partitions),
                     'expired_entries': self.stats['expired_entries'],
                     'provider_calls': self.stats['provider_calls'],
+                    'provider_timeouts': self.stats['provider_timeouts'],
                     'registered_providers': len(self.context_providers),
                     'registered_filters': len(self.context_filters),
                     'max_context_size': self.max_context_size
@@ -392,7 +686,7 @@ class DynamicContext:
                     'exported_at': datetime.now().isoformat(),
                     'stats': self.get_stats(),
                     'providers': self.get_provider_stats(),
-                    'context_entries': list(self.context_entries)
+                    'context_entries': self.context_entries
                 }
                 
                 with open(file_path, 'w', encoding='utf-8') as f:
@@ -409,19 +703,20 @@ class DynamicContext:
             with open(file_path, 'r', encoding='utf-8') as f:
                 import_data = json.load(f)
             
-            with self._lock:
-                # Importar entradas de contexto
-                if 'context_entries' in import_data:
-                    for entry_data in import_data['context_entries']:
-                        # Convertir strings de fecha a datetime
-                        entry_data['created_at'] = datetime.fromisoformat(entry_data['created_at'])
-                        entry_data['expires_at'] = datetime.fromisoformat(entry_data['expires_at'])
-                        if entry_data.get('last_accessed'):
-                            entry_data['last_accessed'] = datetime.fromisoformat(entry_data['last_accessed'])
-                        
-                        self.context_entries.append(entry_data)
-                
-                logger.info(f"Contexto importado desde {file_path}")
+            # Importar entradas de contexto
+            if 'context_entries' in import_data:
+                for entry_data in import_data['context_entries']:
+                    # Convertir strings de fecha a datetime
+                    entry_data['created_at'] = datetime.fromisoformat(entry_data['created_at'])
+                    entry_data['expires_at'] = datetime.fromisoformat(entry_data['expires_at'])
+                    if entry_data.get('last_accessed'):
+                        entry_data['last_accessed'] = datetime.fromisoformat(entry_data['last_accessed'])
+                    entry_data.setdefault('source', 'import')
+                    entry_data.setdefault('metadata', {})
+                    
+                    self._insert_entry(entry_data, entry_data.get('session_id'))
+            
+            logger.info(f"Contexto importado desde {file_path}")
                 
         except Exception as e:
             logger.error(f"Error importando contexto: {e}")
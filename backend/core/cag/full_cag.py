@@ -9,6 +9,10 @@ from typing import Dict, List, Any, Optional, Tuple
 import time
 from datetime import datetime
 
+from ..deadline import Deadline
+from ..token_counter import CountedText, get_token_counter
+from .context_fanout import get_context_fanout
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,11 +20,26 @@ class FullCAG:
     """
     Context-Aware Generation para modelo 120B con límite de 32K tokens.
     Optimizado para profundidad y completitud.
+    
+    Las fuentes seleccionadas se consultan en paralelo, cada una con su
+    presupuesto de tokens y de tiempo; el contexto se ensambla con lo que
+    haya llegado antes del deadline.
     """
     
+    # Presupuesto de tiempo de cada fuente y del ensamblado completo
+    SOURCE_TIMEOUTS_MS = {
+        'static_cache': 200.0,
+        'dynamic_context': 300.0,
+        'rag': 2000.0
+    }
+    CONTEXT_BUDGET_MS = 2500.0
+    
     def __init__(self, static_cache=None, dynamic_context=None, 
                  awareness_gate=None, mini_rag=None, full_rag=None,
-                 max_tokens: int = 32000):
+                 max_tokens: int = 32000,
+                 source_timeouts_ms: Dict[str, float] = None,
+                 context_budget_ms: float = None,
+                 model_family: str = 'gpt-oss'):
         """
         Inicializa FullCAG.
         
@@ -31,6 +50,9 @@ class FullCAG:
             mini_rag: Instancia de MiniRAG
             full_rag: Instancia de FullRAG
             max_tokens: Máximo tokens (32K para modelo 120B)
+            source_timeouts_ms: Timeout por fuente (sobrescribe SOURCE_TIMEOUTS_MS)
+            context_budget_ms: Presupuesto total del ensamblado de contexto
+            model_family: Familia del modelo destino (para contar tokens)
         """
         self.static_cache = static_cache
         self.dynamic_context = dynamic_context
@@ -38,6 +60,10 @@ class FullCAG:
         self.mini_rag = mini_rag
         self.full_rag = full_rag
         self.max_tokens = max_tokens
+        self.source_timeouts_ms = {**self.SOURCE_TIMEOUTS_MS, **(source_timeouts_ms or {})}
+        self.context_budget_ms = context_budget_ms or self.CONTEXT_BUDGET_MS
+        self._fanout = get_context_fanout()
+        self.token_counter = get_token_counter(model_family)
         
         # Límites específicos para FullCAG (más generosos)
         self.token_limits = {
@@ -63,7 +89,8 @@ class FullCAG:
                 'mini_rag': 0,
                 'full_rag': 0
             },
-            'rag_escalations': 0
+            'rag_escalations': 0,
+            'source_timeouts': {}
         }
         
         logger.info(f"FullCAG inicializado con límite de {max_tokens} tokens")
@@ -106,57 +133,88 @@ class FullCAG:
                     'confidence': 0.7
                 }
             
-            # Generar contexto de cada fuente
+            # Consultar las fuentes seleccionadas en paralelo. Los deadlines
+            # se crean antes de encolar: la espera en el pool también cuenta.
+            fanout_deadline = Deadline(self.context_budget_ms)
+            sources = {}
+            selected = source_decision['sources']
+            budget = source_decision['token_budget']
+            
+            if selected.get('static_cache', False) and self.static_cache:
+                static_tokens = budget.get('static_cache', self.token_limits['static_cache'])
+                sources['static_cache'] = lambda: self.static_cache.retrieve_counted(
+                    query, static_tokens, token_counter=self.token_counter
+                )
+            
+            if selected.get('dynamic_context', False) and self.dynamic_context:
+                dynamic_tokens = budget.get('dynamic_context', self.token_limits['dynamic_context'])
+                dynamic_deadline = self._source_deadline('dynamic_context', fanout_deadline)
+                sources['dynamic_context'] = lambda: self.dynamic_context.get_context_counted(
+                    query, dynamic_tokens, deadline=dynamic_deadline,
+                    token_counter=self.token_counter,
+                    session_id=context.get('session_id')
+                )
+            
+            if selected.get('rag', False):
+                rag_deadline = self._source_deadline('rag', fanout_deadline)
+                sources['rag'] = lambda: self._generate_rag_context(query, source_decision,
+                                                                    rag_deadline)
+            
+            results = self._fanout.run(sources, self.source_timeouts_ms, fanout_deadline)
+            
+            # Ensamblar en orden fijo con lo que haya llegado
+            counter = self.token_counter
             context_parts = []
-            actual_tokens = 0
             source_metadata = {}
             
-            # Static Cache
-            if source_decision['sources'].get('static_cache', False) and self.static_cache:
-                static_tokens = source_decision['token_budget'].get('static_cache',
-                                                                   self.token_limits['static_cache'])
-                static_context = self.static_cache.retrieve(query, static_tokens)
-                
-                if static_context:
-                    context_parts.append(f"**Conocimiento Base:**\n{static_context}")
-                    actual_tokens += len(static_context.split())
-                    source_metadata['static_cache'] = {
-                        'tokens_used': len(static_context.split()),
-                        'content_length': len(static_context)
-                    }
-                    self.stats['source_usage']['static_cache'] += 1
-            
-            # Dynamic Context
-            if source_decision['sources'].get('dynamic_context', False) and self.dynamic_context:
-                dynamic_tokens = source_decision['token_budget'].get('dynamic_context',
-                                                                    self.token_limits['dynamic_context'])
-                dynamic_context = self.dynamic_context.get_context(query, dynamic_tokens)
-                
-                if dynamic_context:
-                    context_parts.append(dynamic_context)
-                    actual_tokens += len(dynamic_context.split())
-                    source_metadata['dynamic_context'] = {
-                        'tokens_used': len(dynamic_context.split()),
-                        'content_length': len(dynamic_context)
-                    }
-                    self.stats['source_usage']['dynamic_context'] += 1
-            
-            # RAG (MiniRAG + FullRAG)
-            if source_decision['sources'].get('rag', False):
-                rag_context, rag_metadata = self._generate_rag_context(query, source_decision)
+            static_result = results.get('static_cache')
+            if static_result is not None and static_result.ok:
+                static_context = static_result.content
+                context_parts.append(counter.join([counter.counted("**Conocimiento Base:**"),
+                                                   static_context], "\n"))
+                source_metadata['static_cache'] = {
+                    'tokens_used': static_context.tokens,
+                    'content_length': len(static_context.text),
+                    'latency_ms': static_result.latency_ms
+                }
+                self.stats['source_usage']['static_cache'] += 1
+            
+            dynamic_result = results.get('dynamic_context')
+            if dynamic_result is not None and dynamic_result.ok:
+                dynamic_context = dynamic_result.content
+                context_parts.append(dynamic_context)
+                source_metadata['dynamic_context'] = {
+                    'tokens_used': dynamic_context.tokens,
+                    'content_length': len(dynamic_context.text),
+                    'latency_ms': dynamic_result.latency_ms
+                }
+                self.stats['source_usage']['dynamic_context'] += 1
+            
+            rag_result = results.get('rag')
+            if rag_result is not None and rag_result.ok:
+                rag_context, rag_metadata = rag_result.content
                 if rag_context:
                     context_parts.append(rag_context)
-                    actual_tokens += len(rag_context.split())
+                    for metadata in rag_metadata.values():
+                        metadata['latency_ms'] = rag_result.latency_ms
+                        metadata['queue_ms'] = rag_result.queue_ms
                     source_metadata.update(rag_metadata)
             
-            # Combinar contexto
-            final_context = "\n\n".join(context_parts)
+            timed_out_sources = [name for name, result in results.items()
+                                 if result.status == "timeout"]
+            for name in timed_out_sources:
+                self.stats['source_timeouts'][name] = self.stats['source_timeouts'].get(name, 0) + 1
+            
+            # Combinar contexto (con los conteos ya calculados por fuente)
+            combined = counter.join(context_parts)
             
             # Verificar límite de tokens
-            if actual_tokens > self.max_tokens:
+            if combined.tokens > self.max_tokens:
                 # Truncar inteligentemente (mantener contexto más relevante)
-                final_context = self._intelligent_truncate(final_context, self.max_tokens)
-                actual_tokens = len(final_context.split())
+                combined = self._intelligent_truncate(combined.text, self.max_tokens)
+            
+            final_context = combined.text
+            actual_tokens = combined.tokens
             
             # Calcular latencia
             latency_ms = (time.time() - start_time) * 1000
@@ -173,6 +231,9 @@ class FullCAG:
                 'latency_ms': latency_ms,
                 'confidence': source_decision.get('confidence', 0.7),
                 'rag_escalated': 'full_rag' in source_metadata,
+                'source_latency_ms': {name: result.latency_ms for name, result in results.items()},
+                'source_queue_ms': {name: result.queue_ms for name, result in results.items()},
+                'timed_out_sources': timed_out_sources,
                 'timestamp': datetime.now().isoformat()
             }
             
@@ -196,8 +257,24 @@ class FullCAG:
                 'timestamp': datetime.now().isoformat()
             }
     
-    def _generate_rag_context(self, query: str, source_decision: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
-        """Genera contexto usando RAG (MiniRAG + FullRAG)."""
+    def _source_deadline(self, name: str, fanout_deadline: Deadline) -> Deadline:
+        """Deadline de una fuente: su timeout con margen, sin pasar del global."""
+        # Margen para que la fuente responda antes de que el fan-out la descarte
+        return Deadline(min(self.source_timeouts_ms[name] * 0.9, fanout_deadline.remaining_ms()))
+    
+    def _generate_rag_context(self, query: str, source_decision: Dict[str, Any],
+                              deadline: Optional[Deadline] = None) -> Tuple[CountedText, Dict[str, Any]]:
+        """
+        Genera contexto usando RAG (MiniRAG + FullRAG).
+        
+        MiniRAG recibe el menor entre su propio timeout y lo que queda del
+        deadline; FullRAG solo se intenta si aún queda presupuesto y recibe
+        el resto.
+        """
+        if deadline is None:
+            deadline = Deadline(self.source_timeouts_ms['rag'])
+        mini_results = []
+        
         try:
             rag_tokens = source_decision['token_budget'].get('rag', 
                                                            self.token_limits['mini_rag'] + self.token_limits['full_rag'])
@@ -208,46 +285,52 @@ class FullCAG:
             # MiniRAG (búsqueda rápida)
             if self.mini_rag:
                 mini_tokens = min(self.token_limits['mini_rag'], rag_tokens // 2)
-                mini_results = self.mini_rag.search(query, k=5)
+                mini_deadline = Deadline(min(self.mini_rag.timeout_ms, deadline.remaining_ms()))
+                mini_results = self.mini_rag.search_with_budget(query, k=5,
+                                                                deadline=mini_deadline)['results']
                 
                 if mini_results:
                     mini_context = self._format_rag_results(mini_results, mini_tokens)
                     if mini_context:
-                        context_parts.append(f"**Información Rápida:**\n{mini_context}")
+                        context_parts.append(self.token_counter.join(
+                            [self.token_counter.counted("**Información Rápida:**"), mini_context], "\n"
+                        ))
                         metadata['mini_rag'] = {
-                            'tokens_used': len(mini_context.split()),
+                            'tokens_used': mini_context.tokens,
                             'results_count': len(mini_results)
                         }
                         self.stats['source_usage']['mini_rag'] += 1
             
             # FullRAG (búsqueda profunda) - solo si MiniRAG no fue suficiente
-            if self.full_rag and len(context_parts) == 0:
+            if self.full_rag and len(context_parts) == 0 and not deadline.expired():
                 full_tokens = min(self.token_limits['full_rag'], rag_tokens)
-                full_results = self.full_rag.search(query, mini_results if 'mini_results' in locals() else [])
+                full_results = self.full_rag.search(query, mini_results, deadline=deadline)
                 
                 if full_results:
                     full_context = self._format_rag_results(full_results, full_tokens)
                     if full_context:
-                        context_parts.append(f"**Información Detallada:**\n{full_context}")
+                        context_parts.append(self.token_counter.join(
+                            [self.token_counter.counted("**Información Detallada:**"), full_context], "\n"
+                        ))
                         metadata['full_rag'] = {
-                            'tokens_used': len(full_context.split()),
+                            'tokens_used': full_context.tokens,
                             'results_count': len(full_results)
                         }
                         self.stats['source_usage']['full_rag'] += 1
                         self.stats['rag_escalations'] += 1
             
-            final_context = "\n\n".join(context_parts)
-            return final_context, metadata
+            return self.token_counter.join(context_parts), metadata
             
         except Exception as e:
             logger.error(f"Error generando contexto RAG: {e}")
-            return "", {}
+            return CountedText("", 0), {}
     
-    def _format_rag_results(self, results: List[Any], max_tokens: int) -> str:
+    def _format_rag_results(self, results: List[Any], max_tokens: int) -> CountedText:
         """Formatea resultados de RAG respetando límite de tokens."""
         try:
+            counter = self.token_counter
             if not results:
-                return ""
+                return CountedText("", 0)
             
             formatted_parts = []
             current_tokens = 0
@@ -263,27 +346,32 @@ class FullCAG:
                 
                 # Formatear resultado
                 formatted_result = f"**Resultado {i+1}:**\n{content}\n"
-                result_tokens = len(formatted_result.split())
+                result_tokens = counter.count(formatted_result)
                 
                 if current_tokens + result_tokens <= max_tokens:
-                    formatted_parts.append(formatted_result)
+                    formatted_parts.append(CountedText(formatted_result, result_tokens))
                     current_tokens += result_tokens
                 else:
                     # Truncar último resultado si es necesario
                     remaining_tokens = max_tokens - current_tokens
                     if remaining_tokens > 50:  # Solo si queda espacio significativo
-                        truncated_content = ' '.join(content.split()[:remaining_tokens])
-                        formatted_parts.append(f"**Resultado {i+1}:**\n{truncated_content}...\n")
+                        header = counter.counted(f"**Resultado {i+1}:**")
+                        truncated = counter.truncate(content, remaining_tokens - header.tokens - 2)
+                        formatted_parts.append(CountedText(
+                            f"{header.text}\n{truncated.text}...\n",
+                            header.tokens + truncated.tokens + 2
+                        ))
                     break
             
-            return "\n".join(formatted_parts)
+            return counter.join(formatted_parts, "\n")
             
         except Exception as e:
             logger.error(f"Error formateando resultados RAG: {e}")
-            return ""
+            return CountedText("", 0)
     
-    def _intelligent_truncate(self, context: str, max_tokens: int) -> str:
+    def _intelligent_truncate(self, context: str, max_tokens: int) -> CountedText:
         """Trunca contexto inteligentemente manteniendo la información más relevante."""
+        counter = self.token_counter
         try:
             # Dividir por secciones
             sections = context.split('\n\n')
@@ -313,26 +401,27 @@ class FullCAG:
             truncated_parts = []
             current_tokens = 0
             
+            # Cada sección se cuenta una sola vez; se reserva el separador
+            separator_tokens = counter.count('\n\n')
             for priority, section in prioritized_sections:
-                section_tokens = len(section.split())
+                section_tokens = counter.count(section)
                 if current_tokens + section_tokens <= max_tokens:
-                    truncated_parts.append(section)
-                    current_tokens += section_tokens
+                    truncated_parts.append(CountedText(section, section_tokens))
+                    current_tokens += section_tokens + separator_tokens
                 else:
                     # Truncar última sección si es necesario
                     remaining_tokens = max_tokens - current_tokens
                     if remaining_tokens > 50:
-                        truncated_section = ' '.join(section.split()[:remaining_tokens])
-                        truncated_parts.append(truncated_section + "...")
+                        truncated = counter.truncate(section, remaining_tokens - 1)
+                        truncated_parts.append(CountedText(truncated.text + "...", truncated.tokens + 1))
                     break
             
-            return '\n\n'.join(truncated_parts)
+            return counter.join(truncated_parts)
             
         except Exception as e:
             logger.error(f"Error en truncamiento inteligente: {e}")
             # Fallback: truncamiento simple
-            words = context.split()
-            return ' '.join(words[:max_tokens])
+            return counter.truncate(context, max_tokens)
     
     def _update_stats(self, tokens_used: int, latency_ms: float, 
                      source_metadata: Dict[str, Any]):
@@ -546,6 +635,8 @@ class FullCAG:
                 'token_usage': self.stats['token_usage'].copy(),
                 'source_usage': self.stats['source_usage'].copy(),
                 'rag_escalations': self.stats['rag_escalations'],
+                'source_timeouts': self.stats['source_timeouts'].copy(),
+                'source_timeouts_ms': self.source_timeouts_ms.copy(),
                 'max_tokens': self.max_tokens,
                 'token_limits': self.token_limits.copy(),
                 'components_available': {
@@ -578,7 +669,8 @@ class FullCAG:
                     'mini_rag': 0,
                     'full_rag': 0
                 },
-                'rag_escalations': 0
+                'rag_escalations': 0,
+                'source_timeouts': {}
             }
             logger.info("Estadísticas de FullCAG reseteadas")
         except Exception as e:
@@ -9,6 +9,10 @@ from typing import Dict, List, Any, Optional, Tuple
 import time
 from datetime import datetime
 
+from ..deadline import Deadline
+from ..token_counter import CountedText, get_token_counter
+from .context_fanout import get_context_fanout
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,10 +20,23 @@ class MiniCAG:
     """
     Context-Aware Generation para modelo 20B con límite de 8K tokens.
     Optimizado para velocidad y eficiencia.
+    
+    Las fuentes se consultan en paralelo con presupuestos de tiempo cortos;
+    la que no responde a tiempo se omite en lugar de retrasar la respuesta.
     """
     
+    # Presupuesto de tiempo de cada fuente y del ensamblado completo
+    SOURCE_TIMEOUTS_MS = {
+        'static_cache': 50.0,
+        'dynamic_context': 100.0
+    }
+    CONTEXT_BUDGET_MS = 150.0
+    
     def __init__(self, static_cache=None, dynamic_context=None, 
-                 awareness_gate=None, max_tokens: int = 8000):
+                 awareness_gate=None, max_tokens: int = 8000,
+                 source_timeouts_ms: Dict[str, float] = None,
+                 context_budget_ms: float = None,
+                 model_family: str = 'gpt-oss'):
         """
         Inicializa MiniCAG.
         
@@ -28,11 +45,18 @@ class MiniCAG:
             dynamic_context: Instancia de DynamicContext
             awareness_gate: Instancia de AwarenessGate
             max_tokens: Máximo tokens (8K para modelo 20B)
+            source_timeouts_ms: Timeout por fuente (sobrescribe SOURCE_TIMEOUTS_MS)
+            context_budget_ms: Presupuesto total del ensamblado de contexto
+            model_family: Familia del modelo destino (para contar tokens)
         """
         self.static_cache = static_cache
         self.dynamic_context = dynamic_context
         self.awareness_gate = awareness_gate
         self.max_tokens = max_tokens
+        self.source_timeouts_ms = {**self.SOURCE_TIMEOUTS_MS, **(source_timeouts_ms or {})}
+        self.context_budget_ms = context_budget_ms or self.CONTEXT_BUDGET_MS
+        self._fanout = get_context_fanout()
+        self.token_counter = get_token_counter(model_family)
         
         # Límites específicos para MiniCAG
         self.token_limits = {
@@ -54,7 +78,8 @@ class MiniCAG:
                 'static_cache': 0,
                 'dynamic_context': 0,
                 'rag': 0
-            }
+            },
+            'source_timeouts': {}
         }
         
         logger.info(f"MiniCAG inicializado con límite de {max_tokens} tokens")
@@ -89,51 +114,74 @@ class MiniCAG:
                     'confidence': 0.5
                 }
             
-            # Generar contexto de cada fuente
+            # Consultar las fuentes seleccionadas en paralelo
+            sources = {}
+            selected = source_decision['sources']
+            budget = source_decision['token_budget']
+            
+            if selected.get('static_cache', False) and self.static_cache:
+                static_tokens = budget.get('static_cache', self.token_limits['static_cache'])
+                sources['static_cache'] = lambda: self.static_cache.retrieve_counted(
+                    query, static_tokens, token_counter=self.token_counter
+                )
+            
+            if selected.get('dynamic_context', False) and self.dynamic_context:
+                dynamic_tokens = budget.get('dynamic_context', self.token_limits['dynamic_context'])
+                # Margen para que los proveedores respondan antes del timeout de la fuente
+                dynamic_deadline_ms = self.source_timeouts_ms['dynamic_context'] * 0.9
+                sources['dynamic_context'] = lambda: self.dynamic_context.get_context_counted(
+                    query, dynamic_tokens, deadline=Deadline(dynamic_deadline_ms),
+                    token_counter=self.token_counter,
+                    session_id=context.get('session_id')
+                )
+            
+            results = self._fanout.run(sources, self.source_timeouts_ms,
+                                       Deadline(self.context_budget_ms))
+            
+            # Ensamblar en orden fijo con lo que haya llegado
+            counter = self.token_counter
             context_parts = []
-            actual_tokens = 0
             source_metadata = {}
             
-            # Static Cache
-            if source_decision['sources'].get('static_cache', False) and self.static_cache:
-                static_tokens = source_decision['token_budget'].get('static_cache', 
-                                                                   self.token_limits['static_cache'])
-                static_context = self.static_cache.retrieve(query, static_tokens)
-                
-                if static_context:
-                    context_parts.append(f"**Conocimiento Base:**\n{static_context}")
-                    actual_tokens += len(static_context.split())
-                    source_metadata['static_cache'] = {
-                        'tokens_used': len(static_context.split()),
-                        'content_length': len(static_context)
-                    }
-                    self.stats['source_usage']['static_cache'] += 1
-            
-            # Dynamic Context
-            if source_decision['sources'].get('dynamic_context', False) and self.dynamic_context:
-                dynamic_tokens = source_decision['token_budget'].get('dynamic_context',
-                                                                    self.token_limits['dynamic_context'])
-                dynamic_context = self.dynamic_context.get_context(query, dynamic_tokens)
-                
-                if dynamic_context:
-                    context_parts.append(dynamic_context)
-                    actual_tokens += len(dynamic_context.split())
-                    source_metadata['dynamic_context'] = {
-                        'tokens_used': len(dynamic_context.split()),
-                        'content_length': len(dynamic_context)
-                    }
-                    self.stats['source_usage']['dynamic_context'] += 1
-            
-            # Combinar contexto
-            final_context = "\n\n".join(context_parts)
+            static_result = results.get('static_cache')
+            if static_result is not None and static_result.ok:
+                static_context = static_result.content
+                context_parts.append(counter.join([counter.counted("**Conocimiento Base:**"),
+                                                   static_context], "\n"))
+                source_metadata['static_cache'] = {
+                    'tokens_used': static_context.tokens,
+                    'content_length': len(static_context.text),
+                    'latency_ms': static_result.latency_ms
+                }
+                self.stats['source_usage']['static_cache'] += 1
+            
+            dynamic_result = results.get('dynamic_context')
+            if dynamic_result is not None and dynamic_result.ok:
+                dynamic_context = dynamic_result.content
+                context_parts.append(dynamic_context)
+                source_metadata['dynamic_context'] = {
+                    'tokens_used': dynamic_context.tokens,
+                    'content_length': len(dynamic_context.text),
+                    'latency_ms': dynamic_result.latency_ms
+                }
+                self.stats['source_usage']['dynamic_context'] += 1
+            
+            timed_out_sources = [name for name, result in results.items()
+                                 if result.status == "timeout"]
+            for name in timed_out_sources:
+                self.stats['source_timeouts'][name] = self.stats['source_timeouts'].get(name, 0) + 1
+            
+            # Combinar contexto (con los conteos ya calculados por fuente)
+            combined = counter.join(context_parts)
             
             # Verificar límite de tokens
-            if actual_tokens > self.max_tokens:
+            if combined.tokens > self.max_tokens:
                 # Truncar si es necesario
-                words = final_context.split()
-                truncated_words = words[:self.max_tokens]
-                final_context = " ".join(truncated_words) + "..."
-                actual_tokens = len(truncated_words)
+                truncated = counter.truncate(combined.text, self.max_tokens - 1)
+                combined = CountedText(truncated.text + "...", truncated.tokens + 1)
+            
+            final_context = combined.text
+            actual_tokens = combined.tokens
             
             # Calcular latencia
             latency_ms = (time.time() - start_time) * 1000
@@ -149,6 +197,8 @@ class MiniCAG:
                 'source_metadata': source_metadata,
                 'latency_ms': latency_ms,
                 'confidence': source_decision.get('confidence', 0.5),
+                'source_latency_ms': {name: result.latency_ms for name, result in results.items()},
+                'timed_out_sources': timed_out_sources,
                 'timestamp': datetime.now().isoformat()
             }
             
@@ -324,13 +374,14 @@ class MiniCAG:
             
             # Usar solo una fracción de tokens para velocidad
             speed_tokens = int(self.max_tokens * 0.3)  # Solo 30% para velocidad
-            context = self.static_cache.retrieve(query, speed_tokens)
+            context = self.static_cache.retrieve_counted(query, speed_tokens,
+                                                         token_counter=self.token_counter)
             
             latency_ms = (time.time() - start_time) * 1000
             
             return {
-                'context': context,
-                'tokens_used': len(context.split()),
+                'context': context.text,
+                'tokens_used': context.tokens,
                 'latency_ms': latency_ms,
                 'optimized_for': 'speed'
             }
@@ -347,6 +398,8 @@ class MiniCAG:
                 'avg_latency_ms': round(self.stats['avg_latency_ms'], 2),
                 'token_usage': self.stats['token_usage'].copy(),
                 'source_usage': self.stats['source_usage'].copy(),
+                'source_timeouts': self.stats['source_timeouts'].copy(),
+                'source_timeouts_ms': self.source_timeouts_ms.copy(),
                 'max_tokens': self.max_tokens,
                 'token_limits': self.token_limits.copy(),
                 'components_available': {
@@ -374,7 +427,8 @@ class MiniCAG:
                     'static_cache': 0,
                     'dynamic_context': 0,
                     'rag': 0
-                }
+                },
+                'source_timeouts': {}
             }
             logger.info("Estadísticas de MiniCAG reseteadas")
         except Exception as e:
@@ -7,21 +7,57 @@ StaticCache - Pre-loaded knowledge base con información estática.
 import logging
 import json
 import os
+import re
+import bisect
+import heapq
+import threading
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 import pickle
 from datetime import datetime
 import hashlib
 
+from ..token_counter import CountedText, TokenCounter, get_token_counter
+
 logger = logging.getLogger(__name__)
 
 
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def _tokenize(text: str) -> List[str]:
+    """Tokens en minúsculas (palabras alfanuméricas)."""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
 class StaticCache:
     """
     Pre-loaded knowledge base con información estática.
     Optimizado para recuperación rápida de conocimiento relevante.
+    
+    La recuperación usa un índice invertido token -> {doc_id: peso}, donde el
+    peso ya combina el campo (título, contenido, tags) con la longitud
+    normalizada del documento: puntuar una query es sumar las postings de
+    sus términos y sacar los mejores de un heap. Los documentos agregados
+    con add_document se indexan en el sitio y se anotan en un journal, sin
+    reescribir el pickle completo.
     """
     
+    INDEX_VERSION = 2
+    
+    # Pesos por campo en que aparece el término
+    TITLE_WEIGHT = 2.0
+    CONTENT_WEIGHT = 1.0
+    TAG_WEIGHT = 1.5
+    
+    # Coincidencias parciales (prefijo de un término del vocabulario)
+    PREFIX_WEIGHT = 0.5
+    MIN_PREFIX_LENGTH = 3
+    MAX_PREFIX_EXPANSIONS = 5
+    
+    # Entradas del journal que disparan la reescritura completa del caché
+    JOURNAL_COMPACT_THRESHOLD = 500
+    
     def __init__(self, knowledge_dir: str = "backend/data/knowledge_base"):
         """
         Inicializa el StaticCache.
@@ -36,6 +72,10 @@ class StaticCache:
         self.knowledge = {}
         self.index = {}
         self.cache_file = self.knowledge_dir / "static_cache.pkl"
+        self.journal_file = self.knowledge_dir / "static_cache.journal"
+        self._journal_entries = 0
+        self._vocabulary: Optional[List[str]] = None  # Ordenado, para prefijos
+        self._lock = threading.RLock()
         
         # Cargar conocimiento
         self._load_knowledge()
@@ -51,8 +91,14 @@ class StaticCache:
                     cached_data = pickle.load(f)
                     self.knowledge = cached_data.get('knowledge', {})
                     self.index = cached_data.get('index', {})
-                    logger.info(f"Conocimiento cargado desde caché: {len(self.knowledge)} documentos")
-                    return
+                
+                # Cachés de versiones anteriores no tienen postings
+                if self.index.get('version') != self.INDEX_VERSION:
+                    self._build_index()
+                
+                self._replay_journal()
+                logger.info(f"Conocimiento cargado desde caché: {len(self.knowledge)} documentos")
+                return
             
             # Cargar desde archivos
             self._load_from_files()
@@ -60,13 +106,16 @@ class StaticCache:
             # Construir índice
             self._build_index()
             
+            # Documentos agregados antes de perder el snapshot
+            self._replay_journal()
+            
             # Guardar caché
             self._save_cache()
             
         except Exception as e:
             logger.error(f"Error cargando conocimiento: {e}")
             self.knowledge = {}
-            self.index = {}
+            self.index = self._empty_index()
     
     def _load_from_files(self):
         """Carga conocimiento desde archivos en el directorio."""
@@ -158,45 +207,118 @@ class StaticCache:
     def _build_index(self):
         """Construye índice para búsqueda rápida."""
         try:
-            self.index = {
-                'by_category': {},
-                'by_tags': {},
-                'by_title': {},
-                'content_hashes': {}
-            }
-            
-            for doc_id, doc in self.knowledge.items():
-                # Índice por categoría
-                category = doc['category']
-                if category not in self.index['by_category']:
-                    self.index['by_category'][category] = []
-                self.index['by_category'][category].append(doc_id)
-                
-                # Índice por tags
-                for tag in doc['tags']:
-                    if tag not in self.index['by_tags']:
-                        self.index['by_tags'][tag] = []
-                    self.index['by_tags'][tag].append(doc_id)
+            with self._lock:
+                self.index = self._empty_index()
+                self._vocabulary = None
                 
-                # Índice por título (palabras clave)
-                title_words = doc['title'].lower().split()
-                for word in title_words:
-                    if len(word) > 2:  # Ignorar palabras muy cortas
-                        if word not in self.index['by_title']:
-                            self.index['by_title'][word] = []
-                        self.index['by_title'][word].append(doc_id)
-                
-                # Hash del contenido para detección de duplicados
-                content_hash = hashlib.md5(doc['content'].encode()).hexdigest()
-                self.index['content_hashes'][content_hash] = doc_id
+                for doc_id, doc in self.knowledge.items():
+                    self._index_document(doc_id, doc)
             
             logger.info("Índice construido exitosamente")
             
         except Exception as e:
             logger.error(f"Error construyendo índice: {e}")
     
+    def _empty_index(self) -> Dict[str, Any]:
+        """Estructura vacía del índice."""
+        return {
+            'version': self.INDEX_VERSION,
+            'by_category': {},
+            'by_tags': {},
+            'by_title': {},
+            'content_hashes': {},
+            'postings': {},  # término -> {doc_id: peso normalizado}
+            'doc_terms': {}  # doc_id -> términos indexados (para actualizar)
+        }
+    
+    def _document_term_weights(self, doc: Dict[str, Any]) -> Dict[str, float]:
+        """
+        Peso de cada término del documento: suma de los pesos de los campos
+        en que aparece, escalada por la longitud normalizada (100 palabras).
+        """
+        weights: Dict[str, float] = {}
+        for term in set(_tokenize(doc['title'])):
+            weights[term] = weights.get(term, 0.0) + self.TITLE_WEIGHT
+        for term in set(_tokenize(doc['content'])):
+            weights[term] = weights.get(term, 0.0) + self.CONTENT_WEIGHT
+        for tag in set(tag.lower() for tag in doc['tags']):
+            weights[tag] = weights.get(tag, 0.0) + self.TAG_WEIGHT
+        
+        doc_length = len(doc['content'].split())
+        norm = 100 / doc_length if doc_length > 0 else 1.0
+        return {term: weight * norm for term, weight in weights.items()}
+    
+    def _index_document(self, doc_id: str, doc: Dict[str, Any]):
+        """Agrega un documento a todos los índices (sin tocar los demás)."""
+        index = self.index
+        
+        # Índice por categoría
+        index['by_category'].setdefault(doc['category'], []).append(doc_id)
+        
+        # Índice por tags
+        for tag in doc['tags']:
+            index['by_tags'].setdefault(tag, []).append(doc_id)
+        
+        # Índice por título (palabras clave)
+        for word in set(doc['title'].lower().split()):
+            if len(word) > 2:  # Ignorar palabras muy cortas
+                index['by_title'].setdefault(word, []).append(doc_id)
+        
+        # Hash del contenido para detección de duplicados
+        content_hash = hashlib.md5(doc['content'].encode()).hexdigest()
+        index['content_hashes'][content_hash] = doc_id
+        
+        # Postings con pesos precalculados
+        term_weights = self._document_term_weights(doc)
+        postings = index['postings']
+        for term, weight in term_weights.items():
+            term_postings = postings.get(term)
+            if term_postings is None:
+                term_postings = postings[term] = {}
+                if self._vocabulary is not None:
+                    bisect.insort(self._vocabulary, term)
+            term_postings[doc_id] = weight
+        index['doc_terms'][doc_id] = list(term_weights)
+    
+    def _unindex_document(self, doc_id: str):
+        """Quita un documento de todos los índices."""
+        index = self.index
+        doc = self.knowledge.get(doc_id)
+        if doc is None:
+            return
+        
+        def _discard(mapping: Dict[str, List[str]], key: str):
+            doc_ids = mapping.get(key)
+            if doc_ids and doc_id in doc_ids:
+                doc_ids.remove(doc_id)
+                if not doc_ids:
+                    del mapping[key]
+        
+        _discard(index['by_category'], doc['category'])
+        for tag in doc['tags']:
+            _discard(index['by_tags'], tag)
+        for word in set(doc['title'].lower().split()):
+            _discard(index['by_title'], word)
+        
+        content_hash = hashlib.md5(doc['content'].encode()).hexdigest()
+        if index['content_hashes'].get(content_hash) == doc_id:
+            del index['content_hashes'][content_hash]
+        
+        postings = index['postings']
+        for term in index['doc_terms'].pop(doc_id, []):
+            term_postings = postings.get(term)
+            if term_postings is None:
+                continue
+            term_postings.pop(doc_id, None)
+            if not term_postings:
+                del postings[term]
+                if self._vocabulary is not None:
+                    position = bisect.bisect_left(self._vocabulary, term)
+                    if position < len(self._vocabulary) and self._vocabulary[position] == term:
+                        del self._vocabulary[position]
+    
     def _save_cache(self):
-        """Guarda caché en disco."""
+        """Guarda caché en disco (snapshot completo; vacía el journal)."""
         try:
             cache_data = {
                 'knowledge': self.knowledge,
@@ -204,16 +326,63 @@ class StaticCache:
                 'cached_at': datetime.now().isoformat()
             }
             
-            with open(self.cache_file, 'wb') as f:
-                pickle.dump(cache_data, f)
+            tmp_file = self.cache_file.with_suffix('.pkl.tmp')
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(cache_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.cache_file)
+            
+            if self.journal_file.exists():
+                self.journal_file.unlink()
+            self._journal_entries = 0
             
             logger.debug("Caché guardado exitosamente")
             
         except Exception as e:
             logger.error(f"Error guardando caché: {e}")
     
+    def _append_journal(self, doc_id: str, doc: Dict[str, Any]):
+        """Anota un documento agregado; compacta al superar el umbral."""
+        try:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'id': doc_id, 'doc': doc}, ensure_ascii=False) + "\n")
+            self._journal_entries += 1
+            
+            if self._journal_entries >= self.JOURNAL_COMPACT_THRESHOLD:
+                self._save_cache()
+                
+        except Exception as e:
+            logger.error(f"Error escribiendo journal: {e}")
+    
+    def _replay_journal(self):
+        """Aplica los documentos anotados después del último snapshot."""
+        if not self.journal_file.exists():
+            return
+        
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Línea incompleta de una escritura interrumpida
+                    self._put_document(entry['id'], entry['doc'])
+                    self._journal_entries += 1
+            
+            logger.info(f"Journal aplicado: {self._journal_entries} documentos")
+            
+        except Exception as e:
+            logger.error(f"Error aplicando journal: {e}")
+    
+    def _put_document(self, doc_id: str, doc: Dict[str, Any]):
+        """Inserta o reemplaza un documento actualizando el índice en el sitio."""
+        with self._lock:
+            self._unindex_document(doc_id)
+            self.knowledge[doc_id] = doc
+            self._index_document(doc_id, doc)
+    
     def retrieve(self, query: str, max_tokens: int = 2000, 
-                category: str = None, tags: List[str] = None) -> str:
+                category: str = None, tags: List[str] = None,
+                token_counter: TokenCounter = None) -> str:
         """
         Recupera conocimiento relevante limitado por tokens.
         
@@ -222,120 +391,148 @@ class StaticCache:
             max_tokens: Máximo número de tokens
             category: Categoría específica (opcional)
             tags: Tags específicos (opcional)
+            token_counter: Contador del modelo destino (por defecto el compartido)
             
         Returns:
             Texto de contexto relevante
         """
+        return self.retrieve_counted(query, max_tokens, category, tags, token_counter).text
+    
+    def retrieve_counted(self, query: str, max_tokens: int = 2000,
+                         category: str = None, tags: List[str] = None,
+                         token_counter: TokenCounter = None) -> CountedText:
+        """
+        Igual que retrieve(), pero devuelve también el conteo de tokens para
+        que el llamador no tenga que volver a tokenizar el contexto.
+        """
         try:
-            # Buscar documentos relevantes
-            relevant_docs = self._search_relevant_docs(query, category, tags)
+            counter = token_counter or get_token_counter()
             
-            # Ordenar por relevancia
-            relevant_docs.sort(key=lambda x: x['relevance'], reverse=True)
-            
-            # Construir contexto respetando límite de tokens
+            # Construir contexto respetando límite de tokens, consumiendo
+            # los documentos en orden de relevancia desde el heap
             context_parts = []
             current_tokens = 0
             
-            for doc in relevant_docs:
+            for doc in self._iter_relevant_docs(query, category, tags):
                 doc_content = f"**{doc['title']}**\n{doc['content']}\n"
-                doc_tokens = len(doc_content.split())
+                doc_tokens = counter.count(doc_content)
                 
                 if current_tokens + doc_tokens <= max_tokens:
-                    context_parts.append(doc_content)
+                    context_parts.append(CountedText(doc_content, doc_tokens))
                     current_tokens += doc_tokens
                 else:
                     # Truncar si es necesario
                     remaining_tokens = max_tokens - current_tokens
                     if remaining_tokens > 50:  # Solo si queda espacio significativo
-                        truncated_content = ' '.join(doc_content.split()[:remaining_tokens])
-                        context_parts.append(truncated_content + "...")
+                        truncated = counter.truncate(doc_content, remaining_tokens - 1)
+                        context_parts.append(CountedText(truncated.text + "...", truncated.tokens + 1))
                     break
             
-            context = "\n\n".join(context_parts)
+            context = counter.join(context_parts)
             
             logger.debug(f"Contexto recuperado: {len(context_parts)} documentos, "
-                        f"{current_tokens} tokens")
+                        f"{context.tokens} tokens")
             
             return context
             
         except Exception as e:
             logger.error(f"Error recuperando conocimiento: {e}")
-            return ""
+            return CountedText("", 0)
     
     def _search_relevant_docs(self, query: str, category: str = None, 
-                            tags: List[str] = None) -> List[Dict[str, Any]]:
-        """Busca documentos relevantes para la query."""
+                            tags: List[str] = None, top_k: int = None) -> List[Dict[str, Any]]:
+        """Busca documentos relevantes para la query, ordenados por relevancia."""
         try:
-            query_lower = query.lower()
-            query_words = query_lower.split()
-            
-            relevant_docs = []
-            
-            for doc_id, doc in self.knowledge.items():
-                # Filtros
-                if category and doc['category'] != category:
-                    continue
-                
-                if tags and not any(tag in doc['tags'] for tag in tags):
-                    continue
-                
-                # Calcular relevancia
-                relevance = self._calculate_relevance(query_words, doc)
-                
-                if relevance > 0:
-                    relevant_docs.append({
-                        'id': doc_id,
-                        'title': doc['title'],
-                        'content': doc['content'],
-                        'category': doc['category'],
-                        'relevance': relevance
-                    })
-            
-            return relevant_docs
+            docs = self._iter_relevant_docs(query, category, tags)
+            if top_k is not None:
+                return [doc for _, doc in zip(range(top_k), docs)]
+            return list(docs)
             
         except Exception as e:
             logger.error(f"Error buscando documentos relevantes: {e}")
             return []
     
-    def _calculate_relevance(self, query_words: List[str], doc: Dict[str, Any]) -> float:
-        """Calcula relevancia de un documento para la query."""
-        try:
-            relevance = 0.0
-            
-            # Buscar en título (peso alto)
-            title_lower = doc['title'].lower()
-            for word in query_words:
-                if word in title_lower:
-                    relevance += 2.0
-            
-            # Buscar en contenido (peso medio)
-            content_lower = doc['content'].lower()
-            for word in query_words:
-                if word in content_lower:
-                    relevance += 1.0
-            
-            # Buscar en tags (peso alto)
-            for word in query_words:
-                if word in [tag.lower() for tag in doc['tags']]:
-                    relevance += 1.5
-            
-            # Normalizar por longitud del documento
-            doc_length = len(doc['content'].split())
-            if doc_length > 0:
-                relevance = relevance / (doc_length / 100)  # Normalizar por 100 palabras
-            
-            return relevance
-            
-        except Exception as e:
-            logger.error(f"Error calculando relevancia: {e}")
-            return 0.0
+    def _iter_relevant_docs(self, query: str, category: str = None,
+                            tags: List[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Genera documentos relevantes de mayor a menor relevancia.
+        
+        Solo se puntúan los documentos que aparecen en las postings de la
+        query; el heap se construye en O(n) y cada documento consumido
+        cuesta O(log n), así que quien solo necesita los primeros no paga
+        por ordenar el resto.
+        """
+        with self._lock:
+            scores = self._score_query(query)
+            allowed = self._filter_doc_ids(category, tags)
+            heap = [(-relevance, doc_id) for doc_id, relevance in scores.items()
+                    if relevance > 0 and (allowed is None or doc_id in allowed)]
+        
+        heapq.heapify(heap)
+        while heap:
+            neg_relevance, doc_id = heapq.heappop(heap)
+            doc = self.knowledge.get(doc_id)
+            if doc is None:
+                continue
+            yield {
+                'id': doc_id,
+                'title': doc['title'],
+                'content': doc['content'],
+                'category': doc['category'],
+                'relevance': -neg_relevance
+            }
+    
+    def _score_query(self, query: str) -> Dict[str, float]:
+        """Suma las postings de los términos de la query (y sus prefijos)."""
+        postings = self.index.get('postings', {})
+        query_counts: Dict[str, int] = {}
+        for word in _tokenize(query):
+            query_counts[word] = query_counts.get(word, 0) + 1
+        
+        scores: Dict[str, float] = {}
+        for word, count in query_counts.items():
+            for term, weight in self._expand_term(word):
+                term_weight = weight * count
+                for doc_id, doc_weight in postings.get(term, {}).items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + term_weight * doc_weight
+        return scores
+    
+    def _expand_term(self, word: str) -> List[Tuple[str, float]]:
+        """El término exacto más los del vocabulario que lo tienen de prefijo."""
+        terms = [(word, 1.0)]
+        if len(word) < self.MIN_PREFIX_LENGTH:
+            return terms
+        
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.index.get('postings', {}))
+        
+        start = bisect.bisect_right(self._vocabulary, word)
+        for term in self._vocabulary[start:start + self.MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(word):
+                break
+            terms.append((term, self.PREFIX_WEIGHT))
+        return terms
+    
+    def _filter_doc_ids(self, category: str = None, tags: List[str] = None) -> Optional[set]:
+        """Documentos que cumplen los filtros (None si no hay filtros)."""
+        allowed = None
+        if category:
+            allowed = set(self.index['by_category'].get(category, []))
+        if tags:
+            tagged = set()
+            for tag in tags:
+                tagged.update(self.index['by_tags'].get(tag, []))
+            allowed = tagged if allowed is None else allowed & tagged
+        return allowed
     
     def add_document(self, doc_id: str, title: str, content: str, 
                     category: str = "general", tags: List[str] = None):
         """
         Agrega un nuevo documento al conocimiento.
         
+        El índice se actualiza en el sitio y el documento se anota en el
+        journal; el pickle completo solo se reescribe al compactar.
+        
         Args:
             doc_id: ID único del documento
             title: Título del documento
@@ -351,8 +548,7 @@ class StaticCache:
             if doc_id in self.knowledge:
                 logger.warning(f"Documento {doc_id} ya existe, actualizando")
             
-            # Agregar documento
-            self.knowledge[doc_id] = {
+            doc = {
                 'title': title,
                 'content': content,
                 'category': category,
@@ -362,11 +558,11 @@ class StaticCache:
                 'updated': datetime.now().isoformat()
             }
             
-            # Reconstruir índice
-            self._build_index()
+            # Agregar documento e indexarlo
+            self._put_document(doc_id, doc)
             
-            # Guardar caché
-            self._save_cache()
+            # Persistir de forma incremental
+            self._append_journal(doc_id, doc)
             
             logger.info(f"Documento {doc_id} agregado exitosamente")
             
@@ -401,6 +597,8 @@ class StaticCache:
             'total_documents': len(self.knowledge),
             'categories': len(self.index['by_category']),
             'tags': len(self.index['by_tags']),
+            'indexed_terms': len(self.index['postings']),
+            'journal_entries': self._journal_entries,
             'cache_file_size_mb': self.cache_file.stat().st_size / (1024 * 1024) 
                                 if self.cache_file.exists() else 0,
             'knowledge_dir': str(self.knowledge_dir)
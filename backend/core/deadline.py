@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Deadline - Presupuesto de tiempo cooperativo para rutas de baja latencia.
+
+A diferencia de SIGALRM, funciona en cualquier hilo (uvicorn, thread pools)
+y con presupuestos de milisegundos: cada etapa consulta el tiempo restante
+y decide si continuar, recortar trabajo o devolver lo que ya tiene.
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class DeadlineExceeded(Exception):
+    """El presupuesto de tiempo se agotó antes de completar una etapa."""
+
+    def __init__(self, stage: str, deadline: "Deadline"):
+        self.stage = stage
+        self.deadline = deadline
+        super().__init__(f"Deadline agotado en '{stage}' "
+                         f"({deadline.elapsed_ms():.1f}/{deadline.budget_ms:.0f}ms)")
+
+
+class Deadline:
+    """
+    Presupuesto de tiempo con reloj monotónico.
+
+    Se crea al inicio de una petición y se pasa a cada etapa, que llama a
+    check() antes de trabajo caro y mark() al terminar para dejar constancia
+    del tiempo gastado.
+    """
+
+    def __init__(self, budget_ms: float):
+        """
+        Args:
+            budget_ms: Presupuesto total en milisegundos
+        """
+        self.budget_ms = float(budget_ms)
+        self._start = time.monotonic()
+        self._expires_at = self._start + self.budget_ms / 1000
+        self._stages: List[Tuple[str, float]] = []
+        self._truncated: List[str] = []
+
+    def elapsed_ms(self) -> float:
+        """Milisegundos transcurridos desde la creación."""
+        return (time.monotonic() - self._start) * 1000
+
+    def remaining_ms(self) -> float:
+        """Milisegundos restantes (0 si ya expiró)."""
+        return max(0.0, (self._expires_at - time.monotonic()) * 1000)
+
+    def remaining_s(self) -> float:
+        """Segundos restantes, útil como timeout de E/S."""
+        return self.remaining_ms() / 1000
+
+    def expired(self) -> bool:
+        """Indica si el presupuesto se agotó."""
+        return time.monotonic() >= self._expires_at
+
+    def check(self, stage: str):
+        """Lanza DeadlineExceeded si el presupuesto se agotó."""
+        if self.expired():
+            raise DeadlineExceeded(stage, self)
+
+    def mark(self, stage: str):
+        """Registra el final de una etapa con el tiempo acumulado."""
+        self._stages.append((stage, self.elapsed_ms()))
+
+    def truncate(self, stage: str):
+        """Registra que una etapa devolvió menos de lo pedido por falta de tiempo."""
+        if stage not in self._truncated:
+            self._truncated.append(stage)
+
+    @property
+    def truncated(self) -> bool:
+        """Indica si alguna etapa recortó su resultado."""
+        return bool(self._truncated)
+
+    def report(self) -> Dict[str, Any]:
+        """Resumen del presupuesto gastado, por etapas."""
+        elapsed = self.elapsed_ms()
+        stages = {}
+        previous = 0.0
+        for stage, at_ms in self._stages:
+            stages[stage] = round(at_ms - previous, 3)
+            previous = at_ms
+
+        return {
+            'budget_ms': self.budget_ms,
+            'elapsed_ms': round(elapsed, 3),
+            'spent_ratio': round(elapsed / self.budget_ms, 3) if self.budget_ms else 1.0,
+            'expired': elapsed >= self.budget_ms,
+            'truncated': list(self._truncated),
+            'stages': stages
+        }
+
+
+def ensure_deadline(deadline: Optional[Deadline], budget_ms: float) -> Deadline:
+    """Devuelve `deadline` o uno nuevo con `budget_ms` si no se pasó ninguno."""
+    return deadline if deadline is not None else Deadline(budget_ms)
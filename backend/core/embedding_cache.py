@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché persistente de embeddings sobre una arena mapeada en memoria.
+
+Estructura del directorio (uno por modelo):
+    manifest.json   Dimensión, dtype y capacidad de la arena
+    keys.npy        Clave de 16 bytes por slot (ceros = libre)
+    stamps.npy      Último acceso por slot (segundos, para LRU)
+    vectors.npy     Embeddings (float16 o float32)
+    state.npy       Número de slots ocupados
+    cache.lock      Lock de fichero para escrituras entre procesos
+
+La arena es una tabla hash de direccionamiento abierto: una clave solo
+puede estar en los PROBES slots que siguen a hash(clave) % capacidad, así
+que una búsqueda compara como mucho PROBES claves de la arena compartida y
+ningún proceso necesita un índice propio que reconstruir cuando otro
+escribe. Las escrituras se acumulan y un hilo en segundo plano las vuelca
+por lotes bajo el lock, sin bloquear encode().
+
+Un slot se publica en orden: se borra la clave anterior, se escribe el
+vector y solo entonces la clave nueva. Los lectores no toman el lock de
+fichero; copian el vector y vuelven a comprobar la clave, descartando la
+copia si el slot cambió de dueño mientras tanto.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows: solo exclusión dentro del proceso
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Caché LRU acotada de embeddings, persistente y compartible entre workers.
+
+    Las claves son hashes estables (blake2b) de modelo + texto, así que
+    sobreviven a reinicios. Varios procesos (p. ej. workers de gunicorn)
+    pueden abrir el mismo directorio: comparten las páginas de la arena y
+    coordinan la asignación de slots con un lock de fichero.
+    """
+
+    FORMAT_VERSION = 2
+    KEY_BYTES = 16
+
+    # Slots consecutivos en los que puede vivir una clave (sondeo lineal);
+    # si están todos ocupados se reutiliza el de acceso más antiguo
+    PROBES = 32
+
+    def __init__(self, cache_dir: str, namespace: str,
+                 max_entries: int = 100000,
+                 storage_dtype: str = "float32",
+                 flush_interval: float = 1.0,
+                 flush_batch: int = 256):
+        """
+        Inicializa la caché.
+
+        Args:
+            cache_dir: Directorio base de la caché
+            namespace: Espacio de nombres (normalmente el nombre del modelo)
+            max_entries: Número máximo de embeddings (capacidad de la arena)
+            storage_dtype: "float32" o "float16" para los vectores en disco
+            flush_interval: Segundos entre volcados en segundo plano
+            flush_batch: Entradas pendientes que fuerzan un volcado inmediato
+        """
+        if storage_dtype not in ("float16", "float32"):
+            raise ValueError(f"storage_dtype no soportado: {storage_dtype}")
+
+        self.namespace = namespace
+        self.path = Path(cache_dir) / re.sub(r'[^A-Za-z0-9_.-]+', '_', namespace)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.storage_dtype = storage_dtype
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+
+        # Arena (se abre o crea al conocer la dimensión)
+        self.embedding_dim = None
+        self._keys = None
+        self._stamps = None
+        self._vectors = None
+        self._state = None
+
+        # Escrituras pendientes
+        self._pending: Dict[bytes, np.ndarray] = {}
+        self._lock = threading.RLock()
+        # Orden de adquisición: _io_lock -> lock de fichero -> _lock
+        self._io_lock = threading.Lock()
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+            'flushes': 0
+        }
+
+        self._open_existing()
+
+        # Volcado en segundo plano
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True,
+                                         name="embedding-cache-flush")
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------
+    # Arena
+    # ------------------------------------------------------------------
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.path / "manifest.json"
+
+    @contextmanager
+    def _file_lock(self):
+        """Lock exclusivo entre procesos (solo entre hilos sin fcntl)."""
+        with self._io_lock, open(self.path / "cache.lock", 'a+') as lock_file:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _open_existing(self):
+        """Abre la arena si ya existe en disco."""
+        try:
+            if not self._manifest_path.exists():
+                return
+
+            with open(self._manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+
+            if manifest.get('version') != self.FORMAT_VERSION:
+                logger.warning(f"Caché de embeddings con versión "
+                               f"{manifest.get('version')}, se ignora")
+                return
+
+            self.embedding_dim = manifest['embedding_dim']
+            self.storage_dtype = manifest['storage_dtype']
+            if manifest['capacity'] != self.max_entries:
+                logger.info(f"Caché existente con capacidad {manifest['capacity']} "
+                            f"(solicitada {self.max_entries}), se mantiene la existente")
+                self.max_entries = manifest['capacity']
+
+            self._map_arena('r+')
+
+            logger.info(f"Caché de embeddings abierta: {int(self._state[0])} entradas")
+
+        except Exception as e:
+            logger.error(f"Error abriendo caché de embeddings: {e}")
+            self._keys = None
+
+    def _map_arena(self, mode: str):
+        open_memmap = np.lib.format.open_memmap
+        capacity = self.max_entries
+        self._keys = open_memmap(self.path / "keys.npy", mode=mode, dtype=np.uint8,
+                                 shape=(capacity, self.KEY_BYTES))
+        self._stamps = open_memmap(self.path / "stamps.npy", mode=mode, dtype=np.uint32,
+                                   shape=(capacity,))
+        self._vectors = open_memmap(self.path / "vectors.npy", mode=mode,
+                                    dtype=self.storage_dtype,
+                                    shape=(capacity, self.embedding_dim))
+        self._state = open_memmap(self.path / "state.npy", mode=mode, dtype=np.uint64,
+                                  shape=(1,))
+
+    def _create_arena(self, embedding_dim: int):
+        """Crea la arena en disco (bajo el lock de fichero)."""
+        with self._file_lock():
+            # Otro proceso pudo crearla mientras tanto
+            if self._manifest_path.exists():
+                self._open_existing()
+                if self._keys is not None:
+                    return
+
+            self.embedding_dim = embedding_dim
+            self._map_arena('w+')
+            for array in (self._keys, self._stamps, self._vectors, self._state):
+                array.flush()
+
+            manifest = {
+                'version': self.FORMAT_VERSION,
+                'namespace': self.namespace,
+                'embedding_dim': embedding_dim,
+                'storage_dtype': self.storage_dtype,
+                'capacity': self.max_entries,
+                'created_at': time.time()
+            }
+            tmp_path = self._manifest_path.with_suffix('.json.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            tmp_path.replace(self._manifest_path)
+
+            logger.info(f"Caché de embeddings creada: {self.max_entries} slots, "
+                        f"dim={embedding_dim}, {self.storage_dtype}")
+
+    def _probe_slots(self, keys: List[bytes]) -> np.ndarray:
+        """Slots candidatos de cada clave, (len(keys), PROBES)."""
+        capacity = self.max_entries
+        homes = np.fromiter((int.from_bytes(key[:8], 'little') % capacity for key in keys),
+                            dtype=np.int64, count=len(keys))
+        return (homes[:, None] + np.arange(min(self.PROBES, capacity))) % capacity
+
+    def _find_slots(self, keys: List[bytes]) -> np.ndarray:
+        """Slot de cada clave en la arena (-1 si no está)."""
+        if not keys:
+            return np.empty(0, dtype=np.int64)
+
+        key_bytes = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), self.KEY_BYTES)
+        candidates = self._probe_slots(keys)
+        matches = (self._keys[candidates] == key_bytes[:, None, :]).all(axis=2)
+        found = matches.any(axis=1)
+        slots = candidates[np.arange(len(keys)), matches.argmax(axis=1)]
+        return np.where(found, slots, -1)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def make_key(self, text: str) -> bytes:
+        """Clave estable para un texto (independiente de PYTHONHASHSEED)."""
+        digest = hashlib.blake2b(digest_size=self.KEY_BYTES)
+        digest.update(self.namespace.encode('utf-8'))
+        digest.update(b"\x00")
+        digest.update(text.encode('utf-8'))
+        return digest.digest()
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._keys is None:
+                self._open_existing()
+            stored = int(self._state[0]) if self._keys is not None else 0
+            pending = list(self._pending)
+            if self._keys is not None:
+                pending = [key for key, slot in zip(pending, self._find_slots(pending)) if slot < 0]
+            return stored + len(pending)
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Busca embeddings en la caché.
+
+        Returns:
+            Lista alineada con `texts` (None en los fallos)
+        """
+        keys = [self.make_key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+
+        with self._lock:
+            if self._keys is None:
+                # Otro proceso pudo crear la arena después de abrirse esta
+                self._open_existing()
+
+            lookup = []
+            for i, key in enumerate(keys):
+                embedding = self._pending.get(key)
+                if embedding is not None:
+                    results[i] = embedding
+                elif self._keys is not None:
+                    lookup.append(i)
+
+            if lookup:
+                lookup_keys = [keys[i] for i in lookup]
+                slots = self._find_slots(lookup_keys)
+                hit = slots >= 0
+                hit_slots = slots[hit]
+                if hit_slots.size:
+                    # Otro proceso pudo reutilizar el slot mientras se copiaba
+                    # el vector: la clave se vuelve a comprobar después
+                    vectors = np.array(self._vectors[hit_slots], dtype=np.float32)
+                    key_bytes = np.frombuffer(
+                        b"".join(key for key, ok in zip(lookup_keys, hit) if ok), dtype=np.uint8
+                    ).reshape(-1, self.KEY_BYTES)
+                    still_valid = (self._keys[hit_slots] == key_bytes).all(axis=1)
+                    self._stamps[hit_slots[still_valid]] = np.uint32(time.time())
+
+                    hit_rows = [i for i, ok in zip(lookup, hit) if ok]
+                    for row, vector, valid in zip(hit_rows, vectors, still_valid):
+                        if valid:
+                            results[row] = vector
+
+            hits = sum(1 for embedding in results if embedding is not None)
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(results) - hits
+
+        return results
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        """Encola embeddings para persistirlos en segundo plano."""
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                self._pending[self.make_key(text)] = np.asarray(embedding, dtype=np.float32)
+            pending = len(self._pending)
+
+        if pending >= self.flush_batch:
+            self._wakeup.set()
+
+    def flush(self):
+        """Vuelca las escrituras pendientes a la arena."""
+        with self._lock:
+            if not self._pending:
+                return
+            pending = self._pending
+            self._pending = {}
+
+        try:
+            if self._keys is None:
+                first = next(iter(pending.values()))
+                self._create_arena(int(first.shape[-1]))
+
+            with self._file_lock():
+                with self._lock:
+                    self._write_entries(pending)
+
+                for array in (self._keys, self._stamps, self._vectors, self._state):
+                    array.flush()
+
+            self.stats['flushes'] += 1
+
+        except Exception as e:
+            logger.error(f"Error volcando caché de embeddings: {e}")
+            with self._lock:
+                for key, embedding in pending.items():
+                    self._pending.setdefault(key, embedding)
+
+    def _write_entries(self, entries: Dict[bytes, np.ndarray]):
+        """
+        Escribe entradas en su ventana de sondeo.
+
+        Cada clave va a su slot si ya está, si no al primer slot libre de la
+        ventana y, con la ventana llena, al de acceso más antiguo (LRU
+        aproximado). En un slot reutilizado la clave vieja se borra antes de
+        tocar el vector y la nueva se publica después, así un lector nunca
+        ve una clave junto a un vector a medio escribir.
+        """
+        now = np.uint32(time.time())
+
+        for key, embedding in entries.items():
+            candidates = self._probe_slots([key])[0]
+            window = self._keys[candidates]
+            key_bytes = np.frombuffer(key, dtype=np.uint8)
+
+            matches = np.flatnonzero((window == key_bytes).all(axis=1))
+            if matches.size:
+                # Mismo texto, mismo embedding: basta con reescribirlo
+                slot = candidates[matches[0]]
+                self._vectors[slot] = embedding.astype(self.storage_dtype)
+                self._stamps[slot] = now
+                self.stats['writes'] += 1
+                continue
+
+            free = np.flatnonzero(~window.any(axis=1))
+            if free.size:
+                slot = candidates[free[0]]
+                self._state[0] += 1
+            else:
+                slot = candidates[int(np.argmin(self._stamps[candidates]))]
+                self._keys[slot] = 0
+                self.stats['evictions'] += 1
+
+            self._vectors[slot] = embedding.astype(self.storage_dtype)
+            self._stamps[slot] = now
+            self._keys[slot] = key_bytes
+            self.stats['writes'] += 1
+
+    def _flush_loop(self):
+        """Hilo de volcado periódico."""
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error en hilo de caché de embeddings: {e}")
+
+    def close(self):
+        """Vuelca lo pendiente y detiene el hilo de fondo."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+
+    def clear(self):
+        """Vacía la caché (memoria y disco)."""
+        with self._lock:
+            self._pending.clear()
+
+        if self._keys is not None:
+            with self._file_lock(), self._lock:
+                self._keys[:] = 0
+                self._stamps[:] = 0
+                self._state[0] = 0
+                self._keys.flush()
+                self._state.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estadísticas de la caché."""
+        total = self.stats['hits'] + self.stats['misses']
+        arena_mb = 0.0
+        if self._vectors is not None:
+            arena_mb = (self._vectors.nbytes + self._keys.nbytes +
+                        self._stamps.nbytes) / (1024 * 1024)
+
+        return {
+            **self.stats,
+            'entries': int(self._state[0]) if self._state is not None else 0,
+            'pending': len(self._pending),
+            'capacity': self.max_entries,
+            'hit_rate': self.stats['hits'] / total if total else 0.0,
+            'storage_dtype': self.storage_dtype,
+            'arena_mb': arena_mb
+        }
@@ -8,10 +8,12 @@ import logging
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 from sentence_transformers import SentenceTransformer
-import pickle
 import os
 from pathlib import Path
 
+from .deadline import Deadline
+from .embedding_cache import EmbeddingCache
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,27 +24,31 @@ class EmbeddingModel:
     """
     
     def __init__(self, model_name: str = "all-MiniLM-L6-v2", 
-                 cache_dir: str = "backend/data/embeddings_cache"):
+                 cache_dir: str = "backend/data/embeddings_cache",
+                 cache_max_entries: int = 100000,
+                 cache_dtype: str = "float32"):
         """
         Inicializa el modelo de embeddings.
         
         Args:
             model_name: Nombre del modelo de sentence-transformers
             cache_dir: Directorio para caché de embeddings
+            cache_max_entries: Máximo de embeddings en caché (LRU)
+            cache_dtype: Precisión en disco de la caché ("float32" o "float16")
         """
         self.model_name = model_name
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
-        # Caché en memoria
-        self._memory_cache = {}
-        self._cache_file = self.cache_dir / "embeddings_cache.pkl"
-        
         # Cargar modelo
         self.model = self._load_model()
         
-        # Cargar caché persistente
-        self._load_cache()
+        # Caché persistente (arena mmap compartida entre workers)
+        self._cache = EmbeddingCache(
+            self.cache_dir, model_name,
+            max_entries=cache_max_entries,
+            storage_dtype=cache_dtype
+        )
         
         logger.info(f"EmbeddingModel inicializado con {model_name}")
     
@@ -56,35 +62,13 @@ class EmbeddingModel:
             logger.error(f"Error cargando modelo de embeddings: {e}")
             raise
     
-    def _load_cache(self):
-        """Carga el caché persistente desde disco."""
-        try:
-            if self._cache_file.exists():
-                with open(self._cache_file, 'rb') as f:
-                    self._memory_cache = pickle.load(f)
-                logger.info(f"Caché cargado: {len(self._memory_cache)} embeddings")
-            else:
-                self._memory_cache = {}
-                logger.info("Caché vacío, se creará nuevo")
-        except Exception as e:
-            logger.error(f"Error cargando caché: {e}")
-            self._memory_cache = {}
-    
-    def _save_cache(self):
-        """Guarda el caché persistente en disco."""
-        try:
-            with open(self._cache_file, 'wb') as f:
-                pickle.dump(self._memory_cache, f)
-            logger.debug(f"Caché guardado: {len(self._memory_cache)} embeddings")
-        except Exception as e:
-            logger.error(f"Error guardando caché: {e}")
-    
-    def _get_cache_key(self, text: str) -> str:
-        """Genera clave de caché para un texto."""
-        return f"{self.model_name}:{hash(text)}"
+    def _get_cache_key(self, text: str) -> bytes:
+        """Genera clave de caché estable para un texto."""
+        return self._cache.make_key(text)
     
     def encode(self, texts: List[str], batch_size: int = 32, 
-               use_cache: bool = True) -> np.ndarray:
+               use_cache: bool = True,
+               deadline: Optional[Deadline] = None) -> np.ndarray:
         """
         Codifica textos a embeddings.
         
@@ -92,9 +76,14 @@ class EmbeddingModel:
             texts: Lista de textos a codificar
             batch_size: Tamaño del batch para procesamiento
             use_cache: Si usar caché para acelerar
+            deadline: Presupuesto de tiempo; se comprueba entre batches
             
         Returns:
             Array numpy con embeddings
+            
+        Raises:
+            DeadlineExceeded: Si el presupuesto se agota antes de codificar
+                todos los textos (lo ya codificado queda en caché)
         """
         if not texts:
             return np.array([])
@@ -109,14 +98,11 @@ class EmbeddingModel:
         
         # Verificar caché
         if use_cache:
-            for i, text in enumerate(texts):
-                cache_key = self._get_cache_key(text)
-                if cache_key in self._memory_cache:
-                    embeddings.append(self._memory_cache[cache_key])
-                else:
+            embeddings = self._cache.get_many(texts)
+            for i, (text, embedding) in enumerate(zip(texts, embeddings)):
+                if embedding is None:
                     texts_to_encode.append(text)
                     indices_to_encode.append(i)
-                    embeddings.append(None)  # Placeholder
         else:
             texts_to_encode = texts
             indices_to_encode = list(range(len(texts)))
@@ -124,29 +110,35 @@ class EmbeddingModel:
         
         # Codificar textos no cacheados
         if texts_to_encode:
-            try:
-                new_embeddings = self.model.encode(
-                    texts_to_encode, 
-                    batch_size=batch_size,
-                    show_progress_bar=False
-                )
+            # Con deadline se codifica por batches para poder cortar entre ellos
+            step = batch_size if deadline is not None else len(texts_to_encode)
+            
+            for start in range(0, len(texts_to_encode), step):
+                if deadline is not None:
+                    deadline.check("encode")
                 
-                # Actualizar resultados y caché
-                for i, embedding in enumerate(new_embeddings):
-                    original_idx = indices_to_encode[i]
-                    embeddings[original_idx] = embedding
+                batch_texts = texts_to_encode[start:start + step]
+                try:
+                    new_embeddings = self.model.encode(
+                        batch_texts, 
+                        batch_size=batch_size,
+                        show_progress_bar=False
+                    )
                     
-                    if use_cache:
-                        cache_key = self._get_cache_key(texts_to_encode[i])
-                        self._memory_cache[cache_key] = embedding
-                
-                # Guardar caché si hay nuevos embeddings
-                if use_cache and texts_to_encode:
-                    self._save_cache()
+                    # Actualizar resultados
+                    for i, embedding in enumerate(new_embeddings):
+                        embeddings[indices_to_encode[start + i]] = embedding
                     
-            except Exception as e:
-                logger.error(f"Error codificando embeddings: {e}")
-                raise
+                    # Persistir en segundo plano (no bloquea la respuesta)
+                    if use_cache:
+                        self._cache.put_many(batch_texts, new_embeddings)
+                        
+                except Exception as e:
+                    logger.error(f"Error codificando embeddings: {e}")
+                    raise
+            
+            if deadline is not None:
+                deadline.mark("encode")
         
         # Convertir a numpy array
         result = np.array(embeddings)
@@ -265,17 +257,25 @@ class EmbeddingModel:
     
     def clear_cache(self):
         """Limpia el caché de embeddings."""
-        self._memory_cache.clear()
-        if self._cache_file.exists():
-            self._cache_file.unlink()
+        self._cache.clear()
+        
+        # Caché pickle de versiones anteriores (claves no estables entre reinicios)
+        legacy_file = self.cache_dir / "embeddings_cache.pkl"
+        if legacy_file.exists():
+            legacy_file.unlink()
         logger.info("Caché de embeddings limpiado")
     
+    def flush_cache(self):
+        """Fuerza el volcado a disco de los embeddings pendientes."""
+        self._cache.flush()
+    
     def get_cache_stats(self) -> Dict[str, Any]:
         """Retorna estadísticas del caché."""
+        cache_stats = self._cache.get_stats()
         return {
-            'cache_size': len(self._memory_cache),
-            'cache_file_size_mb': self._cache_file.stat().st_size / (1024 * 1024) 
-                                 if self._cache_file.exists() else 0,
+            'cache_size': len(self._cache),
+            'cache_file_size_mb': cache_stats['arena_mb'],
+            'cache': cache_stats,
             'model_name': self.model_name,
             'embedding_dimension': self.get_embedding_dimension()
         }
@@ -10,6 +10,11 @@ from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import re
 
+import numpy as np
+
+from ..deadline import Deadline, DeadlineExceeded
+from .lexical_index import metadata_match_score
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,8 +22,19 @@ class FullRAG:
     """
     Búsqueda profunda guiada por resultados de MiniRAG.
     Optimizado para completitud y relevancia.
+    
+    La query original y sus expansiones se codifican en un único batch y se
+    buscan con una sola búsqueda multi-query; las listas resultantes se
+    combinan con reciprocal-rank fusion (RRF). El ranking léxico de los
+    candidatos usa el índice BM25 del vector store, construido en la ingesta.
     """
     
+    # Constante k de RRF: score = peso / (RRF_K + rank)
+    RRF_K = 60
+    ORIGINAL_QUERY_WEIGHT = 2.0
+    EXPANDED_QUERY_WEIGHT = 1.0
+    LEXICAL_WEIGHT = 1.0
+    
     def __init__(self, vector_store=None, embedding_model=None, 
                  mini_rag=None, max_results: int = 10, 
                  expansion_factor: float = 2.0):
@@ -61,7 +77,8 @@ class FullRAG:
                    f"expansion_factor={expansion_factor}")
     
     def search(self, query: str, mini_results: List[Any] = None, 
-               filter_metadata: Dict[str, Any] = None) -> List[Any]:
+               filter_metadata: Dict[str, Any] = None,
+               deadline: Optional[Deadline] = None) -> List[Any]:
         """
         Búsqueda profunda expandiendo resultados iniciales.
         
@@ -69,6 +86,8 @@ class FullRAG:
             query: Query original
             mini_results: Resultados de MiniRAG (opcional)
             filter_metadata: Filtros de metadata
+            deadline: Presupuesto de tiempo (opcional); si se agota antes de
+                      la búsqueda profunda se devuelven los de MiniRAG
             
         Returns:
             Lista de documentos encontrados
@@ -78,32 +97,20 @@ class FullRAG:
         try:
             # Si no hay resultados de MiniRAG, usar MiniRAG primero
             if mini_results is None and self.mini_rag:
-                mini_results = self.mini_rag.search(query, k=3)
+                mini_results = self.mini_rag.search(query, k=3, deadline=deadline)
             
             # Expandir query basado en resultados de MiniRAG
-            expanded_queries = self._expand_query(query, mini_results)
-            
-            # Realizar búsquedas expandidas
-            all_results = []
-            seen_doc_ids = set()
-            
-            # Búsqueda original
-            original_results = self._deep_search(query, filter_metadata)
-            all_results.extend(original_results)
-            seen_doc_ids.update(doc.doc_id for doc in original_results)
+            expanded_queries = self._expand_query(query, mini_results or [])
             
-            # Búsquedas expandidas
-            for expanded_query in expanded_queries:
-                expanded_results = self._deep_search(expanded_query, filter_metadata)
-                
-                # Agregar solo resultados nuevos
-                for doc in expanded_results:
-                    if doc.doc_id not in seen_doc_ids:
-                        all_results.append(doc)
-                        seen_doc_ids.add(doc.doc_id)
+            # Query original + expansiones: un batch de embeddings y una
+            # búsqueda multi-query
+            result_lists = self._multi_search([query] + expanded_queries, filter_metadata,
+                                              deadline)
+            weights = ([self.ORIGINAL_QUERY_WEIGHT] +
+                       [self.EXPANDED_QUERY_WEIGHT] * len(expanded_queries))
             
-            # Ordenar por relevancia y limitar resultados
-            final_results = self._rank_and_limit_results(all_results, query)
+            # Fusionar rankings y limitar resultados
+            final_results = self._rank_and_limit_results(result_lists, query, weights)
             
             # Actualizar estadísticas
             latency_ms = (time.time() - start_time) * 1000
@@ -114,6 +121,13 @@ class FullRAG:
             
             return final_results
             
+        except DeadlineExceeded as e:
+            latency_ms = (time.time() - start_time) * 1000
+            self._update_stats(latency_ms, 0, False)
+            logger.warning(f"FullRAG sin presupuesto en {e.stage} ({latency_ms:.1f}ms), "
+                           f"se usan los resultados de MiniRAG")
+            return list(mini_results or [])[:self.max_results]
+            
         except Exception as e:
             latency_ms = (time.time() - start_time) * 1000
             self._update_stats(latency_ms, 0, False)
@@ -316,51 +330,151 @@ class FullRAG:
     
     def _deep_search(self, query: str, filter_metadata: Dict[str, Any] = None) -> List[Any]:
         """Realiza búsqueda profunda en vector store."""
+        return self._multi_search([query], filter_metadata)[0]
+    
+    def _multi_search(self, queries: List[str],
+                      filter_metadata: Dict[str, Any] = None,
+                      deadline: Optional[Deadline] = None) -> List[List[Any]]:
+        """
+        Búsqueda profunda para varias queries a la vez.
+        
+        Un único encode() para todas las queries (sin repetidas) y una única
+        búsqueda por lotes en el vector store.
+        
+        Returns:
+            Lista de resultados alineada con `queries`
+            
+        Raises:
+            DeadlineExceeded: Si el presupuesto se agota antes de buscar
+        """
         try:
-            if not self.embedding_model or not self.vector_store:
-                return []
+            if not queries or not self.embedding_model or not self.vector_store:
+                return [[] for _ in queries]
             
-            # Generar embedding
-            query_embedding = self.embedding_model.encode([query])[0]
+            unique_queries = list(dict.fromkeys(queries))
+            
+            # Generar embeddings en un solo batch
+            if deadline is not None:
+                query_embeddings = self.embedding_model.encode(unique_queries, deadline=deadline)
+            else:
+                query_embeddings = self.embedding_model.encode(unique_queries)
             
             # Buscar con más resultados para mayor cobertura
             search_k = min(self.max_results * 2, 20)  # Buscar más para mejor ranking
-            results = self.vector_store.similarity_search(
-                query_embedding, search_k, filter_metadata
-            )
+            if hasattr(self.vector_store, 'similarity_search_batch'):
+                unique_results = self.vector_store.similarity_search_batch(
+                    query_embeddings, search_k, filter_metadata, deadline=deadline
+                )
+            else:
+                unique_results = [
+                    self.vector_store.similarity_search(embedding, search_k, filter_metadata,
+                                                        deadline=deadline)
+                    for embedding in query_embeddings
+                ]
             
-            return results
+            results_by_query = dict(zip(unique_queries, unique_results))
+            return [results_by_query[query] for query in queries]
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error en búsqueda profunda: {e}")
-            return []
+            return [[] for _ in queries]
     
-    def _rank_and_limit_results(self, all_results: List[Any], original_query: str) -> List[Any]:
-        """Rankea y limita resultados finales."""
+    @staticmethod
+    def _doc_key(doc: Any) -> Any:
+        """Identidad de un documento para deduplicar entre listas."""
+        doc_id = getattr(doc, 'doc_id', None)
+        if doc_id is None and isinstance(doc, dict):
+            doc_id = doc.get('doc_id') or doc.get('id')
+        return doc_id if doc_id is not None else id(doc)
+    
+    def _reciprocal_rank_fusion(self, result_lists: List[List[Any]],
+                                weights: List[float]) -> List[Tuple[float, Any]]:
+        """
+        Combina varias listas ordenadas con reciprocal-rank fusion.
+        
+        Returns:
+            Lista (score, documento) sin duplicados, ordenada por score
+        """
+        scores: Dict[Any, float] = {}
+        docs: Dict[Any, Any] = {}
+        
+        for results, weight in zip(result_lists, weights):
+            for rank, doc in enumerate(results, start=1):
+                key = self._doc_key(doc)
+                docs.setdefault(key, doc)
+                scores[key] = scores.get(key, 0.0) + weight / (self.RRF_K + rank)
+        
+        return sorted(((scores[key], docs[key]) for key in docs),
+                      key=lambda item: item[0], reverse=True)
+    
+    def _rank_and_limit_results(self, result_lists: List[List[Any]], original_query: str,
+                                weights: List[float] = None) -> List[Any]:
+        """
+        Rankea y limita resultados finales.
+        
+        Fusiona los rankings vectoriales de cada query con un ranking léxico
+        del conjunto de candidatos respecto a la query original.
+        """
         try:
-            if not all_results:
+            if weights is None:
+                weights = [self.EXPANDED_QUERY_WEIGHT] * len(result_lists)
+            
+            candidates = [doc for _, doc in self._reciprocal_rank_fusion(result_lists, weights)]
+            if not candidates:
                 return []
             
-            # Calcular scores de relevancia
-            scored_results = []
-            for doc in all_results:
-                score = self._calculate_relevance_score(doc, original_query)
-                scored_results.append((score, doc))
+            # Ranking léxico sobre los candidatos
+            lexical_scores = self._calculate_relevance_scores(candidates, original_query)
+            lexical_ranking = [candidates[i] for i in np.argsort(-lexical_scores, kind='stable')]
             
-            # Ordenar por score
-            scored_results.sort(key=lambda x: x[0], reverse=True)
+            fused = self._reciprocal_rank_fusion(
+                list(result_lists) + [lexical_ranking],
+                list(weights) + [self.LEXICAL_WEIGHT]
+            )
             
             # Limitar resultados
-            final_results = [doc for score, doc in scored_results[:self.max_results]]
-            
-            return final_results
+            return [doc for score, doc in fused[:self.max_results]]
             
         except Exception as e:
             logger.error(f"Error rankeando resultados: {e}")
-            return all_results[:self.max_results]
+            seen = set()
+            flat = []
+            for results in result_lists:
+                for doc in results:
+                    if self._doc_key(doc) not in seen:
+                        seen.add(self._doc_key(doc))
+                        flat.append(doc)
+            return flat[:self.max_results]
+    
+    def _calculate_relevance_scores(self, docs: List[Any], query: str) -> np.ndarray:
+        """
+        Score léxico de cada candidato: BM25 del índice del vector store más
+        el bonus de metadata. Los documentos que el índice no conoce usan el
+        score por escaneo de contenido.
+        """
+        scores = None
+        if self.vector_store is not None and hasattr(self.vector_store, 'lexical_scores'):
+            try:
+                scores = self.vector_store.lexical_scores(query, docs)
+            except Exception as e:
+                logger.warning(f"Índice léxico no disponible, usando escaneo: {e}")
+        
+        if scores is None:
+            return np.array([self._calculate_relevance_score(doc, query) for doc in docs],
+                            dtype=np.float32)
+        
+        query_words = query.lower().split()
+        for i, doc in enumerate(docs):
+            if np.isnan(scores[i]):
+                scores[i] = self._calculate_relevance_score(doc, query)
+            else:
+                scores[i] += metadata_match_score(getattr(doc, 'metadata', None), query_words)
+        return scores
     
     def _calculate_relevance_score(self, doc: Any, query: str) -> float:
-        """Calcula score de relevancia para un documento."""
+        """Calcula score de relevancia para un documento (escaneando su contenido)."""
         try:
             score = 0.0
             
@@ -386,16 +500,7 @@ class FullRAG:
             score += partial_matches * 1.0
             
             # Score por metadata
-            if hasattr(doc, 'metadata') and doc.metadata:
-                metadata = doc.metadata
-                for word in query_words:
-                    for key, value in metadata.items():
-                        if isinstance(value, str) and word in value.lower():
-                            score += 0.5
-                        elif isinstance(value, list):
-                            for item in value:
-                                if isinstance(item, str) and word in item.lower():
-                                    score += 0.3
+            score += metadata_match_score(getattr(doc, 'metadata', None), query_words)
             
             # Normalizar por longitud del contenido
             content_length = len(content.split())
@@ -445,16 +550,7 @@ class FullRAG:
             Lista de resultados comprensivos
         """
         try:
-            # Realizar múltiples búsquedas con diferentes estrategias
-            all_results = []
-            seen_doc_ids = set()
-            
-            # Búsqueda original
-            original_results = self._deep_search(query, filter_metadata)
-            all_results.extend(original_results)
-            seen_doc_ids.update(doc.doc_id for doc in original_results)
-            
-            # Búsquedas con variaciones de la query
+            # Query original y variaciones en una sola búsqueda multi-query
             query_variations = [
                 f"{query} tutorial",
                 f"{query} examples",
@@ -462,15 +558,12 @@ class FullRAG:
                 f"{query} best practices"
             ]
             
-            for variation in query_variations:
-                variation_results = self._deep_search(variation, filter_metadata)
-                for doc in variation_results:
-                    if doc.doc_id not in seen_doc_ids:
-                        all_results.append(doc)
-                        seen_doc_ids.add(doc.doc_id)
+            result_lists = self._multi_search([query] + query_variations, filter_metadata)
+            weights = ([self.ORIGINAL_QUERY_WEIGHT] +
+                       [self.EXPANDED_QUERY_WEIGHT] * len(query_variations))
             
             # Rankear y limitar
-            final_results = self._rank_and_limit_results(all_results, query)
+            final_results = self._rank_and_limit_results(result_lists, query, weights)
             
             return final_results
             
@@ -9,14 +9,26 @@ import time
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
+import numpy as np
+
+from .lexical_index import metadata_match_score
+
 logger = logging.getLogger(__name__)
 
 
 class GuidedSearch:
     """
     Coordinación entre MiniRAG y FullRAG para búsqueda optimizada.
+    
+    Los resultados combinados se rankean de forma híbrida: el orden vectorial
+    en que llegan se fusiona (RRF) con su ranking BM25 del índice léxico.
     """
     
+    # Constante k de RRF y pesos de los rankings vectorial y léxico
+    RRF_K = 60
+    VECTOR_WEIGHT = 1.0
+    LEXICAL_WEIGHT = 1.0
+    
     def __init__(self, mini_rag=None, full_rag=None, 
                  expansion_threshold: float = 0.3):
         """
@@ -345,29 +357,66 @@ class GuidedSearch:
             return mini_results + full_results
     
     def _rank_results(self, results: List[Any], query: str) -> List[Any]:
-        """Rankea resultados por relevancia."""
+        """
+        Rankea resultados por relevancia híbrida.
+        
+        `results` llega en orden vectorial (MiniRAG y luego FullRAG); ese
+        orden se fusiona con el ranking léxico de los mismos resultados.
+        """
         try:
             if not results:
                 return []
             
-            # Calcular scores de relevancia
-            scored_results = []
-            for result in results:
-                score = self._calculate_result_score(result, query)
-                scored_results.append((score, result))
+            lexical_scores = self._calculate_lexical_scores(results, query)
+            lexical_ranks = np.empty(len(results), dtype=np.int64)
+            lexical_ranks[np.argsort(-lexical_scores, kind='stable')] = np.arange(len(results))
+            vector_ranks = np.arange(len(results))
             
-            # Ordenar por score
-            scored_results.sort(key=lambda x: x[0], reverse=True)
+            hybrid_scores = (self.VECTOR_WEIGHT / (self.RRF_K + vector_ranks + 1) +
+                             self.LEXICAL_WEIGHT / (self.RRF_K + lexical_ranks + 1))
             
-            # Retornar solo los resultados (sin scores)
-            return [result for score, result in scored_results]
+            return [results[i] for i in np.argsort(-hybrid_scores, kind='stable')]
             
         except Exception as e:
             logger.error(f"Error rankeando resultados: {e}")
             return results
     
+    def _get_vector_store(self):
+        """Vector store compartido por FullRAG/MiniRAG (None si no hay)."""
+        for rag in (self.full_rag, self.mini_rag):
+            vector_store = getattr(rag, 'vector_store', None)
+            if vector_store is not None and hasattr(vector_store, 'lexical_scores'):
+                return vector_store
+        return None
+    
+    def _calculate_lexical_scores(self, results: List[Any], query: str) -> np.ndarray:
+        """
+        Score léxico de cada resultado: BM25 del índice del vector store más
+        el bonus de metadata; los que el índice no conoce se puntúan
+        escaneando su contenido.
+        """
+        scores = None
+        vector_store = self._get_vector_store()
+        if vector_store is not None:
+            try:
+                scores = vector_store.lexical_scores(query, results)
+            except Exception as e:
+                logger.warning(f"Índice léxico no disponible, usando escaneo: {e}")
+        
+        if scores is None:
+            return np.array([self._calculate_result_score(result, query) for result in results],
+                            dtype=np.float32)
+        
+        query_words = query.lower().split()
+        for i, result in enumerate(results):
+            if np.isnan(scores[i]):
+                scores[i] = self._calculate_result_score(result, query)
+            else:
+                scores[i] += metadata_match_score(getattr(result, 'metadata', None), query_words)
+        return scores
+    
     def _calculate_result_score(self, result: Any, query: str) -> float:
-        """Calcula score de relevancia para un resultado."""
+        """Calcula score de relevancia para un resultado (escaneando su contenido)."""
         try:
             score = 0.0
             
@@ -393,16 +442,7 @@ class GuidedSearch:
             score += partial_matches * 1.0
             
             # Score por metadata
-            if hasattr(result, 'metadata') and result.metadata:
-                metadata = result.metadata
-                for word in query_words:
-                    for key, value in metadata.items():
-                        if isinstance(value, str) and word in value.lower():
-                            score += 0.5
-                        elif isinstance(value, list):
-                            for item in value:
-                                if isinstance(item, str) and word in item.lower():
-                                    score += 0.3
+            score += metadata_match_score(getattr(result, 'metadata', None), query_words)
             
             # Bonus por longitud del contenido (contenido más detallado)
             content_length = len(content.split())
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LexicalIndex - Índice invertido BM25 construido en la ingesta.
+
+Guarda por término las filas que lo contienen y su frecuencia, y por fila
+la longitud del documento. Re-rankear un puñado de candidatos cuesta una
+búsqueda binaria por término de la query, sin volver a leer el contenido.
+El índice se puede volcar a un .npz junto a los segmentos del almacén.
+"""
+
+import bisect
+import math
+import os
+import re
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens en minúsculas (palabras alfanuméricas)."""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+def metadata_match_score(metadata: Optional[Dict[str, Any]], query_words: Iterable[str]) -> float:
+    """Bonus por términos de la query presentes en la metadata (strings y listas)."""
+    if not metadata:
+        return 0.0
+
+    score = 0.0
+    for word in query_words:
+        for value in metadata.values():
+            if isinstance(value, str) and word in value.lower():
+                score += 0.5
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, str) and word in item.lower():
+                        score += 0.3
+    return score
+
+
+class _Postings:
+    """
+    Filas (crecientes) y frecuencias de un término, con crecimiento amortizado.
+
+    Las filas eliminadas quedan con frecuencia 0 y no cuentan en `df`.
+    """
+
+    __slots__ = ('rows', 'tfs', 'size', 'removed')
+
+    def __init__(self):
+        self.rows = np.empty(4, dtype=np.int64)
+        self.tfs = np.empty(4, dtype=np.float32)
+        self.size = 0
+        self.removed = 0
+
+    @property
+    def df(self) -> int:
+        return self.size - self.removed
+
+    def append(self, row: int, tf: int):
+        if self.size == len(self.rows):
+            self.rows = np.resize(self.rows, 2 * self.size)
+            self.tfs = np.resize(self.tfs, 2 * self.size)
+        self.rows[self.size] = row
+        self.tfs[self.size] = tf
+        self.size += 1
+
+    def remove(self, row: int) -> bool:
+        """Anula la frecuencia de una fila. Devuelve False si no estaba."""
+        position = int(np.searchsorted(self.rows[:self.size], row))
+        if position < self.size and self.rows[position] == row and self.tfs[position] > 0:
+            self.tfs[position] = 0
+            self.removed += 1
+            return True
+        return False
+
+    def lookup(self, rows: np.ndarray) -> np.ndarray:
+        """Frecuencia del término en cada fila de `rows` (0 si no aparece)."""
+        own_rows = self.rows[:self.size]
+        positions = np.searchsorted(own_rows, rows)
+        positions[positions >= self.size] = max(self.size - 1, 0)
+        found = own_rows[positions] == rows
+        return np.where(found, self.tfs[:self.size][positions], 0.0).astype(np.float32)
+
+
+class LexicalIndex:
+    """
+    Índice BM25 por filas del vector store.
+
+    Las filas se agregan en orden creciente (como en MetadataIndex), así que
+    las posting lists quedan ordenadas. Las eliminaciones descuentan la fila
+    de df, del número de documentos y de la longitud total, para que IDF y
+    la longitud media sigan al corpus vivo.
+    """
+
+    K1 = 1.5
+    B = 0.75
+    PREFIX_WEIGHT = 0.3  # Peso de coincidencias parciales (prefijo)
+    MAX_PREFIX_EXPANSIONS = 5
+    MIN_PREFIX_LENGTH = 3
+
+    def __init__(self):
+        self._postings: Dict[str, _Postings] = {}
+        self._doc_lengths = np.zeros(1024, dtype=np.float32)
+        self._indexed = np.zeros(1024, dtype=bool)
+        self._doc_count = 0
+        self._total_length = 0
+        self._size = 0
+        self._vocabulary: Optional[List[str]] = None  # Ordenado, para prefijos
+
+    def __len__(self) -> int:
+        return self._doc_count
+
+    def add(self, row: int, text: str):
+        """Indexa el contenido de una fila (ignora filas ya indexadas)."""
+        if row < self._size and self._indexed[row]:
+            return
+        tokens = tokenize(text)
+
+        frequencies: Dict[str, int] = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+
+        for term, tf in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings()
+                if self._vocabulary is not None:
+                    bisect.insort(self._vocabulary, term)
+            postings.append(row, tf)
+
+        if row >= len(self._doc_lengths):
+            capacity = max(2 * len(self._doc_lengths), row + 1)
+            self._doc_lengths = np.resize(self._doc_lengths, capacity)
+            self._doc_lengths[self._size:] = 0
+            self._indexed = np.resize(self._indexed, capacity)
+            self._indexed[self._size:] = False
+        self._doc_lengths[row] = len(tokens)
+        self._indexed[row] = True
+        self._size = max(self._size, row + 1)
+        self._doc_count += 1
+        self._total_length += len(tokens)
+
+    def remove(self, row: int, text: str) -> bool:
+        """
+        Saca una fila del índice.
+
+        Args:
+            row: Fila eliminada o reemplazada
+            text: Contenido con el que se indexó
+
+        Returns:
+            False si la fila no estaba indexada
+        """
+        if row >= self._size or not self._indexed[row]:
+            return False
+
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is None or not postings.remove(row) or postings.df:
+                continue
+            del self._postings[term]
+            if self._vocabulary is not None:
+                position = bisect.bisect_left(self._vocabulary, term)
+                if position < len(self._vocabulary) and self._vocabulary[position] == term:
+                    del self._vocabulary[position]
+
+        self._doc_count -= 1
+        self._total_length -= int(self._doc_lengths[row])
+        self._doc_lengths[row] = 0
+        self._indexed[row] = False
+        return True
+
+    def indexed_rows(self) -> np.ndarray:
+        """Filas indexadas (int64 ordenado)."""
+        return np.flatnonzero(self._indexed[:self._size])
+
+    def idf(self, term: str) -> float:
+        """IDF de BM25 (siempre positivo)."""
+        postings = self._postings.get(term)
+        df = postings.df if postings else 0
+        return math.log(1.0 + (self._doc_count - df + 0.5) / (df + 0.5))
+
+    def _prefix_terms(self, word: str) -> List[str]:
+        """Términos del vocabulario que empiezan por `word` (sin incluirlo)."""
+        if len(word) < self.MIN_PREFIX_LENGTH:
+            return []
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+
+        terms = []
+        start = bisect.bisect_right(self._vocabulary, word)
+        for term in self._vocabulary[start:]:
+            if not term.startswith(word) or len(terms) >= self.MAX_PREFIX_EXPANSIONS:
+                break
+            terms.append(term)
+        return terms
+
+    def score(self, query: str, rows: Iterable[int]) -> np.ndarray:
+        """
+        Puntuación BM25 de la query para cada fila.
+
+        Args:
+            query: Texto de la query
+            rows: Filas a puntuar
+
+        Returns:
+            Array float32 alineado con `rows`
+        """
+        rows = np.asarray(list(rows) if not isinstance(rows, np.ndarray) else rows,
+                          dtype=np.int64)
+        scores = np.zeros(len(rows), dtype=np.float32)
+        if not len(rows) or not self._doc_count:
+            return scores
+
+        valid = (rows >= 0) & (rows < self._size)
+        lengths = np.where(valid, self._doc_lengths[np.clip(rows, 0, max(self._size - 1, 0))], 0)
+        avg_length = self._total_length / self._doc_count or 1.0
+        norm = self.K1 * (1 - self.B + self.B * lengths / avg_length)
+
+        for word in set(tokenize(query)):
+            weighted_terms = [(word, 1.0)] + [(term, self.PREFIX_WEIGHT)
+                                              for term in self._prefix_terms(word)]
+            for term, weight in weighted_terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                tf = postings.lookup(rows)
+                scores += weight * self.idf(term) * tf * (self.K1 + 1) / (tf + norm)
+
+        scores[~valid] = 0.0
+        return scores
+
+    def save(self, path: Path, store_rows: int):
+        """
+        Vuelca el índice a un .npz de forma atómica.
+
+        Args:
+            path: Fichero destino
+            store_rows: Filas del almacén cubiertas por este volcado
+        """
+        terms = sorted(self._postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        rows, tfs = [], []
+        for i, term in enumerate(terms):
+            postings = self._postings[term]
+            live = postings.tfs[:postings.size] > 0
+            rows.append(postings.rows[:postings.size][live])
+            tfs.append(postings.tfs[:postings.size][live])
+            term_offsets[i + 1] = term_offsets[i] + postings.df
+
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                terms=np.frombuffer("\n".join(terms).encode('utf-8'), dtype=np.uint8),
+                term_offsets=term_offsets,
+                rows=np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64),
+                tfs=np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.float32),
+                doc_lengths=self._doc_lengths[:self._size],
+                indexed=self._indexed[:self._size],
+                store_rows=np.array([store_rows], dtype=np.int64)
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Tuple['LexicalIndex', int]:
+        """
+        Carga un índice volcado con save().
+
+        Returns:
+            (índice, filas del almacén que cubre)
+        """
+        with np.load(path, allow_pickle=False) as data:
+            text = data['terms'].tobytes().decode('utf-8')
+            terms = text.split("\n") if text else []
+            term_offsets = data['term_offsets']
+            rows = data['rows']
+            tfs = data['tfs']
+            doc_lengths = data['doc_lengths'].astype(np.float32)
+            indexed = data['indexed'].astype(bool)
+            store_rows = int(data['store_rows'][0])
+
+        index = cls()
+        for i, term in enumerate(terms):
+            postings = _Postings()
+            start, end = int(term_offsets[i]), int(term_offsets[i + 1])
+            postings.rows = rows[start:end].copy()
+            postings.tfs = tfs[start:end].copy()
+            postings.size = end - start
+            index._postings[term] = postings
+
+        index._size = len(indexed)
+        capacity = max(1024, index._size)
+        index._doc_lengths = np.zeros(capacity, dtype=np.float32)
+        index._doc_lengths[:index._size] = doc_lengths
+        index._indexed = np.zeros(capacity, dtype=bool)
+        index._indexed[:index._size] = indexed
+        index._doc_count = int(np.count_nonzero(indexed))
+        index._total_length = int(doc_lengths[indexed].sum())
+        index._vocabulary = terms
+        return index, store_rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estadísticas del índice."""
+        return {
+            'documents': self._doc_count,
+            'terms': len(self._postings),
+            'avg_doc_length': self._total_length / self._doc_count if self._doc_count else 0.0
+        }
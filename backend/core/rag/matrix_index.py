@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MatrixIndex - Motor de búsqueda exacta sobre una matriz contigua de embeddings.
+
+Usado por VectorStore en modo "basic" (sin FAISS/ChromaDB).
+"""
+
+import logging
+import numpy as np
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MatrixIndex:
+    """
+    Índice de fuerza bruta con embeddings pre-normalizados en float32.
+
+    Los vectores nuevos viven en una única matriz preasignada que crece por
+    duplicación amortizada; cada búsqueda es un producto matricial más
+    una selección top-k con argpartition. Opcionalmente el índice arranca
+    sobre bloques base de solo lectura (p. ej. segmentos mapeados con mmap),
+    que ocupan las primeras filas y nunca se copian.
+    """
+
+    def __init__(self, embedding_dim: int, initial_capacity: int = 1024,
+                 base_blocks: Optional[List[np.ndarray]] = None,
+                 base_live: Optional[np.ndarray] = None):
+        """
+        Inicializa el índice.
+
+        Args:
+            embedding_dim: Dimensión de los embeddings
+            initial_capacity: Número de filas preasignadas
+            base_blocks: Bloques (n_i, dim) ya normalizados, de solo lectura
+            base_live: Máscara de filas vivas de los bloques base
+        """
+        self.embedding_dim = embedding_dim
+        self._base = [block for block in (base_blocks or []) if len(block)]
+        self._base_rows = sum(len(block) for block in self._base)
+
+        self._matrix = np.zeros((max(1, initial_capacity), embedding_dim), dtype=np.float32)
+        self._tail_size = 0
+
+        self._live = np.ones(self._base_rows + self._matrix.shape[0], dtype=bool)
+        self._live[self._base_rows:] = False
+        if base_live is not None:
+            self._live[:self._base_rows] = base_live[:self._base_rows]
+        self._size = self._base_rows
+        self._live_count = int(np.count_nonzero(self._live[:self._size]))
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    @property
+    def size(self) -> int:
+        """Número de filas ocupadas (incluye filas eliminadas)."""
+        return self._size
+
+    @staticmethod
+    def normalize(embeddings: np.ndarray) -> np.ndarray:
+        """Convierte a float32 2D y normaliza por norma L2."""
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+
+    def _ensure_capacity(self, required: int):
+        """Duplica la capacidad de la matriz hasta alojar `required` filas propias."""
+        capacity = self._matrix.shape[0]
+        if required <= capacity:
+            return
+
+        while capacity < required:
+            capacity *= 2
+
+        matrix = np.zeros((capacity, self.embedding_dim), dtype=np.float32)
+        matrix[:self._tail_size] = self._matrix[:self._tail_size]
+        live = np.zeros(self._base_rows + capacity, dtype=bool)
+        live[:self._size] = self._live[:self._size]
+
+        self._matrix = matrix
+        self._live = live
+        logger.debug(f"MatrixIndex redimensionado a {capacity} filas")
+
+    def add(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Agrega embeddings al índice.
+
+        Args:
+            embeddings: Array (n, dim) o (dim,)
+
+        Returns:
+            Array con las filas asignadas
+        """
+        embeddings = self.normalize(embeddings)
+        if embeddings.shape[1] != self.embedding_dim:
+            raise ValueError(f"Dimensión {embeddings.shape[1]} no coincide con "
+                             f"{self.embedding_dim}")
+
+        n = embeddings.shape[0]
+        self._ensure_capacity(self._tail_size + n)
+
+        self._matrix[self._tail_size:self._tail_size + n] = embeddings
+        start = self._size
+        self._live[start:start + n] = True
+        self._tail_size += n
+        self._size += n
+        self._live_count += n
+
+        return np.arange(start, start + n, dtype=np.int64)
+
+    def remove(self, rows: np.ndarray):
+        """Marca filas como eliminadas (no vuelven a aparecer en búsquedas)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[(rows >= 0) & (rows < self._size)]
+        self._live_count -= int(np.count_nonzero(self._live[rows]))
+        self._live[rows] = False
+
+    def is_live(self, row: int) -> bool:
+        """Indica si una fila está ocupada y no eliminada."""
+        return 0 <= row < self._size and bool(self._live[row])
+
+    def search(self, query_embeddings: np.ndarray, k: int,
+               mask: Optional[np.ndarray] = None,
+               candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Búsqueda por similitud coseno para una o varias queries.
+
+        Args:
+            query_embeddings: Array (dim,) o (n_queries, dim)
+            k: Número de resultados por query
+            mask: Máscara booleana opcional (size,) con las filas candidatas
+            candidates: Filas candidatas ordenadas (alternativa a `mask`; el
+                        coste es proporcional a su tamaño, no al del índice)
+
+        Returns:
+            Tupla (scores, rows) de forma (n_queries, k'), con
+            k' = min(k, número de filas candidatas), ordenada por score.
+        """
+        queries = self.normalize(query_embeddings)
+        n_queries = queries.shape[0]
+
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=np.int64)
+            candidates = candidates[candidates < self._size]
+            candidates = candidates[self._live[candidates]]
+            valid = None
+        else:
+            valid = self._live[:self._size]
+            if mask is not None:
+                valid = valid & np.asarray(mask, dtype=bool)[:self._size]
+            candidates = np.flatnonzero(valid)
+
+        k = min(k, candidates.size)
+        if k <= 0:
+            return (np.empty((n_queries, 0), dtype=np.float32),
+                    np.empty((n_queries, 0), dtype=np.int64))
+
+        # Con pocos candidatos se multiplica solo su submatriz; con muchos
+        # es más barato puntuar todo y enmascarar que copiar las filas.
+        gather = valid is None or candidates.size < self._size // 2
+        if gather:
+            scores = self._score(queries, candidates)
+        else:
+            scores = self._score(queries)
+            if candidates.size < self._size:
+                scores[:, ~valid] = -np.inf
+
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(scores.shape[1]), (n_queries, scores.shape[1]))
+
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        rows = candidates[top] if gather else top
+        return top_scores, rows.astype(np.int64)
+
+    def _blocks(self):
+        """Recorre (offset, bloque) de base y cola en orden de fila."""
+        offset = 0
+        for block in self._base:
+            yield offset, block
+            offset += len(block)
+        if self._tail_size:
+            yield offset, self._matrix[:self._tail_size]
+
+    def _score(self, queries: np.ndarray,
+               candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similitudes (n_queries, filas) para todas las filas o solo candidatas."""
+        parts = []
+        for offset, block in self._blocks():
+            if candidates is None:
+                parts.append(queries @ block.T)
+                continue
+
+            lo, hi = np.searchsorted(candidates, [offset, offset + len(block)])
+            if hi > lo:
+                parts.append(queries @ block[candidates[lo:hi] - offset].T)
+
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts, axis=1)
+
+    def clear(self):
+        """Vacía el índice (incluidos los bloques base) conservando la capacidad."""
+        self._base = []
+        self._base_rows = 0
+        self._live = np.zeros(self._matrix.shape[0], dtype=bool)
+        self._tail_size = 0
+        self._size = 0
+        self._live_count = 0
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MetadataIndex - Índice invertido de metadata con posting lists de filas.
+
+Los filtros usan la misma sintaxis que ChromaDB:
+    {"category": "programming"}                          igualdad
+    {"year": {"$gte": 2020, "$lt": 2024}}                rango numérico
+    {"lang": {"$in": ["es", "en"]}}                      pertenencia
+    {"tags": {"$contains": "python"}}                    elemento de una lista
+    {"$or": [{"category": "web"}, {"category": "api"}]}  combinaciones
+Varias claves en el mismo dict se combinan con AND.
+"""
+
+import bisect
+import json
+import logging
+import numpy as np
+from array import array
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def _value_key(value: Any) -> Any:
+    """Convierte un valor de metadata en clave hashable.
+
+    Los booleanos llevan su tipo en la clave: True == 1 en Python, pero
+    {"flag": True} no debe coincidir con {"flag": 1}.
+    """
+    if isinstance(value, bool):
+        return (bool, value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_value_key(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+def _key_value(value_key: Any) -> Any:
+    """Inversa de _value_key para booleanos (el resto se devuelve tal cual)."""
+    if isinstance(value_key, tuple) and len(value_key) == 2 and value_key[0] is bool:
+        return value_key[1]
+    return value_key
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class MetadataIndex:
+    """
+    Índice invertido {clave: {valor: filas}} con filas ordenadas (int64).
+
+    Las filas se agregan en orden creciente, así que cada posting list queda
+    ordenada sin coste extra. Los valores numéricos distintos se acumulan
+    sin ordenar y se ordenan en la primera consulta de rango posterior. Las
+    eliminaciones no tocan el índice: el llamador descarta las filas muertas
+    con su máscara de filas vivas.
+    """
+
+    RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte'}
+    OPERATORS = RANGE_OPERATORS | {'$eq', '$ne', '$in', '$nin', '$contains'}
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Any, array]] = {}
+        self._contains: Dict[str, Dict[Any, array]] = {}
+        self._numeric_values: Dict[str, List[float]] = {}
+        self._unsorted_keys: Set[str] = set()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def keys(self) -> List[str]:
+        return list(self._postings.keys())
+
+    def values(self, key: str) -> List[Any]:
+        return [_key_value(value_key) for value_key in self._postings.get(key, {})]
+
+    def add(self, row: int, metadata: Dict[str, Any]):
+        """Indexa la metadata de una fila."""
+        for key, value in (metadata or {}).items():
+            value_key = _value_key(value)
+            postings = self._postings.setdefault(key, {})
+
+            if value_key not in postings:
+                postings[value_key] = array('q')
+                if _is_number(value):
+                    self._numeric_values.setdefault(key, []).append(value)
+                    self._unsorted_keys.add(key)
+            postings[value_key].append(row)
+
+            if isinstance(value, (list, tuple)):
+                contains = self._contains.setdefault(key, {})
+                for item in set(_value_key(item) for item in value):
+                    contains.setdefault(item, array('q')).append(row)
+
+        self._size = max(self._size, row + 1)
+
+    # ------------------------------------------------------------------
+    # Evaluación de filtros
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _rows(postings: Optional[array]) -> np.ndarray:
+        if not postings:
+            return np.empty(0, dtype=np.int64)
+        return np.frombuffer(postings, dtype=np.int64).copy()
+
+    @staticmethod
+    def _union(parts: List[np.ndarray]) -> np.ndarray:
+        parts = [part for part in parts if part.size]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        if len(parts) == 1:
+            return parts[0]
+        return np.unique(np.concatenate(parts))
+
+    @staticmethod
+    def _intersect(parts: List[np.ndarray]) -> np.ndarray:
+        parts = sorted(parts, key=len)
+        result = parts[0]
+        for part in parts[1:]:
+            if result.size == 0:
+                break
+            result = np.intersect1d(result, part, assume_unique=True)
+        return result
+
+    def _complement(self, rows: np.ndarray, universe: int) -> np.ndarray:
+        mask = np.ones(universe, dtype=bool)
+        mask[rows[rows < universe]] = False
+        return np.flatnonzero(mask)
+
+    def select(self, filter_metadata: Dict[str, Any], universe: int = None) -> np.ndarray:
+        """
+        Evalúa un filtro y devuelve las filas candidatas.
+
+        Args:
+            filter_metadata: Filtro en sintaxis ChromaDB
+            universe: Número total de filas (para negaciones)
+
+        Returns:
+            Array int64 ordenado de filas que cumplen el filtro
+        """
+        universe = self._size if universe is None else universe
+        parts = []
+
+        for key, condition in filter_metadata.items():
+            if key == '$and':
+                # Un $and vacío no restringe nada; un $or vacío no admite ninguna fila
+                if not condition:
+                    parts.append(np.arange(universe, dtype=np.int64))
+                else:
+                    parts.append(self._intersect([self.select(sub, universe) for sub in condition]))
+            elif key == '$or':
+                parts.append(self._union([self.select(sub, universe) for sub in condition]))
+            elif isinstance(condition, dict) and condition and set(condition) <= self.OPERATORS:
+                parts.append(self._select_operators(key, condition, universe))
+            else:
+                parts.append(self._select_eq(key, condition))
+
+        if not parts:
+            return np.arange(universe, dtype=np.int64)
+        return self._intersect(parts)
+
+    def _select_eq(self, key: str, value: Any) -> np.ndarray:
+        return self._rows(self._postings.get(key, {}).get(_value_key(value)))
+
+    def _select_operators(self, key: str, condition: Dict[str, Any], universe: int) -> np.ndarray:
+        parts = []
+        postings = self._postings.get(key, {})
+
+        for operator, operand in condition.items():
+            if operator == '$eq':
+                parts.append(self._select_eq(key, operand))
+            elif operator == '$ne':
+                parts.append(self._complement(self._select_eq(key, operand), universe))
+            elif operator == '$in':
+                parts.append(self._union([self._select_eq(key, value) for value in operand]))
+            elif operator == '$nin':
+                excluded = self._union([self._select_eq(key, value) for value in operand])
+                parts.append(self._complement(excluded, universe))
+            elif operator == '$contains':
+                parts.append(self._rows(self._contains.get(key, {}).get(_value_key(operand))))
+
+        ranges = {op: value for op, value in condition.items() if op in self.RANGE_OPERATORS}
+        if ranges and not all(_is_number(value) for value in ranges.values()):
+            # Un operando no numérico (p.ej. un string en un campo numérico) no
+            # coincide con nada, igual que en matches()
+            parts.append(np.empty(0, dtype=np.int64))
+        elif ranges:
+            values = self._numeric_values.get(key, [])
+            if key in self._unsorted_keys:
+                values.sort()
+                self._unsorted_keys.discard(key)
+            lo, hi = 0, len(values)
+            if '$gt' in ranges:
+                lo = max(lo, bisect.bisect_right(values, ranges['$gt']))
+            if '$gte' in ranges:
+                lo = max(lo, bisect.bisect_left(values, ranges['$gte']))
+            if '$lt' in ranges:
+                hi = min(hi, bisect.bisect_left(values, ranges['$lt']))
+            if '$lte' in ranges:
+                hi = min(hi, bisect.bisect_right(values, ranges['$lte']))
+            parts.append(self._union([self._rows(postings.get(value))
+                                      for value in values[lo:hi]]))
+
+        return self._intersect(parts)
+
+    @classmethod
+    def matches(cls, metadata: Dict[str, Any], filter_metadata: Dict[str, Any]) -> bool:
+        """Evalúa un filtro sobre la metadata de un único documento."""
+        if not filter_metadata:
+            return True
+
+        for key, condition in filter_metadata.items():
+            if key == '$and':
+                if not all(cls.matches(metadata, sub) for sub in condition):
+                    return False
+                continue
+            if key == '$or':
+                if not any(cls.matches(metadata, sub) for sub in condition):
+                    return False
+                continue
+
+            present = key in metadata
+            value = metadata.get(key)
+
+            if not (isinstance(condition, dict) and condition and set(condition) <= cls.OPERATORS):
+                if not present or _value_key(value) != _value_key(condition):
+                    return False
+                continue
+
+            for operator, operand in condition.items():
+                if operator == '$ne':
+                    ok = not present or _value_key(value) != _value_key(operand)
+                elif operator == '$nin':
+                    ok = not present or _value_key(value) not in {_value_key(o) for o in operand}
+                elif not present:
+                    ok = False
+                elif operator == '$eq':
+                    ok = _value_key(value) == _value_key(operand)
+                elif operator == '$in':
+                    ok = _value_key(value) in {_value_key(o) for o in operand}
+                elif operator == '$contains':
+                    ok = isinstance(value, (list, tuple)) and \
+                        _value_key(operand) in {_value_key(item) for item in value}
+                elif not _is_number(value) or not _is_number(operand):
+                    ok = False
+                elif operator == '$gt':
+                    ok = value > operand
+                elif operator == '$gte':
+                    ok = value >= operand
+                elif operator == '$lt':
+                    ok = value < operand
+                else:
+                    ok = value <= operand
+
+                if not ok:
+                    return False
+
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estadísticas del índice."""
+        return {
+            'keys': len(self._postings),
+            'entries': sum(len(values) for values in self._postings.values()),
+            'indexed_rows': self._size
+        }
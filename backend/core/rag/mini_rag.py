@@ -2,48 +2,19 @@
 # -*- coding: utf-8 -*-
 """
 MiniRAG - Búsqueda rápida superficial con timeout estricto (<50ms).
+
+El timeout es un Deadline cooperativo (válido en cualquier hilo y con
+presupuestos de milisegundos): cada etapa comprueba el tiempo restante y,
+si se agota, se devuelven resultados parciales o de caché.
 """
 
 import logging
 import time
 from typing import List, Dict, Any, Optional
-from datetime import datetime
-import signal
-import threading
-import time
-from contextlib import contextmanager
-
-logger = logging.getLogger(__name__)
-
-
-class TimeoutError(Exception):
-    """Excepción para timeouts."""
-    pass
 
+from ..deadline import Deadline, DeadlineExceeded, ensure_deadline
 
-@contextmanager
-def timeout(seconds):
-    """Context manager para timeout compatible con Windows."""
-    if hasattr(signal, 'SIGALRM'):
-        # Unix/Linux/Mac
-        def signal_handler(signum, frame):
-            raise TimeoutError(f"Operación excedió {seconds} segundos")
-        
-        old_handler = signal.signal(signal.SIGALRM, signal_handler)
-        signal.alarm(int(seconds))
-        
-        try:
-            yield
-        finally:
-            signal.alarm(0)
-            signal.signal(signal.SIGALRM, old_handler)
-    else:
-        # Windows - simplificado, solo verificar tiempo
-        start_time = time.time()
-        yield
-        elapsed = time.time() - start_time
-        if elapsed > seconds:
-            raise TimeoutError(f"Operación excedió {seconds} segundos")
+logger = logging.getLogger(__name__)
 
 
 class MiniRAG:
@@ -79,14 +50,18 @@ class MiniRAG:
             'successful_queries': 0,
             'timeout_queries': 0,
             'cache_hits': 0,
+            'stale_cache_hits': 0,
+            'partial_results': 0,
             'avg_latency_ms': 0,
             'total_latency_ms': 0
         }
+        self.last_budget: Dict[str, Any] = {}
         
         logger.info(f"MiniRAG inicializado: timeout={timeout_ms}ms, max_results={max_results}")
     
     def search(self, query: str, k: int = None, 
-               filter_metadata: Dict[str, Any] = None) -> List[Any]:
+               filter_metadata: Dict[str, Any] = None,
+               deadline: Optional[Deadline] = None) -> List[Any]:
         """
         Búsqueda superficial con límite de tiempo.
         
@@ -94,77 +69,101 @@ class MiniRAG:
             query: Query de búsqueda
             k: Número de resultados (usa max_results si no se especifica)
             filter_metadata: Filtros de metadata
+            deadline: Presupuesto de tiempo (por defecto timeout_ms)
             
         Returns:
             Lista de documentos encontrados
         """
-        start_time = time.time()
+        return self.search_with_budget(query, k, filter_metadata, deadline)['results']
+    
+    def search_with_budget(self, query: str, k: int = None,
+                           filter_metadata: Dict[str, Any] = None,
+                           deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        Búsqueda superficial que informa del presupuesto gastado.
         
-        try:
-            if k is None:
-                k = self.max_results
+        Args:
+            query: Query de búsqueda
+            k: Número de resultados (usa max_results si no se especifica)
+            filter_metadata: Filtros de metadata
+            deadline: Presupuesto de tiempo (por defecto timeout_ms)
             
+        Returns:
+            Dict con 'results', 'source' (cache, search, partial,
+            stale_cache o timeout) y 'budget' (Deadline.report())
+        """
+        deadline = ensure_deadline(deadline, self.timeout_ms)
+        results: List[Any] = []
+        source = 'search'
+        
+        if k is None:
+            k = self.max_results
+        cache_key = self._get_cache_key(query, k, filter_metadata)
+        
+        try:
             # Verificar caché
-            cache_key = self._get_cache_key(query, k, filter_metadata)
-            if cache_key in self.query_cache:
-                cache_entry = self.query_cache[cache_key]
-                if time.time() - cache_entry['timestamp'] < self.cache_ttl:
-                    self.stats['cache_hits'] += 1
-                    logger.debug(f"Cache hit para query: {query[:50]}...")
-                    return cache_entry['results']
-            
-            # Búsqueda con timeout
-            results = self._search_with_timeout(query, k, filter_metadata)
-            
-            # Actualizar caché
-            self._update_cache(cache_key, results)
-            
-            # Actualizar estadísticas
-            latency_ms = (time.time() - start_time) * 1000
-            self._update_stats(latency_ms, success=True)
+            cache_entry = self.query_cache.get(cache_key)
+            if cache_entry and time.time() - cache_entry['timestamp'] < self.cache_ttl:
+                self.stats['cache_hits'] += 1
+                logger.debug(f"Cache hit para query: {query[:50]}...")
+                results, source = cache_entry['results'], 'cache'
+            else:
+                results = self._search_with_deadline(query, k, filter_metadata, deadline)
+                
+                if deadline.truncated:
+                    # Alguna etapa recortó el resultado: no se cachea. Uno
+                    # completo se cachea aunque terminara fuera de plazo.
+                    source = 'partial'
+                    self.stats['partial_results'] += 1
+                else:
+                    self._update_cache(cache_key, results)
             
-            logger.debug(f"MiniRAG search: {len(results)} resultados, {latency_ms:.1f}ms")
-            return results
+            self._update_stats(deadline.elapsed_ms(), success=True)
             
-        except TimeoutError:
-            latency_ms = (time.time() - start_time) * 1000
-            self._update_stats(latency_ms, success=False, timeout=True)
-            logger.warning(f"MiniRAG timeout: {query[:50]}... ({latency_ms:.1f}ms)")
-            return []
+        except DeadlineExceeded as e:
+            # Sin presupuesto: mejor una respuesta vieja que ninguna
+            stale = self.query_cache.get(cache_key)
+            if stale:
+                self.stats['stale_cache_hits'] += 1
+                results, source = stale['results'], 'stale_cache'
+            else:
+                source = 'timeout'
+            self._update_stats(deadline.elapsed_ms(), success=False, timeout=True)
+            logger.warning(f"MiniRAG timeout en {e.stage}: {query[:50]}... "
+                           f"({deadline.elapsed_ms():.1f}ms, fuente: {source})")
         except Exception as e:
-            latency_ms = (time.time() - start_time) * 1000
-            self._update_stats(latency_ms, success=False)
+            self._update_stats(deadline.elapsed_ms(), success=False)
             logger.error(f"Error en MiniRAG search: {e}")
-            return []
+        
+        self.last_budget = deadline.report()
+        logger.debug(f"MiniRAG search: {len(results)} resultados, "
+                     f"{self.last_budget['elapsed_ms']:.1f}ms ({source})")
+        
+        return {
+            'results': results,
+            'source': source,
+            'budget': self.last_budget
+        }
     
-    def _search_with_timeout(self, query: str, k: int, 
-                           filter_metadata: Dict[str, Any] = None) -> List[Any]:
-        """Búsqueda con timeout estricto."""
-        try:
-            with timeout(self.timeout_ms / 1000):
-                # Generar embedding de la query
-                if not self.embedding_model:
-                    logger.warning("No hay modelo de embeddings disponible")
-                    return []
-                
-                query_embedding = self.embedding_model.encode([query])[0]
-                
-                # Buscar en vector store
-                if not self.vector_store:
-                    logger.warning("No hay vector store disponible")
-                    return []
-                
-                results = self.vector_store.similarity_search(
-                    query_embedding, k, filter_metadata
-                )
-                
-                return results
-                
-        except TimeoutError:
-            raise
-        except Exception as e:
-            logger.error(f"Error en búsqueda con timeout: {e}")
+    def _search_with_deadline(self, query: str, k: int, 
+                              filter_metadata: Dict[str, Any],
+                              deadline: Deadline) -> List[Any]:
+        """Búsqueda cooperativa: cada etapa comprueba el presupuesto restante."""
+        # Generar embedding de la query
+        if not self.embedding_model:
+            logger.warning("No hay modelo de embeddings disponible")
             return []
+        
+        query_embedding = self.embedding_model.encode([query], deadline=deadline)[0]
+        
+        # Buscar en vector store
+        if not self.vector_store:
+            logger.warning("No hay vector store disponible")
+            return []
+        
+        return self.vector_store.similarity_search(
+            query_embedding, k, filter_metadata, deadline=deadline
+        )
     
     def _get_cache_key(self, query: str, k: int, 
                       filter_metadata: Dict[str, Any] = None) -> str:
@@ -233,16 +232,8 @@ class MiniRAG:
             Lista de resultados rápidos
         """
         try:
-            # Usar timeout más estricto para resultados rápidos
-            original_timeout = self.timeout_ms
-            self.timeout_ms = 25  # 25ms para resultados rápidos
-            
-            results = self.search(query, max_results)
-            
-            # Restaurar timeout original
-            self.timeout_ms = original_timeout
-            
-            return results
+            # Presupuesto más estricto para resultados rápidos (25ms)
+            return self.search(query, max_results, deadline=Deadline(25))
             
         except Exception as e:
             logger.error(f"Error obteniendo resultados rápidos: {e}")
@@ -270,6 +261,8 @@ class MiniRAG:
                 'success_rate': self.stats['successful_queries'] / self.stats['total_queries'],
                 'timeout_rate': self.stats['timeout_queries'] / self.stats['total_queries'],
                 'cache_hit_rate': self.stats['cache_hits'] / self.stats['total_queries'],
+                'stale_cache_rate': self.stats['stale_cache_hits'] / self.stats['total_queries'],
+                'partial_rate': self.stats['partial_results'] / self.stats['total_queries'],
                 'avg_latency_ms': round(self.stats['avg_latency_ms'], 2)
             }
             
@@ -293,6 +286,7 @@ class MiniRAG:
             'cache_size': len(self.query_cache),
             'cache_ttl': self.cache_ttl,
             'timeout_ms': self.timeout_ms,
+            'last_budget': self.last_budget,
             'max_results': self.max_results,
             'available': self.is_available()
         }
@@ -305,6 +299,8 @@ class MiniRAG:
                 'successful_queries': 0,
                 'timeout_queries': 0,
                 'cache_hits': 0,
+                'stale_cache_hits': 0,
+                'partial_results': 0,
                 'avg_latency_ms': 0,
                 'total_latency_ms': 0
             }
@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SegmentStore - Formato en disco versionado y mapeable en memoria para VectorStore.
+
+Estructura del directorio:
+    manifest.json            Punto de commit: versión, dimensión, segmentos y filas
+    seg_000001.npy           Embeddings normalizados float32 (inmutables, mmap)
+    documents-000001.log     Log append-only de documentos (una línea JSON por fila)
+    documents-000001.idx     Offsets int64 de cada fila dentro del log
+    doc_hashes-000001.idx    Hash int64 del doc_id de cada fila (búsqueda por id)
+    tombstones-000001.idx    Filas eliminadas (int64, append-only)
+
+Cada fila tiene un número estable (posición global) que comparten los
+segmentos, el log y los índices en memoria. Solo `compact()` renumera.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentStore:
+    """
+    Almacén en disco de embeddings y documentos por segmentos.
+
+    Las escrituras son appends incrementales (un segmento nuevo por lote,
+    líneas nuevas en el log) y el manifest se reemplaza atómicamente al final.
+    La carga solo lee el manifest y mapea los ficheros en modo lectura, así
+    que varios procesos pueden compartir las mismas páginas sin copiarlas.
+    Admite un único proceso escritor; los demás deben abrirlo con read_only.
+    """
+
+    FORMAT_NAME = "capibara6-vectorstore"
+    FORMAT_VERSION = 1
+    MANIFEST_FILE = "manifest.json"
+
+    # Límite de segmentos antes de forzar fusiones
+    MAX_SEGMENTS = 16
+
+    # Filas copiadas por paso en compact() (acota la memoria usada)
+    COMPACT_CHUNK_ROWS = 65536
+
+    # Filas añadidas fuera del índice ordenado de hashes antes de reordenarlo
+    HASH_TAIL_LIMIT = 65536
+
+    def __init__(self, path: Path, embedding_dim: int, read_only: bool = False):
+        """
+        Inicializa el almacén.
+
+        Args:
+            path: Directorio del almacén
+            embedding_dim: Dimensión de los embeddings
+            read_only: Si True nunca escribe ni repara ficheros
+        """
+        self.path = Path(path)
+        self.embedding_dim = embedding_dim
+        self.read_only = read_only
+
+        self.manifest = None
+        self._blocks = []
+        self._offsets = np.zeros(0, dtype=np.int64)
+        self._dead = np.zeros(0, dtype=bool)
+        self._dead_count = 0
+        self._log_map = None
+        self._hashes = None
+        self._hash_sorted = None
+        self._hash_order = None
+        self._hash_tail: Dict[int, List[int]] = {}
+
+        self.load()
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.path / self.MANIFEST_FILE
+
+    def exists(self) -> bool:
+        """Indica si hay un manifest en disco."""
+        return self.manifest_path.exists()
+
+    def _new_manifest(self, generation: int = 1) -> Dict[str, Any]:
+        return {
+            'format': self.FORMAT_NAME,
+            'version': self.FORMAT_VERSION,
+            'embedding_dim': self.embedding_dim,
+            'generation': generation,
+            'next_segment': 1,
+            'segments': [],
+            'rows': 0,
+            'log_size': 0,
+            'tombstones': 0
+        }
+
+    def _file(self, kind: str, generation: int = None) -> Path:
+        generation = self.manifest['generation'] if generation is None else generation
+        suffix = "log" if kind == "documents_log" else "idx"
+        prefix = {'tombstones': 'tombstones', 'doc_hashes': 'doc_hashes'}.get(kind, 'documents')
+        return self.path / f"{prefix}-{generation:06d}.{suffix}"
+
+    def load(self):
+        """Carga (o recarga) el estado publicado en el manifest."""
+        if self.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+
+            if manifest.get('format') != self.FORMAT_NAME:
+                raise ValueError(f"Formato desconocido en {self.manifest_path}")
+            if manifest.get('version', 0) > self.FORMAT_VERSION:
+                raise ValueError(f"Versión de formato no soportada: {manifest['version']}")
+            if manifest['embedding_dim'] != self.embedding_dim:
+                raise ValueError(f"Dimensión del almacén ({manifest['embedding_dim']}) "
+                                 f"distinta de {self.embedding_dim}")
+            self.manifest = manifest
+        else:
+            self.manifest = self._new_manifest()
+
+        rows = self.manifest['rows']
+
+        if not self.read_only:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._repair()
+
+        self._blocks = [
+            np.load(self.path / f"{segment['name']}.npy", mmap_mode='r')
+            for segment in self.manifest['segments']
+        ]
+
+        idx_file = self._file('documents_index')
+        if rows and idx_file.exists():
+            self._offsets = np.fromfile(idx_file, dtype=np.int64, count=rows)
+        else:
+            self._offsets = np.zeros(0, dtype=np.int64)
+
+        self._dead = np.zeros(rows, dtype=bool)
+        tomb_file = self._file('tombstones')
+        if self.manifest['tombstones'] and tomb_file.exists():
+            dead_rows = np.fromfile(tomb_file, dtype=np.int64,
+                                    count=self.manifest['tombstones'])
+            self._dead[dead_rows[dead_rows < rows]] = True
+        self._dead_count = int(np.count_nonzero(self._dead))
+
+        self._remap_log()
+        self._hashes = None
+        self._hash_sorted = None
+        self._hash_order = None
+        self._hash_tail = {}
+
+        logger.debug(f"SegmentStore cargado: {rows} filas, "
+                     f"{len(self._blocks)} segmentos")
+
+    def _repair(self):
+        """Descarta bytes no publicados en el manifest (escrituras interrumpidas)."""
+        truncate_to = {
+            self._file('documents_log'): self.manifest['log_size'],
+            self._file('documents_index'): self.manifest['rows'] * 8,
+            self._file('doc_hashes'): self.manifest['rows'] * 8,
+            self._file('tombstones'): self.manifest['tombstones'] * 8
+        }
+        for file_path, size in truncate_to.items():
+            if file_path.exists() and file_path.stat().st_size > size:
+                with open(file_path, 'r+b') as f:
+                    f.truncate(size)
+                logger.warning(f"Fichero {file_path.name} truncado a {size} bytes")
+
+    def _remap_log(self):
+        """Mapea el log de documentos en memoria (solo lectura)."""
+        if self._log_map is not None:
+            self._log_map.close()
+            self._log_map = None
+
+        log_file = self._file('documents_log')
+        if self.manifest['log_size'] and log_file.exists():
+            with open(log_file, 'rb') as f:
+                self._log_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _write_manifest(self):
+        """Publica el manifest de forma atómica."""
+        tmp_path = self.manifest_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def _check_writable(self):
+        if self.read_only:
+            raise PermissionError("SegmentStore abierto en modo solo lectura")
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    @property
+    def rows(self) -> int:
+        """Número total de filas (incluye eliminadas)."""
+        return self.manifest['rows']
+
+    @property
+    def live_rows(self) -> int:
+        """Número de filas no eliminadas."""
+        return self.rows - self._dead_count
+
+    @property
+    def dead_rows(self) -> int:
+        return self._dead_count
+
+    def blocks(self) -> List[np.ndarray]:
+        """Embeddings de cada segmento como arrays mapeados de solo lectura."""
+        return list(self._blocks)
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Embeddings de filas concretas (ordenadas), leídos de los segmentos."""
+        rows = np.asarray(rows, dtype=np.int64)
+        parts = []
+        offset = 0
+        for block in self._blocks:
+            lo, hi = np.searchsorted(rows, [offset, offset + len(block)])
+            if hi > lo:
+                parts.append(block[rows[lo:hi] - offset])
+            offset += len(block)
+
+        if not parts:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        return np.concatenate(parts)
+
+    def is_live(self, row: int) -> bool:
+        return 0 <= row < self.rows and not self._dead[row]
+
+    def live_mask(self) -> np.ndarray:
+        """Máscara booleana de filas no eliminadas."""
+        return ~self._dead
+
+    def read_document(self, row: int) -> Dict[str, Any]:
+        """Decodifica el documento de una fila desde el log."""
+        if not 0 <= row < self.rows:
+            raise IndexError(f"Fila fuera de rango: {row}")
+
+        start = int(self._offsets[row])
+        end = int(self._offsets[row + 1]) if row + 1 < self.rows else self.manifest['log_size']
+        return json.loads(self._log_map[start:end])
+
+    def iter_documents(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Recorre en streaming los documentos vivos como (fila, dict)."""
+        for row in range(self.rows):
+            if not self._dead[row]:
+                yield row, self.read_document(row)
+
+    @staticmethod
+    def _doc_hash(doc_id: str) -> int:
+        """Hash estable (int64) de un doc_id."""
+        return int.from_bytes(hashlib.blake2b(doc_id.encode('utf-8'), digest_size=8).digest(),
+                              'little', signed=True)
+
+    def _ensure_hashes(self) -> np.ndarray:
+        """
+        Carga los hashes de doc_id persistidos y los ordena en el primer uso.
+
+        Si faltan filas (almacén anterior a este fichero o escritura
+        interrumpida) se calculan desde el log y, si se puede, se persisten.
+        """
+        if self._hash_sorted is not None:
+            return self._hashes
+
+        hashes_file = self._file('doc_hashes')
+        stored = 0
+        if hashes_file.exists():
+            stored = min(self.rows, hashes_file.stat().st_size // 8)
+        hashes = np.fromfile(hashes_file, dtype=np.int64, count=stored) if stored else \
+            np.zeros(0, dtype=np.int64)
+
+        if stored < self.rows:
+            missing = np.fromiter(
+                (self._doc_hash(self.read_document(row)['doc_id']) for row in range(stored, self.rows)),
+                dtype=np.int64, count=self.rows - stored
+            )
+            hashes = np.concatenate([hashes, missing])
+            if not self.read_only:
+                with open(hashes_file, 'ab') as f:
+                    f.write(missing.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                logger.info(f"Hashes de doc_id reconstruidos para {missing.size} filas")
+
+        self._hashes = hashes
+        self._hash_order = np.argsort(hashes, kind='stable')
+        self._hash_sorted = hashes[self._hash_order]
+        self._hash_tail = {}
+        return hashes
+
+    def doc_row(self, doc_id: str) -> Optional[int]:
+        """Fila viva de un doc_id (la más reciente)."""
+        self._ensure_hashes()
+        key = self._doc_hash(doc_id)
+        lo = np.searchsorted(self._hash_sorted, key, side='left')
+        hi = np.searchsorted(self._hash_sorted, key, side='right')
+        candidates = self._hash_order[lo:hi].tolist() + self._hash_tail.get(key, [])
+
+        # El hash solo preselecciona: se confirma contra el documento
+        for row in sorted(candidates, reverse=True):
+            if not self._dead[row] and self.read_document(row)['doc_id'] == doc_id:
+                return int(row)
+        return None
+
+    def is_doc_row(self, row: int, doc_id: str) -> bool:
+        """
+        Indica si `row` es la fila viva de `doc_id` sin decodificar el documento.
+
+        Sirve para validar filas que el llamador ya conoce (p. ej. las de
+        un resultado de búsqueda); compara el hash persistido del doc_id.
+        """
+        if not self.is_live(row):
+            return False
+        hashes = self._ensure_hashes()
+        return int(hashes[row]) == self._doc_hash(doc_id)
+
+    def doc_ids(self) -> List[str]:
+        """Lista de doc_id vivos."""
+        return [data['doc_id'] for _, data in self.iter_documents()]
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def append(self, documents: List[Dict[str, Any]], embeddings: np.ndarray) -> np.ndarray:
+        """
+        Agrega un lote de documentos como segmento nuevo.
+
+        Args:
+            documents: Documentos serializados (Document.to_dict())
+            embeddings: Embeddings normalizados (n, dim)
+
+        Returns:
+            Filas asignadas
+        """
+        self._check_writable()
+
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.shape != (len(documents), self.embedding_dim):
+            raise ValueError("Forma de embeddings incompatible con los documentos")
+
+        start_row = self.rows
+        rows = np.arange(start_row, start_row + len(documents), dtype=np.int64)
+
+        # 1. Segmento inmutable
+        segment_name = f"seg_{self.manifest['next_segment']:06d}"
+        self._save_segment(segment_name, embeddings)
+
+        # 2. Documentos y offsets (append-only)
+        offsets = np.empty(len(documents), dtype=np.int64)
+        position = self.manifest['log_size']
+        with open(self._file('documents_log'), 'ab') as log_f:
+            for i, data in enumerate(documents):
+                line = json.dumps(data, ensure_ascii=False).encode('utf-8') + b"\n"
+                offsets[i] = position
+                log_f.write(line)
+                position += len(line)
+            log_f.flush()
+            os.fsync(log_f.fileno())
+
+        with open(self._file('documents_index'), 'ab') as idx_f:
+            idx_f.write(offsets.tobytes())
+            idx_f.flush()
+            os.fsync(idx_f.fileno())
+
+        if self._hash_sorted is None:
+            # Completa el fichero de hashes antes de añadir filas nuevas
+            self._ensure_hashes()
+        hashes = np.fromiter((self._doc_hash(data['doc_id']) for data in documents),
+                             dtype=np.int64, count=len(documents))
+        with open(self._file('doc_hashes'), 'ab') as hash_f:
+            hash_f.write(hashes.tobytes())
+            hash_f.flush()
+            os.fsync(hash_f.fileno())
+
+        # 3. Commit
+        self.manifest['segments'].append({'name': segment_name, 'rows': len(documents)})
+        self.manifest['next_segment'] += 1
+        self.manifest['rows'] += len(documents)
+        self.manifest['log_size'] = position
+        self._merge_segments()
+        self._write_manifest()
+        self._remove_orphan_segments()
+
+        # Estado en memoria
+        self._offsets = np.concatenate([self._offsets, offsets])
+        self._dead = np.concatenate([self._dead, np.zeros(len(documents), dtype=bool)])
+        self._blocks = [
+            np.load(self.path / f"{segment['name']}.npy", mmap_mode='r')
+            for segment in self.manifest['segments']
+        ]
+        self._remap_log()
+
+        self._hashes = np.concatenate([self._hashes, hashes])
+        for key, row in zip(hashes.tolist(), rows.tolist()):
+            self._hash_tail.setdefault(key, []).append(row)
+        if sum(len(tail) for tail in self._hash_tail.values()) > self.HASH_TAIL_LIMIT:
+            self._hash_order = np.argsort(self._hashes, kind='stable')
+            self._hash_sorted = self._hashes[self._hash_order]
+            self._hash_tail = {}
+
+        return rows
+
+    def _save_segment(self, name: str, embeddings: np.ndarray):
+        """Escribe un segmento .npy de forma atómica."""
+        final_path = self.path / f"{name}.npy"
+        tmp_path = self.path / f"{name}.tmp.npy"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, embeddings)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, final_path)
+
+    def _merge_segments(self):
+        """
+        Fusiona segmentos de cola al estilo LSM: mientras el penúltimo no sea
+        mayor que el último (o haya demasiados), se unen en uno. Cada fila se
+        reescribe O(log N) veces en total.
+        """
+        segments = self.manifest['segments']
+        while len(segments) >= 2 and (
+            segments[-2]['rows'] <= segments[-1]['rows'] or
+            len(segments) > self.MAX_SEGMENTS
+        ):
+            last = segments.pop()
+            previous = segments.pop()
+            merged = np.concatenate([
+                np.load(self.path / f"{previous['name']}.npy", mmap_mode='r'),
+                np.load(self.path / f"{last['name']}.npy", mmap_mode='r')
+            ])
+            name = f"seg_{self.manifest['next_segment']:06d}"
+            self.manifest['next_segment'] += 1
+            self._save_segment(name, merged)
+            segments.append({'name': name, 'rows': previous['rows'] + last['rows']})
+
+    def _remove_orphan_segments(self):
+        """Elimina segmentos que ya no figuran en el manifest.
+
+        En POSIX los procesos que aún los tengan mapeados siguen leyéndolos.
+        """
+        current = {f"{segment['name']}.npy" for segment in self.manifest['segments']}
+        for seg_file in self.path.glob("seg_*.npy"):
+            if seg_file.name not in current:
+                try:
+                    seg_file.unlink()
+                except OSError as e:
+                    logger.debug(f"No se pudo eliminar {seg_file}: {e}")
+
+    def delete(self, rows: List[int]):
+        """Marca filas como eliminadas (append al fichero de tombstones)."""
+        self._check_writable()
+
+        rows = np.asarray([row for row in rows if self.is_live(row)], dtype=np.int64)
+        if rows.size == 0:
+            return
+
+        with open(self._file('tombstones'), 'ab') as f:
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.manifest['tombstones'] += int(rows.size)
+        self._write_manifest()
+
+        self._dead[rows] = True
+        self._dead_count += int(rows.size)
+
+    def compact(self) -> int:
+        """
+        Reescribe el almacén sin filas eliminadas en una nueva generación.
+
+        Las filas se renumeran, así que los índices en memoria deben
+        reconstruirse después. Los lectores con el manifest anterior siguen
+        viendo la generación vieja hasta que recargan. Los embeddings se
+        copian segmento a segmento y por tramos sobre un fichero mapeado,
+        sin cargar el corpus entero en memoria.
+
+        Returns:
+            Número de filas descartadas
+        """
+        self._check_writable()
+        if self._dead_count == 0:
+            return 0
+
+        dropped = self._dead_count
+        live = np.flatnonzero(~self._dead)
+        old_generation = self.manifest['generation']
+        generation = old_generation + 1
+        hashes = self._ensure_hashes()
+
+        manifest = self._new_manifest(generation)
+        manifest['next_segment'] = self.manifest['next_segment'] + 1
+        segment_name = f"seg_{self.manifest['next_segment']:06d}"
+        if live.size:
+            self._compact_segments(segment_name, live.size)
+
+        offsets = np.empty(live.size, dtype=np.int64)
+        position = 0
+        with open(self._file('documents_log', generation), 'wb') as log_f:
+            for i, row in enumerate(live):
+                start = int(self._offsets[row])
+                end = int(self._offsets[row + 1]) if row + 1 < self.rows else self.manifest['log_size']
+                line = self._log_map[start:end]
+                offsets[i] = position
+                log_f.write(line)
+                position += len(line)
+            log_f.flush()
+            os.fsync(log_f.fileno())
+
+        with open(self._file('documents_index', generation), 'wb') as idx_f:
+            idx_f.write(offsets.tobytes())
+            idx_f.flush()
+            os.fsync(idx_f.fileno())
+
+        with open(self._file('doc_hashes', generation), 'wb') as hash_f:
+            hash_f.write(hashes[live].tobytes())
+            hash_f.flush()
+            os.fsync(hash_f.fileno())
+
+        if live.size:
+            manifest['segments'] = [{'name': segment_name, 'rows': int(live.size)}]
+        manifest['rows'] = int(live.size)
+        manifest['log_size'] = position
+
+        self.manifest = manifest
+        self._write_manifest()
+        self._remove_orphan_segments()
+
+        for kind in ('documents_log', 'documents_index', 'doc_hashes', 'tombstones'):
+            old_file = self._file(kind, old_generation)
+            if old_file.exists():
+                old_file.unlink()
+
+        self.load()
+        logger.info(f"SegmentStore compactado: {dropped} filas eliminadas")
+        return dropped
+
+    def _compact_segments(self, name: str, live_count: int):
+        """Escribe en un segmento nuevo las filas vivas de cada segmento actual."""
+        final_path = self.path / f"{name}.npy"
+        tmp_path = self.path / f"{name}.tmp.npy"
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                        shape=(live_count, self.embedding_dim))
+        position = 0
+        offset = 0
+        for block in self._blocks:
+            block_live = np.flatnonzero(~self._dead[offset:offset + len(block)])
+            for start in range(0, block_live.size, self.COMPACT_CHUNK_ROWS):
+                chunk = block_live[start:start + self.COMPACT_CHUNK_ROWS]
+                out[position:position + chunk.size] = block[chunk]
+                position += chunk.size
+            offset += len(block)
+        out.flush()
+        del out
+
+        with open(tmp_path, 'r+b') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, final_path)
+
+    def clear(self):
+        """Elimina todos los datos publicando una generación vacía."""
+        self._check_writable()
+        old_generation = self.manifest['generation']
+        next_segment = self.manifest['next_segment']
+
+        self.manifest = self._new_manifest(old_generation + 1)
+        self.manifest['next_segment'] = next_segment
+        self._write_manifest()
+        self._remove_orphan_segments()
+
+        for kind in ('documents_log', 'documents_index', 'doc_hashes', 'tombstones'):
+            old_file = self._file(kind, old_generation)
+            if old_file.exists():
+                old_file.unlink()
+
+        self.load()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estadísticas del almacén."""
+        return {
+            'format_version': self.manifest['version'],
+            'generation': self.manifest['generation'],
+            'segments': len(self.manifest['segments']),
+            'rows': self.rows,
+            'dead_rows': self._dead_count,
+            'log_size_mb': self.manifest['log_size'] / (1024 * 1024),
+            'read_only': self.read_only
+        }
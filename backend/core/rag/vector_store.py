@@ -6,13 +6,21 @@ Vector Store - Wrapper para FAISS/Chroma con funcionalidades avanzadas.
 
 import logging
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
+from collections import OrderedDict
+from collections.abc import Mapping
 import pickle
 import os
 from pathlib import Path
 from datetime import datetime
 import hashlib
 
+from ..deadline import Deadline
+from .lexical_index import LexicalIndex
+from .matrix_index import MatrixIndex
+from .metadata_index import MetadataIndex
+from .segment_store import SegmentStore
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -47,6 +55,8 @@ class Document:
         self.metadata = metadata or {}
         self.doc_id = doc_id or self._generate_id()
         self.created_at = datetime.now()
+        # Fila en el SegmentStore si el documento se leyó de él (no se serializa)
+        self.row: Optional[int] = None
     
     def _generate_id(self) -> str:
         """Genera ID único basado en contenido."""
@@ -75,14 +85,90 @@ class Document:
         return doc
 
 
+class DocumentTable(Mapping):
+    """
+    Vista dict-like (doc_id -> Document) sobre un SegmentStore.
+    
+    Los documentos se decodifican del log bajo demanda y los más recientes
+    se conservan en una caché LRU por fila.
+    """
+    
+    def __init__(self, segments: SegmentStore, cache_size: int = 4096):
+        self._segments = segments
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+    
+    def by_row(self, row: int) -> Document:
+        """Obtiene el documento de una fila del almacén."""
+        doc = self._cache.get(row)
+        if doc is not None:
+            self._cache.move_to_end(row)
+            return doc
+        
+        doc = Document.from_dict(self._segments.read_document(row))
+        doc.row = row
+        self._cache[row] = doc
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return doc
+    
+    def __getitem__(self, doc_id: str) -> Document:
+        row = self._segments.doc_row(doc_id)
+        if row is None:
+            raise KeyError(doc_id)
+        return self.by_row(row)
+    
+    def __contains__(self, doc_id) -> bool:
+        return self._segments.doc_row(doc_id) is not None
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._segments.doc_ids())
+    
+    def __len__(self) -> int:
+        return self._segments.live_rows
+    
+    def values(self) -> Iterator[Document]:
+        """Recorre los documentos en streaming, sin construir el índice de ids."""
+        for row, _ in self.items_by_row():
+            yield self.by_row(row)
+    
+    def items(self) -> Iterator[Tuple[str, Document]]:
+        for doc in self.values():
+            yield doc.doc_id, doc
+    
+    def items_by_row(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        return self._segments.iter_documents()
+    
+    def invalidate(self):
+        """Vacía la caché (tras compactar o limpiar el almacén)."""
+        self._cache.clear()
+
+
 class VectorStore:
     """
     Wrapper unificado para FAISS y ChromaDB con funcionalidades avanzadas.
+    
+    Documentos y embeddings se persisten en un SegmentStore; los índices
+    FAISS/básico en memoria se reconstruyen desde sus segmentos mapeados.
     """
     
+    # Fracción de vectores eliminados que dispara la compactación en FAISS
+    FAISS_COMPACT_RATIO = 0.2
+    
+    # Factor de sobre-búsqueda cuando hay filtros de metadata
+    FILTER_OVERFETCH = 4
+    
+    # Si los candidatos del filtro son menos que esta fracción del índice
+    # FAISS, se puntúan directamente en lugar de sobre-buscar
+    CANDIDATE_SCAN_RATIO = 0.25
+    
+    # Filas nuevas que disparan un nuevo volcado del índice BM25 a disco
+    LEXICAL_SNAPSHOT_ROWS = 10000
+    
     def __init__(self, store_type: str = "faiss", 
                  index_path: str = "backend/data/vector_store",
-                 embedding_dim: int = 384):
+                 embedding_dim: int = 384,
+                 read_only: bool = False):
         """
         Inicializa el VectorStore.
         
@@ -90,21 +176,32 @@ class VectorStore:
             store_type: Tipo de store ("faiss" o "chromadb")
             index_path: Ruta para almacenar índices
             embedding_dim: Dimensión de los embeddings
+            read_only: Abrir el almacén en solo lectura (workers que comparten
+                       el mismo directorio con un único proceso escritor)
         """
         self.store_type = store_type.lower()
         self.index_path = Path(index_path)
-        self.index_path.mkdir(parents=True, exist_ok=True)
+        if not read_only:
+            self.index_path.mkdir(parents=True, exist_ok=True)
         self.embedding_dim = embedding_dim
+        self.read_only = read_only
+        
+        # Almacén persistente
+        self._segments = SegmentStore(self.index_path, embedding_dim, read_only=read_only)
+        if not self._segments.exists() and not read_only:
+            self._migrate_legacy_store()
         
         # Inicializar store
         self.index = None
-        self.documents = {}
-        self.metadata_index = {}
+        self.documents = DocumentTable(self._segments)
+        self._metadata_index = None
+        self._lexical_index = None
+        self._lexical_snapshot_rows = 0
         
         self._initialize_store()
         
         logger.info(f"VectorStore inicializado: {self.store_type}, "
-                   f"dimensión: {embedding_dim}")
+                   f"dimensión: {embedding_dim}, documentos: {len(self.documents)}")
     
     def _initialize_store(self):
         """Inicializa el store según el tipo."""
@@ -124,17 +221,25 @@ class VectorStore:
     def _initialize_faiss(self):
         """Inicializa FAISS."""
         try:
-            # Crear índice FAISS
-            self.index = faiss.IndexFlatIP(self.embedding_dim)  # Inner Product (cosine similarity)
-            
-            # Cargar índice existente si existe
-            faiss_file = self.index_path / "faiss_index.bin"
-            if faiss_file.exists():
-                self.index = faiss.read_index(str(faiss_file))
-                logger.info(f"Índice FAISS cargado: {self.index.ntotal} vectores")
+            # Índice FAISS con ids propios: id FAISS = fila del almacén
+            self.index = faiss.IndexIDMap2(
+                faiss.IndexFlatIP(self.embedding_dim)  # Inner Product (cosine similarity)
+            )
+            self._faiss_tombstones = set()
+            
+            # Reconstruir desde los segmentos (solo filas vivas)
+            live = self._segments.live_mask()
+            offset = 0
+            for block in self._segments.blocks():
+                rows = np.arange(offset, offset + len(block), dtype=np.int64)
+                block_live = live[offset:offset + len(block)]
+                if block_live.any():
+                    self.index.add_with_ids(
+                        np.ascontiguousarray(block[block_live]), rows[block_live]
+                    )
+                offset += len(block)
             
-            # Cargar documentos y metadata
-            self._load_documents()
+            logger.info(f"Índice FAISS construido: {self.index.ntotal} vectores")
             
         except Exception as e:
             logger.error(f"Error inicializando FAISS: {e}")
@@ -164,12 +269,14 @@ class VectorStore:
     def _initialize_basic(self):
         """Inicializa implementación básica (sin FAISS/ChromaDB)."""
         try:
-            self.index = None
-            self.embeddings = []
-            self.document_ids = []
+            self.store_type = "basic"
             
-            # Cargar datos básicos
-            self._load_documents()
+            # Los segmentos mapeados son la base del índice (sin copiarlos)
+            self.index = MatrixIndex(
+                self.embedding_dim,
+                base_blocks=self._segments.blocks(),
+                base_live=self._segments.live_mask()
+            )
             
             logger.info("Implementación básica inicializada")
             
@@ -177,40 +284,156 @@ class VectorStore:
             logger.error(f"Error inicializando implementación básica: {e}")
             raise
     
-    def _load_documents(self):
-        """Carga documentos desde disco."""
+    def _migrate_legacy_store(self):
+        """Convierte un documents.pkl (+ faiss_index.bin) antiguo al formato por segmentos."""
+        docs_file = self.index_path / "documents.pkl"
+        if not docs_file.exists():
+            return
+        
         try:
-            docs_file = self.index_path / "documents.pkl"
-            if docs_file.exists():
-                with open(docs_file, 'rb') as f:
-                    data = pickle.load(f)
-                    self.documents = data.get('documents', {})
-                    self.metadata_index = data.get('metadata_index', {})
-                
-                logger.info(f"Documentos cargados: {len(self.documents)}")
+            with open(docs_file, 'rb') as f:
+                data = pickle.load(f)
+            documents = data.get('documents', {})
+            
+            # Solo el índice FAISS antiguo guardaba los vectores
+            faiss_file = self.index_path / "faiss_index.bin"
+            if not (FAISS_AVAILABLE and faiss_file.exists()):
+                logger.warning(f"{docs_file} no contiene embeddings: "
+                               f"{len(documents)} documentos deben re-ingestarse")
+                return
+            
+            legacy = faiss.read_index(str(faiss_file))
+            row_doc_ids = data.get('faiss_row_doc_ids') or list(documents.keys())[:legacy.ntotal]
+            
+            migrated_docs = []
+            vectors = []
+            for row, doc_id in enumerate(row_doc_ids):
+                if doc_id is None or doc_id not in documents:
+                    continue
+                try:
+                    vectors.append(legacy.reconstruct(row))
+                except RuntimeError:
+                    continue
+                migrated_docs.append(documents[doc_id].to_dict())
+            
+            if migrated_docs:
+                self._segments.append(migrated_docs, MatrixIndex.normalize(np.array(vectors)))
+            
+            docs_file.rename(docs_file.with_suffix('.pkl.migrated'))
+            faiss_file.rename(faiss_file.with_suffix('.bin.migrated'))
+            logger.info(f"Almacén antiguo migrado: {len(migrated_docs)} documentos")
             
         except Exception as e:
-            logger.error(f"Error cargando documentos: {e}")
-            self.documents = {}
-            self.metadata_index = {}
-    
-    def _save_documents(self):
-        """Guarda documentos en disco."""
+            logger.error(f"Error migrando almacén antiguo: {e}")
+    
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        """Índice invertido de metadata, construido en el primer uso desde el log."""
+        if self._metadata_index is None:
+            metadata_index = MetadataIndex()
+            for row, data in self.documents.items_by_row():
+                metadata_index.add(row, data.get('metadata', {}))
+            self._metadata_index = metadata_index
+        return self._metadata_index
+    
+    @property
+    def lexical_index(self) -> LexicalIndex:
+        """
+        Índice BM25 del contenido.
+        
+        Se carga del último volcado de la generación actual y se pone al día
+        con las filas agregadas o eliminadas desde entonces (o se construye
+        desde el log si no hay volcado).
+        """
+        if self._lexical_index is None:
+            self._lexical_index = self._load_lexical_index()
+        return self._lexical_index
+    
+    def _lexical_snapshot_path(self) -> Path:
+        return self.index_path / f"lexical-{self._segments.manifest['generation']:06d}.npz"
+    
+    def _load_lexical_index(self) -> LexicalIndex:
+        lexical_index, start = LexicalIndex(), 0
+        snapshot = self._lexical_snapshot_path()
+        if snapshot.exists():
+            try:
+                lexical_index, start = LexicalIndex.load(snapshot)
+            except Exception as e:
+                logger.warning(f"Índice BM25 en disco ilegible, se reconstruye: {e}")
+                lexical_index, start = LexicalIndex(), 0
+        
+        live = self._segments.live_mask()
+        indexed = lexical_index.indexed_rows()
+        indexed = indexed[indexed < len(live)]
+        for row in indexed[~live[indexed]]:
+            lexical_index.remove(int(row), self._segments.read_document(int(row)).get('content', ''))
+        for row in range(start, self._segments.rows):
+            if live[row]:
+                lexical_index.add(row, self._segments.read_document(row).get('content', ''))
+        
+        self._lexical_index = lexical_index
+        self._lexical_snapshot_rows = start
+        self._save_lexical_index()
+        return lexical_index
+    
+    def _save_lexical_index(self, force: bool = False):
+        """Vuelca el índice BM25 junto a los segmentos si creció lo suficiente."""
+        if self.read_only or self._lexical_index is None:
+            return
+        rows = self._segments.rows
+        if not force and rows - self._lexical_snapshot_rows < self.LEXICAL_SNAPSHOT_ROWS:
+            return
+        
+        snapshot = self._lexical_snapshot_path()
         try:
-            docs_file = self.index_path / "documents.pkl"
-            data = {
-                'documents': self.documents,
-                'metadata_index': self.metadata_index,
-                'saved_at': datetime.now().isoformat()
-            }
-            
-            with open(docs_file, 'wb') as f:
-                pickle.dump(data, f)
-            
-            logger.debug("Documentos guardados")
-            
+            self._lexical_index.save(snapshot, rows)
+            self._lexical_snapshot_rows = rows
+            self._remove_lexical_snapshots(keep=snapshot)
         except Exception as e:
-            logger.error(f"Error guardando documentos: {e}")
+            logger.warning(f"No se pudo guardar el índice BM25: {e}")
+    
+    def _remove_lexical_snapshots(self, keep: Optional[Path] = None):
+        """Elimina volcados BM25 de otras generaciones."""
+        for snapshot in self.index_path.glob("lexical-*.npz"):
+            if snapshot != keep:
+                try:
+                    snapshot.unlink()
+                except OSError as e:
+                    logger.debug(f"No se pudo eliminar {snapshot}: {e}")
+    
+    def lexical_scores(self, query: str, documents: List[Document]) -> np.ndarray:
+        """
+        Puntuación BM25 de la query para documentos ya recuperados.
+        
+        Args:
+            query: Texto de la query
+            documents: Documentos candidatos
+            
+        Returns:
+            Array alineado con `documents` (NaN para los que no están en el almacén)
+        """
+        rows = []
+        for doc in documents:
+            # Los resultados de búsqueda ya traen su fila: validarla por hash
+            # evita decodificar el documento entero para encontrarla
+            row = getattr(doc, 'row', None)
+            if row is None or not self._segments.is_doc_row(row, doc.doc_id):
+                row = self._segments.doc_row(doc.doc_id)
+            rows.append(row)
+        known = np.array([row is not None for row in rows], dtype=bool)
+        scores = np.full(len(documents), np.nan, dtype=np.float32)
+        if known.any():
+            scores[known] = self.lexical_index.score(
+                query, np.array([row for row in rows if row is not None], dtype=np.int64))
+        return scores
+    
+    def _candidate_rows(self, filter_metadata: Dict[str, Any] = None) -> Optional[np.ndarray]:
+        """Filas vivas que cumplen el filtro (None si no hay filtro)."""
+        if not filter_metadata:
+            return None
+        
+        rows = self.metadata_index.select(filter_metadata, self._segments.rows)
+        return rows[self._segments.live_mask()[rows]]
     
     def add_documents(self, documents: List[Document], embeddings: np.ndarray):
         """
@@ -224,20 +447,33 @@ class VectorStore:
             if len(documents) != len(embeddings):
                 raise ValueError("Número de documentos y embeddings no coincide")
             
+            # El índice BM25 se mantiene en la ingesta (se carga antes del append)
+            lexical_index = self.lexical_index
+            
+            # Un documento re-agregado reemplaza su versión anterior
+            replaced = [self._segments.doc_row(doc.doc_id) for doc in documents]
+            replaced = [row for row in replaced if row is not None]
+            if replaced:
+                self._remove_rows(replaced)
+            
+            # Persistir (append incremental) y obtener filas
+            normalized = MatrixIndex.normalize(embeddings)
+            rows = self._segments.append([doc.to_dict() for doc in documents], normalized)
+            
             if self.store_type == "faiss" and FAISS_AVAILABLE:
-                self._add_to_faiss(documents, embeddings)
+                self._add_to_faiss(rows, normalized)
             elif self.store_type == "chromadb" and CHROMADB_AVAILABLE:
                 self._add_to_chromadb(documents, embeddings)
             else:
-                self._add_to_basic(documents, embeddings)
-            
-            # Actualizar documentos y metadata
-            for doc in documents:
-                self.documents[doc.doc_id] = doc
-                self._update_metadata_index(doc)
+                self._add_to_basic(rows, normalized)
             
-            # Guardar
-            self._save_documents()
+            # Actualizar índices de metadata (si ya se construyó) y léxico
+            if self._metadata_index is not None:
+                for doc, row in zip(documents, rows):
+                    self._metadata_index.add(int(row), doc.metadata)
+            for doc, row in zip(documents, rows):
+                lexical_index.add(int(row), doc.content)
+            self._save_lexical_index()
             
             logger.info(f"Agregados {len(documents)} documentos al vector store")
             
@@ -245,23 +481,37 @@ class VectorStore:
             logger.error(f"Error agregando documentos: {e}")
             raise
     
-    def _add_to_faiss(self, documents: List[Document], embeddings: np.ndarray):
-        """Agrega documentos a FAISS."""
+    def _add_to_faiss(self, rows: np.ndarray, embeddings: np.ndarray):
+        """Agrega embeddings normalizados a FAISS con sus filas como ids."""
         try:
-            # Normalizar embeddings para cosine similarity
-            faiss.normalize_L2(embeddings)
-            
-            # Agregar al índice
-            self.index.add(embeddings.astype('float32'))
-            
-            # Guardar índice
-            faiss_file = self.index_path / "faiss_index.bin"
-            faiss.write_index(self.index, str(faiss_file))
+            self.index.add_with_ids(np.ascontiguousarray(embeddings, dtype='float32'), rows)
             
         except Exception as e:
             logger.error(f"Error agregando a FAISS: {e}")
             raise
     
+    def _maybe_compact_faiss(self) -> bool:
+        """
+        Elimina del índice FAISS las filas marcadas si superan FAISS_COMPACT_RATIO.
+        
+        Returns:
+            True si se compactó el índice
+        """
+        if not self._faiss_tombstones or self.index.ntotal == 0:
+            return False
+        
+        if len(self._faiss_tombstones) < self.FAISS_COMPACT_RATIO * self.index.ntotal:
+            return False
+        
+        removed = self.index.remove_ids(
+            np.fromiter(self._faiss_tombstones, dtype=np.int64,
+                        count=len(self._faiss_tombstones))
+        )
+        self._faiss_tombstones.clear()
+        
+        logger.info(f"Índice FAISS compactado: {removed} vectores eliminados")
+        return True
+    
     def _add_to_chromadb(self, documents: List[Document], embeddings: np.ndarray):
         """Agrega documentos a ChromaDB."""
         try:
@@ -274,7 +524,7 @@ class VectorStore:
             self.collection.add(
                 ids=ids,
                 documents=contents,
-                embeddings=embeddings.tolist(),
+                embeddings=np.asarray(embeddings).tolist(),
                 metadatas=metadatas
             )
             
@@ -282,34 +532,36 @@ class VectorStore:
             logger.error(f"Error agregando a ChromaDB: {e}")
             raise
     
-    def _add_to_basic(self, documents: List[Document], embeddings: np.ndarray):
-        """Agrega documentos a implementación básica."""
+    def _add_to_basic(self, rows: np.ndarray, embeddings: np.ndarray):
+        """Agrega embeddings normalizados a implementación básica."""
         try:
-            for doc, embedding in zip(documents, embeddings):
-                self.document_ids.append(doc.doc_id)
-                self.embeddings.append(embedding)
+            index_rows = self.index.add(embeddings)
+            if not np.array_equal(index_rows, rows):
+                raise RuntimeError("Filas del índice básico desalineadas con el almacén")
             
         except Exception as e:
             logger.error(f"Error agregando a implementación básica: {e}")
             raise
     
-    def _update_metadata_index(self, document: Document):
-        """Actualiza índice de metadata."""
-        try:
-            for key, value in document.metadata.items():
-                if key not in self.metadata_index:
-                    self.metadata_index[key] = {}
-                
-                if value not in self.metadata_index[key]:
-                    self.metadata_index[key][value] = []
-                
-                self.metadata_index[key][value].append(document.doc_id)
-                
-        except Exception as e:
-            logger.error(f"Error actualizando índice de metadata: {e}")
+    def _remove_rows(self, rows: List[int]):
+        """Elimina filas del almacén y de los índices en memoria."""
+        if self._lexical_index is not None:
+            for row in rows:
+                if self._segments.is_live(row):
+                    self._lexical_index.remove(
+                        int(row), self._segments.read_document(row).get('content', ''))
+        
+        self._segments.delete(rows)
+        
+        if self.store_type == "basic":
+            self.index.remove(rows)
+        elif self.store_type == "faiss" and FAISS_AVAILABLE:
+            self._faiss_tombstones.update(int(row) for row in rows)
+            self._maybe_compact_faiss()
     
     def similarity_search(self, query_embedding: np.ndarray, k: int = 5, 
-                         filter_metadata: Dict[str, Any] = None) -> List[Document]:
+                         filter_metadata: Dict[str, Any] = None,
+                         deadline: Optional[Deadline] = None) -> List[Document]:
         """
         Busca documentos similares.
         
@@ -317,50 +569,167 @@ class VectorStore:
             query_embedding: Embedding de la query
             k: Número de resultados
             filter_metadata: Filtros de metadata
+            deadline: Presupuesto de tiempo; si se agota durante la
+                      sobre-búsqueda con filtros se devuelven los resultados
+                      parciales (menos de k)
             
         Returns:
             Lista de documentos similares
+            
+        Raises:
+            DeadlineExceeded: Si el presupuesto ya estaba agotado al empezar
         """
+        if deadline is not None:
+            deadline.check("vector_search")
+        
         try:
             if self.store_type == "faiss" and FAISS_AVAILABLE:
-                return self._search_faiss(query_embedding, k, filter_metadata)
+                results = self._search_faiss(query_embedding, k, filter_metadata, deadline)
             elif self.store_type == "chromadb" and CHROMADB_AVAILABLE:
-                return self._search_chromadb(query_embedding, k, filter_metadata)
+                results = self._search_chromadb(query_embedding, k, filter_metadata)
             else:
-                return self._search_basic(query_embedding, k, filter_metadata)
+                results = self._search_basic(query_embedding, k, filter_metadata)
+            
+            if deadline is not None:
+                deadline.mark("vector_search")
+            return results
                 
         except Exception as e:
             logger.error(f"Error en búsqueda de similitud: {e}")
             return []
     
-    def _search_faiss(self, query_embedding: np.ndarray, k: int, 
-                     filter_metadata: Dict[str, Any] = None) -> List[Document]:
-        """Búsqueda en FAISS."""
-        try:
-            # Normalizar query embedding
-            query_embedding = query_embedding.reshape(1, -1).astype('float32')
-            faiss.normalize_L2(query_embedding)
+    def similarity_search_batch(self, query_embeddings: np.ndarray, k: int = 5,
+                                filter_metadata: Dict[str, Any] = None,
+                                deadline: Optional[Deadline] = None) -> List[List[Document]]:
+        """
+        Busca documentos similares para varias queries a la vez.
+        
+        Args:
+            query_embeddings: Embeddings de las queries (n_queries, dim)
+            k: Número de resultados por query
+            filter_metadata: Filtros de metadata (comunes a todas las queries)
+            deadline: Presupuesto de tiempo (ver similarity_search)
             
-            # Buscar
-            scores, indices = self.index.search(query_embedding, k)
-            
-            # Obtener documentos
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx < len(self.documents):
-                    doc_id = list(self.documents.keys())[idx]
-                    doc = self.documents[doc_id]
-                    
-                    # Aplicar filtros de metadata
-                    if self._matches_filter(doc, filter_metadata):
-                        results.append(doc)
+        Returns:
+            Lista con los documentos similares de cada query
+        """
+        if deadline is not None:
+            deadline.check("vector_search")
+        
+        try:
+            query_embeddings = np.atleast_2d(query_embeddings)
             
+            if self.store_type == "basic":
+                results = self._search_basic_batch(query_embeddings, k, filter_metadata)
+            elif self.store_type == "faiss" and FAISS_AVAILABLE:
+                results = self._search_faiss_batch(query_embeddings, k, filter_metadata, deadline)
+            else:
+                results = []
+                for query_embedding in query_embeddings:
+                    # Sin más presupuesto, las queries restantes quedan vacías
+                    if deadline is not None and deadline.expired():
+                        deadline.truncate("vector_search")
+                        results.append([])
+                        continue
+                    results.append(self.similarity_search(query_embedding, k, filter_metadata))
+            
+            if deadline is not None:
+                deadline.mark("vector_search")
             return results
+                
+        except Exception as e:
+            logger.error(f"Error en búsqueda de similitud por lotes: {e}")
+            return [[] for _ in range(len(query_embeddings))]
+    
+    def _search_faiss(self, query_embedding: np.ndarray, k: int, 
+                     filter_metadata: Dict[str, Any] = None,
+                     deadline: Optional[Deadline] = None) -> List[Document]:
+        """Búsqueda en FAISS."""
+        try:
+            return self._search_faiss_batch(query_embedding, k, filter_metadata, deadline)[0]
             
         except Exception as e:
             logger.error(f"Error en búsqueda FAISS: {e}")
             return []
     
+    def _search_faiss_batch(self, query_embeddings: np.ndarray, k: int,
+                            filter_metadata: Dict[str, Any] = None,
+                            deadline: Optional[Deadline] = None) -> List[List[Document]]:
+        """
+        Búsqueda por lotes en FAISS.
+        
+        Con filtros, el índice de metadata da las filas candidatas: si son
+        pocas se puntúan directamente. Si no, las filas eliminadas y las que
+        no son candidatas se descartan después de la búsqueda, así que se
+        sobre-busca y, si no alcanza, se repite con el doble de candidatos
+        solo para las queries incompletas (mientras quede presupuesto).
+        """
+        # Normalizar query embeddings
+        queries = np.ascontiguousarray(np.atleast_2d(query_embeddings), dtype='float32')
+        faiss.normalize_L2(queries)
+        
+        results = [[] for _ in range(len(queries))]
+        ntotal = self.index.ntotal
+        if ntotal == 0:
+            return results
+        
+        fetch = k + len(self._faiss_tombstones)
+        allowed = self._segments.live_mask()
+        
+        candidates = self._candidate_rows(filter_metadata)
+        if candidates is not None:
+            if candidates.size == 0:
+                return results
+            if candidates.size <= self.CANDIDATE_SCAN_RATIO * ntotal:
+                return self._search_candidates(queries, k, candidates)
+            
+            allowed = np.zeros_like(allowed)
+            allowed[candidates] = True
+            fetch = max(fetch, k * self.FILTER_OVERFETCH,
+                        -(-k * ntotal // candidates.size))
+        
+        pending = np.arange(len(queries))
+        while len(pending):
+            fetch = min(fetch, ntotal)
+            _, ids = self.index.search(queries[pending], fetch)
+            
+            incomplete = []
+            for query_idx, row_ids in zip(pending, ids):
+                hits = []
+                for row in row_ids:
+                    if row < 0:
+                        break
+                    if row < len(allowed) and allowed[row]:
+                        hits.append(self.documents.by_row(int(row)))
+                        if len(hits) == k:
+                            break
+                
+                results[query_idx] = hits
+                if len(hits) < k and fetch < ntotal:
+                    incomplete.append(query_idx)
+            
+            pending = np.array(incomplete, dtype=np.int64)
+            fetch *= 2
+            
+            if len(pending) and deadline is not None and deadline.expired():
+                deadline.truncate("vector_search")
+                logger.debug(f"Deadline agotado: {len(pending)} queries con resultados parciales")
+                break
+        
+        return results
+    
+    def _search_candidates(self, queries: np.ndarray, k: int,
+                           candidates: np.ndarray) -> List[List[Document]]:
+        """Puntuación exacta sobre un subconjunto de filas leídas de los segmentos."""
+        subset = MatrixIndex(self.embedding_dim, initial_capacity=1,
+                             base_blocks=[self._segments.vectors(candidates)])
+        _, positions = subset.search(queries, k)
+        
+        return [
+            [self.documents.by_row(int(row)) for row in candidates[query_positions]]
+            for query_positions in positions
+        ]
+    
     def _search_chromadb(self, query_embedding: np.ndarray, k: int,
                         filter_metadata: Dict[str, Any] = None) -> List[Document]:
         """Búsqueda en ChromaDB."""
@@ -401,51 +770,35 @@ class VectorStore:
                      filter_metadata: Dict[str, Any] = None) -> List[Document]:
         """Búsqueda en implementación básica."""
         try:
-            if not self.embeddings:
-                return []
-            
-            # Calcular similitudes
-            similarities = []
-            for i, embedding in enumerate(self.embeddings):
-                similarity = np.dot(query_embedding, embedding) / (
-                    np.linalg.norm(query_embedding) * np.linalg.norm(embedding)
-                )
-                similarities.append((similarity, i))
-            
-            # Ordenar por similitud
-            similarities.sort(reverse=True)
-            
-            # Obtener top k
-            results = []
-            for similarity, idx in similarities[:k]:
-                if idx < len(self.document_ids):
-                    doc_id = self.document_ids[idx]
-                    doc = self.documents[doc_id]
-                    
-                    # Aplicar filtros de metadata
-                    if self._matches_filter(doc, filter_metadata):
-                        results.append(doc)
-            
-            return results
+            return self._search_basic_batch(query_embedding, k, filter_metadata)[0]
             
         except Exception as e:
             logger.error(f"Error en búsqueda básica: {e}")
             return []
     
+    def _search_basic_batch(self, query_embeddings: np.ndarray, k: int,
+                            filter_metadata: Dict[str, Any] = None) -> List[List[Document]]:
+        """Búsqueda por lotes en la matriz de embeddings."""
+        n_queries = np.atleast_2d(query_embeddings).shape[0]
+        if len(self.index) == 0:
+            return [[] for _ in range(n_queries)]
+        
+        # Los filtros restringen las filas candidatas antes del top-k
+        candidates = self._candidate_rows(filter_metadata)
+        _, rows = self.index.search(query_embeddings, k, candidates=candidates)
+        
+        return [
+            [self.documents.by_row(int(row)) for row in query_rows]
+            for query_rows in rows
+        ]
+    
     def _matches_filter(self, document: Document, filter_metadata: Dict[str, Any]) -> bool:
         """Verifica si documento coincide con filtros."""
         if not filter_metadata:
             return True
         
         try:
-            for key, value in filter_metadata.items():
-                if key not in document.metadata:
-                    return False
-                
-                if document.metadata[key] != value:
-                    return False
-            
-            return True
+            return MetadataIndex.matches(document.metadata, filter_metadata)
             
         except Exception as e:
             logger.error(f"Error verificando filtros: {e}")
@@ -458,16 +811,13 @@ class VectorStore:
     def delete_document(self, doc_id: str) -> bool:
         """Elimina documento por ID."""
         try:
-            if doc_id in self.documents:
-                del self.documents[doc_id]
+            row = self._segments.doc_row(doc_id)
+            if row is not None:
+                self._remove_rows([row])
                 
-                # Limpiar metadata index
-                for key in self.metadata_index:
-                    for value in self.metadata_index[key]:
-                        if doc_id in self.metadata_index[key][value]:
-                            self.metadata_index[key][value].remove(doc_id)
+                if self.store_type == "chromadb" and hasattr(self, 'collection'):
+                    self.collection.delete(ids=[doc_id])
                 
-                self._save_documents()
                 logger.info(f"Documento {doc_id} eliminado")
                 return True
             
@@ -480,13 +830,11 @@ class VectorStore:
     def search_by_metadata(self, metadata_filter: Dict[str, Any]) -> List[Document]:
         """Busca documentos por metadata."""
         try:
-            results = []
+            if not metadata_filter:
+                return list(self.documents.values())
             
-            for doc_id, doc in self.documents.items():
-                if self._matches_filter(doc, metadata_filter):
-                    results.append(doc)
-            
-            return results
+            return [self.documents.by_row(int(row))
+                    for row in self._candidate_rows(metadata_filter)]
             
         except Exception as e:
             logger.error(f"Error buscando por metadata: {e}")
@@ -502,18 +850,19 @@ class VectorStore:
                 'index_path': str(self.index_path)
             }
             
-            if self.store_type == "faiss" and self.index:
+            if self.store_type == "faiss" and self.index is not None:
                 stats['faiss_vectors'] = self.index.ntotal
+                stats['faiss_tombstones'] = len(self._faiss_tombstones)
             elif self.store_type == "chromadb" and hasattr(self, 'collection'):
                 stats['chromadb_documents'] = self.collection.count()
             elif self.store_type == "basic":
-                stats['basic_vectors'] = len(self.embeddings)
+                stats['basic_vectors'] = len(self.index)
+            
+            stats['storage'] = self._segments.get_stats()
             
             # Metadata stats
-            stats['metadata_keys'] = list(self.metadata_index.keys())
-            stats['metadata_entries'] = sum(
-                len(values) for values in self.metadata_index.values()
-            )
+            stats['metadata_keys'] = self.metadata_index.keys()
+            stats['metadata_entries'] = self.metadata_index.get_stats()['entries']
             
             return stats
             
@@ -524,33 +873,66 @@ class VectorStore:
     def clear(self):
         """Limpia el vector store."""
         try:
-            self.documents.clear()
-            self.metadata_index.clear()
-            
-            if self.store_type == "faiss" and self.index:
+            self._segments.clear()
+            self.documents.invalidate()
+            self._metadata_index = None
+            self._lexical_index = None
+            self._lexical_snapshot_rows = 0
+            self._remove_lexical_snapshots()
+            
+            if self.store_type == "faiss" and self.index is not None:
                 self.index.reset()
+                self._faiss_tombstones.clear()
             elif self.store_type == "chromadb" and hasattr(self, 'collection'):
                 # ChromaDB no tiene método clear directo
                 pass
             elif self.store_type == "basic":
-                self.embeddings.clear()
-                self.document_ids.clear()
+                self.index.clear()
             
-            self._save_documents()
             logger.info("Vector store limpiado")
             
         except Exception as e:
             logger.error(f"Error limpiando vector store: {e}")
+    
+    def compact(self) -> int:
+        """
+        Reescribe el almacén en disco sin los documentos eliminados.
+        
+        Las filas se renumeran, así que los índices en memoria se reconstruyen.
+        Los workers en solo lectura deben recrear su VectorStore para verlo.
+        
+        Returns:
+            Número de filas descartadas
+        """
+        try:
+            dropped = self._segments.compact()
+            if dropped:
+                self.documents.invalidate()
+                self._metadata_index = None
+                # Las filas se renumeran: el volcado BM25 anterior no sirve
+                self._lexical_index = None
+                self._lexical_snapshot_rows = 0
+                self._remove_lexical_snapshots()
+                self._load_lexical_index()
+                self._save_lexical_index(force=True)
+                if self.store_type in ("faiss", "basic"):
+                    self._initialize_store()
+            return dropped
+            
+        except Exception as e:
+            logger.error(f"Error compactando vector store: {e}")
+            return 0
 
 
 # Funciones de conveniencia
 def create_vector_store(store_type: str = "faiss", 
                        index_path: str = None,
-                       embedding_dim: int = 384) -> VectorStore:
+                       embedding_dim: int = 384,
+                       read_only: bool = False) -> VectorStore:
     """Crea una instancia de VectorStore."""
     if index_path is None:
         index_path = "backend/data/vector_store"
-    return VectorStore(store_type, index_path, embedding_dim)
+    return VectorStore(store_type, index_path, embedding_dim, read_only)
 
 
 if __name__ == "__main__":
@@ -582,6 +964,18 @@ if __name__ == "__main__":
     for doc in results:
         print(f"- {doc.content[:50]}...")
     
+    # Test búsqueda por lotes con filtro
+    batch_results = store.similarity_search_batch(
+        np.random.rand(3, 384), k=2, filter_metadata={"category": "programming"}
+    )
+    print(f"Resultados por lote: {[len(r) for r in batch_results]}")
+    
+    # Test filtros combinados
+    or_results = store.search_by_metadata(
+        {"$or": [{"category": "database"}, {"category": {"$in": ["programming"]}}]}
+    )
+    print(f"Documentos con filtro $or: {len(or_results)}")
+    
     # Test estadísticas
     stats = store.get_stats()
     print(f"\nEstadísticas: {stats}")
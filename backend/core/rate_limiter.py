@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RateLimiter - Limitador GCRA (token bucket sin temporizadores) con backend
+intercambiable.
+
+Cada clave guarda un único float, el TAT (theoretical arrival time): el coste
+por request es O(1) y no depende del número de clientes. Una clave cuyo TAT
+ya pasó equivale a un bucket lleno, así que se puede olvidar sin perder
+información (eviction de claves inactivas).
+
+Backends:
+- memory: diccionario del proceso, con eviction incremental de claves
+  inactivas y tope de claves
+- shm: tabla hash en memoria compartida (multiprocessing.shared_memory) con
+  lock de fichero, para que el límite se mantenga entre workers de uvicorn
+  de la misma máquina
+"""
+
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitResult(NamedTuple):
+    """Resultado de consumir una request."""
+    allowed: bool
+    retry_after: float  # segundos hasta la próxima request permitida
+    remaining: int      # requests que aún caben en la ventana
+
+
+def _gcra(tat: Optional[float], now: float, interval: float,
+          window: float) -> Tuple[bool, float, float]:
+    """
+    Paso GCRA.
+
+    Args:
+        tat: TAT guardado (None si la clave no existe)
+        now: Instante actual
+        interval: Segundos entre requests a ritmo sostenido (window / requests)
+        window: Ventana; admite ráfagas de hasta requests peticiones
+
+    Returns:
+        (permitida, TAT a guardar, segundos de espera si no se permite)
+    """
+    tat = now if tat is None or tat < now else tat
+    new_tat = tat + interval
+    if new_tat - now > window:
+        return False, tat, new_tat - window - now
+    return True, new_tat, 0.0
+
+
+class MemoryBackend:
+    """TATs en un OrderedDict del proceso (orden = última actualización)."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, now: float, interval: float,
+                window: float) -> Tuple[bool, float, float]:
+        """Aplica GCRA a `key` y devuelve (permitida, TAT, espera)."""
+        with self._lock:
+            allowed, tat, wait = _gcra(self._tats.get(key), now, interval, window)
+            if allowed:
+                self._tats[key] = tat
+                self._tats.move_to_end(key)
+            self._evict(now)
+            return allowed, tat, wait
+
+    def peek(self, key: str) -> Optional[float]:
+        """TAT guardado de `key`."""
+        return self._tats.get(key)
+
+    def _evict(self, now: float):
+        # Las claves más antiguas suelen ser las inactivas: se sueltan mientras
+        # su TAT ya haya pasado. Coste amortizado O(1).
+        while self._tats:
+            key, tat = next(iter(self._tats.items()))
+            if tat > now and len(self._tats) <= self.max_keys:
+                break
+            del self._tats[key]
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+
+class SharedMemoryBackend:
+    """
+    TATs en una tabla hash de memoria compartida entre procesos.
+
+    Cada slot son 16 bytes (hash de la clave, TAT). Sondeo lineal acotado a
+    PROBES slots: un slot vacío o con TAT pasado se reutiliza y, si todos
+    están ocupados, se sobrescribe el de menor TAT.
+    """
+
+    SLOT = struct.Struct('<Qd')
+    PROBES = 8
+
+    def __init__(self, name: str = 'capibara6_ratelimit', slots: int = 65536):
+        """
+        Args:
+            name: Nombre del segmento (compartido por todos los workers)
+            slots: Número de slots (claves activas simultáneas)
+        """
+        if not FCNTL_AVAILABLE:
+            raise RuntimeError("El backend shm requiere fcntl (POSIX)")
+
+        from multiprocessing import shared_memory, resource_tracker
+
+        size = slots * self.SLOT.size
+        self._lock_file = open(os.path.join('/tmp', f'{name}.lock'), 'a+')
+        self._thread_lock = threading.Lock()
+
+        # Crear o adjuntar bajo el lock de fichero: SharedMemory(create=True)
+        # hace shm_open y después ftruncate, y un worker que adjuntara entre
+        # ambos vería un segmento de tamaño 0
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        # El segmento vive mientras haya workers: que el resource tracker de
+        # este proceso no lo borre al salir
+        try:
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        except Exception:
+            pass
+
+        self.slots = self._shm.size // self.SLOT.size
+        if self.slots == 0:
+            self._shm.close()
+            self._lock_file.close()
+            raise RuntimeError(f"Segmento de memoria compartida '{name}' vacío")
+        self._buf = self._shm.buf
+
+    def _key_hash(self, key: str) -> int:
+        # hash() cambia entre procesos; blake2b es estable
+        value = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        return value or 1  # 0 marca slot vacío
+
+    def _find(self, key_hash: int, now: float) -> Tuple[int, Optional[float]]:
+        """Slot de la clave (o el que debe ocuparla) y su TAT."""
+        start = key_hash % self.slots
+        free_slot = None
+        oldest_slot, oldest_tat = start, math.inf
+        for probe in range(self.PROBES):
+            slot = (start + probe) % self.slots
+            stored_hash, tat = self.SLOT.unpack_from(self._buf, slot * self.SLOT.size)
+            if stored_hash == key_hash:
+                return slot, tat
+            if free_slot is None and (stored_hash == 0 or tat <= now):
+                free_slot = slot
+            if tat < oldest_tat:
+                oldest_slot, oldest_tat = slot, tat
+        return (free_slot if free_slot is not None else oldest_slot), None
+
+    def acquire(self, key: str, now: float, interval: float,
+                window: float) -> Tuple[bool, float, float]:
+        """Aplica GCRA a `key` y devuelve (permitida, TAT, espera)."""
+        key_hash = self._key_hash(key)
+        with self._thread_lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                slot, stored_tat = self._find(key_hash, now)
+                allowed, tat, wait = _gcra(stored_tat, now, interval, window)
+                if allowed:
+                    self.SLOT.pack_into(self._buf, slot * self.SLOT.size, key_hash, tat)
+                return allowed, tat, wait
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def peek(self, key: str) -> Optional[float]:
+        """TAT guardado de `key`."""
+        with self._thread_lock:
+            return self._find(self._key_hash(key), time.time())[1]
+
+    def __len__(self) -> int:
+        now = time.time()
+        return sum(1 for slot in range(self.slots)
+                   if self.SLOT.unpack_from(self._buf, slot * self.SLOT.size)[1] > now)
+
+    def close(self):
+        """Suelta el segmento (no lo borra: otros workers pueden usarlo)."""
+        self._buf = None
+        self._shm.close()
+        self._lock_file.close()
+
+
+def create_backend(kind: Optional[str] = None, name: str = 'capibara6_ratelimit'):
+    """
+    Crea un backend por nombre ("memory" o "shm"; por defecto
+    RATE_LIMIT_BACKEND). Si shm no está disponible, usa memory.
+    """
+    kind = kind or os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    if kind == 'shm':
+        try:
+            return SharedMemoryBackend(name=name)
+        except Exception as e:
+            logger.warning(f"Backend shm no disponible ({e}), usando memoria del proceso")
+    return MemoryBackend()
+
+
+class RateLimiter:
+    """
+    Limitador de `requests` peticiones por `window` segundos y clave, con
+    ráfagas de hasta `requests` peticiones.
+    """
+
+    def __init__(self, requests: int = 10, window: int = 60, backend=None):
+        """
+        Args:
+            requests: Peticiones permitidas por ventana
+            window: Ventana en segundos
+            backend: MemoryBackend, SharedMemoryBackend o compatible
+        """
+        self.requests = requests
+        self.window = float(window)
+        self.interval = self.window / requests
+        self.backend = backend if backend is not None else MemoryBackend()
+
+    def hit(self, client_id: str) -> RateLimitResult:
+        """Consume una request de `client_id`."""
+        now = time.time()
+        allowed, tat, wait = self.backend.acquire(client_id, now, self.interval, self.window)
+        remaining = int((self.window - (tat - now)) / self.interval) if allowed else 0
+        return RateLimitResult(allowed, wait, max(0, remaining))
+
+    def is_allowed(self, client_id: str) -> bool:
+        """Verifica si el cliente puede hacer una request (y la consume)"""
+        return self.hit(client_id).allowed
+
+    def get_retry_after(self, client_id: str) -> int:
+        """Retorna segundos hasta que pueda hacer otra request"""
+        tat = self.backend.peek(client_id)
+        if tat is None:
+            return 0
+        return max(0, math.ceil(tat + self.interval - self.window - time.time()))
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TokenCounter - Conteo de tokens compartido y cacheado por familia de modelo.
+
+Dos modos:
+- approximate: caracteres por token calibrados por familia (sin dependencias)
+- exact: tokenizer real de la familia (transformers), con fallback al
+  aproximado si no se puede cargar
+
+Los conteos se cachean por texto, así que los presupuestos de contexto se
+calculan una vez por fragmento y se pueden arrastrar con CountedText.
+"""
+
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from transformers import AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+# Caracteres por token medidos sobre texto mixto español/inglés
+CHARS_PER_TOKEN = {
+    'default': 4.0,
+    'gpt-oss': 4.0,
+    'llama': 3.8,
+    'mistral': 3.5,
+    'gemma': 3.8,
+    'qwen': 3.7,
+    'aya': 3.6
+}
+
+# Tokenizer de referencia de cada familia (modo exacto)
+FAMILY_TOKENIZERS = {
+    'gpt-oss': 'openai/gpt-oss-20b',
+    'llama': 'meta-llama/Llama-3.1-8B-Instruct',
+    'mistral': 'mistralai/Mistral-7B-Instruct-v0.3',
+    'gemma': 'google/gemma-3-12b-it',
+    'qwen': 'Qwen/Qwen2.5-7B-Instruct',
+    'aya': 'CohereForAI/aya-expanse-8b'
+}
+
+DEFAULT_MODE = os.getenv('CAPIBARA_TOKEN_COUNT_MODE', 'approximate')
+
+
+def model_family_for(model_name: str) -> str:
+    """Familia de tokenizer a partir del nombre de un modelo."""
+    name = (model_name or '').lower()
+    for family in FAMILY_TOKENIZERS:
+        if family in name:
+            return family
+    if 'phi' in name:
+        return 'llama'
+    return 'default'
+
+
+@dataclass
+class CountedText:
+    """Texto con su conteo de tokens ya calculado."""
+    text: str
+    tokens: int
+
+    def __bool__(self) -> bool:
+        return bool(self.text)
+
+
+class TokenCounter:
+    """
+    Contador de tokens de una familia de modelo, con caché LRU.
+
+    Thread-safe: se comparte entre los componentes CAG/RAG del proceso.
+    """
+
+    def __init__(self, model_family: str = 'default', mode: str = None,
+                 tokenizer: Any = None, cache_size: int = 50000):
+        """
+        Args:
+            model_family: Familia de modelo (ver CHARS_PER_TOKEN)
+            mode: "approximate" o "exact" (por defecto CAPIBARA_TOKEN_COUNT_MODE)
+            tokenizer: Tokenizer ya cargado para el modo exacto (opcional)
+            cache_size: Máximo de conteos en caché
+        """
+        self.model_family = model_family
+        self.mode = mode or DEFAULT_MODE
+        self.chars_per_token = CHARS_PER_TOKEN.get(model_family, CHARS_PER_TOKEN['default'])
+        self.cache_size = cache_size
+
+        self._tokenizer = tokenizer
+        self._tokenizer_failed = False
+        self._cache: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'counts': 0,
+            'cache_hits': 0,
+            'exact_counts': 0,
+            'approximate_counts': 0
+        }
+
+    @property
+    def exact(self) -> bool:
+        """Indica si los conteos vienen del tokenizer real."""
+        return self.mode == 'exact' and self._get_tokenizer() is not None
+
+    def _get_tokenizer(self):
+        if self._tokenizer is not None or self._tokenizer_failed:
+            return self._tokenizer
+
+        name = FAMILY_TOKENIZERS.get(self.model_family)
+        if not TRANSFORMERS_AVAILABLE or name is None:
+            self._tokenizer_failed = True
+            logger.warning(f"Tokenizer exacto no disponible para '{self.model_family}', "
+                           f"usando conteo aproximado")
+            return None
+
+        try:
+            self._tokenizer = AutoTokenizer.from_pretrained(name)
+            logger.info(f"Tokenizer cargado para '{self.model_family}': {name}")
+        except Exception as e:
+            self._tokenizer_failed = True
+            logger.warning(f"No se pudo cargar el tokenizer {name}: {e}; usando conteo aproximado")
+        return self._tokenizer
+
+    def _approximate(self, text: str) -> int:
+        # Cada palabra es al menos un token; el resto lo da la densidad de la familia
+        return max(len(text.split()), math.ceil(len(text) / self.chars_per_token))
+
+    def _count_uncached(self, text: str) -> int:
+        if self.mode == 'exact':
+            tokenizer = self._get_tokenizer()
+            if tokenizer is not None:
+                self.stats['exact_counts'] += 1
+                return len(tokenizer.encode(text, add_special_tokens=False))
+        self.stats['approximate_counts'] += 1
+        return self._approximate(text)
+
+    def count(self, text: str) -> int:
+        """Número de tokens de `text` (cacheado)."""
+        if not text:
+            return 0
+
+        # hash() de un str se calcula una vez y queda guardado en el objeto
+        key = (len(text), hash(text))
+        with self._lock:
+            self.stats['counts'] += 1
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                self.stats['cache_hits'] += 1
+                return tokens
+
+        tokens = self._count_uncached(text)
+
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        """Conteos de varios textos."""
+        return [self.count(text) for text in texts]
+
+    def counted(self, text: str) -> CountedText:
+        """Envuelve `text` con su conteo."""
+        return CountedText(text, self.count(text))
+
+    def join(self, parts: List[CountedText], separator: str = "\n\n") -> CountedText:
+        """Une fragmentos ya contados sin volver a tokenizar el resultado."""
+        parts = [part for part in parts if part]
+        if not parts:
+            return CountedText("", 0)
+        tokens = sum(part.tokens for part in parts) + self.count(separator) * (len(parts) - 1)
+        return CountedText(separator.join(part.text for part in parts), tokens)
+
+    def truncate(self, text: str, max_tokens: int) -> CountedText:
+        """
+        Recorta `text` para que quepa en `max_tokens`.
+
+        Returns:
+            CountedText con el prefijo que cabe y su conteo
+        """
+        tokens = self.count(text)
+        if tokens <= max_tokens:
+            return CountedText(text, tokens)
+        if max_tokens <= 0:
+            return CountedText("", 0)
+
+        if self.exact:
+            ids = self._tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+            truncated = self._tokenizer.decode(ids)
+            return CountedText(truncated, len(ids))
+
+        # Aproximado: cortar por caracteres en un límite de palabra y ajustar
+        limit = int(max_tokens * self.chars_per_token)
+        truncated = text[:limit]
+        while truncated:
+            cut = truncated.rfind(' ')
+            truncated = truncated[:cut] if cut > 0 else truncated
+            tokens = self._approximate(truncated)
+            if tokens <= max_tokens:
+                return CountedText(truncated, tokens)
+            truncated = truncated[:int(len(truncated) * 0.9)]
+        return CountedText("", 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estadísticas del contador."""
+        with self._lock:
+            return {
+                'model_family': self.model_family,
+                'mode': self.mode,
+                'exact': self.mode == 'exact' and self._tokenizer is not None,
+                'cached_entries': len(self._cache),
+                **self.stats
+            }
+
+
+_counters: Dict[Tuple[str, str], TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model_family: str = 'default', mode: str = None) -> TokenCounter:
+    """Contador compartido para una familia de modelo y modo."""
+    key = (model_family, mode or DEFAULT_MODE)
+    counter = _counters.get(key)
+    if counter is None:
+        with _counters_lock:
+            counter = _counters.get(key)
+            if counter is None:
+                counter = _counters[key] = TokenCounter(model_family, key[1])
+    return counter
+
+
+def register_tokenizer(model_family: str, tokenizer: Any) -> TokenCounter:
+    """
+    Registra un tokenizer ya cargado (p. ej. el del motor vLLM) como
+    contador exacto de su familia.
+    """
+    counter = TokenCounter(model_family, 'exact', tokenizer=tokenizer)
+    with _counters_lock:
+        _counters[(model_family, 'exact')] = counter
+    return counter
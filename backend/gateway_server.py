@@ -5,22 +5,25 @@ Gateway inteligente con routing semántico, circuit breakers y rate limiting
 """
 
 import os
+import math
 import time
 import logging
 import asyncio
 import secrets
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
-from collections import defaultdict
+from typing import Dict, Any, Optional, List, Set
+from collections import defaultdict, deque
 from functools import wraps
 
 from fastapi import FastAPI, HTTPException, Request, Depends, Header, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
 import httpx
 from dotenv import load_dotenv
 import acontext_integration
+from core.rate_limiter import RateLimiter, create_backend
 
 # Cargar variables de entorno
 load_dotenv("/home/elect/capibara6/backend/.env.production")
@@ -50,6 +53,13 @@ ACONTEXT_ENABLED = os.getenv("ACONTEXT_ENABLED", "true").lower() == "true"
 ACONTEXT_PROJECT_ID = os.getenv("ACONTEXT_PROJECT_ID", "capibara6-project")
 ACONTEXT_SPACE_ID = os.getenv("ACONTEXT_SPACE_ID", None)  # Optional space for learning
 
+# Tope de latencia de la búsqueda de experiencias antes de generar
+ACONTEXT_SEARCH_TIMEOUT_MS = float(os.getenv("ACONTEXT_SEARCH_TIMEOUT_MS", "300"))
+# Cola write-behind de mensajes Acontext
+ACONTEXT_QUEUE_SIZE = int(os.getenv("ACONTEXT_QUEUE_SIZE", "1000"))
+ACONTEXT_SESSION_CONCURRENCY = int(os.getenv("ACONTEXT_SESSION_CONCURRENCY", "16"))
+ACONTEXT_WRITE_RETRIES = int(os.getenv("ACONTEXT_WRITE_RETRIES", "3"))
+
 logger.info(f"📊 Acontext integration: {'enabled' if ACONTEXT_ENABLED else 'disabled'}")
 if ACONTEXT_ENABLED:
     logger.info(f"📚 Acontext project: {ACONTEXT_PROJECT_ID}")
@@ -64,6 +74,19 @@ RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # segundos
 CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5"))
 CIRCUIT_BREAKER_TIMEOUT = int(os.getenv("CIRCUIT_BREAKER_TIMEOUT", "60"))
 
+# Pools HTTP hacia los upstreams
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "200"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "50"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))  # segundos
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))  # segundos
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+
+try:
+    import h2  # noqa: F401  (necesario para http2=True en httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 # ============================================
 # MODELOS PYDANTIC
 # ============================================
@@ -214,43 +237,231 @@ class CircuitBreaker:
             self.failures[service_name] = 0
 
 # ============================================
-# RATE LIMITER
+# UPSTREAM CLIENTS
 # ============================================
 
-class RateLimiter:
-    """Rate limiter simple basado en IP"""
+# Cabeceras que no se reenvían entre saltos (RFC 7230 §6.1)
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade'
+}
 
-    def __init__(self, requests: int = 10, window: int = 60):
-        self.requests = requests
-        self.window = window
-        self.requests_log = defaultdict(list)
+class UpstreamClients:
+    """Clientes HTTP compartidos por upstream (keep-alive, límites de pool y timeouts)"""
 
-    def is_allowed(self, client_id: str) -> bool:
-        """Verifica si el cliente puede hacer una request"""
-        now = time.time()
+    def __init__(self):
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.config: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, name: str, read_timeout: float, http2: bool = False):
+        """Registra un upstream con su timeout de lectura"""
+        self.config[name] = {
+            "read_timeout": read_timeout,
+            "http2": http2 and UPSTREAM_HTTP2 and HTTP2_AVAILABLE
+        }
 
-        # Limpiar requests antiguas
-        self.requests_log[client_id] = [
-            req_time for req_time in self.requests_log[client_id]
-            if now - req_time < self.window
-        ]
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Cliente del upstream (se crea la primera vez o si se cerró)"""
+        client = self.clients.get(name)
+        if client is None or client.is_closed:
+            config = self.config[name]
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(config["read_timeout"], connect=UPSTREAM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                    keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY
+                ),
+                http2=config["http2"]
+            )
+            self.clients[name] = client
+        return client
+
+    def start(self):
+        """Crea todos los clientes registrados"""
+        for name in self.config:
+            self.get(name)
+
+    async def close(self):
+        """Cierra los clientes y sus conexiones"""
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+    async def proxy(self, name: str, request: Request, url: str,
+                    content: Optional[bytes] = None) -> StreamingResponse:
+        """
+        Reenvía `request` a `url` y devuelve la respuesta en streaming.
+
+        Sin `content`, el cuerpo de la request también se reenvía en streaming.
+        Los errores de conexión (httpx.RequestError) se propagan antes de
+        empezar a responder, así que los fallbacks de cada proxy siguen
+        funcionando.
+        """
+        client = self.get(name)
+
+        if content is None and request.method in ["POST", "PUT", "PATCH"]:
+            content = request.stream()
+
+        headers = {key: value for key, value in request.headers.items()
+                   if key.lower() != 'host' and key.lower() not in HOP_BY_HOP_HEADERS}
+        upstream_request = client.build_request(
+            method=request.method,
+            url=url,
+            params=request.query_params,
+            content=content,
+            headers=headers
+        )
+        response = await client.send(upstream_request, stream=True)
+
+        # aiter_raw mantiene content-encoding/content-length del upstream
+        return StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            headers={key: value for key, value in response.headers.items()
+                     if key.lower() not in HOP_BY_HOP_HEADERS},
+            background=BackgroundTask(response.aclose)
+        )
 
-        # Verificar límite
-        if len(self.requests_log[client_id]) >= self.requests:
-            return False
+# ============================================
+# ACONTEXT WRITE-BEHIND
+# ============================================
 
-        # Registrar nueva request
-        self.requests_log[client_id].append(now)
-        return True
+class AcontextWriteBehind:
+    """
+    Cola write-behind acotada para persistir mensajes de Acontext fuera del
+    camino crítico del chat.
+
+    Un dispatcher reparte las operaciones de la cola por sesión y cada
+    sesión se procesa en su propia tarea, con un tope de sesiones
+    simultáneas. Dentro de cada sesión se respeta el orden (mensaje de
+    usuario, respuesta, flush); los reintentos de una sesión no frenan a las
+    demás. Cada operación se reintenta con backoff exponencial. Si la cola
+    está llena, la operación se descarta.
+    """
+
+    def __init__(self, max_size: int = 1000, max_concurrent_sessions: int = 16,
+                 max_retries: int = 3, retry_backoff: float = 0.5):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.max_concurrent_sessions = max_concurrent_sessions
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._worker: Optional[asyncio.Task] = None
+        self._session_slots = asyncio.Semaphore(max_concurrent_sessions)
+        # id(tarea de sesión) -> (tarea de sesión, operaciones pendientes)
+        self._sessions: Dict[int, tuple] = {}
+        self._session_tasks: Set[asyncio.Task] = set()
+        self.stats = defaultdict(int)
+
+    def start(self):
+        """Arranca el dispatcher (requiere event loop en marcha)"""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0):
+        """Vacía la cola (como mucho `timeout` segundos) y para las tareas"""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Acontext write-behind: {self.queue.qsize() + self._pending_operations()} "
+                           f"operaciones sin enviar al cerrar")
+        self._worker.cancel()
+        self._worker = None
+        for task in list(self._session_tasks):
+            task.cancel()
+
+    def send_message(self, session: asyncio.Task, message: Dict[str, Any]):
+        """Encola un mensaje; `session` es la tarea que resuelve el session_id"""
+        self._enqueue(session, "message", message)
+
+    def flush(self, session: asyncio.Task):
+        """Encola el flush de la sesión (tras sus mensajes pendientes)"""
+        self._enqueue(session, "flush", None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de la cola"""
+        return {
+            "pending": self.queue.qsize() + self._pending_operations(),
+            "active_sessions": len(self._sessions),
+            **self.stats
+        }
+
+    def _pending_operations(self) -> int:
+        return sum(len(operations) for _, operations in self._sessions.values())
+
+    def _enqueue(self, session: asyncio.Task, kind: str, payload: Optional[Dict[str, Any]]):
+        self.start()
+        try:
+            self.queue.put_nowait((session, kind, payload))
+            self.stats["enqueued"] += 1
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            logger.warning(f"⚠️ Acontext write-behind queue full, dropping {kind}")
+
+    async def _run(self):
+        while True:
+            session, kind, payload = await self.queue.get()
+
+            entry = self._sessions.get(id(session))
+            if entry is None:
+                # La tarea de sesión vive mientras queden operaciones suyas
+                entry = self._sessions[id(session)] = (session, deque())
+                task = asyncio.create_task(self._process_session(id(session)))
+                self._session_tasks.add(task)
+                task.add_done_callback(self._session_tasks.discard)
+            entry[1].append((kind, payload))
+
+    async def _process_session(self, key: int):
+        session, operations = self._sessions[key]
+        try:
+            async with self._session_slots:
+                self.stats["sessions"] += 1
+                try:
+                    session_id = await session
+                except Exception as e:
+                    logger.error(f"❌ Acontext session error: {e}")
+                    session_id = None
+
+                # Las operaciones que lleguen mientras tanto se añaden a la cola
+                # de esta sesión y se procesan aquí, en orden
+                while operations:
+                    kind, payload = operations.popleft()
+                    try:
+                        if not session_id:
+                            # La sesión no se pudo crear
+                            self.stats["failed"] += 1
+                        else:
+                            await self._send(session_id, kind, payload)
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        logger.error(f"❌ Acontext write-behind error: {e}")
+                    finally:
+                        self.queue.task_done()
+        finally:
+            del self._sessions[key]
+            for _ in operations:
+                self.queue.task_done()
+
+    async def _send(self, session_id: str, kind: str, payload: Optional[Dict[str, Any]]):
+        for attempt in range(self.max_retries + 1):
+            # AcontextIntegration devuelve {"status": "error"} en lugar de lanzar
+            if kind == "message":
+                result = await acontext_client.send_message_to_session(session_id, payload)
+            else:
+                result = await acontext_client.flush_session(ACONTEXT_PROJECT_ID, session_id)
+
+            if result.get("status") != "error":
+                self.stats["sent"] += 1
+                return
 
-    def get_retry_after(self, client_id: str) -> int:
-        """Retorna segundos hasta que pueda hacer otra request"""
-        if client_id not in self.requests_log or not self.requests_log[client_id]:
-            return 0
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
 
-        oldest_request = min(self.requests_log[client_id])
-        retry_after = int(self.window - (time.time() - oldest_request))
-        return max(0, retry_after)
+        self.stats["failed"] += 1
+        logger.error(f"❌ Acontext {kind} failed after {self.max_retries} retries (session {session_id})")
 
 # ============================================
 # INSTANCIAS GLOBALES
@@ -261,13 +472,29 @@ circuit_breaker = CircuitBreaker(
     threshold=CIRCUIT_BREAKER_THRESHOLD,
     timeout=CIRCUIT_BREAKER_TIMEOUT
 )
+# GCRA por IP; RATE_LIMIT_BACKEND=shm comparte el límite entre workers
 rate_limiter = RateLimiter(
     requests=RATE_LIMIT_REQUESTS,
-    window=RATE_LIMIT_WINDOW
+    window=RATE_LIMIT_WINDOW,
+    backend=create_backend(name="capibara6_gateway_ratelimit")
 )
 
+# Clientes HTTP por upstream
+upstream_clients = UpstreamClients()
+upstream_clients.register("vllm", read_timeout=30.0, http2=True)
+upstream_clients.register("ollama", read_timeout=120.0)
+upstream_clients.register("bridge", read_timeout=30.0)
+upstream_clients.register("mcp", read_timeout=30.0)
+upstream_clients.register("acontext", read_timeout=30.0)
+upstream_clients.register("rag", read_timeout=30.0)
+
 # Acontext client
 acontext_client = acontext_integration.acontext_client
+acontext_writer = AcontextWriteBehind(
+    max_size=ACONTEXT_QUEUE_SIZE,
+    max_concurrent_sessions=ACONTEXT_SESSION_CONCURRENCY,
+    max_retries=ACONTEXT_WRITE_RETRIES
+)
 
 # ============================================
 # FASTAPI APP
@@ -301,8 +528,9 @@ async def check_rate_limit(request: Request):
     """Middleware de rate limiting"""
     client_id = request.client.host
 
-    if not rate_limiter.is_allowed(client_id):
-        retry_after = rate_limiter.get_retry_after(client_id)
+    result = rate_limiter.hit(client_id)
+    if not result.allowed:
+        retry_after = math.ceil(result.retry_after)
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Rate limit exceeded. Try again in {retry_after} seconds",
@@ -361,25 +589,22 @@ async def health():
 
     # Check vLLM
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{VLLM_URL}/health")
-            services_status["vllm"] = "healthy" if response.status_code == 200 else "unhealthy"
+        response = await upstream_clients.get("vllm").get(f"{VLLM_URL}/health", timeout=5.0)
+        services_status["vllm"] = "healthy" if response.status_code == 200 else "unhealthy"
     except:
         services_status["vllm"] = "unavailable"
 
     # Check Ollama
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{OLLAMA_URL}/api/version")
-            services_status["ollama"] = "healthy" if response.status_code == 200 else "unhealthy"
+        response = await upstream_clients.get("ollama").get(f"{OLLAMA_URL}/api/version", timeout=5.0)
+        services_status["ollama"] = "healthy" if response.status_code == 200 else "unhealthy"
     except:
         services_status["ollama"] = "unavailable"
 
     # Check Bridge API
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{BRIDGE_API_URL}/health")
-            services_status["bridge_api"] = "healthy" if response.status_code == 200 else "unhealthy"
+        response = await upstream_clients.get("bridge").get(f"{BRIDGE_API_URL}/health", timeout=5.0)
+        services_status["bridge_api"] = "healthy" if response.status_code == 200 else "unhealthy"
     except:
         services_status["bridge_api"] = "unavailable"
 
@@ -393,57 +618,74 @@ async def health():
         }
     )
 
-@app.post("/api/chat", response_model=ChatResponse, dependencies=[Depends(check_rate_limit)])
-async def chat(request: ChatRequest):
-    """Endpoint de chat con routing semántico y persistencia de contexto Acontext"""
-    start_time = time.time()
-
-    # Initialize Acontext session if enabled
-    acontext_session_id = None
-    if ACONTEXT_ENABLED:
-        try:
-            acontext_session = await acontext_client.create_session(
-                project_id=ACONTEXT_PROJECT_ID,
-                space_id=ACONTEXT_SPACE_ID
-            )
-            acontext_session_id = acontext_session.id
-            logger.info(f"📊 Acontext session created: {acontext_session_id}")
-        except Exception as e:
-            logger.error(f"❌ Error creating Acontext session: {e}")
-            # Continue without Acontext if it fails
+async def _create_acontext_session() -> Optional[str]:
+    """Crea la sesión Acontext de un chat (None si falla)"""
+    try:
+        acontext_session = await acontext_client.create_session(
+            project_id=ACONTEXT_PROJECT_ID,
+            space_id=ACONTEXT_SPACE_ID
+        )
+        logger.info(f"📊 Acontext session created: {acontext_session.id}")
+        return acontext_session.id
+    except Exception as e:
+        logger.error(f"❌ Error creating Acontext session: {e}")
+        # Continue without Acontext if it fails
+        return None
 
-    # If Acontext space is configured, search for relevant experiences
-    context_experiences = []
-    search_result = None
-    if ACONTEXT_ENABLED and ACONTEXT_SPACE_ID:
-        try:
-            # Search for relevant experiences in the space with enhanced parameters
-            search_result = await acontext_client.search_space(
+async def _search_acontext_experiences(query: str) -> List[Dict[str, Any]]:
+    """Busca experiencias relevantes en el space, como mucho ACONTEXT_SEARCH_TIMEOUT_MS"""
+    try:
+        # Search for relevant experiences in the space with enhanced parameters
+        search_result = await asyncio.wait_for(
+            acontext_client.search_space(
                 space_id=ACONTEXT_SPACE_ID,
-                query=request.message,
+                query=query,
                 mode="fast",
                 limit=5  # Limit to top 5 most relevant experiences
-            )
-            context_experiences = search_result.get("cited_blocks", [])
-            search_metadata = search_result.get("search_metadata", {})
+            ),
+            timeout=ACONTEXT_SEARCH_TIMEOUT_MS / 1000
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"⏱️ Acontext search exceeded {ACONTEXT_SEARCH_TIMEOUT_MS}ms, continuing without experiences")
+        return []
+    except Exception as e:
+        logger.error(f"❌ Error searching Acontext space: {e}")
+        # Continue without experiences if search fails
+        return []
 
-            if context_experiences:
-                logger.info(f"🔍 Found {len(context_experiences)} relevant experiences from Acontext space (search took {search_metadata.get('search_date', 'N/A')})")
+    context_experiences = search_result.get("cited_blocks", [])
+    search_metadata = search_result.get("search_metadata", {})
 
-                # Log the relevance scores of found experiences
-                for i, exp in enumerate(context_experiences[:3]):  # Log top 3
-                    score = exp.get("relevance_score", "N/A")
-                    title = exp.get("title", "Unknown")[:50]
-                    logger.debug(f"   Top {i+1}: '{title}...' (relevance: {score})")
-            else:
-                logger.info("🔍 No relevant experiences found in Acontext space")
-        except Exception as e:
-            logger.error(f"❌ Error searching Acontext space: {e}")
-            # Continue without experiences if search fails
+    if context_experiences:
+        logger.info(f"🔍 Found {len(context_experiences)} relevant experiences from Acontext space (search took {search_metadata.get('search_date', 'N/A')})")
+
+        # Log the relevance scores of found experiences
+        for i, exp in enumerate(context_experiences[:3]):  # Log top 3
+            score = exp.get("relevance_score", "N/A")
+            title = exp.get("title", "Unknown")[:50]
+            logger.debug(f"   Top {i+1}: '{title}...' (relevance: {score})")
+    else:
+        logger.info("🔍 No relevant experiences found in Acontext space")
+
+    return context_experiences
+
+@app.post("/api/chat", response_model=ChatResponse, dependencies=[Depends(check_rate_limit)])
+async def chat(request: ChatRequest):
+    """Endpoint de chat con routing semántico y persistencia de contexto Acontext"""
+    start_time = time.time()
 
-    # Seleccionar modelo
+    # Acontext fuera del camino crítico: la sesión se crea en segundo plano
+    # (la cola write-behind la espera) y la búsqueda corre en paralelo con el routing
+    acontext_session = None
+    search_task = None
+    if ACONTEXT_ENABLED:
+        acontext_session = asyncio.create_task(_create_acontext_session())
+        if ACONTEXT_SPACE_ID:
+            search_task = asyncio.create_task(_search_acontext_experiences(request.message))
+
+    # Seleccionar modelo (en un hilo, para que las llamadas Acontext avancen mientras tanto)
     if request.use_semantic_router and semantic_router.enabled:
-        routing_info = semantic_router.select_model(request.message)
+        routing_info = await asyncio.to_thread(semantic_router.select_model, request.message)
         selected_model = routing_info['model_id']
     else:
         routing_info = None
@@ -451,6 +693,9 @@ async def chat(request: ChatRequest):
 
     logger.info(f"🎯 Modelo seleccionado: {selected_model}")
 
+    # If Acontext space is configured, wait (capped) for relevant experiences
+    context_experiences = await search_task if search_task else []
+
     # Prepare context from experiences if available
     context_message = ""
     if context_experiences:
@@ -477,28 +722,22 @@ async def chat(request: ChatRequest):
         "max_tokens": request.max_tokens
     }
 
-    # Store user message in Acontext if enabled
-    if ACONTEXT_ENABLED and acontext_session_id:
-        try:
-            user_message = {
-                "role": "user",
-                "content": request.message
-            }
-            await acontext_client.send_message_to_session(acontext_session_id, user_message)
-            logger.info(f"💬 User message stored in Acontext session: {acontext_session_id}")
-        except Exception as e:
-            logger.error(f"❌ Error storing user message in Acontext: {e}")
+    # Store user message in Acontext if enabled (write-behind)
+    if acontext_session:
+        acontext_writer.send_message(acontext_session, {
+            "role": "user",
+            "content": request.message
+        })
 
     try:
         # Llamar a vLLM con circuit breaker
         async def call_vllm():
-            async with httpx.AsyncClient(timeout=30.0) as client:  # Reducir timeout para evitar cuelgues
-                response = await client.post(
-                    f"{VLLM_URL}/v1/chat/completions",
-                    json=vllm_request
-                )
-                response.raise_for_status()
-                return response.json()
+            response = await upstream_clients.get("vllm").post(
+                f"{VLLM_URL}/v1/chat/completions",
+                json=vllm_request
+            )
+            response.raise_for_status()
+            return response.json()
 
         result = await circuit_breaker.call_async("vllm", call_vllm)
 
@@ -506,17 +745,13 @@ async def chat(request: ChatRequest):
         response_text = result['choices'][0]['message']['content']
         tokens = result.get('usage', {}).get('total_tokens', 0)
 
-        # Store assistant response in Acontext if enabled
-        if ACONTEXT_ENABLED and acontext_session_id:
-            try:
-                assistant_message = {
-                    "role": "assistant",
-                    "content": response_text
-                }
-                await acontext_client.send_message_to_session(acontext_session_id, assistant_message)
-                logger.info(f"🤖 Assistant message stored in Acontext session: {acontext_session_id}")
-            except Exception as e:
-                logger.error(f"❌ Error storing assistant message in Acontext: {e}")
+        # Store assistant response and flush the session in Acontext if enabled
+        if acontext_session:
+            acontext_writer.send_message(acontext_session, {
+                "role": "assistant",
+                "content": response_text
+            })
+            acontext_writer.flush(acontext_session)
 
         latency_ms = int((time.time() - start_time) * 1000)
 
@@ -529,74 +764,24 @@ async def chat(request: ChatRequest):
         )
 
     except HTTPException as he:
-        # Even if the main call fails, try to flush session if Acontext was used
-        if ACONTEXT_ENABLED and acontext_session_id:
-            try:
-                await acontext_client.flush_session(ACONTEXT_PROJECT_ID, acontext_session_id)
-                logger.info(f"🔄 Acontext session flushed: {acontext_session_id}")
-            except Exception as e:
-                logger.error(f"❌ Error flushing Acontext session: {e}")
+        # Even if the main call fails, flush session if Acontext was used
+        if acontext_session:
+            acontext_writer.flush(acontext_session)
 
         logger.error(f"❌ HTTPException en chat: {he}")
         raise
     except httpx.HTTPStatusError as he:
         logger.error(f"❌ HTTPStatusError en chat (vLLM): {he}")
 
-        # Even if the main call fails, try to flush session if Acontext was used
-        if ACONTEXT_ENABLED and acontext_session_id:
-            try:
-                await acontext_client.flush_session(ACONTEXT_PROJECT_ID, acontext_session_id)
-                logger.info(f"🔄 Acontext session flushed: {acontext_session_id}")
-            except Exception as e:
-                logger.error(f"❌ Error flushing Acontext session: {e}")
-
         # Intentar fallback a Ollama
         try:
-            logger.info("🔄 Intentando fallback a Ollama...")
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                ollama_request = {
-                    "model": "phi3:mini",
-                    "prompt": request.message,
-                    "stream": False
-                }
-                response = await client.post(
-                    f"{OLLAMA_URL}/api/generate",
-                    json=ollama_request
-                )
-                response.raise_for_status()
-                result = response.json()
-
-                # Store fallback response in Acontext if enabled
-                if ACONTEXT_ENABLED and acontext_session_id:
-                    try:
-                        fallback_message = {
-                            "role": "assistant",
-                            "content": result['response']
-                        }
-                        await acontext_client.send_message_to_session(acontext_session_id, fallback_message)
-                        logger.info(f"🔄 Fallback message stored in Acontext session: {acontext_session_id}")
-                    except Exception as e:
-                        logger.error(f"❌ Error storing fallback message in Acontext: {e}")
-
-                latency_ms = int((time.time() - start_time) * 1000)
-
-                return ChatResponse(
-                    response=result['response'],
-                    model="phi3:mini (fallback)",
-                    routing_info={"fallback": True, "original_model": selected_model},
-                    tokens=None,
-                    latency_ms=latency_ms
-                )
+            return await _ollama_fallback(request, selected_model, acontext_session, start_time)
         except Exception as fallback_error:
             logger.error(f"❌ Fallback también falló: {fallback_error}")
 
-            # Still try to flush session if Acontext was used
-            if ACONTEXT_ENABLED and acontext_session_id:
-                try:
-                    await acontext_client.flush_session(ACONTEXT_PROJECT_ID, acontext_session_id)
-                    logger.info(f"🔄 Acontext session flushed: {acontext_session_id}")
-                except Exception as e:
-                    logger.error(f"❌ Error flushing Acontext session: {e}")
+            # Still flush session if Acontext was used
+            if acontext_session:
+                acontext_writer.flush(acontext_session)
 
             raise HTTPException(
                 status_code=503,
@@ -606,74 +791,54 @@ async def chat(request: ChatRequest):
         logger.error(f"❌ Error general en chat: {e}")
         logger.exception("Full traceback:")  # Log completo del error para diagnóstico
 
-        # Even if the main call fails, try to flush session if Acontext was used
-        if ACONTEXT_ENABLED and acontext_session_id:
-            try:
-                await acontext_client.flush_session(ACONTEXT_PROJECT_ID, acontext_session_id)
-                logger.info(f"🔄 Acontext session flushed: {acontext_session_id}")
-            except Exception as e2:
-                logger.error(f"❌ Error flushing Acontext session: {e2}")
-
         # Intentar fallback a Ollama
         try:
-            logger.info("🔄 Intentando fallback a Ollama...")
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                ollama_request = {
-                    "model": "phi3:mini",
-                    "prompt": request.message,
-                    "stream": False
-                }
-                response = await client.post(
-                    f"{OLLAMA_URL}/api/generate",
-                    json=ollama_request
-                )
-                response.raise_for_status()
-                result = response.json()
-
-                # Store fallback response in Acontext if enabled
-                if ACONTEXT_ENABLED and acontext_session_id:
-                    try:
-                        fallback_message = {
-                            "role": "assistant",
-                            "content": result['response']
-                        }
-                        await acontext_client.send_message_to_session(acontext_session_id, fallback_message)
-                        logger.info(f"🔄 Fallback message stored in Acontext session: {acontext_session_id}")
-                    except Exception as e:
-                        logger.error(f"❌ Error storing fallback message in Acontext: {e}")
-
-                latency_ms = int((time.time() - start_time) * 1000)
-
-                return ChatResponse(
-                    response=result['response'],
-                    model="phi3:mini (fallback)",
-                    routing_info={"fallback": True, "original_model": selected_model},
-                    tokens=None,
-                    latency_ms=latency_ms
-                )
+            return await _ollama_fallback(request, selected_model, acontext_session, start_time)
         except Exception as fallback_error:
             logger.error(f"❌ Fallback también falló: {fallback_error}")
 
-            # Still try to flush session if Acontext was used
-            if ACONTEXT_ENABLED and acontext_session_id:
-                try:
-                    await acontext_client.flush_session(ACONTEXT_PROJECT_ID, acontext_session_id)
-                    logger.info(f"🔄 Acontext session flushed: {acontext_session_id}")
-                except Exception as e:
-                    logger.error(f"❌ Error flushing Acontext session: {e}")
+            # Still flush session if Acontext was used
+            if acontext_session:
+                acontext_writer.flush(acontext_session)
 
             raise HTTPException(
                 status_code=503,
                 detail=f"All model services unavailable: {str(e)}"
             )
 
-    # Flush session at the end of successful request
-    if ACONTEXT_ENABLED and acontext_session_id:
-        try:
-            await acontext_client.flush_session(ACONTEXT_PROJECT_ID, acontext_session_id)
-            logger.info(f"🔄 Acontext session flushed: {acontext_session_id}")
-        except Exception as e:
-            logger.error(f"❌ Error flushing Acontext session: {e}")
+async def _ollama_fallback(request: ChatRequest, selected_model: str,
+                           acontext_session: Optional[asyncio.Task], start_time: float) -> ChatResponse:
+    """Responde con Ollama cuando vLLM falla"""
+    logger.info("🔄 Intentando fallback a Ollama...")
+    ollama_request = {
+        "model": "phi3:mini",
+        "prompt": request.message,
+        "stream": False
+    }
+    response = await upstream_clients.get("ollama").post(
+        f"{OLLAMA_URL}/api/generate",
+        json=ollama_request
+    )
+    response.raise_for_status()
+    result = response.json()
+
+    # Store fallback response and flush the session in Acontext if enabled
+    if acontext_session:
+        acontext_writer.send_message(acontext_session, {
+            "role": "assistant",
+            "content": result['response']
+        })
+        acontext_writer.flush(acontext_session)
+
+    latency_ms = int((time.time() - start_time) * 1000)
+
+    return ChatResponse(
+        response=result['response'],
+        model="phi3:mini (fallback)",
+        routing_info={"fallback": True, "original_model": selected_model},
+        tokens=None,
+        latency_ms=latency_ms
+    )
 
 @app.get("/api/router/info")
 async def router_info():
@@ -715,7 +880,9 @@ async def acontext_status():
         "enabled": ACONTEXT_ENABLED,
         "project_id": ACONTEXT_PROJECT_ID,
         "space_id": ACONTEXT_SPACE_ID,
-        "status": "connected" if ACONTEXT_ENABLED else "disconnected"
+        "status": "connected" if ACONTEXT_ENABLED else "disconnected",
+        "search_timeout_ms": ACONTEXT_SEARCH_TIMEOUT_MS,
+        "write_behind": acontext_writer.get_stats()
     }
 
 @app.post("/api/acontext/session/create")
@@ -792,73 +959,50 @@ MCP_BASE_URL = os.getenv("MCP_BASE_URL", "http://10.204.0.5:5003")
 async def mcp_proxy(request: Request, path: str):
     """Proxy para todos los endpoints de MCP (Model Context Protocol)"""
     # Construir la URL completa de MCP
-    mcp_base_url = os.getenv("MCP_BASE_URL", "http://10.204.0.5:5003")
-
-    # Obtener el cuerpo de la solicitud
-    body = await request.body() if request.method in ["POST", "PUT", "PATCH"] else None
-
-    # Hacer la solicitud al servidor de MCP
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            # Construir la URL completa
-            url = f"{mcp_base_url}/api/mcp/{path}"
-
-            # Incluir los parámetros de consulta si existen
-            params = dict(request.query_params)
-
-            # Hacer la solicitud al servidor MCP
-            response = await client.request(
-                method=request.method,
-                url=url,
-                params=params,
-                content=body,
-                headers={key: value for key, value in request.headers.items()
-                        if key.lower() not in ['host', 'content-length']},
-                timeout=30.0
-            )
+    url = f"{MCP_BASE_URL}/api/mcp/{path}"
 
-            # Devolver la respuesta
-            return JSONResponse(
-                status_code=response.status_code,
-                content=response.json() if response.content else None,
-                headers=dict(response.headers)
-            )
-        except httpx.RequestError as e:
-            logger.error(f"Error en proxy MCP: {e}")
-            # MCP es opcional, devolver respuesta simulada si no está disponible
-            logger.info("🔄 MCP service unavailable, returning simulated response")
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "status": "simulated",
-                    "service": "mcp",
-                    "path": path,
-                    "timestamp": datetime.now().isoformat(),
-                    "fallback_mode": True
-                },
-                headers={"x-mcp-mode": "simulated"}
-            )
-        except Exception as e:
-            logger.error(f"Error inesperado en proxy MCP: {e}")
-            # MCP es opcional, devolver respuesta simulada si no está disponible
-            logger.info("🔄 MCP service unavailable, returning simulated response")
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "status": "simulated",
-                    "service": "mcp",
-                    "path": path,
-                    "timestamp": datetime.now().isoformat(),
-                    "fallback_mode": True,
-                    "error": str(e)
-                },
-                headers={"x-mcp-mode": "simulated"}
-            )
+    # Reenviar request y respuesta en streaming con el cliente compartido
+    try:
+        return await upstream_clients.proxy("mcp", request, url)
+    except httpx.RequestError as e:
+        logger.error(f"Error en proxy MCP: {e}")
+        # MCP es opcional, devolver respuesta simulada si no está disponible
+        logger.info("🔄 MCP service unavailable, returning simulated response")
+        return JSONResponse(
+            status_code=200,
+            content={
+                "status": "simulated",
+                "service": "mcp",
+                "path": path,
+                "timestamp": datetime.now().isoformat(),
+                "fallback_mode": True
+            },
+            headers={"x-mcp-mode": "simulated"}
+        )
+    except Exception as e:
+        logger.error(f"Error inesperado en proxy MCP: {e}")
+        # MCP es opcional, devolver respuesta simulada si no está disponible
+        logger.info("🔄 MCP service unavailable, returning simulated response")
+        return JSONResponse(
+            status_code=200,
+            content={
+                "status": "simulated",
+                "service": "mcp",
+                "path": path,
+                "timestamp": datetime.now().isoformat(),
+                "fallback_mode": True,
+                "error": str(e)
+            },
+            headers={"x-mcp-mode": "simulated"}
+        )
 
 # ============================================
 # ACONTEXT PROXY ENDPOINTS
 # ============================================
 
+# URL del servicio Acontext
+ACONTEXT_BASE_URL = os.getenv("ACONTEXT_BASE_URL", "http://localhost:8029/api/v1")
+
 @app.api_route("/api/acontext/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def acontext_proxy(request: Request, path: str):
     """Proxy para todos los endpoints de Acontext"""
@@ -866,43 +1010,17 @@ async def acontext_proxy(request: Request, path: str):
         raise HTTPException(status_code=503, detail="Acontext integration not enabled")
 
     # Construir la URL completa de Acontext
-    acontext_base_url = os.getenv("ACONTEXT_BASE_URL", "http://localhost:8029/api/v1")
-
-    # Obtener el cuerpo de la solicitud
-    body = await request.body() if request.method in ["POST", "PUT", "PATCH"] else None
+    url = f"{ACONTEXT_BASE_URL}/{path}"
 
-    # Hacer la solicitud al servidor de Acontext
-    async with httpx.AsyncClient() as client:
-        try:
-            # Construir la URL completa
-            url = f"{acontext_base_url}/{path}"
-
-            # Incluir los parámetros de consulta si existen
-            params = dict(request.query_params)
-
-            # Hacer la solicitud al servidor Acontext
-            response = await client.request(
-                method=request.method,
-                url=url,
-                params=params,
-                content=body,
-                headers={key: value for key, value in request.headers.items()
-                        if key.lower() not in ['host', 'content-length']},
-                timeout=30.0
-            )
-
-            # Devolver la respuesta
-            return JSONResponse(
-                status_code=response.status_code,
-                content=response.json() if response.content else None,
-                headers=dict(response.headers)
-            )
-        except httpx.RequestError as e:
-            logger.error(f"Error en proxy Acontext: {e}")
-            raise HTTPException(status_code=502, detail=f"Acontext service error: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error inesperado en proxy Acontext: {e}")
-            raise HTTPException(status_code=500, detail=f"Acontext proxy error: {str(e)}")
+    # Reenviar request y respuesta en streaming con el cliente compartido
+    try:
+        return await upstream_clients.proxy("acontext", request, url)
+    except httpx.RequestError as e:
+        logger.error(f"Error en proxy Acontext: {e}")
+        raise HTTPException(status_code=502, detail=f"Acontext service error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error inesperado en proxy Acontext: {e}")
+        raise HTTPException(status_code=500, detail=f"Acontext proxy error: {str(e)}")
 
 # ============================================
 # RAG PROXY ENDPOINTS
@@ -910,98 +1028,53 @@ async def acontext_proxy(request: Request, path: str):
 
 # URL del servicio RAG
 RAG_BASE_URL = os.getenv("RAG_BASE_URL", "http://10.204.0.10:8000/api/v1")
+# Raíz del servicio RAG (los proxies añaden /api/v1/...)
+RAG_SERVICE_URL = os.getenv("RAG_BASE_URL", "http://10.204.0.10:8000")
 
 @app.api_route("/api/v1/rag/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def rag_proxy(request: Request, path: str):
     """Proxy para todos los endpoints de RAG"""
     # Construir la URL completa de RAG
-    rag_base_url = os.getenv("RAG_BASE_URL", "http://10.204.0.10:8000")
+    url = f"{RAG_SERVICE_URL}/api/v1/rag/{path}"
 
-    # Obtener el cuerpo de la solicitud
+    # El cuerpo (JSON pequeño) se lee entero porque el modo simulado lo necesita;
+    # la respuesta se reenvía en streaming
     body = await request.body() if request.method in ["POST", "PUT", "PATCH"] else None
 
-    # Hacer la solicitud al servidor de RAG
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            # Construir la URL completa
-            url = f"{rag_base_url}/api/v1/rag/{path}"
-
-            # Incluir los parámetros de consulta si existen
-            params = dict(request.query_params)
-
-            # Hacer la solicitud al servidor RAG
-            response = await client.request(
-                method=request.method,
-                url=url,
-                params=params,
-                content=body,
-                headers={key: value for key, value in request.headers.items()
-                        if key.lower() not in ['host', 'content-length']},
-                timeout=30.0
-            )
-
-            # Devolver la respuesta
-            return JSONResponse(
-                status_code=response.status_code,
-                content=response.json() if response.content else None,
-                headers=dict(response.headers)
-            )
-        except httpx.RequestError as e:
-            logger.error(f"Error en proxy RAG: {e}")
-            # Si falla la conexión, usar modo simulado de RAG
-            logger.info("🔄 RAG service unavailable, switching to simulated RAG mode")
-            return simulate_rag_search(path, await request.json() if request.method in ["POST", "PUT"] else {})
-        except Exception as e:
-            logger.error(f"Error inesperado en proxy RAG: {e}")
-            # Si falla la conexión, usar modo simulado de RAG
-            logger.info("🔄 RAG service unavailable, switching to simulated RAG mode")
-            return simulate_rag_search(path, await request.json() if request.method in ["POST", "PUT"] else {})
+    try:
+        return await upstream_clients.proxy("rag", request, url, content=body)
+    except httpx.RequestError as e:
+        logger.error(f"Error en proxy RAG: {e}")
+        # Si falla la conexión, usar modo simulado de RAG
+        logger.info("🔄 RAG service unavailable, switching to simulated RAG mode")
+        return simulate_rag_search(path, await request.json() if request.method in ["POST", "PUT"] else {})
+    except Exception as e:
+        logger.error(f"Error inesperado en proxy RAG: {e}")
+        # Si falla la conexión, usar modo simulado de RAG
+        logger.info("🔄 RAG service unavailable, switching to simulated RAG mode")
+        return simulate_rag_search(path, await request.json() if request.method in ["POST", "PUT"] else {})
 
 @app.api_route("/api/v1/embeddings/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def embeddings_proxy(request: Request, path: str):
     """Proxy para endpoints de embeddings RAG"""
     # Construir la URL completa de RAG embeddings
-    rag_base_url = os.getenv("RAG_BASE_URL", "http://10.204.0.10:8000")
+    url = f"{RAG_SERVICE_URL}/api/v1/embeddings/{path}"
 
-    # Obtener el cuerpo de la solicitud
+    # El cuerpo se lee entero porque la respuesta simulada usa su tamaño
     body = await request.body() if request.method in ["POST", "PUT", "PATCH"] else None
 
-    # Hacer la solicitud al servidor de RAG
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            # Construir la URL completa
-            url = f"{rag_base_url}/api/v1/embeddings/{path}"
-
-            # Incluir los parámetros de consulta si existen
-            params = dict(request.query_params)
-
-            # Hacer la solicitud al servidor RAG
-            response = await client.request(
-                method=request.method,
-                url=url,
-                params=params,
-                content=body,
-                headers={key: value for key, value in request.headers.items()
-                        if key.lower() not in ['host', 'content-length']},
-                timeout=30.0
-            )
-
-            # Devolver la respuesta
-            return JSONResponse(
-                status_code=response.status_code,
-                content=response.json() if response.content else None,
-                headers=dict(response.headers)
-            )
-        except httpx.RequestError as e:
-            logger.error(f"Error en proxy embeddings RAG: {e}")
-            # Simular generación de embeddings
-            logger.info("🔄 Embeddings service unavailable, returning simulated embeddings")
-            return {"embeddings": [0.1, 0.2, 0.3, 0.4, 0.5], "model": "simulated-embedding-model", "tokens": len(str(body or '')) if body else 0}
-        except Exception as e:
-            logger.error(f"Error inesperado en proxy embeddings RAG: {e}")
-            # Simular generación de embeddings
-            logger.info("🔄 Embeddings service unavailable, returning simulated embeddings")
-            return {"embeddings": [0.1, 0.2, 0.3, 0.4, 0.5], "model": "simulated-embedding-model", "tokens": 0}
+    try:
+        return await upstream_clients.proxy("rag", request, url, content=body)
+    except httpx.RequestError as e:
+        logger.error(f"Error en proxy embeddings RAG: {e}")
+        # Simular generación de embeddings
+        logger.info("🔄 Embeddings service unavailable, returning simulated embeddings")
+        return {"embeddings": [0.1, 0.2, 0.3, 0.4, 0.5], "model": "simulated-embedding-model", "tokens": len(str(body or '')) if body else 0}
+    except Exception as e:
+        logger.error(f"Error inesperado en proxy embeddings RAG: {e}")
+        # Simular generación de embeddings
+        logger.info("🔄 Embeddings service unavailable, returning simulated embeddings")
+        return {"embeddings": [0.1, 0.2, 0.3, 0.4, 0.5], "model": "simulated-embedding-model", "tokens": 0}
 
 # Endpoint específico para RAG search que puede ser llamado desde el frontend
 @app.post("/api/rag/search")
@@ -1011,31 +1084,28 @@ async def rag_search_proxy(query_data: dict):
     if not query:
         raise HTTPException(status_code=400, detail="Query parameter is required")
 
-    rag_base_url = os.getenv("RAG_BASE_URL", "http://10.204.0.10:8000")
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            # Llamar al endpoint de búsqueda semántica de RAG
-            response = await client.post(
-                f"{rag_base_url}/api/v1/rag/search",
-                json={"query": query},
-                headers={"Content-Type": "application/json"}
-            )
+    try:
+        # Llamar al endpoint de búsqueda semántica de RAG
+        response = await upstream_clients.get("rag").post(
+            f"{RAG_SERVICE_URL}/api/v1/rag/search",
+            json={"query": query},
+            headers={"Content-Type": "application/json"}
+        )
 
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"RAG search returned status {response.status_code}: {response.text}")
-                logger.info("🔄 RAG service unavailable, switching to simulated RAG mode")
-                return simulate_rag_search("search", {"query": query})
-        except httpx.RequestError as e:
-            logger.error(f"Error en búsqueda RAG: {e}")
-            logger.info("🔄 RAG service unavailable, switching to simulated RAG mode")
-            return simulate_rag_search("search", {"query": query})
-        except Exception as e:
-            logger.error(f"Error inesperado en búsqueda RAG: {e}")
+        if response.status_code == 200:
+            return response.json()
+        else:
+            logger.error(f"RAG search returned status {response.status_code}: {response.text}")
             logger.info("🔄 RAG service unavailable, switching to simulated RAG mode")
             return simulate_rag_search("search", {"query": query})
+    except httpx.RequestError as e:
+        logger.error(f"Error en búsqueda RAG: {e}")
+        logger.info("🔄 RAG service unavailable, switching to simulated RAG mode")
+        return simulate_rag_search("search", {"query": query})
+    except Exception as e:
+        logger.error(f"Error inesperado en búsqueda RAG: {e}")
+        logger.info("🔄 RAG service unavailable, switching to simulated RAG mode")
+        return simulate_rag_search("search", {"query": query})
 
 # Función para simular respuestas RAG cuando el servicio no está disponible
 def simulate_rag_search(path: str, data: dict):
@@ -1394,7 +1464,8 @@ async def startup_event():
     logger.info("=" * 60)
     logger.info(f"🎯 Semantic Router: {'✅ Activo' if semantic_router.enabled else '❌ Inactivo'}")
     logger.info(f"⚡ Circuit Breaker: ✅ Activo (threshold={CIRCUIT_BREAKER_THRESHOLD})")
-    logger.info(f"🚦 Rate Limiter: ✅ Activo ({RATE_LIMIT_REQUESTS} req/{RATE_LIMIT_WINDOW}s)")
+    logger.info(f"🚦 Rate Limiter: ✅ Activo ({RATE_LIMIT_REQUESTS} req/{RATE_LIMIT_WINDOW}s, "
+                f"{type(rate_limiter.backend).__name__})")
     logger.info(f"📊 Acontext Integration: {'✅ Activo' if ACONTEXT_ENABLED else '❌ Inactivo'}")
     logger.info(f"📚 Acontext Project: {ACONTEXT_PROJECT_ID}")
     if ACONTEXT_SPACE_ID:
@@ -1404,11 +1475,21 @@ async def startup_event():
     logger.info(f"🔗 Bridge API: {BRIDGE_API_URL}")
     logger.info("=" * 60)
 
+    # Abrir los pools HTTP antes de la primera request
+    upstream_clients.start()
+    if ACONTEXT_ENABLED:
+        acontext_writer.start()
+    logger.info(f"🔌 Upstream clients: {', '.join(upstream_clients.clients)} "
+                f"(HTTP/2: {'✅' if HTTP2_AVAILABLE and UPSTREAM_HTTP2 else '❌'})")
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Limpieza al cerrar"""
     logger.info("🛑 Cerrando API Gateway...")
 
+    # Enviar lo pendiente de la cola write-behind antes de cerrar el cliente
+    await acontext_writer.stop()
+
     # Close Acontext client
     try:
         await acontext_client.close()
@@ -1416,6 +1497,13 @@ async def shutdown_event():
     except Exception as e:
         logger.error(f"Error closing Acontext client: {e}")
 
+    # Close upstream HTTP clients
+    try:
+        await upstream_clients.close()
+        logger.info("🔒 Upstream clients closed")
+    except Exception as e:
+        logger.error(f"Error closing upstream clients: {e}")
+
 # ============================================
 # MAIN
 # ============================================
@@ -5,6 +5,7 @@ Main API - API REST principal para Capibara6.
 """
 
 import logging
+import math
 import os
 import time
 from datetime import datetime
@@ -18,6 +19,8 @@ from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import uvicorn
 
+from core.rate_limiter import RateLimiter, create_backend
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,8 +33,9 @@ ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 API_VERSION = "v1"
 API_PREFIX = f"/api/{API_VERSION}"
 
-# Rate limiting (simulado)
-rate_limit_storage = {}
+# Rate limiting: 100 requests por minuto por IP (GCRA; RATE_LIMIT_BACKEND=shm
+# comparte el límite entre workers)
+rate_limiter = RateLimiter(requests=100, window=60, backend=create_backend(name="capibara6_api_ratelimit"))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -129,25 +133,14 @@ app.add_middleware(
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
     """Middleware de rate limiting."""
-    global rate_limit_storage
-    client_ip = request.client.host
-    current_time = time.time()
-    
-    # Limpiar entradas antiguas (más de 1 minuto)
-    cleaned_storage = {k: v for k, v in rate_limit_storage.items() 
-                         if current_time - v['last_request'] < 60}
-    rate_limit_storage.clear()
-    rate_limit_storage.update(cleaned_storage)
-    # Verificar límite (100 requests por minuto por IP)
-    if client_ip in rate_limit_storage:
-        if rate_limit_storage[client_ip]['count'] >= 100:
-            return JSONResponse(
-                status_code=429,
-                content={"error": "Rate limit exceeded", "retry_after": 60}
-            )
-        rate_limit_storage[client_ip]['count'] += 1
-    else:
-        rate_limit_storage[client_ip] = {'count': 1, 'last_request': current_time}
+    result = rate_limiter.hit(request.client.host)
+    if not result.allowed:
+        retry_after = math.ceil(result.retry_after)
+        return JSONResponse(
+            status_code=429,
+            content={"error": "Rate limit exceeded", "retry_after": retry_after},
+            headers={"Retry-After": str(retry_after)}
+        )
     
     response = await call_next(request)
     return response
@@ -0,0 +1,18 @@
+"""
+Configuración común de pytest para los tests unitarios
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Los módulos del backend se importan como core.X, los de ARM Axion como
+# vllm_integration.X y los scripts de vllm-integration/ por su nombre
+for path in (ROOT / "backend", ROOT / "arm-axion-optimizations",
+             ROOT / "arm-axion-optimizations" / "vllm-integration"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+# Scripts antiguos contra servidores en marcha: no son tests unitarios
+collect_ignore = ["deprecated"]
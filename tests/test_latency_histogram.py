@@ -0,0 +1,59 @@
+"""
+Tests for LatencyHistogram (fixed-memory latency percentiles)
+"""
+
+import numpy as np
+import pytest
+
+from vllm_integration.latency_histogram import LatencyHistogram
+
+
+def test_empty():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None
+    assert histogram.snapshot() == {'count': 0}
+
+
+def test_percentiles_within_relative_error():
+    values = np.random.default_rng(0).lognormal(mean=-2.0, sigma=1.0, size=10000)
+    histogram = LatencyHistogram(relative_error=0.01)
+    for value in values:
+        histogram.record(value)
+
+    for p in (50, 95, 99):
+        exact = np.percentile(values, p, method='inverted_cdf')
+        assert histogram.percentile(p) == pytest.approx(exact, rel=0.02)
+
+
+def test_snapshot_exact_stats():
+    histogram = LatencyHistogram()
+    for value in (0.1, 0.2, 0.6):
+        histogram.record(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 3
+    assert snapshot['mean'] == pytest.approx(0.3)
+    assert snapshot['min'] == 0.1
+    assert snapshot['max'] == 0.6
+    assert snapshot['median'] == snapshot['p50']
+
+
+def test_out_of_range_values_land_in_edge_buckets():
+    histogram = LatencyHistogram(min_value=0.001, max_value=1.0)
+    histogram.record(0.0)
+    histogram.record(50.0)
+
+    assert histogram.percentile(1) == pytest.approx(0.001, rel=0.02)
+    assert histogram.percentile(100) == pytest.approx(1.0, rel=0.02)
+    assert (histogram.min, histogram.max) == (0.0, 50.0)
+
+
+def test_ignores_invalid_values_and_resets():
+    histogram = LatencyHistogram()
+    histogram.record(None)
+    histogram.record(-1.0)
+    assert histogram.count == 0
+
+    histogram.record(0.5)
+    histogram.reset()
+    assert histogram.snapshot() == {'count': 0}
@@ -0,0 +1,86 @@
+"""
+Tests de MetadataIndex (prefiltrado por metadata)
+"""
+
+import pytest
+
+from core.rag.metadata_index import MetadataIndex
+
+ROWS = [
+    {'lang': 'es', 'year': 2021, 'tags': ['rag', 'cpu'], 'public': True},
+    {'lang': 'en', 'year': 2023, 'tags': ['gpu'], 'public': False},
+    {'lang': 'es', 'year': 2019.5, 'tags': ['cpu'], 'public': 1},
+    {'lang': 'fr', 'year': 2023, 'public': True},
+]
+
+
+@pytest.fixture
+def index():
+    index = MetadataIndex()
+    for row, metadata in enumerate(ROWS):
+        index.add(row, metadata)
+    return index
+
+
+@pytest.mark.parametrize("filter_metadata", [
+    {'lang': 'es'},
+    {'lang': {'$ne': 'es'}},
+    {'lang': {'$in': ['en', 'fr']}},
+    {'lang': {'$nin': ['en']}},
+    {'year': {'$gte': 2021}},
+    {'year': {'$gt': 2019.5, '$lt': 2023}},
+    {'year': {'$lte': 2021}},
+    {'tags': {'$contains': 'cpu'}},
+    {'$or': [{'lang': 'fr'}, {'year': {'$lt': 2020}}]},
+    {'$and': [{'lang': 'es'}, {'tags': {'$contains': 'rag'}}]},
+    {'public': True},
+    {'public': 1},
+    {'public': {'$ne': True}},
+    {'$and': []},
+    {'$or': []},
+    {'year': {'$gt': '2020'}},
+    {'year': {'$gte': 2020, '$lt': None}},
+])
+def test_select_matches_per_document_evaluation(index, filter_metadata):
+    expected = [row for row, metadata in enumerate(ROWS)
+                if MetadataIndex.matches(metadata, filter_metadata)]
+    assert index.select(filter_metadata).tolist() == expected
+
+
+def test_booleans_do_not_match_integers(index):
+    assert index.select({'public': True}).tolist() == [0, 3]
+    assert index.select({'public': 1}).tolist() == [2]
+    assert sorted(index.values('public'), key=repr) == sorted([True, False, 1], key=repr)
+
+
+def test_ranges_see_values_added_after_a_query(index):
+    assert index.select({'year': {'$gt': 2022}}).tolist() == [1, 3]
+
+    index.add(4, {'year': 2030})
+    index.add(5, {'year': 2000})
+    assert index.select({'year': {'$gt': 2022}}).tolist() == [1, 3, 4]
+    assert index.select({'year': {'$lt': 2019}}).tolist() == [5]
+
+
+def test_range_ignores_booleans():
+    index = MetadataIndex()
+    index.add(0, {'score': True})
+    index.add(1, {'score': 0.5})
+
+    assert index.select({'score': {'$gt': 0}}).tolist() == [1]
+
+
+def test_empty_filter_returns_universe(index):
+    assert index.select({}, universe=6).tolist() == list(range(6))
+
+
+def test_negation_uses_universe(index):
+    assert index.select({'lang': {'$ne': 'es'}}, universe=6).tolist() == [1, 3, 4, 5]
+
+
+def test_empty_combinators_and_mismatched_ranges(index):
+    assert index.select({'$and': []}).tolist() == [0, 1, 2, 3]
+    assert index.select({'$or': []}).tolist() == []
+    assert index.select({'$and': [], 'lang': 'es'}).tolist() == [0, 2]
+    assert index.select({'year': {'$lt': 'z'}}).tolist() == []
+    assert not MetadataIndex.matches(ROWS[0], {'year': {'$lt': 'z'}})
@@ -0,0 +1,88 @@
+"""
+Tests de los fallbacks AWQ/GPTQ de custom_ops_fallback (requieren torch)
+"""
+
+import numpy as np
+import pytest
+
+import quant_packing
+from test_quant_packing import pack_awq, random_values
+from test_quant_packing import pack_rows as pack_rows_np
+
+torch = pytest.importorskip("torch")
+
+import custom_ops_fallback as fallback  # noqa: E402
+
+
+def pack_rows(values, bits=4):
+    return torch.from_numpy(pack_rows_np(values, bits))
+
+
+def random_nibbles(rows, cols, seed=0):
+    return random_values(rows, cols, 4, seed)
+
+
+@pytest.mark.parametrize("dim,order", [(1, None), (0, None), (1, quant_packing.AWQ_REVERSE_ORDER)])
+def test_unpack_matches_numpy_reference(dim, order):
+    packed = np.random.default_rng(0).integers(-2**31, 2**31, size=(4, 6)).astype(np.int32)
+
+    expected = quant_packing.unpack_int32(packed, 4, dim, order)
+    assert fallback._unpack_int32(torch.from_numpy(packed), 4, dim, order).tolist() == expected.tolist()
+
+
+def awq_case(in_features=32, out_features=16, group_size=8):
+    groups = in_features // group_size
+    weight = random_nibbles(in_features, out_features, seed=1)
+    zeros = random_nibbles(groups, out_features, seed=2)
+    scales = torch.rand(groups, out_features, dtype=torch.float32) + 0.5
+
+    expected = (torch.from_numpy(weight - np.repeat(zeros, group_size, axis=0)).float()
+                * scales.repeat_interleave(group_size, dim=0))
+    qweight = torch.from_numpy(pack_awq(weight))
+    qzeros = torch.from_numpy(pack_awq(zeros))
+    return qweight, qzeros, scales, expected
+
+
+def test_awq_dequantize_matches_reference():
+    qweight, qzeros, scales, expected = awq_case()
+
+    weight = fallback.awq_dequantize_fallback(qweight, scales, qzeros, 0, 0, 0)
+    torch.testing.assert_close(weight, expected)
+
+
+@pytest.mark.parametrize("mode", ["cache", "blocked"])
+def test_awq_gemm_modes_agree(mode):
+    qweight, qzeros, scales, expected = awq_case()
+    x = torch.randn(3, qweight.shape[0])
+
+    fallback.set_quant_fallback_mode(mode, block_n=8)
+    try:
+        out = fallback.awq_gemm_fallback(x, qweight, qzeros, scales, 8)
+    finally:
+        fallback.set_quant_fallback_mode("cache", block_n=512)
+    torch.testing.assert_close(out, x @ expected, rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize("mode", ["cache", "blocked"])
+def test_gptq_gemm_v1_zeros(mode):
+    in_features, out_features, group_size = 32, 16, 8
+    groups = in_features // group_size
+    weight = random_nibbles(in_features, out_features, seed=3)
+    zeros = random_nibbles(groups, out_features, seed=4)
+    zeros[zeros == 0] = 1  # v1 guarda zero - 1
+    scales = torch.rand(groups, out_features, dtype=torch.float32) + 0.5
+
+    expected = (torch.from_numpy(weight - np.repeat(zeros, group_size, axis=0)).float()
+                * scales.repeat_interleave(group_size, dim=0))
+    qweight = pack_rows(weight.T).T.contiguous()
+    qzeros = pack_rows(zeros - 1)
+    x = torch.randn(2, in_features)
+
+    fallback.set_quant_fallback_mode(mode, block_n=8)
+    try:
+        out = fallback.gptq_gemm_fallback(
+            x, qweight, qzeros, scales, torch.empty(0, dtype=torch.int32), False, False, 4
+        )
+    finally:
+        fallback.set_quant_fallback_mode("cache", block_n=512)
+    torch.testing.assert_close(out, x @ expected, rtol=1e-4, atol=1e-4)
@@ -0,0 +1,75 @@
+"""
+Tests del desempaquetado int32 de quant_packing (sin torch)
+"""
+
+import numpy as np
+import pytest
+
+import quant_packing
+
+# Orden de empaquetado de AutoAWQ: el nibble i guarda la columna AWQ_PACK_ORDER[i]
+AWQ_PACK_ORDER = [0, 2, 4, 6, 1, 3, 5, 7]
+
+
+def pack_rows(values, bits=4, order=None):
+    """Empaqueta cada grupo de 32 // bits columnas en un int32 (referencia)"""
+    values = np.asarray(values, dtype=np.int64)
+    pack_factor = 32 // bits
+    positions = order or list(range(pack_factor))
+    rows, cols = values.shape
+    packed = np.zeros((rows, cols // pack_factor), dtype=np.int64)
+    for c in range(cols):
+        packed[:, c // pack_factor] |= values[:, c] << (bits * positions[c % pack_factor])
+    return packed.astype(np.uint32).view(np.int32)
+
+
+def pack_awq(values):
+    """Empaqueta como AutoAWQ: el nibble i recibe la columna AWQ_PACK_ORDER[i]"""
+    values = np.asarray(values, dtype=np.int64)
+    rows, cols = values.shape
+    packed = np.zeros((rows, cols // 8), dtype=np.int64)
+    for p in range(cols // 8):
+        for nibble, column in enumerate(AWQ_PACK_ORDER):
+            packed[:, p] |= values[:, p * 8 + column] << (4 * nibble)
+    return packed.astype(np.uint32).view(np.int32)
+
+
+def random_values(rows, cols, bits=4, seed=0):
+    return np.random.default_rng(seed).integers(0, 1 << bits, size=(rows, cols))
+
+
+@pytest.mark.parametrize("bits", [2, 4, 8])
+def test_unpack_columns_roundtrip_including_sign_bit(bits):
+    values = random_values(3, 2 * (32 // bits), bits)
+    values[0, 32 // bits - 1] = (1 << bits) - 1  # Valor alto: el int32 empaquetado es negativo
+
+    unpacked = quant_packing.unpack_int32(pack_rows(values, bits), bits, 1)
+    assert unpacked.tolist() == values.tolist()
+
+
+def test_unpack_rows_roundtrip():
+    values = random_values(16, 3)
+    packed = np.ascontiguousarray(pack_rows(values.T).T)
+
+    assert quant_packing.unpack_int32(packed, 4, 0).tolist() == values.tolist()
+
+
+def test_awq_reverse_order_inverts_pack_order():
+    assert [quant_packing.AWQ_REVERSE_ORDER[c] for c in AWQ_PACK_ORDER] == list(range(8))
+
+
+def test_unpack_awq_layout():
+    values = random_values(2, 16)
+
+    unpacked = quant_packing.unpack_int32(pack_awq(values), 4, 1, quant_packing.AWQ_REVERSE_ORDER)
+    assert unpacked.tolist() == values.tolist()
+
+
+def test_unpack_shifts_follow_order():
+    assert quant_packing.unpack_shifts(8) == [0, 8, 16, 24]
+    assert quant_packing.unpack_shifts(4, quant_packing.AWQ_REVERSE_ORDER) == [0, 16, 4, 20, 8, 24, 12, 28]
+
+
+def test_unpack_rejects_unsupported_bits():
+    with pytest.raises(NotImplementedError):
+        quant_packing.unpack_int32(np.zeros((1, 1), dtype=np.int32), 3, 1)
@@ -0,0 +1,140 @@
+"""
+Tests del limitador GCRA y sus backends (memory y shm)
+"""
+
+import os
+import uuid
+
+import pytest
+
+from core import rate_limiter
+from core.rate_limiter import MemoryBackend, RateLimiter, SharedMemoryBackend
+
+WINDOW = 60.0
+REQUESTS = 3
+INTERVAL = WINDOW / REQUESTS
+
+
+@pytest.fixture
+def shm_name():
+    if not rate_limiter.FCNTL_AVAILABLE:
+        pytest.skip("El backend shm requiere fcntl")
+    from multiprocessing import shared_memory
+
+    name = f"capibara6_test_{uuid.uuid4().hex[:12]}"
+    yield name
+
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+        segment.close()
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        os.remove(os.path.join('/tmp', f'{name}.lock'))
+    except FileNotFoundError:
+        pass
+
+
+@pytest.fixture(params=["memory", "shm"])
+def backend(request):
+    if request.param == "memory":
+        yield MemoryBackend()
+        return
+    backend = SharedMemoryBackend(name=request.getfixturevalue("shm_name"), slots=64)
+    yield backend
+    backend.close()
+
+
+def test_burst_then_reject(backend):
+    now = 1000.0
+    results = [backend.acquire("client", now, INTERVAL, WINDOW) for _ in range(REQUESTS + 1)]
+
+    assert [allowed for allowed, _, _ in results] == [True, True, True, False]
+    assert results[-1][2] == pytest.approx(INTERVAL)
+
+
+def test_refills_at_sustained_rate(backend):
+    now = 1000.0
+    for _ in range(REQUESTS):
+        backend.acquire("client", now, INTERVAL, WINDOW)
+
+    assert not backend.acquire("client", now + INTERVAL / 2, INTERVAL, WINDOW)[0]
+    assert backend.acquire("client", now + INTERVAL, INTERVAL, WINDOW)[0]
+    assert not backend.acquire("client", now + INTERVAL, INTERVAL, WINDOW)[0]
+
+
+def test_keys_are_independent(backend):
+    now = 1000.0
+    for _ in range(REQUESTS):
+        backend.acquire("a", now, INTERVAL, WINDOW)
+
+    assert not backend.acquire("a", now, INTERVAL, WINDOW)[0]
+    assert backend.acquire("b", now, INTERVAL, WINDOW)[0]
+
+
+def test_rejected_request_does_not_move_tat(backend):
+    now = 1000.0
+    for _ in range(REQUESTS):
+        backend.acquire("client", now, INTERVAL, WINDOW)
+    tat = backend.peek("client")
+
+    backend.acquire("client", now, INTERVAL, WINDOW)
+    assert backend.peek("client") == tat
+
+
+def test_memory_backend_evicts_idle_keys():
+    backend = MemoryBackend(max_keys=2)
+    for i, key in enumerate(["a", "b", "c"]):
+        backend.acquire(key, 1000.0 + i, INTERVAL, WINDOW)
+    assert len(backend) == 2
+    assert backend.peek("a") is None
+
+    # Claves cuyo TAT ya pasó equivalen a un bucket lleno: se sueltan
+    backend.acquire("d", 1000.0 + 10 * WINDOW, INTERVAL, WINDOW)
+    assert len(backend) == 1
+
+
+def test_shm_backend_is_shared_between_instances(shm_name):
+    first = SharedMemoryBackend(name=shm_name, slots=64)
+    second = SharedMemoryBackend(name=shm_name, slots=64)
+    try:
+        now = 1000.0
+        for _ in range(REQUESTS):
+            assert first.acquire("client", now, INTERVAL, WINDOW)[0]
+        assert not second.acquire("client", now, INTERVAL, WINDOW)[0]
+        assert second.peek("client") == first.peek("client")
+    finally:
+        first.close()
+        second.close()
+
+
+def test_shm_backend_attaches_with_existing_size(shm_name):
+    first = SharedMemoryBackend(name=shm_name, slots=64)
+    second = SharedMemoryBackend(name=shm_name, slots=16)
+    try:
+        assert second.slots == first.slots == 64
+    finally:
+        first.close()
+        second.close()
+
+
+def test_rate_limiter_hit_reports_remaining():
+    limiter = RateLimiter(requests=REQUESTS, window=int(WINDOW))
+
+    results = [limiter.hit("client") for _ in range(REQUESTS + 1)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results] == [2, 1, 0, 0]
+    assert results[-1].retry_after > 0
+    assert limiter.get_retry_after("client") > 0
+    assert limiter.get_retry_after("other") == 0
+
+
+def test_create_backend_by_name(shm_name):
+    assert isinstance(rate_limiter.create_backend("memory"), MemoryBackend)
+
+    backend = rate_limiter.create_backend("shm", name=shm_name)
+    try:
+        assert isinstance(backend, SharedMemoryBackend)
+    finally:
+        backend.close()
@@ -0,0 +1,123 @@
+"""
+Tests de SegmentStore (formato en disco de VectorStore)
+"""
+
+import numpy as np
+import pytest
+
+from core.rag.segment_store import SegmentStore
+
+DIM = 4
+
+
+def make_docs(ids):
+    return [{'doc_id': doc_id, 'content': f"contenido {doc_id}", 'metadata': {}} for doc_id in ids]
+
+
+def make_embeddings(n, seed=0):
+    vectors = np.random.default_rng(seed).random((n, DIM), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SegmentStore(tmp_path / "store", DIM)
+
+
+def test_append_and_read(store):
+    embeddings = make_embeddings(3)
+    rows = store.append(make_docs(["a", "b", "c"]), embeddings)
+
+    assert rows.tolist() == [0, 1, 2]
+    assert store.rows == store.live_rows == 3
+    assert store.read_document(1)['doc_id'] == "b"
+    np.testing.assert_allclose(store.vectors(np.array([0, 2])), embeddings[[0, 2]])
+
+
+def test_reload_from_disk(store):
+    store.append(make_docs(["a", "b"]), make_embeddings(2))
+    store.append(make_docs(["c"]), make_embeddings(1, seed=1))
+
+    reopened = SegmentStore(store.path, DIM, read_only=True)
+    assert reopened.rows == 3
+    assert reopened.doc_ids() == ["a", "b", "c"]
+    assert reopened.doc_row("c") == 2
+
+
+def test_doc_row_returns_latest_live_row(store):
+    store.append(make_docs(["a", "b"]), make_embeddings(2))
+    store.append(make_docs(["a"]), make_embeddings(1, seed=1))
+
+    assert store.doc_row("a") == 2
+    store.delete([2])
+    assert store.doc_row("a") == 0
+    assert store.doc_row("missing") is None
+
+
+def test_doc_row_rebuilds_missing_hashes(store):
+    store.append(make_docs(["a", "b"]), make_embeddings(2))
+    store._file('doc_hashes').unlink()
+
+    # Almacén sin fichero de hashes (formato anterior)
+    reopened = SegmentStore(store.path, DIM)
+    assert reopened.doc_row("b") == 1
+    assert reopened._file('doc_hashes').stat().st_size == 2 * 8
+
+
+def test_delete_is_persisted(store):
+    store.append(make_docs(["a", "b", "c"]), make_embeddings(3))
+    store.delete([1, 1, 99])
+
+    reopened = SegmentStore(store.path, DIM, read_only=True)
+    assert reopened.live_rows == 2
+    assert not reopened.is_live(1)
+    assert [row for row, _ in reopened.iter_documents()] == [0, 2]
+
+
+def test_compact_renumbers_rows(store, monkeypatch):
+    monkeypatch.setattr(SegmentStore, "COMPACT_CHUNK_ROWS", 2)
+    embeddings = np.concatenate([make_embeddings(3), make_embeddings(2, seed=1)])
+    store.append(make_docs(["a", "b", "c"]), embeddings[:3])
+    store.append(make_docs(["d", "e"]), embeddings[3:])
+    store.delete([0, 3])
+
+    assert store.compact() == 2
+    assert store.rows == store.live_rows == 3
+    assert store.doc_ids() == ["b", "c", "e"]
+    assert store.doc_row("e") == 2
+    np.testing.assert_allclose(store.vectors(np.arange(3)), embeddings[[1, 2, 4]])
+
+    reopened = SegmentStore(store.path, DIM, read_only=True)
+    assert reopened.doc_ids() == ["b", "c", "e"]
+
+
+def test_compact_to_empty(store):
+    store.append(make_docs(["a"]), make_embeddings(1))
+    store.delete([0])
+
+    assert store.compact() == 1
+    assert store.rows == 0
+    assert store.doc_row("a") is None
+
+
+def test_read_only_rejects_writes(store):
+    store.append(make_docs(["a"]), make_embeddings(1))
+    reader = SegmentStore(store.path, DIM, read_only=True)
+
+    with pytest.raises(PermissionError):
+        reader.append(make_docs(["b"]), make_embeddings(1))
+
+
+def test_append_rejects_wrong_shape(store):
+    with pytest.raises(ValueError):
+        store.append(make_docs(["a", "b"]), make_embeddings(1))
+
+
+def test_is_doc_row_checks_liveness_and_id(store):
+    store.append(make_docs(["a", "b"]), make_embeddings(2))
+
+    assert store.is_doc_row(1, "b")
+    assert not store.is_doc_row(1, "a")
+    assert not store.is_doc_row(5, "b")
+    store.delete([1])
+    assert not store.is_doc_row(1, "b")
@@ -0,0 +1,71 @@
+"""
+Tests del índice de postings y el journal de StaticCache
+"""
+
+import pytest
+
+from core.cag.static_cache import StaticCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return StaticCache(str(tmp_path))
+
+
+def ids(docs):
+    return [doc['id'] for doc in docs]
+
+
+def test_add_document_is_indexed(cache):
+    cache.add_document("quokka", "Quokka", "El quokka vive en la isla Rottnest",
+                       category="fauna", tags=["marsupial"])
+
+    assert ids(cache._search_relevant_docs("quokka")) == ["quokka"]
+    assert ids(cache._search_relevant_docs("quokka", category="fauna")) == ["quokka"]
+    assert ids(cache._search_relevant_docs("quokka", category="otra")) == []
+    assert ids(cache._search_relevant_docs("quokka", tags=["marsupial"])) == ["quokka"]
+
+
+def test_prefix_matches_rank_below_exact(cache):
+    cache.add_document("exacto", "Rottnest", "rottnest")
+    cache.add_document("prefijo", "Rottnestiano", "rottnestiano")
+
+    assert ids(cache._search_relevant_docs("rottnest")) == ["exacto", "prefijo"]
+    assert ids(cache._search_relevant_docs("rottnestia")) == ["prefijo"]
+
+
+def test_update_unindexes_old_terms(cache):
+    cache.add_document("animal", "Quokka", "quokka")
+    cache.add_document("animal", "Wombat", "wombat")
+
+    assert ids(cache._search_relevant_docs("quokka")) == []
+    assert ids(cache._search_relevant_docs("wombat")) == ["animal"]
+
+
+def test_journal_is_replayed_on_load(cache, tmp_path):
+    cache.add_document("quokka", "Quokka", "quokka", category="fauna")
+    assert cache.journal_file.exists()
+
+    reloaded = StaticCache(str(tmp_path))
+    assert reloaded.get_document("quokka")['category'] == "fauna"
+    assert ids(reloaded._search_relevant_docs("quokka")) == ["quokka"]
+    assert reloaded.get_stats()['journal_entries'] == 1
+
+
+def test_journal_compaction_rewrites_snapshot(cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(StaticCache, "JOURNAL_COMPACT_THRESHOLD", 2)
+    cache.add_document("a", "Quokka", "quokka")
+    cache.add_document("b", "Wombat", "wombat")
+
+    assert not cache.journal_file.exists()
+    reloaded = StaticCache(str(tmp_path))
+    assert reloaded.get_stats()['journal_entries'] == 0
+    assert ids(reloaded._search_relevant_docs("wombat")) == ["b"]
+
+
+def test_retrieve_respects_token_budget(cache):
+    cache.add_document("largo", "Quokka", "quokka " * 500)
+
+    context = cache.retrieve_counted("quokka", max_tokens=100)
+    assert context.text.startswith("**Quokka**")
+    assert 0 < context.tokens <= 100
@@ -0,0 +1,121 @@
+"""
+Tests for incremental detokenization and coalesced SSE streaming
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+from vllm_integration.stream_emitter import (
+    DeltaTracker,
+    IncrementalDetokenizer,
+    SSEChunkTemplate,
+    StreamEmitter
+)
+
+
+class ByteTokenizer:
+    """One token per UTF-8 byte"""
+
+    def encode(self, text):
+        return list(text.encode('utf-8'))
+
+    def decode(self, token_ids, skip_special_tokens=True):
+        return bytes(token_ids).decode('utf-8', errors='replace')
+
+
+def sse_payloads(frames):
+    return [json.loads(line[len('data: '):])
+            for frame in frames for line in frame.split('\n')
+            if line.startswith('data: {')]
+
+
+def test_detokenizer_holds_back_partial_utf8():
+    tokenizer = ByteTokenizer()
+    detokenizer = IncrementalDetokenizer(tokenizer, tokenizer.encode("prompt "))
+    ids = tokenizer.encode("olá ñu")
+
+    deltas = [detokenizer.add([token_id]) for token_id in ids]
+    assert "".join(deltas) + detokenizer.flush() == "olá ñu"
+    # The first byte of a two-byte character yields nothing until the second
+    assert deltas[2] == "" and deltas[3] == "á"
+
+
+def test_delta_tracker_cumulative_outputs():
+    tracker = DeltaTracker()
+    tracker.delta_mode = False
+
+    texts = []
+    for text, token_ids in (("Hel", [1]), ("Hello", [1, 2]), ("Hello!", [1, 2, 3])):
+        texts.append(tracker.update(SimpleNamespace(text=text, token_ids=token_ids, finish_reason=None)))
+
+    assert texts == ["Hel", "lo", "!"]
+    assert tracker.num_tokens == 3
+
+
+async def collect(emitter, deltas):
+    return [frame async for frame in emitter.frames(deltas)]
+
+
+def test_emitter_coalesces_bursts_into_frames():
+    async def deltas():
+        for token in ["a", "b", "c", "d"]:
+            yield token, None
+        yield "", "length"
+
+    emitter = StreamEmitter(SSEChunkTemplate.chat("req-1", "model"), max_delay_ms=50)
+    frames = asyncio.run(collect(emitter, deltas()))
+    payloads = sse_payloads(frames)
+
+    assert payloads[0]['choices'][0]['delta'] == {'role': 'assistant', 'content': ''}
+    text = "".join(p['choices'][0]['delta'].get('content', '') for p in payloads[1:])
+    assert text == "abcd"
+    assert emitter.frames_sent < 4
+    assert payloads[-1]['choices'][0]['finish_reason'] == "length"
+    assert frames[-1].endswith("data: [DONE]\n\n")
+
+
+def test_emitter_aborts_slow_clients():
+    closed = []
+
+    async def deltas():
+        try:
+            while True:
+                yield "x" * 10, None
+        finally:
+            closed.append(True)
+
+    async def run():
+        emitter = StreamEmitter(SSEChunkTemplate.completion("req-2", "model"),
+                                max_delay_ms=1, max_pending_chars=100)
+        stream = emitter.frames(deltas())
+        frames = []
+        async for frame in stream:
+            frames.append(frame)
+            await asyncio.sleep(0.01)  # Slow consumer
+        return emitter, frames
+
+    emitter, frames = asyncio.run(run())
+    assert emitter.overflowed
+    assert closed == [True]
+    assert sse_payloads(frames)[-1]['choices'][0]['finish_reason'] == "abort"
+
+
+def test_emitter_closes_source_when_client_leaves():
+    closed = []
+
+    async def deltas():
+        try:
+            while True:
+                yield "x", None
+                await asyncio.sleep(0)
+        finally:
+            closed.append(True)
+
+    async def run():
+        stream = StreamEmitter(SSEChunkTemplate.ollama("model"), max_delay_ms=1).frames(deltas())
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert closed == [True]